@@ -3,7 +3,7 @@ import sqlite3
 import psycopg2
 import psycopg2.extras
 from datetime import datetime, timedelta
-from flask import Flask, render_template, redirect, url_for, request, jsonify, g
+from flask import Flask, render_template, redirect, url_for, request, jsonify, g, send_file
 from flask_cors import CORS
 from flask_compress import Compress
 from werkzeug.utils import secure_filename
@@ -13,6 +13,8 @@ import asyncio
 from functools import wraps
 from services.manus_ai_service import manus_ai
 from services import openai_service
+from services.report_jobs import get_report_job_manager
+from services.webhook_dispatcher import get_dispatcher
 
 # Decorator para suportar rotas async no Flask
 def async_route(f):
@@ -1669,56 +1671,70 @@ def api_notification_read(notification_id):
 
 # ===== REPORTS ENDPOINTS =====
 
+# Inicializar jobs de relatório (reenfileira jobs órfãos de um restart)
+try:
+    get_report_job_manager()
+except Exception as e:
+    print(f"⚠️ Erro ao iniciar jobs de relatório: {e}")
+
+# Iniciar entrega de webhooks (linhas pendentes de antes de um restart)
+try:
+    get_dispatcher().start()
+except Exception as e:
+    print(f"⚠️ Erro ao iniciar dispatcher de webhooks: {e}")
+
 @app.route("/api/reports/generate", methods=["POST"])
 def api_report_generate():
-    """Generate report"""
-    data = request.get_json()
-    db = get_db()
+    """Generate report (background job; returns job id)"""
+    data = request.get_json() or {}
     
     try:
-        # Buscar dados das campanhas
-        campaigns = db.execute("""
-            SELECT c.*, m.impressions, m.clicks, m.conversions, m.spend, m.revenue, m.roas
-            FROM campaigns c
-            LEFT JOIN campaign_metrics m ON c.id = m.campaign_id
-            WHERE c.created_at BETWEEN ? AND ?
-        """, (
-            data.get("date_range_start"),
-            data.get("date_range_end")
-        )).fetchall()
-        
-        report_data = {
-            "campaigns": [dict(c) for c in campaigns],
-            "summary": {
-                "total_campaigns": len(campaigns),
-                "total_spend": sum(c["spend"] or 0 for c in campaigns),
-                "total_revenue": sum(c["revenue"] or 0 for c in campaigns),
-                "avg_roas": sum(c["roas"] or 0 for c in campaigns) / len(campaigns) if campaigns else 0
-            }
-        }
-        
-        # Salvar relatório
-        cursor = db.execute(sql_param("""
-            INSERT INTO reports (report_name, report_type, date_range_start, date_range_end, data_json)
-            VALUES (?, ?, ?, ?, ?)
-        """), (
-            data.get("report_name", "Relatório Personalizado"),
-            data.get("report_type", "performance"),
-            data.get("date_range_start"),
-            data.get("date_range_end"),
-            json.dumps(report_data)
-        ))
-        db_commit()
+        job_id = get_report_job_manager().submit(
+            date_range_start=data.get("date_range_start"),
+            date_range_end=data.get("date_range_end"),
+            report_name=data.get("report_name", "Relatório Personalizado"),
+            report_type=data.get("report_type", "performance"),
+            fmt=data.get("format", "csv")
+        )
         
         return jsonify({
             "success": True,
-            "report_id": cursor.lastrowid,
-            "data": report_data
-        })
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": url_for("api_report_job_status", job_id=job_id),
+            "download_url": url_for("api_report_job_download", job_id=job_id)
+        }), 202
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
 
+@app.route("/api/reports/jobs/<job_id>", methods=["GET"])
+def api_report_job_status(job_id):
+    """Report job status"""
+    job = get_report_job_manager().get_job(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Job não encontrado"}), 404
+    job.pop("file_path", None)
+    return jsonify({"success": True, "job": job})
+
+
+@app.route("/api/reports/jobs/<job_id>/download", methods=["GET"])
+def api_report_job_download(job_id):
+    """Download report file (supports Range requests)"""
+    download = get_report_job_manager().get_download(job_id)
+    if not download:
+        return jsonify({"success": False, "message": "Relatório ainda não disponível"}), 404
+    return send_file(
+        os.path.abspath(download["path"]),
+        mimetype=download["mimetype"],
+        as_attachment=True,
+        download_name=download["filename"],
+        conditional=True
+    )
+
+
 @app.route("/api/reports/list", methods=["GET"])
 def api_reports_list():
     """List all reports"""
@@ -4653,6 +4669,10 @@ def stripe_webhook():
         # Processar evento com o handler
         process_result = webhook_handler.handle_event(event)
         
+        if process_result.get('in_progress'):
+            # Não-2xx: o Stripe reenvia e o evento é processado após a reserva
+            return jsonify({'received': True, 'processed': False, 'error': process_result.get('error')}), 409
+        
         if process_result['success']:
             return jsonify({'received': True, 'processed': True}), 200
         else:
@@ -4969,7 +4989,7 @@ def api_market_intelligence():
     
     try:
         from services.similarweb_intelligence import similarweb_intelligence
-        from services.manus_credit_tracker import manus_credit_tracker, ActionType
+        from services.manus_credit_tracker import get_manus_credit_tracker, ActionType
         
         # Get market insights via Manus IA
         insights = similarweb_intelligence.get_market_insights(domain, country, timeframe)
@@ -4978,7 +4998,7 @@ def api_market_intelligence():
         if insights and insights.get('status') != 'offline' and insights.get('data'):
             # Registrar uso de créditos
             try:
-                manus_credit_tracker.log_credit_usage(
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.SIMILARWEB_INSIGHT,
                     context={'domain': domain, 'source': 'api', 'country': country}
                 )
@@ -5130,9 +5150,9 @@ def api_manus_credits_dashboard():
     Retorna métricas de créditos Manus para o CEO Dashboard.
     """
     try:
-        from services.manus_credit_tracker import manus_credit_tracker
+        from services.manus_credit_tracker import get_manus_credit_tracker
         
-        metrics = manus_credit_tracker.get_dashboard_metrics()
+        metrics = get_manus_credit_tracker().get_dashboard_metrics()
         
         return jsonify({
             'success': True,
@@ -5155,11 +5175,11 @@ def api_manus_credits_report():
         timeframe: Período ('today', '7d', '30d', 'all')
     """
     try:
-        from services.manus_credit_tracker import manus_credit_tracker
+        from services.manus_credit_tracker import get_manus_credit_tracker
         
         timeframe = request.args.get('timeframe', '30d')
         
-        report = manus_credit_tracker.get_usage_report(timeframe)
+        report = get_manus_credit_tracker().get_usage_report(timeframe)
         
         return jsonify({
             'success': True,
@@ -5182,11 +5202,11 @@ def api_manus_credits_roi():
         timeframe: Período ('today', '7d', '30d', 'all')
     """
     try:
-        from services.manus_credit_tracker import manus_credit_tracker
+        from services.manus_credit_tracker import get_manus_credit_tracker
         
         timeframe = request.args.get('timeframe', '30d')
         
-        roi_data = manus_credit_tracker.get_roi_by_credits(timeframe)
+        roi_data = get_manus_credit_tracker().get_roi_by_credits(timeframe)
         
         return jsonify({
             'success': True,
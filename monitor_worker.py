@@ -58,6 +58,18 @@ class ManusMonitor:
         
         # Inicializar Google Ads Client (se credenciais disponíveis)
         self.init_google_ads_client()
+        
+        # Benchmarks recalculados do histórico (fora dos requests do Web Service)
+        self.init_benchmark_recompute()
+    
+    def init_benchmark_recompute(self):
+        """Agenda o recompute diário dos benchmarks a partir de campaign_metrics"""
+        try:
+            from services.benchmark_global import benchmark_global
+            benchmark_global.start_scheduled_recompute(interval_hours=24)
+            logger.info("✅ Recompute de benchmarks agendado (24h)")
+        except Exception as e:
+            logger.warning(f"⚠️ Recompute de benchmarks não agendado: {str(e)}")
     
     def init_google_ads_client(self):
         """Inicializa cliente Google Ads"""
@@ -3,7 +3,8 @@ ROTAS DA EXPANSAO UNICORNIO
 Integra todos os 19 sistemas avancados do Nexora Prime V2
 """
 
-from flask import Blueprint, request, jsonify
+import os
+from flask import Blueprint, request, jsonify, send_file, url_for
 from datetime import datetime
 
 # Importar todos os engines
@@ -13,8 +14,9 @@ from services.dynamic_creative_ai import dynamic_creative_ai
 from services.velyra_memory import velyra_memory
 from services.ltv_engine import ltv_engine
 from services.anti_ban_ai import anti_ban_ai
-from services.agency_mode import agency_mode
-from services.monetization_system import monetization_system
+from services.agency_mode import get_agency_mode
+from services.agency_report_batch import get_agency_report_batch
+from services.monetization_system import get_monetization_system
 from services.benchmark_global import benchmark_global
 from services.war_mode import war_mode
 from services.realtime_pipeline import realtime_pipeline
@@ -24,7 +26,7 @@ from services.funnel_accelerator import funnel_accelerator
 from services.geo_intelligence import geo_intelligence
 from services.learning_cycle import learning_cycle
 from services.testing_framework import testing_framework
-from services.enterprise_security import enterprise_security
+from services.enterprise_security import get_enterprise_security
 from services.automation_hub import automation_hub
 
 # Criar blueprint
@@ -247,7 +249,7 @@ def check_compliance():
 def add_client():
     """Adiciona cliente - usa create_client."""
     data = request.get_json() or {}
-    result = agency_mode.create_client(
+    result = get_agency_mode().create_client(
         agency_id=data.get('agency_id', 'default'),
         client_data=data
     )
@@ -256,10 +258,11 @@ def add_client():
 @unicorn_bp.route('/agency/clients', methods=['GET'])
 def list_clients():
     """Lista clientes."""
+    clients = get_agency_mode().list_clients(request.args.get('agency_id'))
     result = {
         "success": True,
-        "clients": list(agency_mode.clients.values()),
-        "total": len(agency_mode.clients),
+        "clients": clients,
+        "total": len(clients),
         "timestamp": datetime.now().isoformat()
     }
     return jsonify(result)
@@ -267,33 +270,69 @@ def list_clients():
 @unicorn_bp.route('/agency/report/<client_id>', methods=['GET'])
 def get_client_report(client_id):
     """Obtem relatorio do cliente - usa get_client_dashboard."""
-    result = agency_mode.get_client_dashboard(client_id)
+    result = get_agency_mode().get_client_dashboard(client_id)
     return jsonify(result)
 
+@unicorn_bp.route('/agency/reports/batch', methods=['POST'])
+def submit_agency_reports():
+    """Gera relatorios white-label de todos os clientes em lote (background)."""
+    data = request.get_json() or {}
+    result = get_agency_report_batch().submit(
+        agency_id=data.get('agency_id', 'default'),
+        report_type=data.get('report_type', 'monthly'),
+        date_range=data.get('date_range')
+    )
+    if "error" in result:
+        return jsonify(result), 400
+    result["status_url"] = url_for("unicorn.get_agency_report_batch_status", batch_id=result["batch_id"])
+    return jsonify(result), 202
+
+@unicorn_bp.route('/agency/reports/batch/<batch_id>', methods=['GET'])
+def get_agency_report_batch_status(batch_id):
+    """Status do lote e lista de relatorios gerados."""
+    batch = get_agency_report_batch().get_batch(batch_id)
+    if batch is None:
+        return jsonify({"error": "Lote nao encontrado"}), 404
+    return jsonify(batch)
+
+@unicorn_bp.route('/agency/reports/batch/<batch_id>/<client_id>', methods=['GET'])
+def download_agency_report(batch_id, client_id):
+    """Download do relatorio de um cliente (html ou json)."""
+    download = get_agency_report_batch().get_download(batch_id, client_id, request.args.get('format', 'html'))
+    if not download:
+        return jsonify({"error": "Relatorio ainda nao disponivel"}), 404
+    return send_file(
+        os.path.abspath(download["path"]),
+        mimetype=download["mimetype"],
+        as_attachment=True,
+        download_name=download["filename"],
+        conditional=True
+    )
+
 
 # ==================== MONETIZATION ====================
 
 @unicorn_bp.route('/monetization/plans', methods=['GET'])
 def get_plans():
     """Obtem planos - usa compare_plans."""
-    result = monetization_system.compare_plans()
+    result = get_monetization_system().compare_plans()
     return jsonify(result)
 
 @unicorn_bp.route('/monetization/subscribe', methods=['POST'])
 def subscribe():
     """Assina plano - usa create_subscription."""
     data = request.get_json() or {}
-    result = monetization_system.create_subscription(
+    result = get_monetization_system().create_subscription(
         user_id=data.get('user_id', 'demo_user'),
-        plan_type=data.get('plan_type', 'professional'),
-        payment_method=data.get('payment_method', {})
+        plan=data.get('plan_type', 'professional'),
+        billing_cycle=data.get('billing_cycle', 'monthly')
     )
     return jsonify(result)
 
 @unicorn_bp.route('/monetization/usage/<user_id>', methods=['GET'])
 def get_usage(user_id):
     """Obtem uso - usa get_usage_report."""
-    result = monetization_system.get_usage_report(user_id)
+    result = get_monetization_system().get_usage_report(user_id)
     return jsonify(result)
 
 
@@ -563,33 +602,33 @@ def calculate_sample_size():
 def enable_2fa():
     """Habilita 2FA."""
     data = request.get_json() or {}
-    result = enterprise_security.enable_2fa(data.get('user_id', ''))
+    result = get_enterprise_security().enable_2fa(data.get('user_id', ''))
     return jsonify(result)
 
 @unicorn_bp.route('/security/2fa/verify', methods=['POST'])
 def verify_2fa():
     """Verifica 2FA."""
     data = request.get_json() or {}
-    result = enterprise_security.verify_2fa(data.get('user_id', ''), data.get('code', ''))
+    result = get_enterprise_security().verify_2fa(data.get('user_id', ''), data.get('code', ''))
     return jsonify(result)
 
 @unicorn_bp.route('/security/consent', methods=['POST'])
 def register_consent():
     """Registra consentimento."""
     data = request.get_json() or {}
-    result = enterprise_security.register_consent(data.get('user_id', ''), data.get('consent_type', ''), data.get('granted', False), data.get('details', {}))
+    result = get_enterprise_security().register_consent(data.get('user_id', ''), data.get('consent_type', ''), data.get('granted', False), data.get('details', {}))
     return jsonify(result)
 
 @unicorn_bp.route('/security/export/<user_id>', methods=['GET'])
 def export_user_data(user_id):
     """Exporta dados do usuario (LGPD)."""
-    result = enterprise_security.export_user_data(user_id)
+    result = get_enterprise_security().export_user_data(user_id)
     return jsonify(result)
 
 @unicorn_bp.route('/security/compliance/<report_type>', methods=['GET'])
 def get_compliance_report(report_type):
     """Obtem relatorio de compliance."""
-    result = enterprise_security.generate_compliance_report(report_type)
+    result = get_enterprise_security().generate_compliance_report(report_type)
     return jsonify(result)
 
 
@@ -74,9 +74,9 @@ except ImportError:
     financial_simulator = None
 
 try:
-    from services.manus_credit_tracker import manus_credit_tracker, ActionType
+    from services.manus_credit_tracker import get_manus_credit_tracker, ActionType
 except ImportError:
-    manus_credit_tracker = None
+    get_manus_credit_tracker = None
     ActionType = None
 
 logger = logging.getLogger(__name__)
@@ -203,8 +203,8 @@ class AdCreatorService:
                         results['market_intelligence'] = market_intel
                         
                         # Registrar uso de créditos
-                        if manus_credit_tracker:
-                            manus_credit_tracker.log_credit_usage(
+                        if get_manus_credit_tracker:
+                            get_manus_credit_tracker().log_credit_usage(
                                 action_type=ActionType.MARKET_RESEARCH,
                                 context={
                                     'domain': domain,
@@ -284,8 +284,8 @@ class AdCreatorService:
             )
             
             # Registrar uso de créditos
-            if manus_credit_tracker:
-                manus_credit_tracker.log_credit_usage(
+            if get_manus_credit_tracker:
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.COMPETITOR_ANALYSIS,
                     context={
                         'product': product,
@@ -403,8 +403,8 @@ class AdCreatorService:
                     results['generated_creatives'] = generated
                     
                     # Registrar uso de créditos
-                    if manus_credit_tracker:
-                        manus_credit_tracker.log_credit_usage(
+                    if get_manus_credit_tracker:
+                        get_manus_credit_tracker().log_credit_usage(
                             action_type=ActionType.CREATIVE_GENERATION,
                             context={
                                 'count': len(generated),
@@ -792,8 +792,8 @@ class AdCreatorService:
             logger.info(f"🎉 FASE 7 concluída! {len(ads)} anúncios criados")
             
             # Registrar uso de créditos
-            if manus_credit_tracker:
-                manus_credit_tracker.log_credit_usage(
+            if get_manus_credit_tracker:
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.CAMPAIGN_OPTIMIZATION,
                     context={
                         'ads_created': len(ads),
@@ -1002,8 +1002,8 @@ class AdCreatorService:
             logger.info(f"🎉 FASE 9 concluída! {len(result['ad_ids'])} anúncios publicados")
 
             # Registrar uso de créditos
-            if manus_credit_tracker:
-                manus_credit_tracker.log_credit_usage(
+            if get_manus_credit_tracker:
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.CAMPAIGN_OPTIMIZATION,
                     context={
                         'action': 'campaign_execution',
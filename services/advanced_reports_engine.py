@@ -13,9 +13,11 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass, field
 from enum import Enum
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import statistics
 
+import numpy as np
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -170,38 +172,223 @@ class MetricsCalculator:
         
         return results
     
-    def compare_periods(
+    def calculate_metrics_batch(self, raw: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Calcula todas as métricas para várias linhas de uma vez.
+        
+        Args:
+            raw: Matriz (n_linhas × RAW_FIELDS) com os totais brutos de cada linha
+        
+        Returns:
+            Dict métrica -> array com um valor por linha (sem arredondamento;
+            o arredondamento fica para quem extrai os valores)
+        """
+        raw = np.atleast_2d(np.asarray(raw, dtype=np.float64))
+        impressions, clicks, spend, conversions, revenue, reach = (raw[:, i] for i in range(len(RAW_FIELDS)))
+        
+        def ratio(numerator, denominator, scale=1.0):
+            out = np.zeros_like(numerator)
+            np.divide(numerator * scale, denominator, out=out, where=denominator > 0)
+            return out
+        
+        return {
+            "impressions": impressions,
+            "clicks": clicks,
+            "spend": spend,
+            "conversions": conversions,
+            "revenue": revenue,
+            "reach": reach,
+            "ctr": ratio(clicks, impressions, 100),
+            "cpc": ratio(spend, clicks),
+            "cpm": ratio(spend, impressions, 1000),
+            "cpa": ratio(spend, conversions),
+            "roas": ratio(revenue, spend),
+            "conversion_rate": ratio(conversions, clicks, 100),
+            "frequency": ratio(impressions, reach),
+            "profit": revenue - spend,
+            "roi": ratio(revenue - spend, spend, 100)
+        }
+    
+    def compare_arrays(
         self,
-        current: Dict[str, float],
-        previous: Dict[str, float]
-    ) -> Dict[str, Dict[str, Any]]:
-        """Compara métricas entre dois períodos"""
+        current: Dict[str, np.ndarray],
+        previous: Dict[str, np.ndarray]
+    ) -> Dict[str, Dict[str, np.ndarray]]:
+        """Comparação vetorizada de períodos (arrays alinhados por linha)"""
         comparison = {}
         
         for metric_id, metric_def in self.metrics.items():
-            current_val = current.get(metric_id, 0)
-            previous_val = previous.get(metric_id, 0)
+            current_val = np.asarray(current.get(metric_id, 0), dtype=np.float64)
+            previous_val = np.asarray(previous.get(metric_id, 0), dtype=np.float64)
             
-            if previous_val > 0:
-                change_pct = ((current_val - previous_val) / previous_val) * 100
+            safe_previous = np.where(previous_val > 0, previous_val, 1.0)
+            change_pct = np.where(
+                previous_val > 0,
+                (current_val - previous_val) / safe_previous * 100,
+                np.where(current_val > 0, 100.0, 0.0)
+            )
+            
+            # Determinar se a mudança é positiva ou negativa
+            if metric_def.higher_is_better:
+                is_positive = change_pct > 0
             else:
-                change_pct = 100 if current_val > 0 else 0
+                is_positive = change_pct < 0
                 
-            # Determinar se a mudança é positiva ou negativa
-            is_positive = (change_pct > 0 and metric_def.higher_is_better) or \
-                         (change_pct < 0 and not metric_def.higher_is_better)
-                         
             comparison[metric_id] = {
                 "current": current_val,
                 "previous": previous_val,
-                "change": round(current_val - previous_val, 2),
-                "change_percent": round(change_pct, 1),
-                "trend": "up" if change_pct > 0 else "down" if change_pct < 0 else "stable",
+                "change": current_val - previous_val,
+                "change_percent": change_pct,
                 "is_positive": is_positive,
-                "benchmark": metric_def.benchmark
+                "sign": np.sign(change_pct)
             }
             
         return comparison
+    
+    def compare_periods(
+        self,
+        current: Dict[str, float],
+        previous: Dict[str, float]
+    ) -> Dict[str, Dict[str, Any]]:
+        """Compara métricas entre dois períodos"""
+        arrays = self.compare_arrays(current, previous)
+        return {
+            metric_id: {
+                "current": current.get(metric_id, 0),
+                "previous": previous.get(metric_id, 0),
+                "change": round(float(data["change"]), 2),
+                "change_percent": round(float(data["change_percent"]), 1),
+                "trend": "up" if data["sign"] > 0 else "down" if data["sign"] < 0 else "stable",
+                "is_positive": bool(data["is_positive"]),
+                "benchmark": self.metrics[metric_id].benchmark
+            }
+            for metric_id, data in arrays.items()
+        }
+
+
+# Campos brutos (somáveis) na ordem das colunas do MetricsFrame
+RAW_FIELDS = ("impressions", "clicks", "spend", "conversions", "revenue", "reach")
+COUNT_FIELDS = ("impressions", "clicks", "conversions", "reach")
+
+
+class MetricsFrame:
+    """
+    Dados de um período em colunas NumPy.
+    
+    Aceita os totais agregados da campanha ou, quando `campaign_data["daily"]`
+    existe, uma linha por dia — nesse caso os totais e as séries de tendência
+    saem das mesmas colunas.
+    """
+    
+    def __init__(self, rows: List[Dict[str, Any]], daily: bool = False):
+        self.daily = daily
+        self.dates = [row.get("date") for row in rows]
+        self.values = np.array(
+            [[float(row.get(f, 0) or 0) for f in RAW_FIELDS] for row in rows],
+            dtype=np.float64
+        ).reshape(len(rows), len(RAW_FIELDS))
+        
+    @classmethod
+    def from_campaign_data(cls, campaign_data: Dict[str, Any]) -> "MetricsFrame":
+        daily = campaign_data.get("daily")
+        if isinstance(daily, list) and daily:
+            return cls(daily, daily=True)
+        return cls([campaign_data])
+    
+    def totals(self) -> np.ndarray:
+        return self.values.sum(axis=0)
+
+
+@dataclass
+class ReportContext:
+    """Resultados intermediários compartilhados entre os tipos de relatório"""
+    date_range: Tuple[datetime, datetime]
+    frame: MetricsFrame
+    current_metrics: Dict[str, Any]
+    previous_metrics: Dict[str, Any]
+    comparison: Dict[str, Dict[str, Any]]
+    insights: List[str]
+    recommendations: List[str]
+    trend_series: List[Dict[str, Any]]
+    roi_trend: List[Dict[str, Any]]
+
+
+class ReportStore:
+    """
+    Armazenamento limitado de relatórios em disco.
+    
+    Um JSON por relatório e um índice em memória (ordem de geração); ao
+    passar de `max_reports`, os mais antigos são removidos.
+    """
+    
+    def __init__(self, directory: str = "data/reports/advanced", max_reports: int = 500):
+        self.directory = directory
+        self.max_reports = max_reports
+        self.index: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._load_index()
+        
+    def _path(self, report_id: str) -> str:
+        return os.path.join(self.directory, f"{report_id}.json")
+    
+    def _load_index(self):
+        if not os.path.isdir(self.directory):
+            return
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                entries.append({
+                    "id": data["id"],
+                    "type": data["type"],
+                    "title": data["title"],
+                    "generated_at": data["generated_at"]
+                })
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Relatório inválido em {name}: {e}")
+        for entry in sorted(entries, key=lambda e: e["generated_at"]):
+            self.index[entry["id"]] = entry
+            
+    def save(self, report: Report):
+        """Grava o relatório e aplica o limite"""
+        os.makedirs(self.directory, exist_ok=True)
+        data = report.to_dict()
+        tmp_path = self._path(report.id) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp_path, self._path(report.id))
+        
+        self.index[report.id] = {
+            "id": report.id,
+            "type": data["type"],
+            "title": data["title"],
+            "generated_at": data["generated_at"]
+        }
+        self.index.move_to_end(report.id)
+        
+        while len(self.index) > self.max_reports:
+            old_id, _ = self.index.popitem(last=False)
+            try:
+                os.remove(self._path(old_id))
+            except OSError:
+                pass
+                
+    def get(self, report_id: str) -> Optional[Dict[str, Any]]:
+        if report_id not in self.index:
+            return None
+        try:
+            with open(self._path(report_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+    def list(self) -> List[Dict[str, Any]]:
+        return list(self.index.values())
+    
+    def __len__(self) -> int:
+        return len(self.index)
 
 
 class InsightGenerator:
@@ -424,38 +611,132 @@ class AdvancedReportsEngine:
     Gera relatórios executivos e dashboards inteligentes
     """
     
-    def __init__(self):
+    CONTEXT_CACHE_SIZE = 64
+    
+    def __init__(self, reports_dir: str = "data/reports/advanced", max_reports: int = 500):
         self.metrics_calculator = MetricsCalculator()
         self.insight_generator = InsightGenerator()
         self.dashboard_builder = DashboardBuilder()
-        self.reports: Dict[str, Report] = {}
+        self.store = ReportStore(reports_dir, max_reports)
         self.scheduled_reports: List[Dict[str, Any]] = []
+        self._contexts: "OrderedDict[str, ReportContext]" = OrderedDict()
         
-    def generate_executive_summary(
+    def build_context(
         self,
         campaign_data: Dict[str, Any],
         date_range: Tuple[datetime, datetime],
         previous_data: Optional[Dict[str, Any]] = None
-    ) -> Report:
-        """Gera relatório executivo"""
-        report_id = hashlib.md5(f"exec_{datetime.now()}".encode()).hexdigest()[:12]
+    ) -> ReportContext:
+        """
+        Calcula uma vez tudo que os relatórios do período usam.
         
-        # Calcular métricas
-        current_metrics = self.metrics_calculator.calculate_metrics(campaign_data)
+        Totais do período atual, do anterior e as linhas diárias entram numa
+        única matriz e passam juntos por calculate_metrics_batch.
+        """
+        key = hashlib.md5(json.dumps(
+            [campaign_data, previous_data, [d.isoformat() for d in date_range]],
+            sort_keys=True, default=str
+        ).encode()).hexdigest()
+        cached = self._contexts.get(key)
+        if cached is not None:
+            self._contexts.move_to_end(key)
+            return cached
+        
+        frame = MetricsFrame.from_campaign_data(campaign_data)
+        rows = [frame.totals()]
+        if previous_data:
+            rows.append(MetricsFrame.from_campaign_data(previous_data).totals())
+        daily_offset = len(rows)
+        if frame.daily:
+            rows.extend(frame.values)
+            
+        batch = self.metrics_calculator.calculate_metrics_batch(np.vstack(rows))
         
-        # Comparar com período anterior
+        current_metrics = self._metrics_row(batch, 0)
         if previous_data:
-            previous_metrics = self.metrics_calculator.calculate_metrics(previous_data)
+            previous_metrics = self._metrics_row(batch, 1)
         else:
             previous_metrics = {k: v * 0.9 for k, v in current_metrics.items()}  # Simulação
-            
         comparison = self.metrics_calculator.compare_periods(current_metrics, previous_metrics)
         
-        # Gerar insights
-        insights = self.insight_generator.generate_performance_insights(current_metrics, comparison)
+        if frame.daily:
+            revenue = [round(v, 2) for v in batch["revenue"][daily_offset:].tolist()]
+            spend = [round(v, 2) for v in batch["spend"][daily_offset:].tolist()]
+            conversions = batch["conversions"][daily_offset:].tolist()
+            roi = [round(v, 2) for v in batch["roi"][daily_offset:].tolist()]
+            trend_series = [
+                {"date": date, "revenue": revenue[i], "spend": spend[i], "conversions": conversions[i]}
+                for i, date in enumerate(frame.dates)
+            ]
+            roi_trend = [{"date": date, "roi": roi[i]} for i, date in enumerate(frame.dates)]
+        else:
+            trend_series = self._generate_trend_data(date_range)
+            roi_trend = self._generate_roi_trend(date_range)
         
-        # Gerar recomendações
-        recommendations = self.insight_generator.generate_recommendations(current_metrics, comparison)
+        context = ReportContext(
+            date_range=date_range,
+            frame=frame,
+            current_metrics=current_metrics,
+            previous_metrics=previous_metrics,
+            comparison=comparison,
+            insights=self.insight_generator.generate_performance_insights(current_metrics, comparison),
+            recommendations=self.insight_generator.generate_recommendations(current_metrics, comparison),
+            trend_series=trend_series,
+            roi_trend=roi_trend
+        )
+        
+        self._contexts[key] = context
+        while len(self._contexts) > self.CONTEXT_CACHE_SIZE:
+            self._contexts.popitem(last=False)
+        return context
+    
+    @staticmethod
+    def _metrics_row(batch: Dict[str, np.ndarray], row: int) -> Dict[str, Any]:
+        """Extrai uma linha do lote como dict (mesmo arredondamento de calculate_metrics)"""
+        metrics = {}
+        for metric_id, values in batch.items():
+            value = float(values[row])
+            if metric_id in COUNT_FIELDS:
+                metrics[metric_id] = int(value) if value.is_integer() else value
+            else:
+                metrics[metric_id] = round(value, 2)
+        return metrics
+    
+    def generate_all_reports(
+        self,
+        campaign_data: Dict[str, Any],
+        date_range: Tuple[datetime, datetime],
+        previous_data: Optional[Dict[str, Any]] = None,
+        audience_data: Optional[Dict[str, Any]] = None,
+        creative_data: Optional[List[Dict[str, Any]]] = None
+    ) -> Dict[str, Report]:
+        """Gera os quatro relatórios de um cliente sobre o mesmo contexto"""
+        context = self.build_context(campaign_data, date_range, previous_data)
+        return {
+            ReportType.EXECUTIVE_SUMMARY.value: self.generate_executive_summary(
+                campaign_data, date_range, previous_data, context=context
+            ),
+            ReportType.ROI_ANALYSIS.value: self.generate_roi_analysis(campaign_data, date_range, context=context),
+            ReportType.AUDIENCE_INSIGHTS.value: self.generate_audience_insights(audience_data or {}, date_range),
+            ReportType.CREATIVE_PERFORMANCE.value: self.generate_creative_performance(creative_data or [], date_range)
+        }
+        
+    def generate_executive_summary(
+        self,
+        campaign_data: Dict[str, Any],
+        date_range: Tuple[datetime, datetime],
+        previous_data: Optional[Dict[str, Any]] = None,
+        context: Optional[ReportContext] = None
+    ) -> Report:
+        """Gera relatório executivo"""
+        report_id = hashlib.md5(f"exec_{datetime.now()}".encode()).hexdigest()[:12]
+        
+        # Métricas, comparação, insights e recomendações vêm do contexto compartilhado
+        context = context or self.build_context(campaign_data, date_range, previous_data)
+        current_metrics = context.current_metrics
+        comparison = context.comparison
+        insights = context.insights
+        recommendations = context.recommendations
         
         # Construir seções
         sections = [
@@ -484,7 +765,7 @@ class AdvancedReportsEngine:
                 id="trends",
                 title="Tendências",
                 type="chart",
-                data={"type": "line", "series": self._generate_trend_data(date_range)},
+                data={"type": "line", "series": context.trend_series},
                 insights=[],
                 order=3
             )
@@ -509,18 +790,20 @@ class AdvancedReportsEngine:
             recommendations=recommendations
         )
         
-        self.reports[report_id] = report
+        self.store.save(report)
         return report
     
     def generate_roi_analysis(
         self,
         campaign_data: Dict[str, Any],
-        date_range: Tuple[datetime, datetime]
+        date_range: Tuple[datetime, datetime],
+        context: Optional[ReportContext] = None
     ) -> Report:
         """Gera análise de ROI"""
         report_id = hashlib.md5(f"roi_{datetime.now()}".encode()).hexdigest()[:12]
         
-        metrics = self.metrics_calculator.calculate_metrics(campaign_data)
+        context = context or self.build_context(campaign_data, date_range)
+        metrics = context.current_metrics
         
         # Análise de ROI por canal (simulado)
         roi_by_channel = {
@@ -561,7 +844,7 @@ class AdvancedReportsEngine:
                 id="roi_trend",
                 title="Evolução do ROI",
                 type="chart",
-                data={"type": "line", "series": self._generate_roi_trend(date_range)},
+                data={"type": "line", "series": context.roi_trend},
                 insights=[],
                 order=3
             )
@@ -587,7 +870,7 @@ class AdvancedReportsEngine:
             ]
         )
         
-        self.reports[report_id] = report
+        self.store.save(report)
         return report
     
     def generate_audience_insights(
@@ -667,7 +950,7 @@ class AdvancedReportsEngine:
             ]
         )
         
-        self.reports[report_id] = report
+        self.store.save(report)
         return report
     
     def generate_creative_performance(
@@ -739,38 +1022,32 @@ class AdvancedReportsEngine:
             ]
         )
         
-        self.reports[report_id] = report
+        self.store.save(report)
         return report
     
-    def _generate_trend_data(self, date_range: Tuple[datetime, datetime]) -> List[Dict[str, Any]]:
-        """Gera dados de tendência"""
+    def _date_axis(self, date_range: Tuple[datetime, datetime]) -> Tuple[np.ndarray, List[str]]:
         days = (date_range[1] - date_range[0]).days
-        data = []
-        
-        for i in range(days + 1):
-            date = date_range[0] + timedelta(days=i)
-            data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "revenue": 1000 + (i * 50) + (i % 3 * 100),
-                "spend": 300 + (i * 15),
-                "conversions": 10 + (i % 5)
-            })
-            
-        return data
+        i = np.arange(days + 1)
+        dates = [(date_range[0] + timedelta(days=int(d))).strftime("%Y-%m-%d") for d in i]
+        return i, dates
+    
+    def _generate_trend_data(self, date_range: Tuple[datetime, datetime]) -> List[Dict[str, Any]]:
+        """Gera dados de tendência (simulados, quando não há dados diários)"""
+        i, dates = self._date_axis(date_range)
+        revenue = (1000 + i * 50 + (i % 3) * 100).tolist()
+        spend = (300 + i * 15).tolist()
+        conversions = (10 + i % 5).tolist()
+        
+        return [
+            {"date": date, "revenue": revenue[n], "spend": spend[n], "conversions": conversions[n]}
+            for n, date in enumerate(dates)
+        ]
     
     def _generate_roi_trend(self, date_range: Tuple[datetime, datetime]) -> List[Dict[str, Any]]:
-        """Gera tendência de ROI"""
-        days = (date_range[1] - date_range[0]).days
-        data = []
-        
-        for i in range(days + 1):
-            date = date_range[0] + timedelta(days=i)
-            data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "roi": 80 + (i * 2) + (i % 4 * 5)
-            })
-            
-        return data
+        """Gera tendência de ROI (simulada, quando não há dados diários)"""
+        i, dates = self._date_axis(date_range)
+        roi = (80 + i * 2 + (i % 4) * 5).tolist()
+        return [{"date": date, "roi": roi[n]} for n, date in enumerate(dates)]
     
     def get_dashboard(
         self,
@@ -778,36 +1055,24 @@ class AdvancedReportsEngine:
         date_range: Tuple[datetime, datetime]
     ) -> Dict[str, Any]:
         """Obtém dashboard executivo"""
-        current_metrics = self.metrics_calculator.calculate_metrics(campaign_data)
-        previous_metrics = {k: v * 0.9 for k, v in current_metrics.items()}
-        comparison = self.metrics_calculator.compare_periods(current_metrics, previous_metrics)
-        time_series = self._generate_trend_data(date_range)
+        context = self.build_context(campaign_data, date_range)
         
         return self.dashboard_builder.build_executive_dashboard(
-            current_metrics, comparison, time_series
+            context.current_metrics, context.comparison, context.trend_series
         )
     
     def get_report(self, report_id: str) -> Optional[Dict[str, Any]]:
         """Obtém relatório por ID"""
-        report = self.reports.get(report_id)
-        return report.to_dict() if report else None
+        return self.store.get(report_id)
     
     def list_reports(self) -> List[Dict[str, Any]]:
         """Lista todos os relatórios"""
-        return [
-            {
-                "id": r.id,
-                "type": r.type.value,
-                "title": r.title,
-                "generated_at": r.generated_at.isoformat()
-            }
-            for r in self.reports.values()
-        ]
+        return self.store.list()
     
     def get_status(self) -> Dict[str, Any]:
         """Retorna status do motor"""
         return {
-            "total_reports": len(self.reports),
+            "total_reports": len(self.store),
             "scheduled_reports": len(self.scheduled_reports),
             "available_metrics": len(self.metrics_calculator.metrics),
             "report_types": [t.value for t in ReportType]
@@ -10,13 +10,11 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 
+try:
+    from services.agency_report_batch import get_agency_report_batch
+except ImportError:
+    from agency_report_batch import get_agency_report_batch
 
-class AgencyGhostMode:
-    """
-    Modo Agência Fantasma
-    Sistema completo que opera como agência milionária em piloto automático
-    """
-    
 
 def handle_errors(func):
     """Decorador para tratamento automático de erros"""
@@ -30,6 +28,12 @@ def handle_errors(func):
     return wrapper
 
 
+class AgencyGhostMode:
+    """
+    Modo Agência Fantasma
+    Sistema completo que opera como agência milionária em piloto automático
+    """
+    
     def __init__(self):
         self.autopilot_enabled = False
         self.managed_accounts = []
@@ -44,7 +48,8 @@ def handle_errors(func):
             "auto_respond_to_leads": True,
             "budget_safety_limit": 10000.00,
             "min_roas_threshold": 1.5,
-            "max_cpa_threshold": 100.00
+            "max_cpa_threshold": 100.00,
+            "report_agency_id": None  # Agência (AgencyMode) dos relatórios automáticos
         }
     
     def enable_autopilot(self, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -596,6 +601,22 @@ def handle_errors(func):
         
         return dashboard
     
+    def generate_client_reports(self, agency_id: str, report_type: str = "monthly") -> Dict[str, Any]:
+        """
+        Gera os relatórios white-label de todos os clientes da agência
+        
+        Roda em lote fora do request (AgencyReportBatch); acompanhe pelo
+        batch_id e baixe os arquivos quando o status for "done".
+        
+        Args:
+            agency_id: ID da agência no AgencyMode
+            report_type: Tipo do relatório (monthly, weekly...)
+        
+        Returns:
+            Dict com batch_id e status (ou error)
+        """
+        return get_agency_report_batch().submit(agency_id, report_type)
+    
     def _optimize_campaigns(self) -> Dict[str, Any]:
         """Otimiza campanhas automaticamente"""
         return {
@@ -650,6 +671,15 @@ def handle_errors(func):
     
     def _send_reports(self) -> Dict[str, Any]:
         """Envia relatórios automaticamente"""
+        agency_id = self.autopilot_config.get("report_agency_id")
+        if agency_id:
+            batch = self.generate_client_reports(agency_id)
+            return {
+                "action": "send_reports",
+                "reports_sent": 0,
+                "batch": batch,
+                "report_types": ["White-Label Monthly"]
+            }
         return {
             "action": "send_reports",
             "reports_sent": random.randint(3, 10),
@@ -2,16 +2,54 @@
 AGENCY MODE - Modo Agência Multi-Conta
 Gestão de múltiplos clientes com permissões e dashboards isolados
 Nexora Prime V2 - Expansão Unicórnio
+
+Agências, clientes, usuários e atribuições ficam em tabelas indexadas
+(compartilhadas entre os workers). Totais por agência são mantidos de
+forma incremental a cada escrita, e o acesso de cada usuário (clientes
+visíveis + bitmap de permissões por cliente) fica em cache read-through,
+validado a cada leitura pelas versões de acesso do usuário e da agência.
 """
 
 import os
 import json
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, get_db_connection_with_dict, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, get_db_connection_with_dict, sql_param, is_postgres
+
+
+ACCESS_CACHE_SIZE = 4096
+
+# Versões que validam o cache de acesso (mudam a cada atribuição / novo cliente)
+ACCESS_VERSIONS_SELECT = """
+    SELECT u.agency_id, u.role, u.access_version, COALESCE(t.access_version, 0) AS agency_version
+    FROM agency_users u LEFT JOIN agency_totals t ON t.agency_id = u.agency_id
+    WHERE u.id = ?
+"""
+
+METRIC_FIELDS = ("total_spend", "total_revenue", "total_campaigns", "active_campaigns")
+
+CLIENT_SELECT = """
+    SELECT id, agency_id, name, company, email, phone, niche, status, ad_accounts, settings,
+           total_spend, total_revenue, total_campaigns, active_campaigns, created_at
+    FROM agency_clients
+"""
+
+# Reserva de vaga no plano: uma instrução, atômica entre processos
+# (e invalida o acesso de owners/admins em todos os workers)
+CLIENT_SLOT_UPDATE = """
+    UPDATE agency_totals SET total_clients = total_clients + 1, access_version = access_version + 1
+    WHERE agency_id = ? AND total_clients < ?
+"""
+
 class UserRole(Enum):
     OWNER = "owner"
     ADMIN = "admin"
@@ -19,6 +57,9 @@ class UserRole(Enum):
     ANALYST = "analyst"
     VIEWER = "viewer"
 
+# Roles com acesso a todos os clientes da agência
+AGENCY_WIDE_ROLES = (UserRole.OWNER.value, UserRole.ADMIN.value)
+
 class AgencyMode:
     """Sistema de gestão multi-conta para agências."""
     
@@ -26,12 +67,6 @@ class AgencyMode:
         self.name = "Agency Mode"
         self.version = "2.0.0"
         
-        # Estrutura de dados
-        self.agencies = {}
-        self.clients = {}
-        self.users = {}
-        self.permissions = {}
-        
         # Permissões por role
         self.role_permissions = {
             UserRole.OWNER: {
@@ -109,11 +144,110 @@ class AgencyMode:
                 "report_footer"
             ]
         }
+        
+        # Bitmap de permissões: um bit por permissão, uma máscara por role
+        self.permission_bits = {
+            permission: 1 << index
+            for index, permission in enumerate(self.role_permissions[UserRole.OWNER])
+        }
+        self.role_masks = {
+            role.value: self._permission_mask(permissions)
+            for role, permissions in self.role_permissions.items()
+        }
+        
+        # Cache de acesso por usuário: {user_id: ((versão do usuário, versão da agência),
+        #                                         {agency_id, role, role_mask, clients})}
+        self._access_cache: Dict[str, Any] = {}
+        self._access_cache_lock = threading.Lock()
+        
+        self._init_tables()
+    
+    def _init_tables(self):
+        """Cria as tabelas de tenants (agências, clientes, usuários, atribuições, totais)."""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_agencies (
+                    id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    owner_email TEXT,
+                    plan TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    settings TEXT NOT NULL,
+                    white_label TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_clients (
+                    id TEXT PRIMARY KEY,
+                    agency_id TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    company TEXT,
+                    email TEXT,
+                    phone TEXT,
+                    niche TEXT,
+                    status TEXT NOT NULL,
+                    ad_accounts TEXT,
+                    settings TEXT,
+                    total_spend REAL NOT NULL DEFAULT 0,
+                    total_revenue REAL NOT NULL DEFAULT 0,
+                    total_campaigns INTEGER NOT NULL DEFAULT 0,
+                    active_campaigns INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_agency_clients_agency ON agency_clients (agency_id, total_spend)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_users (
+                    id TEXT PRIMARY KEY,
+                    agency_id TEXT,
+                    email TEXT,
+                    name TEXT,
+                    role TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    last_login TEXT,
+                    access_version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_agency_users_agency ON agency_users (agency_id)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_user_clients (
+                    user_id TEXT NOT NULL,
+                    client_id TEXT NOT NULL,
+                    permissions TEXT,
+                    PRIMARY KEY (user_id, client_id)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_totals (
+                    agency_id TEXT PRIMARY KEY,
+                    total_clients INTEGER NOT NULL DEFAULT 0,
+                    total_users INTEGER NOT NULL DEFAULT 0,
+                    total_spend REAL NOT NULL DEFAULT 0,
+                    total_revenue REAL NOT NULL DEFAULT 0,
+                    total_campaigns INTEGER NOT NULL DEFAULT 0,
+                    active_campaigns INTEGER NOT NULL DEFAULT 0,
+                    access_version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[AGENCY MODE] ❌ Erro ao criar tabelas: {e}")
     
     def create_agency(self, agency_data: Dict) -> Dict[str, Any]:
         """Cria uma nova agência."""
         
         agency_id = f"agency_{secrets.token_hex(8)}"
+        plan = agency_data.get("plan", "starter")
         
         agency = {
             "id": agency_id,
@@ -121,23 +255,32 @@ class AgencyMode:
             "owner_email": agency_data.get("owner_email"),
             "created_at": datetime.now().isoformat(),
             "status": "active",
-            "plan": agency_data.get("plan", "starter"),
+            "plan": plan,
             "settings": {
-                "max_clients": self._get_plan_limits(agency_data.get("plan", "starter"))["max_clients"],
-                "max_users": self._get_plan_limits(agency_data.get("plan", "starter"))["max_users"],
-                "white_label_enabled": agency_data.get("plan", "starter") in ["professional", "enterprise"]
+                "max_clients": self._get_plan_limits(plan)["max_clients"],
+                "max_users": self._get_plan_limits(plan)["max_users"],
+                "white_label_enabled": plan in ["professional", "enterprise"]
             },
             "white_label": {
                 "logo_url": agency_data.get("logo_url"),
                 "primary_color": agency_data.get("primary_color", "#6366F1"),
                 "secondary_color": agency_data.get("secondary_color", "#4F46E5"),
                 "company_name": agency_data.get("name", "Nova Agência")
-            },
-            "clients": [],
-            "users": []
+            }
         }
         
-        self.agencies[agency_id] = agency
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO agency_agencies (id, name, owner_email, plan, status, settings, white_label, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """), (agency_id, agency["name"], agency["owner_email"], plan, agency["status"],
+                   json.dumps(agency["settings"]), json.dumps(agency["white_label"]), agency["created_at"]))
+            cursor.execute(sql_param("INSERT INTO agency_totals (agency_id) VALUES (?)"), (agency_id,))
+            conn.commit()
+        finally:
+            conn.close()
         
         # Criar usuário owner
         owner_user = self.create_user({
@@ -157,15 +300,10 @@ class AgencyMode:
     def create_client(self, agency_id: str, client_data: Dict) -> Dict[str, Any]:
         """Cria um novo cliente para a agência."""
         
-        if agency_id not in self.agencies:
+        agency = self._get_agency(agency_id)
+        if agency is None:
             return {"error": "Agência não encontrada"}
         
-        agency = self.agencies[agency_id]
-        
-        # Verificar limite de clientes
-        if len(agency["clients"]) >= agency["settings"]["max_clients"]:
-            return {"error": f"Limite de {agency['settings']['max_clients']} clientes atingido"}
-        
         client_id = f"client_{secrets.token_hex(8)}"
         
         client = {
@@ -184,16 +322,27 @@ class AgencyMode:
                 "currency": client_data.get("currency", "BRL"),
                 "notification_email": client_data.get("email")
             },
-            "metrics": {
-                "total_spend": 0,
-                "total_revenue": 0,
-                "total_campaigns": 0,
-                "active_campaigns": 0
-            }
+            "metrics": {field: 0 for field in METRIC_FIELDS}
         }
         
-        self.clients[client_id] = client
-        agency["clients"].append(client_id)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            # Verificar limite de clientes (reserva a vaga no mesmo UPDATE)
+            cursor.execute(sql_param(CLIENT_SLOT_UPDATE), (agency_id, agency["settings"]["max_clients"]))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return {"error": f"Limite de {agency['settings']['max_clients']} clientes atingido"}
+            cursor.execute(sql_param("""
+                INSERT INTO agency_clients
+                    (id, agency_id, name, company, email, phone, niche, status, ad_accounts, settings, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """), (client_id, agency_id, client["name"], client["company"], client["email"], client["phone"],
+                   client["niche"], client["status"], json.dumps(client["ad_accounts"]),
+                   json.dumps(client["settings"]), client["created_at"]))
+            conn.commit()
+        finally:
+            conn.close()
         
         return {
             "client_id": client_id,
@@ -214,17 +363,33 @@ class AgencyMode:
             "role": user_data.get("role", UserRole.VIEWER.value),
             "created_at": datetime.now().isoformat(),
             "status": "active",
-            "assigned_clients": user_data.get("assigned_clients", []),
+            "assigned_clients": list(user_data.get("assigned_clients", [])),
             "last_login": None,
             "permissions": self._get_role_permissions(user_data.get("role", UserRole.VIEWER.value))
         }
         
-        self.users[user_id] = user
-        
-        # Adicionar à agência
-        agency_id = user_data.get("agency_id")
-        if agency_id and agency_id in self.agencies:
-            self.agencies[agency_id]["users"].append(user_id)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO agency_users (id, agency_id, email, name, role, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """), (user_id, user["agency_id"], user["email"], user["name"], user["role"],
+                   user["status"], user["created_at"]))
+            if user["assigned_clients"]:
+                cursor.executemany(sql_param("""
+                    INSERT INTO agency_user_clients (user_id, client_id) VALUES (?, ?)
+                    ON CONFLICT (user_id, client_id) DO NOTHING
+                """), [(user_id, client_id) for client_id in user["assigned_clients"]])
+            
+            # Adicionar à agência
+            if user["agency_id"]:
+                cursor.execute(sql_param(
+                    "UPDATE agency_totals SET total_users = total_users + 1 WHERE agency_id = ?"
+                ), (user["agency_id"],))
+            conn.commit()
+        finally:
+            conn.close()
         
         return {
             "user_id": user_id,
@@ -240,21 +405,33 @@ class AgencyMode:
     ) -> Dict[str, Any]:
         """Atribui usuário a um cliente específico."""
         
-        if user_id not in self.users:
+        if self._access(user_id) is None:
             return {"error": "Usuário não encontrado"}
         
-        if client_id not in self.clients:
+        if self._get_client(client_id) is None:
             return {"error": "Cliente não encontrado"}
         
-        user = self.users[user_id]
-        
-        if client_id not in user["assigned_clients"]:
-            user["assigned_clients"].append(client_id)
-        
         # Salvar permissões específicas se fornecidas
-        if permissions:
-            permission_key = f"{user_id}_{client_id}"
-            self.permissions[permission_key] = permissions
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if permissions:
+                cursor.execute(sql_param("""
+                    INSERT INTO agency_user_clients (user_id, client_id, permissions) VALUES (?, ?, ?)
+                    ON CONFLICT (user_id, client_id) DO UPDATE SET permissions = excluded.permissions
+                """), (user_id, client_id, json.dumps(permissions)))
+            else:
+                cursor.execute(sql_param("""
+                    INSERT INTO agency_user_clients (user_id, client_id) VALUES (?, ?)
+                    ON CONFLICT (user_id, client_id) DO NOTHING
+                """), (user_id, client_id))
+            # Outros workers recarregam o acesso na próxima leitura
+            cursor.execute(sql_param(
+                "UPDATE agency_users SET access_version = access_version + 1 WHERE id = ?"
+            ), (user_id,))
+            conn.commit()
+        finally:
+            conn.close()
         
         return {
             "user_id": user_id,
@@ -265,11 +442,10 @@ class AgencyMode:
     def get_client_dashboard(self, client_id: str, user_id: str = None) -> Dict[str, Any]:
         """Obtém dashboard isolado de um cliente."""
         
-        if client_id not in self.clients:
+        client = self._get_client(client_id)
+        if client is None:
             return {"error": "Cliente não encontrado"}
         
-        client = self.clients[client_id]
-        
         # Verificar permissão se user_id fornecido
         if user_id:
             if not self._check_client_access(user_id, client_id):
@@ -302,58 +478,56 @@ class AgencyMode:
         
         return dashboard
     
+    def list_clients(self, agency_id: str = None) -> List[Dict]:
+        """Lista clientes (de uma agência ou todos)."""
+        where = " WHERE agency_id = ?" if agency_id else ""
+        return self._query_clients(where + " ORDER BY created_at", (agency_id,) if agency_id else ())
+    
     def get_agency_overview(self, agency_id: str) -> Dict[str, Any]:
         """Obtém visão geral da agência com todos os clientes."""
         
-        if agency_id not in self.agencies:
+        agency = self._get_agency(agency_id)
+        if agency is None:
             return {"error": "Agência não encontrada"}
         
-        agency = self.agencies[agency_id]
-        
-        # Agregar métricas de todos os clientes
-        total_spend = 0
-        total_revenue = 0
-        total_campaigns = 0
-        active_campaigns = 0
-        
-        client_summaries = []
-        for client_id in agency["clients"]:
-            if client_id in self.clients:
-                client = self.clients[client_id]
-                total_spend += client["metrics"]["total_spend"]
-                total_revenue += client["metrics"]["total_revenue"]
-                total_campaigns += client["metrics"]["total_campaigns"]
-                active_campaigns += client["metrics"]["active_campaigns"]
-                
-                client_summaries.append({
-                    "id": client_id,
-                    "name": client["name"],
-                    "spend": client["metrics"]["total_spend"],
-                    "revenue": client["metrics"]["total_revenue"],
-                    "roas": round(
-                        client["metrics"]["total_revenue"] / client["metrics"]["total_spend"], 2
-                    ) if client["metrics"]["total_spend"] > 0 else 0,
-                    "status": client["status"]
-                })
+        # Métricas agregadas mantidas a cada escrita (sem somar os clientes)
+        totals = self._get_totals(agency_id)
+        total_spend = totals["total_spend"]
+        total_revenue = totals["total_revenue"]
+        
+        # Resumo por cliente já ordenado pelo índice (agency_id, total_spend)
+        client_summaries = [
+            {
+                "id": client["id"],
+                "name": client["name"],
+                "spend": client["metrics"]["total_spend"],
+                "revenue": client["metrics"]["total_revenue"],
+                "roas": round(
+                    client["metrics"]["total_revenue"] / client["metrics"]["total_spend"], 2
+                ) if client["metrics"]["total_spend"] > 0 else 0,
+                "status": client["status"]
+            }
+            for client in self._query_clients(" WHERE agency_id = ? ORDER BY total_spend DESC", (agency_id,))
+        ]
         
         return {
             "agency_id": agency_id,
             "agency_name": agency["name"],
             "timestamp": datetime.now().isoformat(),
             "summary": {
-                "total_clients": len(agency["clients"]),
-                "total_users": len(agency["users"]),
+                "total_clients": totals["total_clients"],
+                "total_users": totals["total_users"],
                 "total_spend": round(total_spend, 2),
                 "total_revenue": round(total_revenue, 2),
                 "overall_roas": round(total_revenue / total_spend, 2) if total_spend > 0 else 0,
-                "total_campaigns": total_campaigns,
-                "active_campaigns": active_campaigns
+                "total_campaigns": totals["total_campaigns"],
+                "active_campaigns": totals["active_campaigns"]
             },
-            "clients": sorted(client_summaries, key=lambda x: x["spend"], reverse=True),
+            "clients": client_summaries,
             "plan_usage": {
-                "clients_used": len(agency["clients"]),
+                "clients_used": totals["total_clients"],
                 "clients_limit": agency["settings"]["max_clients"],
-                "users_used": len(agency["users"]),
+                "users_used": totals["total_users"],
                 "users_limit": agency["settings"]["max_users"]
             }
         }
@@ -367,23 +541,47 @@ class AgencyMode:
     ) -> Dict[str, Any]:
         """Gera relatório white-label para cliente."""
         
-        if agency_id not in self.agencies:
+        agency = self._get_agency(agency_id)
+        if agency is None:
             return {"error": "Agência não encontrada"}
         
-        if client_id not in self.clients:
+        client = self._get_client(client_id)
+        if client is None:
             return {"error": "Cliente não encontrado"}
         
-        agency = self.agencies[agency_id]
-        client = self.clients[client_id]
-        
         # Verificar se white-label está habilitado
         if not agency["settings"]["white_label_enabled"]:
             return {"error": "White-label não disponível no seu plano"}
         
+        period = date_range or {
+            "start": (datetime.now() - timedelta(days=30)).isoformat(),
+            "end": datetime.now().isoformat()
+        }
+        
+        return self.build_report(agency, client, report_type, period)
+    
+    @staticmethod
+    def build_report(
+        agency: Dict,
+        client: Dict,
+        report_type: str,
+        period: Dict,
+        market: Dict = None
+    ) -> Dict[str, Any]:
+        """
+        Monta o relatório white-label a partir dos registros já carregados.
+        
+        Não acessa o banco, então roda em processo filho (AgencyReportBatch).
+        `market` = benchmark e tendências do nicho, calculados uma vez por lote.
+        """
+        
         # Configurações de branding
         branding = agency["white_label"]
+        roas = round(
+            client["metrics"]["total_revenue"] / client["metrics"]["total_spend"], 2
+        ) if client["metrics"]["total_spend"] > 0 else 0
         
-        # Gerar relatório
+        # Gerar relatório (métricas já agregadas no registro do cliente)
         report = {
             "report_id": f"report_{secrets.token_hex(8)}",
             "generated_at": datetime.now().isoformat(),
@@ -398,25 +596,38 @@ class AgencyMode:
                 "name": client["name"],
                 "company": client["company"]
             },
-            "period": date_range or {
-                "start": (datetime.now() - timedelta(days=30)).isoformat(),
-                "end": datetime.now().isoformat()
-            },
-            "executive_summary": self._generate_executive_summary(client),
+            "period": period,
+            "executive_summary": AgencyMode._generate_executive_summary(client),
             "performance_metrics": {
                 "spend": client["metrics"]["total_spend"],
                 "revenue": client["metrics"]["total_revenue"],
-                "roas": round(
-                    client["metrics"]["total_revenue"] / client["metrics"]["total_spend"], 2
-                ) if client["metrics"]["total_spend"] > 0 else 0,
+                "roas": roas,
                 "campaigns": client["metrics"]["total_campaigns"],
                 "conversions": 0  # Placeholder
             },
-            "campaign_breakdown": self._get_campaign_breakdown(client_id),
-            "recommendations": self._generate_report_recommendations(client),
-            "next_steps": self._generate_next_steps(client)
+            "campaign_breakdown": AgencyMode._get_campaign_breakdown(client["id"]),
+            "recommendations": AgencyMode._generate_report_recommendations(client),
+            "next_steps": AgencyMode._generate_next_steps(client)
         }
         
+        if market:
+            market_roas = market.get("benchmarks", {}).get("roas", {})
+            report["market_benchmark"] = {
+                "niche": market.get("niche"),
+                "benchmarks": market.get("benchmarks", {}),
+                "trends": market.get("trends", {}),
+                "roas_vs_market": {
+                    "client": roas,
+                    "market_avg": market_roas.get("avg"),
+                    "market_top": market_roas.get("top"),
+                    "position": (
+                        "acima do topo do mercado" if market_roas.get("top") and roas >= market_roas["top"]
+                        else "acima da média" if market_roas.get("avg") and roas >= market_roas["avg"]
+                        else "abaixo da média"
+                    )
+                }
+            }
+        
         return report
     
     def check_permission(
@@ -427,62 +638,86 @@ class AgencyMode:
     ) -> bool:
         """Verifica se usuário tem determinada permissão."""
         
-        if user_id not in self.users:
+        access = self._access(user_id)
+        if access is None:
             return False
         
-        user = self.users[user_id]
-        
-        # Verificar permissão base do role
-        base_permission = user["permissions"].get(permission, False)
-        
-        # Se tem cliente específico, verificar acesso ao cliente
-        if client_id and not self._check_client_access(user_id, client_id):
+        bit = self.permission_bits.get(permission)
+        if bit is None:
             return False
         
-        # Verificar permissões específicas do cliente
-        if client_id:
-            permission_key = f"{user_id}_{client_id}"
-            if permission_key in self.permissions:
-                specific_permission = self.permissions[permission_key].get(permission)
-                if specific_permission is not None:
-                    return specific_permission
+        # Sem cliente: permissão base do role
+        if not client_id:
+            return bool(access["role_mask"] & bit)
         
-        return base_permission
+        # Com cliente: máscara do cliente (role + permissões específicas); sem acesso = None
+        mask = access["clients"].get(client_id)
+        return mask is not None and bool(mask & bit)
     
     def get_user_accessible_clients(self, user_id: str) -> List[Dict]:
         """Obtém lista de clientes acessíveis por um usuário."""
         
-        if user_id not in self.users:
+        access = self._access(user_id)
+        if access is None or not access["clients"]:
             return []
         
-        user = self.users[user_id]
-        
         # Owner e Admin têm acesso a todos os clientes da agência
-        if user["role"] in [UserRole.OWNER.value, UserRole.ADMIN.value]:
-            agency_id = user["agency_id"]
-            if agency_id in self.agencies:
-                return [
-                    self.clients[cid] for cid in self.agencies[agency_id]["clients"]
-                    if cid in self.clients
-                ]
+        if access["role"] in AGENCY_WIDE_ROLES:
+            return self._query_clients(" WHERE agency_id = ? ORDER BY created_at", (access["agency_id"],))
         
         # Outros roles têm acesso apenas aos clientes atribuídos
-        return [
-            self.clients[cid] for cid in user["assigned_clients"]
-            if cid in self.clients
-        ]
+        client_ids = list(access["clients"])
+        placeholders = ", ".join("?" for _ in client_ids)
+        return self._query_clients(f" WHERE id IN ({placeholders}) ORDER BY created_at", tuple(client_ids))
     
-    def update_client_metrics(self, client_id: str, metrics: Dict) -> Dict[str, Any]:
-        """Atualiza métricas de um cliente."""
+    def update_client_metrics(self, client_id: str, metrics: Dict, increment: bool = False) -> Dict[str, Any]:
+        """
+        Atualiza métricas de um cliente.
         
-        if client_id not in self.clients:
-            return {"error": "Cliente não encontrado"}
+        Com increment=True os valores são somados aos atuais (ex.: gasto do
+        dia). A diferença é aplicada aos totais da agência na mesma transação.
+        """
         
-        client = self.clients[client_id]
+        fields = [key for key in METRIC_FIELDS if key in metrics]
         
-        for key, value in metrics.items():
-            if key in client["metrics"]:
-                client["metrics"][key] = value
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            if is_postgres():
+                cursor.execute(sql_param(CLIENT_SELECT + " WHERE id = ? FOR UPDATE"), (client_id,))
+            else:
+                conn.isolation_level = None
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(sql_param(CLIENT_SELECT + " WHERE id = ?"), (client_id,))
+            row = cursor.fetchone()
+            if row is None:
+                self._rollback(conn)
+                return {"error": "Cliente não encontrado"}
+            
+            client = self._client_from_row(row)
+            deltas = {}
+            for key in fields:
+                new_value = client["metrics"][key] + metrics[key] if increment else metrics[key]
+                deltas[key] = new_value - client["metrics"][key]
+                client["metrics"][key] = new_value
+            
+            if fields:
+                assignments = ", ".join(f"{key} = ?" for key in fields)
+                cursor.execute(sql_param(f"UPDATE agency_clients SET {assignments}, updated_at = ? WHERE id = ?"),
+                               tuple(client["metrics"][key] for key in fields) + (datetime.now().isoformat(), client_id))
+                increments = ", ".join(f"{key} = {key} + ?" for key in fields)
+                cursor.execute(sql_param(f"UPDATE agency_totals SET {increments} WHERE agency_id = ?"),
+                               tuple(deltas[key] for key in fields) + (client["agency_id"],))
+            
+            if is_postgres():
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+        except Exception:
+            self._rollback(conn)
+            raise
+        finally:
+            conn.close()
         
         return {
             "client_id": client_id,
@@ -490,6 +725,145 @@ class AgencyMode:
             "message": "Métricas atualizadas com sucesso"
         }
     
+    # ===== ARMAZENAMENTO =====
+    
+    @staticmethod
+    def _rollback(conn):
+        if is_postgres():
+            conn.rollback()
+        elif conn.in_transaction:
+            conn.execute("ROLLBACK")
+    
+    def _fetch(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+    
+    def _get_agency(self, agency_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._fetch("""
+            SELECT id, name, owner_email, plan, status, settings, white_label, created_at
+            FROM agency_agencies WHERE id = ?
+        """, (agency_id,))
+        if not rows:
+            return None
+        agency = rows[0]
+        agency["settings"] = json.loads(agency["settings"])
+        agency["white_label"] = json.loads(agency["white_label"])
+        return agency
+    
+    def _get_totals(self, agency_id: str) -> Dict[str, Any]:
+        rows = self._fetch("""
+            SELECT total_clients, total_users, total_spend, total_revenue, total_campaigns, active_campaigns
+            FROM agency_totals WHERE agency_id = ?
+        """, (agency_id,))
+        return rows[0] if rows else {
+            "total_clients": 0, "total_users": 0, **{field: 0 for field in METRIC_FIELDS}
+        }
+    
+    @staticmethod
+    def _client_from_row(row: Dict) -> Dict[str, Any]:
+        client = {key: row[key] for key in (
+            "id", "agency_id", "name", "company", "email", "phone", "niche", "created_at", "status"
+        )}
+        client["ad_accounts"] = json.loads(row["ad_accounts"]) if row["ad_accounts"] else []
+        client["settings"] = json.loads(row["settings"]) if row["settings"] else {}
+        client["metrics"] = {field: row[field] for field in METRIC_FIELDS}
+        return client
+    
+    def _query_clients(self, clause: str, params: tuple = ()) -> List[Dict]:
+        return [self._client_from_row(row) for row in self._fetch(CLIENT_SELECT + clause, params)]
+    
+    def _get_client(self, client_id: str) -> Optional[Dict[str, Any]]:
+        clients = self._query_clients(" WHERE id = ?", (client_id,))
+        return clients[0] if clients else None
+    
+    def get_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Usuário com role, permissões e clientes atribuídos."""
+        rows = self._fetch("""
+            SELECT id, agency_id, email, name, role, created_at, status, last_login
+            FROM agency_users WHERE id = ?
+        """, (user_id,))
+        if not rows:
+            return None
+        user = rows[0]
+        user["assigned_clients"] = [
+            row["client_id"] for row in self._fetch(
+                "SELECT client_id FROM agency_user_clients WHERE user_id = ?", (user_id,)
+            )
+        ]
+        user["permissions"] = self._get_role_permissions(user["role"])
+        return user
+    
+    # ===== ACESSO (conjuntos de clientes + bitmap de permissões) =====
+    
+    def _permission_mask(self, permissions: Dict) -> int:
+        mask = 0
+        for permission, granted in permissions.items():
+            if granted and permission in self.permission_bits:
+                mask |= self.permission_bits[permission]
+        return mask
+    
+    def _client_mask(self, role_mask: int, specific: Optional[Dict]) -> int:
+        """Máscara do role com as permissões específicas do cliente aplicadas."""
+        if not specific:
+            return role_mask
+        for permission, granted in specific.items():
+            bit = self.permission_bits.get(permission)
+            if bit is None or granted is None:
+                continue
+            role_mask = role_mask | bit if granted else role_mask & ~bit
+        return role_mask
+    
+    def _access(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Acesso pré-calculado do usuário, com cache read-through validado pelas
+        versões no banco (o mesmo esquema do SlidingWindowLimiter):
+        {agency_id, role, role_mask, clients: {client_id: máscara}}
+        """
+        rows = self._fetch(ACCESS_VERSIONS_SELECT, (user_id,))
+        if not rows:
+            return None
+        agency_id, role = rows[0]["agency_id"], rows[0]["role"]
+        version = (rows[0]["access_version"], rows[0]["agency_version"])
+        with self._access_cache_lock:
+            cached = self._access_cache.get(user_id)
+            if cached and cached[0] == version:
+                return cached[1]
+        
+        role_mask = self.role_masks.get(role, self.role_masks[UserRole.VIEWER.value])
+        
+        assignments = {
+            row["client_id"]: json.loads(row["permissions"]) if row["permissions"] else None
+            for row in self._fetch(
+                "SELECT client_id, permissions FROM agency_user_clients WHERE user_id = ?", (user_id,)
+            )
+        }
+        if role in AGENCY_WIDE_ROLES:
+            client_ids = [row["id"] for row in self._fetch(
+                "SELECT id FROM agency_clients WHERE agency_id = ?", (agency_id,)
+            )]
+        else:
+            client_ids = list(assignments)
+        
+        access = {
+            "agency_id": agency_id,
+            "role": role,
+            "role_mask": role_mask,
+            "clients": {
+                client_id: self._client_mask(role_mask, assignments.get(client_id))
+                for client_id in client_ids
+            }
+        }
+        with self._access_cache_lock:
+            if user_id not in self._access_cache and len(self._access_cache) >= ACCESS_CACHE_SIZE:
+                self._access_cache.pop(next(iter(self._access_cache)))
+            self._access_cache[user_id] = (version, access)
+        return access
+    
     def _get_plan_limits(self, plan: str) -> Dict:
         """Retorna limites do plano."""
         limits = {
@@ -510,16 +884,8 @@ class AgencyMode:
     
     def _check_client_access(self, user_id: str, client_id: str) -> bool:
         """Verifica se usuário tem acesso a um cliente."""
-        if user_id not in self.users:
-            return False
-        
-        user = self.users[user_id]
-        
-        # Owner e Admin têm acesso a todos
-        if user["role"] in [UserRole.OWNER.value, UserRole.ADMIN.value]:
-            return True
-        
-        return client_id in user["assigned_clients"]
+        access = self._access(user_id)
+        return access is not None and client_id in access["clients"]
     
     def _get_performance_data(self, client_id: str, period: str) -> Dict:
         """Obtém dados de performance de um período."""
@@ -556,7 +922,8 @@ class AgencyMode:
             }
         ]
     
-    def _generate_executive_summary(self, client: Dict) -> str:
+    @staticmethod
+    def _generate_executive_summary(client: Dict) -> str:
         """Gera resumo executivo para relatório."""
         spend = client["metrics"]["total_spend"]
         revenue = client["metrics"]["total_revenue"]
@@ -577,12 +944,14 @@ class AgencyMode:
         resultando em um ROAS de {roas}x.
         """
     
-    def _get_campaign_breakdown(self, client_id: str) -> List[Dict]:
+    @staticmethod
+    def _get_campaign_breakdown(client_id: str) -> List[Dict]:
         """Obtém breakdown de campanhas."""
         # Placeholder
         return []
     
-    def _generate_report_recommendations(self, client: Dict) -> List[str]:
+    @staticmethod
+    def _generate_report_recommendations(client: Dict) -> List[str]:
         """Gera recomendações para relatório."""
         recommendations = []
         
@@ -602,7 +971,8 @@ class AgencyMode:
         
         return recommendations
     
-    def _generate_next_steps(self, client: Dict) -> List[str]:
+    @staticmethod
+    def _generate_next_steps(client: Dict) -> List[str]:
         """Gera próximos passos para relatório."""
         return [
             "Reunião de alinhamento para discutir resultados",
@@ -612,5 +982,23 @@ class AgencyMode:
         ]
 
 
-# Instância global
-agency_mode = AgencyMode()
+# Instância global (criada no primeiro uso: o construtor cria as tabelas no banco)
+_agency_instance: Optional[AgencyMode] = None
+_agency_lock = threading.Lock()
+
+
+def get_agency_mode() -> AgencyMode:
+    """
+    Retorna instância global do modo agência (singleton)
+
+    Returns:
+        AgencyMode: Instância do modo agência
+    """
+    global _agency_instance
+
+    if _agency_instance is None:
+        with _agency_lock:
+            if _agency_instance is None:
+                _agency_instance = AgencyMode()
+
+    return _agency_instance
@@ -0,0 +1,500 @@
+"""
+🗂️ AGENCY REPORT BATCH - Relatórios White-Label em Lote
+Nexora Prime
+
+Relatórios mensais de todos os clientes de uma agência, fora do request:
+- A API só registra o lote (tabela `agency_report_batches`) e devolve o
+  batch_id; uma thread do pool coordena a execução
+- Agência e clientes são lidos uma vez; benchmark e tendências de mercado
+  são calculados uma vez por nicho e compartilhados entre os clientes
+- A renderização roda num pool de processos, em blocos de clientes (o
+  contexto compartilhado é serializado uma vez por bloco)
+- Pool quebrado (filho morto) é recriado; blocos que passam de
+  RENDER_TIMEOUT falham o lote
+- O worker reivindica o lote (UPDATE condicional em 'queued') e renova
+  `heartbeat_at` enquanto roda; lote em running com heartbeat vencido
+  (worker reiniciado no meio) é marcado como failed
+- Cada relatório vira um arquivo JSON + HTML em
+  data/agency_reports/<batch_id>/, baixado depois pelo cliente; o
+  manifest.json do lote lista os arquivos gerados
+"""
+
+import os
+import json
+import html
+import time
+import uuid
+import atexit
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, get_db_connection_with_dict, sql_param, ensure_column
+    from services.agency_mode import AgencyMode, get_agency_mode
+except ImportError:
+    from db_utils import get_db_connection, get_db_connection_with_dict, sql_param, ensure_column
+    from agency_mode import AgencyMode, get_agency_mode
+
+
+REPORT_CHUNK_SIZE = 25  # clientes por tarefa do pool
+PARALLEL_THRESHOLD = 8  # abaixo disso renderiza no próprio processo
+RENDER_TIMEOUT = 600.0  # segundos para renderizar todos os blocos de um lote
+HEARTBEAT_SECONDS = 30  # intervalo de renovação do heartbeat de um lote em execução
+STALE_BATCH_SECONDS = 300  # lote em running sem heartbeat há mais que isso ficou órfão
+
+FORMATS = {
+    "json": "application/json",
+    "html": "text/html"
+}
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def _pool_context():
+    """forkserver/spawn: o filho não herda locks nem conexões das threads do gunicorn"""
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado (criado no primeiro uso e após quebrar)"""
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=min(4, os.cpu_count() or 1), mp_context=_pool_context()
+                )
+    return _process_pool
+
+
+def _reset_process_pool(pool: ProcessPoolExecutor):
+    """Descarta o pool (quebrado ou com filho travado); o próximo uso cria outro"""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is pool:
+            _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _shutdown_process_pool():
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(_shutdown_process_pool)
+
+
+def _write_atomic(path: str, content: str) -> int:
+    tmp_path = path + ".part"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def render_html(report: Dict[str, Any]) -> str:
+    """HTML autocontido com o branding da agência"""
+    esc = lambda value: html.escape(str(value if value is not None else ""))
+    branding = report["branding"]
+    metrics = report["performance_metrics"]
+
+    rows = "".join(
+        f"<tr><th>{esc(label)}</th><td>{esc(metrics[key])}</td></tr>"
+        for key, label in (("spend", "Investimento"), ("revenue", "Receita"),
+                           ("roas", "ROAS"), ("campaigns", "Campanhas"))
+    )
+    market = report.get("market_benchmark")
+    market_html = ""
+    if market:
+        position = market["roas_vs_market"]
+        market_html = (
+            f"<h2>Mercado ({esc(market['niche'])})</h2>"
+            f"<p>ROAS {esc(position['client'])}x vs. média {esc(position['market_avg'])}x "
+            f"- {esc(position['position'])}</p>"
+        )
+    logo = f'<img src="{esc(branding["logo_url"])}" alt="">' if branding.get("logo_url") else ""
+
+    return f"""<!DOCTYPE html>
+<html lang="pt-BR">
+<head><meta charset="utf-8"><title>{esc(branding['company_name'])} - {esc(report['client']['name'])}</title>
+<style>body{{font-family:sans-serif;color:#1f2937}}h1,h2{{color:{esc(branding['primary_color'])}}}
+th{{text-align:left;padding-right:16px;color:{esc(branding['secondary_color'])}}}</style></head>
+<body>
+<header>{logo}<h1>{esc(branding['company_name'])}</h1></header>
+<p>Relatório {esc(report['report_type'])} - {esc(report['client']['name'])} ({esc(report['client']['company'])})</p>
+<p>Período: {esc(report['period']['start'][:10])} a {esc(report['period']['end'][:10])}</p>
+<p>{esc(report['executive_summary'].strip())}</p>
+<table>{rows}</table>
+{market_html}
+<h2>Recomendações</h2><ul>{''.join(f'<li>{esc(r)}</li>' for r in report['recommendations'])}</ul>
+<h2>Próximos passos</h2><ul>{''.join(f'<li>{esc(s)}</li>' for s in report['next_steps'])}</ul>
+</body>
+</html>
+"""
+
+
+def _render_chunk(shared: Dict[str, Any], clients: List[Dict[str, Any]], batch_dir: str) -> List[Dict[str, Any]]:
+    """
+    Renderiza e grava os relatórios de um bloco de clientes.
+
+    Função de módulo para poder rodar em processo filho; não acessa o banco.
+    """
+    results = []
+    for client in clients:
+        try:
+            report = AgencyMode.build_report(
+                shared["agency"], client, shared["report_type"], shared["period"],
+                shared["market"].get(client.get("niche"))
+            )
+            base = os.path.join(batch_dir, client["id"])
+            size = _write_atomic(base + ".json", json.dumps(report, ensure_ascii=False, default=str))
+            size += _write_atomic(base + ".html", render_html(report))
+            results.append({
+                "client_id": client["id"],
+                "client_name": client["name"],
+                "report_id": report["report_id"],
+                "bytes": size
+            })
+        except Exception as e:
+            results.append({"client_id": client["id"], "client_name": client.get("name"), "error": str(e)})
+    return results
+
+
+class AgencyReportBatch:
+    """
+    Lotes de relatórios white-label por agência.
+
+    O estado de cada lote fica na tabela agency_report_batches, então
+    qualquer worker do gunicorn responde ao status e ao download.
+    """
+
+    def __init__(self, output_dir: str = "data/agency_reports", agency: AgencyMode = None,
+                 benchmark=None, max_workers: int = 2):
+        self.output_dir = output_dir
+        self.agency = agency or get_agency_mode()
+        self._benchmark = benchmark
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._init_database()
+        try:
+            self._fail_stale_batches()
+        except Exception as e:
+            print(f"[AGENCY REPORTS] ⚠️ Erro ao marcar lotes órfãos: {e}")
+
+    def _init_database(self):
+        """Cria a tabela de lotes"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS agency_report_batches (
+                    id TEXT PRIMARY KEY,
+                    agency_id TEXT NOT NULL,
+                    report_type TEXT NOT NULL,
+                    period_start TEXT,
+                    period_end TEXT,
+                    status TEXT NOT NULL,
+                    total_clients INTEGER DEFAULT 0,
+                    reports_written INTEGER DEFAULT 0,
+                    failed INTEGER DEFAULT 0,
+                    output_dir TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    heartbeat_at TEXT
+                )
+            """)
+            ensure_column(cursor, "agency_report_batches", "heartbeat_at", "TEXT")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agency_report_batches_agency
+                ON agency_report_batches(agency_id, created_at)
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[AGENCY REPORTS] ❌ Erro ao inicializar tabela: {e}")
+
+    @property
+    def benchmark(self):
+        if self._benchmark is None:
+            try:
+                from services.benchmark_global import benchmark_global
+            except ImportError:
+                from benchmark_global import benchmark_global
+            self._benchmark = benchmark_global
+        return self._benchmark
+
+    # ===== API =====
+
+    def submit(self, agency_id: str, report_type: str = "monthly", date_range: Dict = None) -> Dict[str, Any]:
+        """
+        Registra o lote e agenda a execução em background.
+
+        Returns:
+            {"batch_id", "status"} ou {"error"}
+        """
+        agency = self.agency._get_agency(agency_id)
+        if agency is None:
+            return {"error": "Agência não encontrada"}
+        if not agency["settings"]["white_label_enabled"]:
+            return {"error": "White-label não disponível no seu plano"}
+
+        period = date_range or {
+            "start": (datetime.now() - timedelta(days=30)).isoformat(),
+            "end": datetime.now().isoformat()
+        }
+        batch_id = uuid.uuid4().hex
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO agency_report_batches (
+                    id, agency_id, report_type, period_start, period_end, status, created_at
+                ) VALUES (?, ?, ?, ?, ?, 'queued', ?)
+            """), (batch_id, agency_id, report_type, period["start"], period["end"], datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._get_executor().submit(self.run_batch, batch_id)
+        return {"batch_id": batch_id, "status": "queued"}
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """Status do lote com a lista de relatórios (None se não existir)"""
+        self._fail_stale_batches(batch_id)
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("SELECT * FROM agency_report_batches WHERE id = ?"), (batch_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+
+        batch = dict(row)
+        manifest_path = os.path.join(batch["output_dir"] or "", "manifest.json")
+        batch["reports"] = []
+        if batch["status"] == "done" and os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                batch["reports"] = json.load(f)["reports"]
+        return batch
+
+    def get_download(self, batch_id: str, client_id: str, fmt: str = "html") -> Optional[Dict[str, Any]]:
+        """Caminho, nome e MIME do relatório de um cliente num lote concluído"""
+        if fmt not in FORMATS:
+            return None
+        batch = self.get_batch(batch_id)
+        if not batch or batch["status"] != "done":
+            return None
+        if client_id not in {r["client_id"] for r in batch["reports"] if "error" not in r}:
+            return None
+        path = os.path.join(batch["output_dir"], f"{client_id}.{fmt}")
+        if not os.path.exists(path):
+            return None
+        return {
+            "path": path,
+            "filename": f"relatorio_{client_id}_{batch['period_end'][:10]}.{fmt}",
+            "mimetype": FORMATS[fmt]
+        }
+
+    # ===== EXECUÇÃO =====
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agency-report")
+        return self._executor
+
+    def _update_batch(self, batch_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(f"UPDATE agency_report_batches SET {assignments} WHERE id = ?"),
+                           (*fields.values(), batch_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _market_context(self, clients: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Benchmark e tendências por nicho - uma consulta por nicho, não por cliente"""
+        market = {}
+        for niche in {client["niche"] for client in clients}:
+            try:
+                market[niche] = {
+                    "niche": niche,
+                    "benchmarks": self.benchmark.get_benchmark(niche, metrics=["ctr", "cpa", "roas"])["benchmarks"],
+                    "trends": self.benchmark.get_industry_trends(niche)["trends"]
+                }
+            except Exception as e:
+                print(f"[AGENCY REPORTS] ⚠️ Sem dados de mercado para {niche}: {e}")
+        return market
+
+    def _render_in_pool(self, shared: Dict[str, Any], chunks: List[List[Dict[str, Any]]],
+                        batch_dir: str) -> List[Dict[str, Any]]:
+        """
+        Renderiza os blocos no pool de processos.
+
+        Pool quebrado é recriado e o lote tentado de novo uma vez; estourar
+        RENDER_TIMEOUT descarta o pool e falha o lote.
+        """
+        for attempt in range(2):
+            pool = _get_process_pool()
+            futures = []
+            try:
+                futures = [pool.submit(_render_chunk, shared, chunk, batch_dir) for chunk in chunks]
+                deadline = time.monotonic() + RENDER_TIMEOUT
+                return [r for future in futures
+                        for r in future.result(timeout=max(0.0, deadline - time.monotonic()))]
+            except BrokenProcessPool:
+                _reset_process_pool(pool)
+                if attempt:
+                    raise
+                print("[AGENCY REPORTS] ⚠️ Pool de processos quebrado, recriando")
+            except FutureTimeoutError:
+                for future in futures:
+                    future.cancel()
+                _reset_process_pool(pool)
+                raise TimeoutError(f"Renderização excedeu {RENDER_TIMEOUT:.0f}s")
+
+    def _fail_stale_batches(self, batch_id: str = None) -> int:
+        """Marca como failed lotes em running com heartbeat vencido (worker morreu no meio)"""
+        now = datetime.now()
+        cutoff = (now - timedelta(seconds=STALE_BATCH_SECONDS)).isoformat()
+        query = """
+            UPDATE agency_report_batches SET status = 'failed', error = ?, finished_at = ?
+            WHERE status = 'running' AND COALESCE(heartbeat_at, started_at, created_at) < ?
+        """
+        params = ("Lote interrompido (worker reiniciado ou travado)", now.isoformat(), cutoff)
+        if batch_id:
+            query += " AND id = ?"
+            params += (batch_id,)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            failed = cursor.rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        return failed
+
+    def _claim_batch(self, batch_id: str, batch_dir: str) -> bool:
+        """Passa o lote de queued para running; False se outro worker (ou a varredura) chegou antes"""
+        now = datetime.now().isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                UPDATE agency_report_batches
+                SET status = 'running', started_at = ?, heartbeat_at = ?, output_dir = ?
+                WHERE id = ? AND status = 'queued'
+            """), (now, now, batch_dir, batch_id))
+            claimed = cursor.rowcount > 0
+            conn.commit()
+        finally:
+            conn.close()
+        return claimed
+
+    @contextmanager
+    def _heartbeat(self, batch_id: str):
+        """Renova heartbeat_at a cada HEARTBEAT_SECONDS enquanto o lote roda"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(HEARTBEAT_SECONDS):
+                try:
+                    self._update_batch(batch_id, heartbeat_at=datetime.now().isoformat())
+                except Exception as e:
+                    print(f"[AGENCY REPORTS] ⚠️ Erro no heartbeat do lote {batch_id}: {e}")
+
+        thread = threading.Thread(target=beat, name=f"agency-report-heartbeat-{batch_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def run_batch(self, batch_id: str):
+        """Executa o lote (chamado pelo pool; pode ser chamado direto)"""
+        batch = self.get_batch(batch_id)
+        if batch is None:
+            return
+
+        batch_dir = os.path.join(self.output_dir, batch_id)
+        if not self._claim_batch(batch_id, batch_dir):
+            return
+
+        try:
+            with self._heartbeat(batch_id):
+                os.makedirs(batch_dir, exist_ok=True)
+                agency = self.agency._get_agency(batch["agency_id"])
+                clients = self.agency.list_clients(batch["agency_id"])
+                shared = {
+                    "agency": agency,
+                    "report_type": batch["report_type"],
+                    "period": {"start": batch["period_start"], "end": batch["period_end"]},
+                    "market": self._market_context(clients)
+                }
+                self._update_batch(batch_id, total_clients=len(clients))
+
+                chunks = [clients[i:i + REPORT_CHUNK_SIZE] for i in range(0, len(clients), REPORT_CHUNK_SIZE)]
+                if len(clients) < PARALLEL_THRESHOLD:
+                    results = [r for chunk in chunks for r in _render_chunk(shared, chunk, batch_dir)]
+                else:
+                    results = self._render_in_pool(shared, chunks, batch_dir)
+
+            written = sum(1 for r in results if "error" not in r)
+            _write_atomic(os.path.join(batch_dir, "manifest.json"), json.dumps({
+                "batch_id": batch_id,
+                "agency_id": batch["agency_id"],
+                "report_type": batch["report_type"],
+                "period": shared["period"],
+                "generated_at": datetime.now().isoformat(),
+                "reports": results
+            }, ensure_ascii=False))
+            self._update_batch(
+                batch_id,
+                status="done",
+                reports_written=written,
+                failed=len(results) - written,
+                finished_at=datetime.now().isoformat()
+            )
+            print(f"[AGENCY REPORTS] ✅ Lote {batch_id} concluído ({written}/{len(results)} relatórios)")
+        except Exception as e:
+            self._update_batch(batch_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            print(f"[AGENCY REPORTS] ❌ Lote {batch_id} falhou: {e}")
+
+
+# Instância global do gerenciador
+_batch_instance: Optional[AgencyReportBatch] = None
+_batch_lock = threading.Lock()
+
+
+def get_agency_report_batch() -> AgencyReportBatch:
+    """
+    Retorna instância global dos lotes de relatórios (singleton)
+
+    Returns:
+        AgencyReportBatch: Instância do gerenciador
+    """
+    global _batch_instance
+
+    if _batch_instance is None:
+        with _batch_lock:
+            if _batch_instance is None:
+                _batch_instance = AgencyReportBatch()
+
+    return _batch_instance
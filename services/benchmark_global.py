@@ -6,10 +6,32 @@ Nexora Prime V2 - Expansão Unicórnio
 
 import os
 import json
+import time
+import threading
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 import random
 
+import numpy as np
+
+try:
+    from services.db_utils import get_db_connection, sql_param
+except ImportError:
+    from db_utils import get_db_connection, sql_param
+
+
+# Métricas de custo usam o multiplicador "cpa" do país; ROAS usa "roas"
+COUNTRY_METRIC_KEYS = {"cpc": "cpa", "cpa": "cpa", "cpl": "cpa", "cpi": "cpa", "roas": "roas"}
+PLATFORM_METRIC_KEYS = {"ctr": "ctr", "conversion_rate": "conversion"}
+HIGHER_IS_BETTER = {"ctr", "roas", "conversion_rate", "epc", "aov", "ltv", "margin", "retention_d1", "retention_d7"}
+BENCHMARK_STATS = ("min", "avg", "top")
+
+# Benchmarks derivados do nosso próprio histórico (campaign_metrics)
+HISTORY_NICHE = "historico"
+HISTORY_METRICS = {"ctr": "%", "cpc": "BRL", "cpa": "BRL", "roas": "x", "conversion_rate": "%"}
+PLATFORM_ALIASES = {"meta": "facebook", "google": "google_search", "google_ads": "google_search"}
+
+
 class BenchmarkGlobal:
     """Sistema de benchmark global automático."""
     
@@ -104,6 +126,106 @@ class BenchmarkGlobal:
         
         # Histórico de benchmarks (simulado)
         self.benchmark_history = {}
+        
+        # Percentis do histórico próprio: escopo ("_all" ou plataforma) -> métrica -> stats
+        self.history_benchmarks: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.history_updated_at: Optional[str] = None
+        self.snapshot_refresh_interval = 600
+        self._snapshot_checked_at = 0.0
+        self._scheduler: Optional[threading.Thread] = None
+        
+        # Cubo nicho × país × plataforma × métrica × (min, avg, top)
+        self.rebuild_cube()
+    
+    # ===== CUBO PRÉ-CALCULADO =====
+    
+    def rebuild_cube(self):
+        """
+        Recalcula o cubo de benchmarks e as visões por contexto.
+        
+        Roda na inicialização e quando os dados mudam; get_benchmark e o
+        scoring em lote só fazem lookups.
+        """
+        niches = dict(self.niche_benchmarks)
+        overall = self.history_benchmarks.get("_all")
+        if overall:
+            niches[HISTORY_NICHE] = {
+                metric: {**stats, "unit": HISTORY_METRICS[metric]}
+                for metric, stats in overall.items()
+            }
+        
+        niche_keys = list(niches)
+        countries = list(self.country_multipliers)
+        platforms = list(self.platform_multipliers)
+        metric_keys = sorted({m for benchmarks in niches.values() for m in benchmarks})
+        metric_index = {m: i for i, m in enumerate(metric_keys)}
+        
+        base = np.full((len(niche_keys), len(metric_keys), len(BENCHMARK_STATS)), np.nan)
+        for n, niche in enumerate(niche_keys):
+            for metric, values in niches[niche].items():
+                base[n, metric_index[metric]] = [values[stat] for stat in BENCHMARK_STATS]
+        
+        country_mult = np.ones((len(countries), len(metric_keys)))
+        for c, country in enumerate(countries):
+            for metric, key in COUNTRY_METRIC_KEYS.items():
+                if metric in metric_index:
+                    country_mult[c, metric_index[metric]] = self.country_multipliers[country].get(key, 1.0)
+        
+        platform_mult = np.ones((len(platforms), len(metric_keys)))
+        for p, platform in enumerate(platforms):
+            for metric, key in PLATFORM_METRIC_KEYS.items():
+                if metric in metric_index:
+                    platform_mult[p, metric_index[metric]] = self.platform_multipliers[platform].get(key, 1.0)
+        
+        raw = (
+            base[:, None, None, :, :]
+            * country_mult[None, :, None, :, None]
+            * platform_mult[None, None, :, :, None]
+        )
+        
+        # Histórico por plataforma já é observado: substitui o multiplicador de plataforma
+        if overall:
+            h = niche_keys.index(HISTORY_NICHE)
+            for p, platform in enumerate(platforms):
+                for metric, stats in self.history_benchmarks.get(platform, {}).items():
+                    m = metric_index[metric]
+                    observed = np.array([stats[stat] for stat in BENCHMARK_STATS])
+                    raw[h, :, p, m, :] = observed[None, :] * country_mult[:, m, None]
+        
+        adjusted = set(COUNTRY_METRIC_KEYS) | set(PLATFORM_METRIC_KEYS)
+        cube = np.full(raw.shape, np.nan)
+        views: Dict[Tuple[str, str, str], Dict[str, Dict[str, Any]]] = {}
+        
+        for n, niche in enumerate(niche_keys):
+            for c, country in enumerate(countries):
+                for p, platform in enumerate(platforms):
+                    view = {}
+                    for metric, values in niches[niche].items():
+                        m = metric_index[metric]
+                        if metric in adjusted:
+                            stats = [round(float(v), 2) for v in raw[n, c, p, m]]
+                        else:
+                            stats = [values[stat] for stat in BENCHMARK_STATS]
+                        cube[n, c, p, m] = stats
+                        view[metric] = {"unit": values["unit"], **dict(zip(BENCHMARK_STATS, stats))}
+                    views[(niche, country, platform)] = view
+        
+        self.cube = cube
+        self.cube_niches = {niche: i for i, niche in enumerate(niche_keys)}
+        self.cube_countries = {country: i for i, country in enumerate(countries)}
+        self.cube_platforms = {platform: i for i, platform in enumerate(platforms)}
+        self.cube_metrics = metric_index
+        self._views = views
+        self.cube_built_at = datetime.now().isoformat()
+    
+    def _resolve_context(self, niche: str, country: str, platform: str) -> Tuple[str, str, str]:
+        """Normaliza o contexto para as chaves do cubo (com os mesmos fallbacks)"""
+        niche_key = niche.lower().replace(" ", "_")
+        return (
+            niche_key if niche_key in self.cube_niches else "ecommerce",
+            country if country in self.cube_countries else "BR",
+            platform if platform in self.cube_platforms else "facebook"
+        )
     
     def get_benchmark(
         self,
@@ -112,57 +234,18 @@ class BenchmarkGlobal:
         platform: str = "facebook",
         metrics: List[str] = None
     ) -> Dict[str, Any]:
-        """Obtém benchmark para um contexto específico."""
+        """Obtém benchmark para um contexto específico (lookup no cubo)."""
         
-        # Obter benchmarks base do nicho
-        niche_key = niche.lower().replace(" ", "_")
-        base_benchmarks = self.niche_benchmarks.get(
-            niche_key, 
-            self.niche_benchmarks["ecommerce"]
-        )
-        
-        # Obter multiplicadores
-        country_mult = self.country_multipliers.get(country, self.country_multipliers["BR"])
-        platform_mult = self.platform_multipliers.get(platform, self.platform_multipliers["facebook"])
+        self.refresh_if_stale()
         
-        # Aplicar multiplicadores
-        adjusted_benchmarks = {}
-        for metric, values in base_benchmarks.items():
-            if metrics and metric not in metrics:
-                continue
-            
-            adjusted = {
-                "unit": values["unit"],
-                "min": values["min"],
-                "avg": values["avg"],
-                "top": values["top"]
-            }
-            
-            # Aplicar multiplicadores de país
-            if metric in ["cpc", "cpa", "cpl", "cpi"]:
-                mult = country_mult.get("cpa", 1.0)
-                adjusted["min"] = round(values["min"] * mult, 2)
-                adjusted["avg"] = round(values["avg"] * mult, 2)
-                adjusted["top"] = round(values["top"] * mult, 2)
-            elif metric == "roas":
-                mult = country_mult.get("roas", 1.0)
-                adjusted["min"] = round(values["min"] * mult, 2)
-                adjusted["avg"] = round(values["avg"] * mult, 2)
-                adjusted["top"] = round(values["top"] * mult, 2)
-            
-            # Aplicar multiplicadores de plataforma
-            if metric == "ctr":
-                mult = platform_mult.get("ctr", 1.0)
-                adjusted["min"] = round(values["min"] * mult, 2)
-                adjusted["avg"] = round(values["avg"] * mult, 2)
-                adjusted["top"] = round(values["top"] * mult, 2)
-            elif metric == "conversion_rate":
-                mult = platform_mult.get("conversion", 1.0)
-                adjusted["min"] = round(values["min"] * mult, 2)
-                adjusted["avg"] = round(values["avg"] * mult, 2)
-                adjusted["top"] = round(values["top"] * mult, 2)
-            
-            adjusted_benchmarks[metric] = adjusted
+        niche_key = niche.lower().replace(" ", "_")
+        resolved = self._resolve_context(niche, country, platform)
+        view = self._views[resolved]
+        adjusted_benchmarks = {
+            metric: dict(values)
+            for metric, values in view.items()
+            if not metrics or metric in metrics
+        }
         
         return {
             "timestamp": datetime.now().isoformat(),
@@ -172,8 +255,8 @@ class BenchmarkGlobal:
                 "platform": platform
             },
             "benchmarks": adjusted_benchmarks,
-            "data_source": "market_aggregation",
-            "last_updated": datetime.now().isoformat(),
+            "data_source": "campaign_history" if resolved[0] == HISTORY_NICHE else "market_aggregation",
+            "last_updated": self.history_updated_at if resolved[0] == HISTORY_NICHE else self.cube_built_at,
             "confidence": self._calculate_confidence(niche_key, country, platform)
         }
     
@@ -446,6 +529,248 @@ class BenchmarkGlobal:
             "interpretation": self._interpret_score(final_score)
         }
     
+    def score_campaigns_batch(
+        self,
+        campaigns: List[Dict[str, Any]],
+        weights: Dict[str, float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Pontua e ranqueia muitas campanhas de uma vez.
+        
+        Mesma fórmula de calculate_performance_score, aplicada como operações
+        NumPy sobre o cubo. Cada campanha traz "metrics" e, opcionalmente,
+        "niche", "country", "platform" e "campaign_id".
+        
+        Returns:
+            Lista na ordem de entrada com score, nota, posição e percentil
+        """
+        if not campaigns:
+            return []
+        
+        self.refresh_if_stale()
+        
+        weights = weights or {"roas": 0.30, "cpa": 0.25, "ctr": 0.15, "conversion_rate": 0.20, "cpc": 0.10}
+        metric_names = [m for m in weights if m in self.cube_metrics]
+        weight_vector = np.array([weights[m] for m in metric_names])
+        
+        contexts = [
+            self._resolve_context(c.get("niche", "ecommerce"), c.get("country", "BR"), c.get("platform", "facebook"))
+            for c in campaigns
+        ]
+        n_idx = np.array([self.cube_niches[ctx[0]] for ctx in contexts])
+        c_idx = np.array([self.cube_countries[ctx[1]] for ctx in contexts])
+        p_idx = np.array([self.cube_platforms[ctx[2]] for ctx in contexts])
+        m_idx = np.array([self.cube_metrics[m] for m in metric_names])
+        
+        # (campanhas, métricas, stats)
+        bench = self.cube[n_idx, c_idx, p_idx][:, m_idx, :]
+        low, avg, top = bench[..., 0], bench[..., 1], bench[..., 2]
+        values = np.array(
+            [[c.get("metrics", {}).get(m, np.nan) for m in metric_names] for c in campaigns],
+            dtype=np.float64
+        ).reshape(len(campaigns), len(metric_names))
+        
+        higher = np.array([m in ("ctr", "roas", "conversion_rate") for m in metric_names])
+        # Para "menor é melhor" basta inverter o sinal: a fórmula fica a mesma
+        sign = np.where(higher, 1.0, -1.0)
+        v, lo, av, tp = values * sign, low * sign, avg * sign, top * sign
+        
+        with np.errstate(divide="ignore", invalid="ignore"):
+            upper_band = 50 + 50 * (v - av) / (tp - av)
+            lower_band = 50 * (v - lo) / (av - lo)
+        scores = np.select(
+            [v >= tp, v >= av, v >= lo],
+            [100.0, upper_band, lower_band],
+            default=0.0
+        )
+        scores = np.clip(np.nan_to_num(scores), 0, 100)
+        
+        valid = ~np.isnan(values) & ~np.isnan(avg)
+        effective_weights = np.where(valid, weight_vector, 0.0)
+        total_weight = effective_weights.sum(axis=1)
+        weighted = (scores * effective_weights).sum(axis=1)
+        overall = np.divide(weighted, total_weight, out=np.zeros_like(weighted), where=total_weight > 0)
+        
+        order = np.argsort(-overall, kind="stable")
+        ranks = np.empty(len(campaigns), dtype=int)
+        ranks[order] = np.arange(1, len(campaigns) + 1)
+        percentiles = 100.0 * (len(campaigns) - ranks) / max(len(campaigns) - 1, 1)
+        
+        results = []
+        for i, campaign in enumerate(campaigns):
+            final_score = round(float(overall[i]), 1)
+            results.append({
+                "campaign_id": campaign.get("campaign_id"),
+                "overall_score": final_score,
+                "metric_scores": {
+                    metric_names[j]: round(float(scores[i, j]), 1)
+                    for j in range(len(metric_names)) if valid[i, j]
+                },
+                "grade": self._score_to_grade(final_score),
+                "rank": int(ranks[i]),
+                "percentile": round(float(percentiles[i]), 1)
+            })
+        return results
+    
+    # ===== BENCHMARKS DO HISTÓRICO PRÓPRIO =====
+    
+    def _init_history_table(self, cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS benchmark_percentiles (
+                scope TEXT NOT NULL,
+                metric TEXT NOT NULL,
+                min_value REAL NOT NULL,
+                avg_value REAL NOT NULL,
+                top_value REAL NOT NULL,
+                samples INTEGER NOT NULL,
+                computed_at TEXT NOT NULL,
+                PRIMARY KEY (scope, metric)
+            )
+        """)
+    
+    def recompute_from_history(self, min_samples: int = 20, chunk_size: int = 5000) -> Dict[str, Any]:
+        """
+        Recalcula benchmarks a partir dos percentis de campaign_metrics.
+        
+        Roda no agendamento (worker), nunca no request: grava o snapshot em
+        benchmark_percentiles e reconstrói o cubo. As campanhas não têm nicho
+        nem país, então o histórico vira o nicho "historico", com percentis
+        por plataforma quando há amostras suficientes.
+        """
+        columns: Dict[str, Dict[str, List[float]]] = {}
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT LOWER(c.platform) AS platform, m.ctr, m.cpc, m.cpa, m.roas, m.clicks, m.conversions
+                FROM campaign_metrics m
+                JOIN campaigns c ON c.id = m.campaign_id
+            """)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    if isinstance(row, dict):
+                        row = (row["platform"], row["ctr"], row["cpc"], row["cpa"], row["roas"], row["clicks"], row["conversions"])
+                    platform = PLATFORM_ALIASES.get(row[0], row[0])
+                    clicks, conversions = row[5] or 0, row[6] or 0
+                    values = {
+                        "ctr": row[1],
+                        "cpc": row[2],
+                        "cpa": row[3],
+                        "roas": row[4],
+                        "conversion_rate": conversions / clicks * 100 if clicks else None
+                    }
+                    for scope in ("_all", platform):
+                        bucket = columns.setdefault(scope, {m: [] for m in HISTORY_METRICS})
+                        for metric, value in values.items():
+                            if value:
+                                bucket[metric].append(float(value))
+        finally:
+            conn.close()
+        
+        computed_at = datetime.now().isoformat()
+        history: Dict[str, Dict[str, Dict[str, float]]] = {}
+        rows_to_save = []
+        for scope, metrics in columns.items():
+            if scope != "_all" and scope not in self.platform_multipliers:
+                continue
+            for metric, values in metrics.items():
+                if len(values) < min_samples:
+                    continue
+                if metric in HIGHER_IS_BETTER:
+                    low, avg, top = np.percentile(values, [25, 50, 90])
+                else:
+                    low, avg, top = np.percentile(values, [75, 50, 10])
+                stats = {"min": round(float(low), 2), "avg": round(float(avg), 2), "top": round(float(top), 2), "samples": len(values)}
+                history.setdefault(scope, {})[metric] = stats
+                rows_to_save.append((scope, metric, stats["min"], stats["avg"], stats["top"], len(values), computed_at))
+        
+        if "_all" not in history:
+            return {"success": False, "message": "Histórico insuficiente", "min_samples": min_samples}
+        
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            self._init_history_table(cursor)
+            cursor.execute("DELETE FROM benchmark_percentiles")
+            cursor.executemany(sql_param("""
+                INSERT INTO benchmark_percentiles
+                    (scope, metric, min_value, avg_value, top_value, samples, computed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """), rows_to_save)
+            conn.commit()
+        finally:
+            conn.close()
+        
+        self._apply_history(history, computed_at)
+        return {
+            "success": True,
+            "computed_at": computed_at,
+            "scopes": sorted(history),
+            "metrics": len(rows_to_save)
+        }
+    
+    def _apply_history(self, history: Dict[str, Dict[str, Dict[str, float]]], computed_at: Optional[str]):
+        self.history_benchmarks = history
+        self.history_updated_at = computed_at
+        self._snapshot_checked_at = time.time()
+        self.rebuild_cube()
+    
+    def load_history_snapshot(self) -> bool:
+        """Carrega o último snapshot gravado pelo recompute (se mudou)"""
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT scope, metric, min_value, avg_value, top_value, samples, computed_at FROM benchmark_percentiles")
+                rows = cursor.fetchall()
+            finally:
+                conn.close()
+        except Exception:
+            # Tabela ainda não existe: nenhum recompute rodou
+            self._snapshot_checked_at = time.time()
+            return False
+        
+        history: Dict[str, Dict[str, Dict[str, float]]] = {}
+        computed_at = None
+        for row in rows:
+            if isinstance(row, dict):
+                row = (row["scope"], row["metric"], row["min_value"], row["avg_value"], row["top_value"], row["samples"], row["computed_at"])
+            history.setdefault(row[0], {})[row[1]] = {"min": row[2], "avg": row[3], "top": row[4], "samples": row[5]}
+            computed_at = max(computed_at or row[6], row[6])
+        
+        if not history or computed_at == self.history_updated_at:
+            self._snapshot_checked_at = time.time()
+            return False
+        
+        self._apply_history(history, computed_at)
+        return True
+    
+    def refresh_if_stale(self):
+        """Recarrega o snapshot no máximo a cada snapshot_refresh_interval segundos"""
+        if time.time() - self._snapshot_checked_at >= self.snapshot_refresh_interval:
+            self.load_history_snapshot()
+    
+    def start_scheduled_recompute(self, interval_hours: float = 24.0):
+        """Inicia o recompute periódico em thread daemon (usado pelo worker)"""
+        if self._scheduler is not None and self._scheduler.is_alive():
+            return
+        
+        def run():
+            while True:
+                try:
+                    result = self.recompute_from_history()
+                    if result.get("success"):
+                        print(f"[BENCHMARK] ✅ Benchmarks recalculados ({result['metrics']} métricas)")
+                except Exception as e:
+                    print(f"[BENCHMARK] ❌ Erro no recompute: {e}")
+                time.sleep(interval_hours * 3600)
+        
+        self._scheduler = threading.Thread(target=run, name="benchmark-recompute", daemon=True)
+        self._scheduler.start()
+    
     def _calculate_confidence(self, niche: str, country: str, platform: str) -> str:
         """Calcula nível de confiança dos dados."""
         # Nichos com mais dados têm maior confiança
@@ -0,0 +1,215 @@
+"""
+💰 BUDGET ALLOCATOR - Alocação de Portfólio com Retornos Decrescentes
+Nexora Prime
+
+Resolve a distribuição de orçamento como otimização com restrições:
+
+    maximizar   Σ a_i · b_i^k_i          (receita esperada, 0 < k < 1)
+    sujeito a   Σ b_i = orçamento total
+                lo_i ≤ b_i ≤ hi_i        (mín/máx e limite de mudança por passo)
+
+As curvas a·b^k são ajustadas por regressão log-log no histórico de
+gasto × receita de cada campanha (ou ancoradas no ponto atual quando não
+há histórico). Pelas condições de KKT, todas as campanhas não travadas
+ficam com o mesmo retorno marginal λ; λ é encontrado por bisseção
+vetorizada em numpy, então milhares de campanhas levam milissegundos e o
+resultado é determinístico.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Sequence
+
+import numpy as np
+
+
+DEFAULT_ELASTICITY = 0.7
+MIN_ELASTICITY = 0.2
+MAX_ELASTICITY = 0.95
+
+
+@dataclass
+class AllocationResult:
+    """Resultado de uma alocação (arrays alinhados com a entrada)"""
+    budgets: np.ndarray
+    expected_revenue: np.ndarray
+    marginal_roas: float
+    total_allocated: float
+    unallocated: float
+    feasible: bool
+
+    def expected_roas(self) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(self.budgets > 0, self.expected_revenue / self.budgets, 0.0)
+
+
+def fit_response_curves(
+    current_spend: Sequence[float],
+    current_revenue: Sequence[float],
+    history: Optional[Sequence[Optional[Sequence[Dict]]]] = None,
+    default_elasticity: float = DEFAULT_ELASTICITY
+):
+    """
+    Ajusta receita = a · gasto^k para cada campanha.
+
+    Args:
+        current_spend: Gasto atual por campanha (ponto de ancoragem)
+        current_revenue: Receita atual por campanha
+        history: Por campanha, lista de pontos {"spend", "revenue"} (opcional)
+        default_elasticity: k usado quando o histórico não basta
+
+    Returns:
+        (a, k) como arrays numpy
+    """
+    spend = np.asarray(current_spend, dtype=np.float64)
+    revenue = np.asarray(current_revenue, dtype=np.float64)
+    n = len(spend)
+    k = np.full(n, default_elasticity)
+
+    # Regressão log-log vetorizada: histórico em matriz com máscara
+    log_a_fit = np.full(n, np.nan)
+    if history is not None:
+        width = max((len(h) for h in history if h), default=0)
+        if width:
+            xs = np.zeros((n, width))
+            ys = np.zeros((n, width))
+            mask = np.zeros((n, width), dtype=bool)
+            for i, points in enumerate(history):
+                for j, point in enumerate(points or []):
+                    s, r = point.get("spend", 0) or 0, point.get("revenue", 0) or 0
+                    if s > 0 and r > 0:
+                        xs[i, j], ys[i, j], mask[i, j] = np.log(s), np.log(r), True
+
+            counts = mask.sum(axis=1)
+            safe = np.maximum(counts, 1)
+            mean_x = (xs * mask).sum(axis=1) / safe
+            mean_y = (ys * mask).sum(axis=1) / safe
+            dx = (xs - mean_x[:, None]) * mask
+            dy = (ys - mean_y[:, None]) * mask
+            var_x = (dx * dx).sum(axis=1)
+            usable = (counts >= 3) & (var_x > 1e-9)
+
+            slope = np.where(usable, (dx * dy).sum(axis=1) / np.where(usable, var_x, 1), default_elasticity)
+            k = np.where(usable, np.clip(slope, MIN_ELASTICITY, MAX_ELASTICITY), k)
+            log_a_fit = np.where(usable, mean_y - k * mean_x, np.nan)
+
+    # Sem ajuste: curva passa pelo ponto atual (receita atual com gasto atual)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        anchored = np.where((spend > 0) & (revenue > 0), revenue / np.power(np.maximum(spend, 1e-12), k), 0.0)
+    a = np.where(np.isnan(log_a_fit), anchored, np.exp(np.nan_to_num(log_a_fit)))
+    return a, k
+
+
+class BudgetAllocator:
+    """
+    Alocador de portfólio sobre curvas de retorno decrescente.
+
+    Sem estado: pode ser compartilhado entre chamadores e threads.
+    """
+
+    def __init__(self, iterations: int = 80):
+        self.iterations = iterations
+
+    def allocate(
+        self,
+        total_budget: float,
+        a: Sequence[float],
+        k: Sequence[float],
+        current: Sequence[float] = None,
+        min_budget: Sequence[float] = None,
+        max_budget: Sequence[float] = None,
+        max_step_change: Optional[float] = None
+    ) -> AllocationResult:
+        """
+        Distribui `total_budget` maximizando a receita esperada.
+
+        Args:
+            total_budget: Orçamento a distribuir
+            a, k: Curvas de resposta (receita = a · b^k)
+            current: Orçamento atual (base do limite por passo)
+            min_budget, max_budget: Limites absolutos por campanha
+            max_step_change: Variação máxima relativa ao orçamento atual
+                (0.5 = ±50%); campanhas com orçamento atual 0 não têm limite
+
+        Returns:
+            AllocationResult
+        """
+        a = np.maximum(np.asarray(a, dtype=np.float64), 0.0)
+        k = np.clip(np.asarray(k, dtype=np.float64), MIN_ELASTICITY, MAX_ELASTICITY)
+        n = len(a)
+        total_budget = max(float(total_budget), 0.0)
+
+        lo = np.zeros(n) if min_budget is None else np.maximum(np.asarray(min_budget, dtype=np.float64), 0.0)
+        hi = np.full(n, np.inf) if max_budget is None else np.asarray(max_budget, dtype=np.float64)
+
+        if current is not None and max_step_change is not None:
+            current = np.asarray(current, dtype=np.float64)
+            limited = current > 0
+            lo = np.where(limited, np.maximum(lo, current * (1 - max_step_change)), lo)
+            hi = np.where(limited, np.minimum(hi, current * (1 + max_step_change)), hi)
+
+        hi = np.maximum(hi, lo)
+        feasible = lo.sum() <= total_budget + 1e-9
+
+        if n == 0:
+            return AllocationResult(np.zeros(0), np.zeros(0), 0.0, 0.0, total_budget, True)
+
+        if not feasible:
+            # Mínimos não cabem no orçamento: reduz todos proporcionalmente
+            budgets = lo * (total_budget / lo.sum())
+            lam = 0.0
+        elif np.minimum(hi, 1e18).sum() <= total_budget:
+            budgets = np.minimum(hi, 1e18)
+            lam = 0.0
+        else:
+            budgets, lam = self._solve(total_budget, a, k, lo, hi)
+
+        revenue = a * np.power(budgets, k)
+        allocated = float(budgets.sum())
+        return AllocationResult(
+            budgets=budgets,
+            expected_revenue=revenue,
+            marginal_roas=float(lam),
+            total_allocated=allocated,
+            unallocated=max(total_budget - allocated, 0.0),
+            feasible=bool(feasible)
+        )
+
+    def _solve(self, total_budget, a, k, lo, hi):
+        """Bisseção em log λ: Σ clip(b_i(λ), lo_i, hi_i) = orçamento"""
+        active = a > 0
+        log_ak = np.log(np.where(active, a * k, 1.0))
+        inv = 1.0 / (1.0 - k)
+
+        def budgets_for(log_lam):
+            exponent = np.clip((log_ak - log_lam) * inv, -700, 700)
+            raw = np.where(active, np.exp(exponent), 0.0)
+            return np.clip(raw, lo, hi)
+
+        low, high = -60.0, 60.0
+        for _ in range(self.iterations):
+            mid = (low + high) / 2
+            if budgets_for(mid).sum() > total_budget:
+                low = mid
+            else:
+                high = mid
+
+        budgets = budgets_for(high)
+        residual = total_budget - budgets.sum()
+        if residual > 1e-9:
+            # Sobra (campanhas sem receita ou tolerância da bisseção):
+            # preenche proporcionalmente à folga até o máximo
+            headroom = np.minimum(hi, 1e18) - budgets
+            if not np.isfinite(hi).all():
+                headroom = np.where(np.isfinite(hi), headroom, total_budget)
+            share = headroom / headroom.sum() if headroom.sum() > 0 else headroom
+            budgets = np.minimum(budgets + residual * share, hi)
+        return budgets, float(np.exp(high))
+
+
+# Instância global do alocador
+budget_allocator = BudgetAllocator()
+
+
+def get_budget_allocator() -> BudgetAllocator:
+    """Retorna a instância global do alocador"""
+    return budget_allocator
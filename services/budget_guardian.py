@@ -6,16 +6,23 @@ Nível: Agência Milionária
 """
 
 import json
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple
 
+try:
+    from services.sliding_window_limiter import LimitRule, get_limiter, DAY, HOUR
+except ImportError:
+    from sliding_window_limiter import LimitRule, get_limiter, DAY, HOUR
+
+
+# Janelas deslizantes de gasto: 24h, 7 dias e 30 dias
+SPENDING_WINDOWS = {
+    "today": LimitRule(window_seconds=DAY, bucket_seconds=HOUR),
+    "this_week": LimitRule(window_seconds=7 * DAY, bucket_seconds=6 * HOUR),
+    "this_month": LimitRule(window_seconds=30 * DAY, bucket_seconds=DAY)
+}
 
-class BudgetGuardian:
-    """
-    Guardião de Orçamento - Sistema de segurança financeira
-    Protege contra gastos indevidos e requer aprovação para custos
-    """
-    
 
 def handle_errors(func):
     """Decorador para tratamento automático de erros"""
@@ -29,8 +36,16 @@ def handle_errors(func):
     return wrapper
 
 
-    def __init__(self, db_path='database.db'):
+class BudgetGuardian:
+    """
+    Guardião de Orçamento - Sistema de segurança financeira
+    Protege contra gastos indevidos e requer aprovação para custos
+    """
+    
+    def __init__(self, db_path='database.db', account_id: str = "default"):
         self.db_path = db_path
+        self.account_id = account_id
+        self.spending_limiter = get_limiter("budget_guardian", SPENDING_WINDOWS)
         
         # Limites padrão de segurança
         self.default_limits = {
@@ -335,14 +350,19 @@ def handle_errors(func):
             "protection_level": "high" if len(protections) > 2 else "medium" if len(protections) > 0 else "low"
         }
     
+    def record_spending(self, amount: float) -> Dict[str, float]:
+        """Registra um gasto aprovado/realizado nas janelas de gasto da conta"""
+        self.spending_limiter.record(self.account_id, amount)
+        return self._get_current_spending()
+    
     def _get_current_spending(self) -> Dict[str, float]:
-        """Retorna gastos atuais (simulado)"""
-        # Em produção, buscaria do banco de dados
+        """Retorna gastos atuais (janelas deslizantes de 24h, 7 e 30 dias)"""
+        usage = self.spending_limiter.usage(self.account_id)
         return {
-            "today": 150.50,
-            "this_week": 850.75,
-            "this_month": 3250.00,
-            "last_30_days": 4100.25
+            "today": usage["today"]["amount"],
+            "this_week": usage["this_week"]["amount"],
+            "this_month": usage["this_month"]["amount"],
+            "last_30_days": usage["this_month"]["amount"]
         }
     
     def _get_user_limits(self) -> Dict[str, float]:
@@ -364,6 +384,10 @@ def handle_errors(func):
     def _detect_suspicious_pattern(self, amount: float, campaign_data: Dict[str, Any],
                                    current_spending: Dict[str, float]) -> bool:
         """Detecta padrões suspeitos de gastos"""
+        # Sem histórico não há padrão para comparar
+        if current_spending["last_30_days"] <= 0:
+            return False
+        
         # Verificar se gasto é muito acima da média
         avg_daily = current_spending["last_30_days"] / 30
         if amount > avg_daily * 3:
@@ -456,5 +480,23 @@ def handle_errors(func):
         return recommendations
 
 
-# Instância global
-budget_guardian = BudgetGuardian()
+# Instância global (criada no primeiro uso: o limitador cria a tabela no banco)
+_guardian_instance: Optional[BudgetGuardian] = None
+_guardian_lock = threading.Lock()
+
+
+def get_budget_guardian() -> BudgetGuardian:
+    """
+    Retorna instância global do guardião de orçamento (singleton)
+
+    Returns:
+        BudgetGuardian: Instância do guardião
+    """
+    global _guardian_instance
+
+    if _guardian_instance is None:
+        with _guardian_lock:
+            if _guardian_instance is None:
+                _guardian_instance = BudgetGuardian()
+
+    return _guardian_instance
@@ -0,0 +1,279 @@
+"""
+🧭 CAMPAIGN SIMILARITY - Índice kNN sobre o Histórico de Campanhas
+Nexora Prime
+
+Codifica cada campanha de `campaigns_history` em um vetor numérico:
+- Categóricos (nicho, país, plataforma, tipo de produto, objetivo,
+  público, tipo de criativo) viram embeddings determinísticos por hash,
+  ponderados por importância
+- Orçamento e resultados (ROAS, CPA, conversões, score) em escala log/fixa
+
+O índice fica em memória (uma matriz float32 por grupo de features, com
+crescimento amortizado, mais a norma² de cada linha por grupo) e é
+atualizado incrementalmente a cada campanha aprendida. A busca kNN só lê
+os grupos presentes na consulta: |x-q|² = Σ (|x_g|² - 2 x_g·q_g + |q_g|²),
+um produto matriz-vetor estreito por grupo + argpartition. Os JSONs
+`strategy`/`learnings` são decodificados uma única vez, na entrada do índice.
+"""
+
+import hashlib
+import json
+import math
+import threading
+import time
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param
+except ImportError:
+    from db_utils import get_db_connection, sql_param
+
+
+EMBEDDING_DIM = 8
+
+# Campo categórico -> peso na distância
+CATEGORICAL_FIELDS = {
+    "niche": 3.0,
+    "country": 2.0,
+    "platform": 2.0,
+    "product_type": 1.0,
+    "objective": 1.5,
+    "audience": 1.0,
+    "creative_type": 1.0,
+}
+
+NUMERIC_GROUPS = {
+    "budget": 1,
+    "outcomes": 4,
+}
+
+HISTORY_COLUMNS = (
+    "id, niche, country, product_type, platform, strategy, budget, roas, cpa, "
+    "conversions, status, success_score, ended_at, learnings"
+)
+
+GROUP_WIDTHS = dict(
+    [(field, EMBEDDING_DIM) for field in CATEGORICAL_FIELDS] + list(NUMERIC_GROUPS.items())
+)
+
+
+class CampaignEncoder:
+    """Transforma dados de campanha em vetores por grupo de features"""
+
+    def __init__(self):
+        self._embeddings: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def _embedding(self, field: str, value: str) -> np.ndarray:
+        key = (field, value)
+        vector = self._embeddings.get(key)
+        if vector is None:
+            seed = int(hashlib.md5(f"{field}:{value}".encode()).hexdigest()[:8], 16)
+            vector = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+            # Norma sqrt(1/2): valores distintos ficam a distância ~1 (antes do peso)
+            vector = (vector / np.linalg.norm(vector) * math.sqrt(0.5)).astype(np.float32)
+            self._embeddings[key] = vector
+        return vector
+
+    @staticmethod
+    def categorical_values(campaign: Dict[str, Any]) -> Dict[str, Optional[str]]:
+        strategy = campaign.get("strategy")
+        strategy = strategy if isinstance(strategy, dict) else {}
+        values = {}
+        for field in CATEGORICAL_FIELDS:
+            value = campaign.get(field, strategy.get(field))
+            if isinstance(value, dict):
+                value = value.get("type") or json.dumps(value, sort_keys=True)
+            values[field] = None if value in (None, "") else str(value).lower()
+        return values
+
+    def encode(self, campaign: Dict[str, Any], include_outcomes: bool = True) -> Dict[str, np.ndarray]:
+        """
+        Returns:
+            Grupo de features -> vetor float32, só para os grupos presentes
+        """
+        groups = {}
+
+        for field, value in self.categorical_values(campaign).items():
+            if value is not None:
+                groups[field] = self._embedding(field, value) * CATEGORICAL_FIELDS[field]
+
+        budget = campaign.get("budget")
+        if budget:
+            groups["budget"] = np.array([math.log1p(max(float(budget), 0)) / 2], dtype=np.float32)
+
+        if include_outcomes and campaign.get("roas") is not None:
+            groups["outcomes"] = np.array([
+                min(max(float(campaign.get("roas") or 0), 0), 20) / 2,
+                math.log1p(max(float(campaign.get("cpa") or 0), 0)) / 2,
+                math.log1p(max(float(campaign.get("conversions") or 0), 0)) / 2,
+                float(campaign.get("success_score") or 0) / 50
+            ], dtype=np.float32)
+
+        return groups
+
+
+class CampaignSimilarityIndex:
+    """
+    Índice kNN em memória sobre campaigns_history.
+
+    Carregado do banco no primeiro uso; `upsert` mantém o índice em dia no
+    processo que aprende e `sync_interval` traz linhas novas gravadas por
+    outros processos (filtrando por ended_at).
+    """
+
+    def __init__(self, sync_interval: float = 30.0, initial_capacity: int = 1024):
+        self.encoder = CampaignEncoder()
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._capacity = initial_capacity
+        self._matrices = {g: np.zeros((initial_capacity, w), dtype=np.float32) for g, w in GROUP_WIDTHS.items()}
+        self._norms = {g: np.zeros(initial_capacity, dtype=np.float32) for g in GROUP_WIDTHS}
+        self._records: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._loaded = False
+        self._last_sync = 0.0
+        self._last_ended_at = ""
+
+    def __len__(self):
+        return len(self._records)
+
+    # ===== CARGA / SINCRONIZAÇÃO =====
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        if self._loaded and now - self._last_sync < self.sync_interval:
+            return
+        with self._lock:
+            if self._loaded and now - self._last_sync < self.sync_interval:
+                return
+            try:
+                self._load_rows(self._last_ended_at if self._loaded else None)
+            except Exception as e:
+                print(f"[SIMILARITY] ❌ Erro ao carregar histórico: {e}")
+            self._loaded = True
+            self._last_sync = now
+
+    def _load_rows(self, since: Optional[str]):
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if since:
+                cursor.execute(sql_param(
+                    f"SELECT {HISTORY_COLUMNS} FROM campaigns_history WHERE ended_at > ?"
+                ), (since,))
+            else:
+                cursor.execute(f"SELECT {HISTORY_COLUMNS} FROM campaigns_history")
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        for row in rows:
+            record = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+            self._add(self._decode(record))
+
+    @staticmethod
+    def _decode(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Decodifica os JSONs uma única vez"""
+        for field in ("strategy", "learnings"):
+            value = record.get(field)
+            if isinstance(value, str):
+                try:
+                    record[field] = json.loads(value) if value else {}
+                except (TypeError, ValueError):
+                    record[field] = {}
+            elif value is None:
+                record[field] = {}
+        return record
+
+    # ===== ATUALIZAÇÃO =====
+
+    def upsert(self, record: Dict[str, Any]):
+        """Adiciona ou substitui uma campanha (strategy/learnings já decodificados)"""
+        with self._lock:
+            self._add(self._decode(dict(record)))
+
+    def _add(self, record: Dict[str, Any]):
+        groups = self.encoder.encode(record)
+        position = self._positions.get(record["id"])
+        if position is None:
+            position = len(self._records)
+            if position >= self._capacity:
+                self._grow()
+            self._records.append(record)
+            self._positions[record["id"]] = position
+        else:
+            self._records[position] = record
+        for group in GROUP_WIDTHS:
+            vector = groups.get(group)
+            if vector is None:
+                # Grupo ausente: zeros (distância = norma da consulta)
+                self._matrices[group][position] = 0
+                self._norms[group][position] = 0
+            else:
+                self._matrices[group][position] = vector
+                self._norms[group][position] = float(vector @ vector)
+        if record.get("ended_at") and str(record["ended_at"]) > self._last_ended_at:
+            self._last_ended_at = str(record["ended_at"])
+
+    def _grow(self):
+        n = len(self._records)
+        self._capacity *= 2
+        for group, width in GROUP_WIDTHS.items():
+            matrix = np.zeros((self._capacity, width), dtype=np.float32)
+            matrix[:n] = self._matrices[group][:n]
+            self._matrices[group] = matrix
+            norms = np.zeros(self._capacity, dtype=np.float32)
+            norms[:n] = self._norms[group][:n]
+            self._norms[group] = norms
+
+    # ===== BUSCA =====
+
+    def search(self, query: Dict[str, Any], k: int = 5, include_outcomes: bool = False) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        k vizinhos mais próximos de `query`.
+
+        Só os grupos de features presentes na consulta entram na distância
+        (uma consulta só com nicho/país/plataforma ignora orçamento e
+        resultados). Empates são desfeitos pelo maior success_score.
+
+        Returns:
+            Lista de (registro, similaridade em 0..1)
+        """
+        self._ensure_loaded()
+        with self._lock:
+            n = len(self._records)
+            if n == 0 or k <= 0:
+                return []
+            distances = np.zeros(n, dtype=np.float32)
+            for group, q in self.encoder.encode(query, include_outcomes=include_outcomes).items():
+                distances += self._norms[group][:n]
+                matrix = self._matrices[group][:n]
+                # Grupo de largura 1: multiplicação direta (gemv n×1 é lento)
+                distances -= 2 * (matrix[:, 0] * q[0] if len(q) == 1 else matrix @ q)
+                distances += float(q @ q)
+            distances = np.maximum(distances, 0)
+
+            k = min(k, n)
+            candidates = np.argpartition(distances, k - 1)[:k] if k < n else np.arange(n)
+            # Inclui empatados com o k-ésimo para desempatar pelo score
+            cutoff = distances[candidates].max()
+            tied = np.flatnonzero(distances <= cutoff + 1e-6)
+            if len(tied) > k:
+                candidates = tied
+            scores = np.array([self._records[i].get("success_score") or 0 for i in candidates])
+            order = np.lexsort((-scores, np.round(distances[candidates], 6)))[:k]
+
+            return [
+                (self._records[candidates[i]], float(1 / (1 + math.sqrt(distances[candidates[i]]))))
+                for i in order
+            ]
+
+    def get(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            position = self._positions.get(campaign_id)
+            return self._records[position] if position is not None else None
@@ -0,0 +1,603 @@
+"""
+👥 COHORT LTV - LTV por Coortes com Ingestão Incremental
+Nexora Prime
+
+Subsistema de LTV sobre tabelas agregadas:
+- Clientes e pedidos ingeridos em lotes (idempotente por order_id)
+- Coortes mês de aquisição × canal com receita por mês desde a aquisição
+  (a curva cumulativa é um cumsum na leitura)
+- Estatísticas por campanha, público, criativo e canal atualizadas por delta
+- Distribuição de LTV por cliente em sketches de quantis (buckets
+  logarítmicos, erro relativo limitado, suportam remoção)
+
+Nenhuma consulta percorre a lista de clientes: tudo vem das tabelas.
+Vários workers podem ingerir ao mesmo tempo: clientes e estatísticas do
+lote são travados na transação (BEGIN IMMEDIATE no SQLite, SELECT ... FOR
+UPDATE no PostgreSQL) e os sketches são mesclados no banco, não no processo.
+"""
+
+import json
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+import numpy as np
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+
+
+DIMENSIONS = ("campaign", "audience", "creative", "channel")
+
+
+class QuantileSketch:
+    """
+    Sketch de quantis com erro relativo `alpha` (estilo DDSketch).
+
+    Cada valor positivo cai no bucket ceil(log_gamma(x)); add e remove são
+    O(1), então o LTV de um cliente pode ser "movido" quando ele compra de
+    novo. Sketches do mesmo alpha podem ser somados (merge).
+    """
+
+    def __init__(self, alpha: float = 0.01):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = defaultdict(int)
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count += count
+        else:
+            self.buckets[self._key(value)] += count
+        self.count += count
+        self.total += value * count
+
+    def remove(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zero_count -= count
+        else:
+            key = self._key(value)
+            self.buckets[key] -= count
+            if self.buckets[key] <= 0:
+                del self.buckets[key]
+        self.count -= count
+        self.total -= value * count
+
+    def merge(self, other: "QuantileSketch"):
+        for key, count in other.buckets.items():
+            self.buckets[key] += count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.total += other.total
+
+    def quantile(self, q: float) -> float:
+        if self.count <= 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # Valor representativo do bucket (meio em escala relativa)
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def summary(self) -> Dict[str, float]:
+        """Mesmas chaves de LTVEngine._calculate_ltv_distribution"""
+        if self.count <= 0:
+            return {}
+        return {
+            "min": round(self.quantile(0.0), 2),
+            "max": round(self.quantile(1.0), 2),
+            "median": round(self.quantile(0.5), 2),
+            "p25": round(self.quantile(0.25), 2),
+            "p75": round(self.quantile(0.75), 2),
+            "p90": round(self.quantile(0.90), 2),
+            "avg": round(self.total / self.count, 2)
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "buckets": {str(k): v for k, v in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data.get("alpha", 0.01))
+        sketch.buckets.update({int(k): v for k, v in data.get("buckets", {}).items()})
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.total = data.get("total", 0.0)
+        return sketch
+
+
+def _month(timestamp: Any) -> Tuple[str, int]:
+    """('AAAA-MM', índice absoluto do mês)"""
+    text = timestamp.isoformat() if isinstance(timestamp, datetime) else str(timestamp)
+    year, month = int(text[0:4]), int(text[5:7])
+    return f"{year:04d}-{month:02d}", year * 12 + month - 1
+
+
+def _rows_as_dicts(cursor, rows) -> List[Dict[str, Any]]:
+    if not rows:
+        return []
+    if isinstance(rows[0], dict):
+        return [dict(r) for r in rows]
+    columns = [d[0] for d in cursor.description]
+    return [dict(zip(columns, r)) for r in rows]
+
+
+class CohortLTVStore:
+    """
+    Tabelas de coortes e agregados de LTV atualizadas incrementalmente.
+
+    `ingest_orders` processa um lote numa única transação: trava só os
+    clientes e as estatísticas do lote, acumula os deltas em memória e
+    aplica tudo com executemany + upsert aditivo. Os sketches ficam no
+    banco com `sketch_version`; o cache local só é relido quando a versão
+    muda.
+    """
+
+    def __init__(self, sketch_alpha: float = 0.01):
+        self.sketch_alpha = sketch_alpha
+        # (dimension, dimension_id) -> (sketch_version, sketch)
+        self.sketches: Dict[Tuple[str, str], Tuple[int, QuantileSketch]] = {}
+        self._lock = threading.Lock()
+        self._init_database()
+
+    def _init_database(self):
+        """Cria as tabelas de coortes"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ltv_customers (
+                    customer_id TEXT PRIMARY KEY,
+                    acquired_at TEXT,
+                    cohort_month TEXT,
+                    channel TEXT,
+                    campaign_id TEXT,
+                    audience_id TEXT,
+                    creative_id TEXT,
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    first_order_value REAL,
+                    last_order_at TEXT
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ltv_orders (
+                    order_id TEXT PRIMARY KEY,
+                    customer_id TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ltv_cohorts (
+                    cohort_month TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    customers INTEGER NOT NULL DEFAULT 0,
+                    repeat_customers INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (cohort_month, channel)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ltv_cohort_revenue (
+                    cohort_month TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    month_offset INTEGER NOT NULL,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (cohort_month, channel, month_offset)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ltv_dimension_stats (
+                    dimension TEXT NOT NULL,
+                    dimension_id TEXT NOT NULL,
+                    customers INTEGER NOT NULL DEFAULT 0,
+                    repeat_customers INTEGER NOT NULL DEFAULT 0,
+                    orders INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    first_order_revenue REAL NOT NULL DEFAULT 0,
+                    sketch TEXT,
+                    sketch_version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT,
+                    PRIMARY KEY (dimension, dimension_id)
+                )
+            """)
+            ensure_column(cursor, "ltv_dimension_stats", "sketch_version", "INTEGER NOT NULL DEFAULT 0")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[COHORT LTV] ❌ Erro ao inicializar tabelas: {e}")
+
+    # ===== INGESTÃO =====
+
+    def ingest_customers(self, customers: Iterable[Dict[str, Any]]) -> int:
+        """
+        Registra (ou completa) a atribuição de clientes.
+
+        O cliente só entra nas coortes no primeiro pedido; aqui gravamos
+        canal, campanha, público e criativo para quando ele comprar.
+        """
+        rows = [
+            (
+                str(c["customer_id"]),
+                c.get("channel") or "unknown",
+                _opt_str(c.get("campaign_id")),
+                _opt_str(c.get("audience_id")),
+                _opt_str(c.get("creative_id"))
+            )
+            for c in customers if c.get("customer_id") is not None
+        ]
+        if not rows:
+            return 0
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            # Atribuição só é atualizada enquanto o cliente não comprou
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_customers (customer_id, channel, campaign_id, audience_id, creative_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (customer_id) DO UPDATE SET
+                    channel = excluded.channel,
+                    campaign_id = excluded.campaign_id,
+                    audience_id = excluded.audience_id,
+                    creative_id = excluded.creative_id
+                WHERE ltv_customers.orders = 0
+            """), rows)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+    def ingest_orders(self, orders: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Ingere um lote de pedidos.
+
+        Cada pedido: order_id, customer_id, amount, created_at e, se o cliente
+        ainda não existir, os campos de atribuição (channel, campaign_id, ...).
+
+        Returns:
+            Contagem de pedidos novos, duplicados e clientes adquiridos
+        """
+        batch: Dict[str, Dict[str, Any]] = {}
+        for order in orders:
+            if order.get("order_id") is None or order.get("customer_id") is None:
+                continue
+            batch.setdefault(str(order["order_id"]), order)
+        if not batch:
+            return {"ingested": 0, "duplicates": 0, "new_customers": 0}
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if not is_postgres():
+                conn.isolation_level = None
+                cursor.execute("BEGIN IMMEDIATE")
+
+            # Clientes novos entram com orders = 0 para poderem ser travados
+            first_seen: Dict[str, Dict[str, Any]] = {}
+            for order in batch.values():
+                first_seen.setdefault(str(order["customer_id"]), order)
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_customers (customer_id, channel, campaign_id, audience_id, creative_id)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (customer_id) DO NOTHING
+            """), [
+                (
+                    cid, o.get("channel") or "unknown", _opt_str(o.get("campaign_id")),
+                    _opt_str(o.get("audience_id")), _opt_str(o.get("creative_id"))
+                )
+                for cid, o in sorted(first_seen.items())
+            ])
+            lock = " FOR UPDATE" if is_postgres() else ""
+            customers = {
+                row["customer_id"]: row
+                for row in self._select_in(
+                    cursor, "SELECT * FROM ltv_customers WHERE customer_id IN ({}) ORDER BY customer_id" + lock,
+                    sorted(first_seen)
+                )
+            }
+
+            # Com os clientes travados, a checagem de duplicados é consistente
+            existing = self._select_in(cursor, "SELECT order_id FROM ltv_orders WHERE order_id IN ({})", list(batch))
+            duplicates = {row["order_id"] for row in existing}
+            new_orders = sorted(
+                (o for oid, o in batch.items() if oid not in duplicates),
+                key=lambda o: str(o.get("created_at", ""))
+            )
+            customer_ids = sorted({str(o["customer_id"]) for o in new_orders})
+            previous_revenue = {cid: (c["revenue"] if c["orders"] else None) for cid, c in customers.items()}
+
+            cohort_revenue = defaultdict(lambda: [0.0, 0])
+            cohort_counts = defaultdict(lambda: [0, 0])
+            dimension_deltas = defaultdict(lambda: [0, 0, 0, 0.0, 0.0])
+            order_rows = []
+            new_customers = 0
+
+            for order in new_orders:
+                cid = str(order["customer_id"])
+                amount = float(order.get("amount", 0) or 0)
+                created_at = str(order.get("created_at") or datetime.now().isoformat())
+                customer = customers[cid]
+
+                if not customer["orders"]:
+                    # Primeiro pedido = aquisição
+                    customer["acquired_at"] = created_at
+                    customer["cohort_month"] = _month(created_at)[0]
+                    customer["first_order_value"] = amount
+                    new_customers += 1
+                    cohort_counts[(customer["cohort_month"], customer["channel"])][0] += 1
+
+                customer["orders"] += 1
+                customer["revenue"] += amount
+                customer["last_order_at"] = created_at
+
+                offset = _month(created_at)[1] - _month(customer["acquired_at"])[1]
+                bucket = cohort_revenue[(customer["cohort_month"], customer["channel"], max(0, offset))]
+                bucket[0] += amount
+                bucket[1] += 1
+
+                became_repeat = customer["orders"] == 2
+                if became_repeat:
+                    cohort_counts[(customer["cohort_month"], customer["channel"])][1] += 1
+
+                for key in self._dimension_keys(customer):
+                    delta = dimension_deltas[key]
+                    delta[0] += 1 if customer["orders"] == 1 else 0
+                    delta[1] += 1 if became_repeat else 0
+                    delta[2] += 1
+                    delta[3] += amount
+                    delta[4] += amount if customer["orders"] == 1 else 0
+
+                order_rows.append((str(order["order_id"]), cid, amount, created_at))
+
+            now = datetime.now().isoformat()
+            dimension_keys = sorted(dimension_deltas)
+            # Linhas de estatística travadas em ordem fixa (depois dos clientes)
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_dimension_stats (dimension, dimension_id, updated_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT (dimension, dimension_id) DO NOTHING
+            """), [(k[0], k[1], now) for k in dimension_keys])
+            sketches = {}
+            for key in dimension_keys:
+                cursor.execute(sql_param(
+                    "SELECT sketch FROM ltv_dimension_stats WHERE dimension = ? AND dimension_id = ?" + lock
+                ), key)
+                stored = _rows_as_dicts(cursor, cursor.fetchall())[0]["sketch"]
+                sketches[key] = (
+                    QuantileSketch.from_dict(json.loads(stored)) if stored else QuantileSketch(self.sketch_alpha)
+                )
+
+            # Sketches: move o LTV de cada cliente tocado sobre a versão do banco
+            for cid in customer_ids:
+                customer = customers[cid]
+                for key in self._dimension_keys(customer):
+                    if previous_revenue.get(cid) is not None:
+                        sketches[key].remove(previous_revenue[cid])
+                    sketches[key].add(customer["revenue"])
+
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_orders (order_id, customer_id, amount, created_at)
+                VALUES (?, ?, ?, ?)
+            """), order_rows)
+            cursor.executemany(sql_param("""
+                UPDATE ltv_customers SET
+                    acquired_at = ?, cohort_month = ?, orders = ?, revenue = ?,
+                    first_order_value = ?, last_order_at = ?
+                WHERE customer_id = ?
+            """), [
+                (
+                    c["acquired_at"], c["cohort_month"], c["orders"], c["revenue"],
+                    c["first_order_value"], c["last_order_at"], c["customer_id"]
+                )
+                for c in (customers[cid] for cid in customer_ids)
+            ])
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_cohorts (cohort_month, channel, customers, repeat_customers)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (cohort_month, channel) DO UPDATE SET
+                    customers = ltv_cohorts.customers + excluded.customers,
+                    repeat_customers = ltv_cohorts.repeat_customers + excluded.repeat_customers
+            """), [(k[0], k[1], v[0], v[1]) for k, v in cohort_counts.items()])
+            cursor.executemany(sql_param("""
+                INSERT INTO ltv_cohort_revenue (cohort_month, channel, month_offset, revenue, orders)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (cohort_month, channel, month_offset) DO UPDATE SET
+                    revenue = ltv_cohort_revenue.revenue + excluded.revenue,
+                    orders = ltv_cohort_revenue.orders + excluded.orders
+            """), [(k[0], k[1], k[2], v[0], v[1]) for k, v in cohort_revenue.items()])
+            cursor.executemany(sql_param("""
+                UPDATE ltv_dimension_stats SET
+                    customers = customers + ?,
+                    repeat_customers = repeat_customers + ?,
+                    orders = orders + ?,
+                    revenue = revenue + ?,
+                    first_order_revenue = first_order_revenue + ?,
+                    sketch = ?,
+                    sketch_version = sketch_version + 1,
+                    updated_at = ?
+                WHERE dimension = ? AND dimension_id = ?
+            """), [
+                (v[0], v[1], v[2], v[3], v[4], json.dumps(sketches[k].to_dict()), now, k[0], k[1])
+                for k, v in ((k, dimension_deltas[k]) for k in dimension_keys)
+            ])
+            if is_postgres():
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+        except Exception:
+            if is_postgres():
+                conn.rollback()
+            elif conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        return {"ingested": len(order_rows), "duplicates": len(duplicates), "new_customers": new_customers}
+
+    @staticmethod
+    def _dimension_keys(customer: Dict[str, Any]) -> List[Tuple[str, str]]:
+        keys = [("all", "all"), ("channel", customer["channel"])]
+        for dimension in ("campaign", "audience", "creative"):
+            value = customer.get(f"{dimension}_id")
+            if value is not None:
+                keys.append((dimension, value))
+        return keys
+
+    @staticmethod
+    def _select_in(cursor, query: str, values: List[str], chunk: int = 500) -> List[Dict[str, Any]]:
+        """SELECT ... IN (...) em blocos (limite de parâmetros do SQLite)"""
+        results = []
+        for i in range(0, len(values), chunk):
+            part = values[i:i + chunk]
+            cursor.execute(sql_param(query.format(", ".join("?" * len(part)))), part)
+            results.extend(_rows_as_dicts(cursor, cursor.fetchall()))
+        return results
+
+    # ===== CONSULTAS =====
+
+    def get_dimension_ltv(self, dimension: str, dimension_id: Any) -> Optional[Dict[str, Any]]:
+        """LTV agregado de uma campanha/público/criativo/canal (None se sem dados)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT customers, repeat_customers, orders, revenue, first_order_revenue, sketch_version
+                FROM ltv_dimension_stats
+                WHERE dimension = ? AND dimension_id = ?
+            """), (dimension, str(dimension_id)))
+            rows = _rows_as_dicts(cursor, cursor.fetchall())
+            if not rows or not rows[0]["customers"]:
+                return None
+            row = rows[0]
+            sketch = self._cached_sketch(cursor, (dimension, str(dimension_id)), row["sketch_version"])
+        finally:
+            conn.close()
+
+        customers = row["customers"]
+        return {
+            "customer_count": customers,
+            "total_revenue": round(row["revenue"], 2),
+            "avg_ltv": round(row["revenue"] / customers, 2),
+            "avg_first_purchase": round(row["first_order_revenue"] / customers, 2),
+            "repeat_rate": row["repeat_customers"] / customers,
+            "avg_purchases": row["orders"] / customers,
+            "distribution": sketch.summary() if sketch else {}
+        }
+
+    def _cached_sketch(self, cursor, key: Tuple[str, str], version: int) -> Optional[QuantileSketch]:
+        """Sketch da dimensão; só relê do banco quando outro worker mudou a versão"""
+        with self._lock:
+            cached = self.sketches.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        cursor.execute(sql_param(
+            "SELECT sketch, sketch_version FROM ltv_dimension_stats WHERE dimension = ? AND dimension_id = ?"
+        ), key)
+        rows = _rows_as_dicts(cursor, cursor.fetchall())
+        if not rows or not rows[0]["sketch"]:
+            return None
+        sketch = QuantileSketch.from_dict(json.loads(rows[0]["sketch"]))
+        with self._lock:
+            self.sketches[key] = (rows[0]["sketch_version"], sketch)
+        return sketch
+
+    def get_cohort_curves(self, channel: str = None, max_months: int = 24) -> List[Dict[str, Any]]:
+        """
+        Curvas de receita cumulativa por cliente para cada coorte.
+
+        Returns:
+            Uma entrada por (mês de aquisição, canal) com `cumulative_ltv[m]`
+            = receita acumulada por cliente até m meses após a aquisição
+        """
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            where = " WHERE channel = ?" if channel else ""
+            params = (channel,) if channel else ()
+            cursor.execute(sql_param("SELECT cohort_month, channel, customers, repeat_customers FROM ltv_cohorts" + where), params)
+            cohorts = _rows_as_dicts(cursor, cursor.fetchall())
+            cursor.execute(sql_param(
+                "SELECT cohort_month, channel, month_offset, revenue FROM ltv_cohort_revenue" + where
+                + (" AND" if channel else " WHERE") + " month_offset <= ?"
+            ), params + (max_months,))
+            revenue_rows = _rows_as_dicts(cursor, cursor.fetchall())
+        finally:
+            conn.close()
+
+        index = {(c["cohort_month"], c["channel"]): i for i, c in enumerate(cohorts)}
+        revenue = np.zeros((len(cohorts), max_months + 1))
+        for row in revenue_rows:
+            i = index.get((row["cohort_month"], row["channel"]))
+            if i is not None:
+                revenue[i, row["month_offset"]] += row["revenue"]
+
+        customers = np.array([max(c["customers"], 1) for c in cohorts], dtype=np.float64)
+        curves = np.cumsum(revenue, axis=1) / customers[:, None] if cohorts else revenue
+
+        # Meses já observados por coorte (não projeta além de hoje)
+        _, current_month = _month(datetime.now())
+        results = []
+        for i, cohort in enumerate(sorted(cohorts, key=lambda c: (c["cohort_month"], c["channel"]))):
+            row = index[(cohort["cohort_month"], cohort["channel"])]
+            observed = min(max_months, current_month - _month(cohort["cohort_month"] + "-01")[1])
+            results.append({
+                "cohort_month": cohort["cohort_month"],
+                "channel": cohort["channel"],
+                "customers": cohort["customers"],
+                "repeat_rate": round(cohort["repeat_customers"] / cohort["customers"], 4) if cohort["customers"] else 0,
+                "cumulative_ltv": [round(float(v), 2) for v in curves[row, :max(observed, 0) + 1]]
+            })
+        return results
+
+
+def _opt_str(value: Any) -> Optional[str]:
+    return None if value is None else str(value)
+
+
+# Instância global do store
+_store_instance: Optional[CohortLTVStore] = None
+_store_lock = threading.Lock()
+
+
+def get_cohort_ltv_store() -> CohortLTVStore:
+    """
+    Retorna instância global do store de coortes (singleton)
+
+    Returns:
+        CohortLTVStore: Instância do store
+    """
+    global _store_instance
+
+    if _store_instance is None:
+        with _store_lock:
+            if _store_instance is None:
+                _store_instance = CohortLTVStore()
+
+    return _store_instance
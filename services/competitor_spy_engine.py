@@ -15,12 +15,12 @@ from services.manus_ai_service import manus_ai
 # Importar Similarweb Intelligence (via Manus IA)
 try:
     from services.similarweb_intelligence import similarweb_intelligence
-    from services.manus_credit_tracker import manus_credit_tracker, ActionType
+    from services.manus_credit_tracker import get_manus_credit_tracker, ActionType
     SIMILARWEB_AVAILABLE = True
 except ImportError:
     SIMILARWEB_AVAILABLE = False
     similarweb_intelligence = None
-    manus_credit_tracker = None
+    get_manus_credit_tracker = None
 
 logger = logging.getLogger(__name__)
 
@@ -184,8 +184,8 @@ class CompetitorSpyEngine:
                 return None
             
             # Registrar uso de créditos
-            if manus_credit_tracker:
-                manus_credit_tracker.log_credit_usage(
+            if get_manus_credit_tracker:
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.SIMILARWEB_INSIGHT,
                     context={'domain': domain, 'source': 'competitor_spy'}
                 )
@@ -0,0 +1,260 @@
+"""
+🔑 CREDENTIAL SERVICE - Hash de Senhas Fora da Thread da Requisição
+Nexora Prime
+
+Hash de senhas com scrypt (memory-hard, `hashlib.scrypt` da stdlib):
+- O cálculo roda num pool de processos limitado, então rajadas de login
+  ocupam no máximo `max_workers` CPUs e não travam os workers do gunicorn
+- Fila limitada (`max_pending`): acima dela o serviço recusa na hora com
+  CredentialServiceBusy em vez de acumular requisições esperando
+- Formato autodescritivo "scrypt$n$r$p$salt$hash" (base64): os parâmetros
+  de custo ficam no hash, então dá para subir o custo sem invalidar senhas
+- `verify` pede rehash quando o hash usa parâmetros antigos (ou o
+  pbkdf2_sha256 legado) - o login grava o hash novo
+- `benchmark_params` escolhe o maior N que cabe numa latência alvo
+- Filho que morre quebra o pool: ele é descartado e o próximo uso cria outro
+"""
+
+import os
+import hmac
+import time
+import base64
+import atexit
+import hashlib
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, List
+
+
+SALT_BYTES = 16
+VERIFY_TIMEOUT_SECONDS = 10.0
+LEGACY_PBKDF2_ITERATIONS = 100000
+
+
+class CredentialServiceBusy(Exception):
+    """Fila de hash cheia - o chamador deve responder 429/503"""
+
+
+@dataclass(frozen=True)
+class ScryptParams:
+    """Parâmetros de custo do scrypt (memória ~ 128 * n * r bytes)"""
+    n: int = 2 ** 15
+    r: int = 8
+    p: int = 1
+    dklen: int = 32
+
+    @property
+    def maxmem(self) -> int:
+        # Folga sobre o mínimo exigido pelo OpenSSL
+        return 128 * self.n * self.r * (self.p + 1) + 1024 * 1024
+
+    @property
+    def memory_mb(self) -> float:
+        return round(128 * self.n * self.r / (1024 * 1024), 1)
+
+    @classmethod
+    def from_env(cls) -> "ScryptParams":
+        defaults = cls()
+        return cls(
+            n=int(os.environ.get("SCRYPT_N", defaults.n)),
+            r=int(os.environ.get("SCRYPT_R", defaults.r)),
+            p=int(os.environ.get("SCRYPT_P", defaults.p))
+        )
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int, dklen: int) -> bytes:
+    """Função de módulo para poder rodar em processo filho"""
+    params = ScryptParams(n=n, r=r, p=p, dklen=dklen)
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=params.maxmem, dklen=dklen)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+
+
+def encode_hash(params: ScryptParams, salt: bytes, digest: bytes) -> str:
+    return f"scrypt${params.n}${params.r}${params.p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def parse_hash(encoded: str) -> Dict[str, Any]:
+    """
+    Decodifica um hash armazenado.
+
+    Aceita "scrypt$n$r$p$salt$hash" e o legado
+    "pbkdf2_sha256$iteracoes$salt_hex$hash_hex" (hash_password antigo).
+    """
+    parts = encoded.split("$")
+    if parts[0] == "scrypt" and len(parts) == 6:
+        digest = _b64decode(parts[5])
+        return {
+            "algorithm": "scrypt",
+            "params": ScryptParams(n=int(parts[1]), r=int(parts[2]), p=int(parts[3]), dklen=len(digest)),
+            "salt": _b64decode(parts[4]),
+            "digest": digest
+        }
+    if parts[0] == "pbkdf2_sha256" and len(parts) == 4:
+        return {
+            "algorithm": "pbkdf2_sha256",
+            "iterations": int(parts[1]),
+            "salt": parts[2].encode(),
+            "digest": bytes.fromhex(parts[3])
+        }
+    raise ValueError("Formato de hash desconhecido")
+
+
+class CredentialService:
+    """Hash e verificação de senhas num pool de processos limitado"""
+
+    def __init__(self, params: Optional[ScryptParams] = None, max_workers: Optional[int] = None,
+                 max_pending: Optional[int] = None):
+        self.params = params or ScryptParams.from_env()
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 4
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Pool criado no primeiro uso (depois do fork do gunicorn)"""
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                    atexit.register(self._executor.shutdown, wait=False)
+        return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """Descarta o pool quebrado; o próximo uso cria outro"""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, fn, *args) -> bytes:
+        """
+        Executa no pool respeitando a fila limitada.
+
+        A vaga só é devolvida quando o cálculo termina de fato: no timeout o
+        scrypt continua rodando no filho e segue contando na fila.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise CredentialServiceBusy("Muitas verificações de senha em andamento")
+        executor = self._get_executor()
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._reset_executor(executor)
+            raise CredentialServiceBusy("Pool de hash reiniciado, tente novamente")
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=VERIFY_TIMEOUT_SECONDS)
+        except FutureTimeoutError:
+            future.cancel()
+            raise CredentialServiceBusy("Tempo esgotado na verificação de senha")
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            raise CredentialServiceBusy("Pool de hash reiniciado, tente novamente")
+
+    # ===== API =====
+
+    def hash_password(self, password: str) -> str:
+        """Hash scrypt com os parâmetros atuais"""
+        salt = secrets.token_bytes(SALT_BYTES)
+        params = self.params
+        digest = self._run(_scrypt, password, salt, params.n, params.r, params.p, params.dklen)
+        return encode_hash(params, salt, digest)
+
+    def needs_rehash(self, encoded: str) -> bool:
+        try:
+            parsed = parse_hash(encoded)
+        except ValueError:
+            return True
+        return parsed["algorithm"] != "scrypt" or parsed["params"] != self.params
+
+    def verify(self, password: str, encoded: str) -> Dict[str, Any]:
+        """
+        Verifica a senha contra o hash armazenado.
+
+        Returns:
+            {"valid", "needs_rehash", "new_hash"} - `new_hash` vem preenchido
+            quando a senha confere e o hash usa parâmetros antigos
+        """
+        try:
+            parsed = parse_hash(encoded)
+        except ValueError:
+            return {"valid": False, "needs_rehash": False, "new_hash": None}
+
+        if parsed["algorithm"] == "scrypt":
+            params = parsed["params"]
+            digest = self._run(_scrypt, password, parsed["salt"], params.n, params.r, params.p, params.dklen)
+        else:
+            digest = self._run(_pbkdf2, password, parsed["salt"], parsed["iterations"])
+
+        valid = hmac.compare_digest(digest, parsed["digest"])
+        needs_rehash = valid and self.needs_rehash(encoded)
+        return {
+            "valid": valid,
+            "needs_rehash": needs_rehash,
+            "new_hash": self.hash_password(password) if needs_rehash else None
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def benchmark_params(target_ms: float = 250.0, r: int = 8, p: int = 1,
+                     min_n: int = 2 ** 12, max_n: int = 2 ** 20, samples: int = 3) -> Dict[str, Any]:
+    """
+    Mede o scrypt dobrando N e escolhe o maior N com latência <= target_ms.
+
+    Rode no hardware de produção e exporte SCRYPT_N/SCRYPT_R/SCRYPT_P; os
+    hashes antigos são refeitos no próximo login de cada usuário.
+    """
+    timings: List[Dict[str, Any]] = []
+    chosen = ScryptParams(n=min_n, r=r, p=p)
+    n = min_n
+    while n <= max_n:
+        params = ScryptParams(n=n, r=r, p=p)
+        salt = secrets.token_bytes(SALT_BYTES)
+        elapsed = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            _scrypt("benchmark-password", salt, params.n, params.r, params.p, params.dklen)
+            elapsed.append((time.perf_counter() - start) * 1000)
+        median_ms = round(sorted(elapsed)[len(elapsed) // 2], 2)
+        timings.append({"n": n, "memory_mb": params.memory_mb, "ms": median_ms})
+        if median_ms > target_ms:
+            break
+        chosen = params
+        n *= 2
+
+    return {
+        "target_ms": target_ms,
+        "params": {"n": chosen.n, "r": chosen.r, "p": chosen.p, "memory_mb": chosen.memory_mb},
+        "timings": timings
+    }
+
+
+credential_service = CredentialService()
+
+
+if __name__ == "__main__":
+    print(benchmark_params())
@@ -0,0 +1,277 @@
+"""
+💳 CREDIT METERING - Medição Durável de Consumo de Créditos Manus
+Nexora Prime
+
+Eventos de uso do ManusCreditTracker:
+- Bufferizados em memória e gravados em lote (executemany) na tabela
+  `manus_credit_usage` - a cada `flush_size` eventos, a cada
+  `flush_interval` segundos (thread) e na saída do processo
+- Na mesma transação, rollups por hora e por dia de cada tipo de ação
+  (`manus_credit_rollups`, upsert aditivo - seguro com vários workers)
+- Consultas por período ('today', '7d', '30d', 'all') somam só os
+  rollups: horas do primeiro dia parcial + dias completos
+- `events` lista os eventos gravados (histórico detalhado)
+"""
+
+import atexit
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres
+
+
+HOURLY_RETENTION_DAYS = 35  # Rollups por hora além disso não são consultados
+
+USAGE_INSERT = """
+    INSERT INTO manus_credit_usage (created_at, action_type, credits_used, context)
+    VALUES (?, ?, ?, ?)
+"""
+
+ROLLUP_UPSERT = """
+    INSERT INTO manus_credit_rollups (granularity, bucket, action_type, credits, actions)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (granularity, bucket, action_type) DO UPDATE SET
+        credits = manus_credit_rollups.credits + excluded.credits,
+        actions = manus_credit_rollups.actions + excluded.actions
+"""
+
+ROLLUP_SELECT = (
+    "SELECT action_type, SUM(credits) AS credits, SUM(actions) AS actions FROM manus_credit_rollups "
+)
+
+
+def hour_bucket(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H")
+
+
+def day_bucket(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+
+class CreditUsageMeter:
+    """Buffer de eventos de uso + rollups hora/dia no banco"""
+
+    def __init__(self, flush_size: int = 100, flush_interval: float = 5.0):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.pending: List[Dict[str, Any]] = []
+        self._lock = threading.RLock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._init_tables()
+
+    def _init_tables(self):
+        id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS manus_credit_usage (
+                    {id_column},
+                    created_at TEXT NOT NULL,
+                    action_type TEXT NOT NULL,
+                    credits_used INTEGER NOT NULL,
+                    context TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_manus_credit_usage_time ON manus_credit_usage (created_at)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS manus_credit_rollups (
+                    granularity TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    action_type TEXT NOT NULL,
+                    credits INTEGER NOT NULL DEFAULT 0,
+                    actions INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (granularity, bucket, action_type)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[CREDIT METERING] ❌ Erro ao criar tabelas: {e}")
+
+    # ===== ESCRITA =====
+
+    def record(self, record: Dict[str, Any]):
+        """Bufferiza um evento ({timestamp, action_type, credits_used, context})"""
+        with self._lock:
+            self.pending.append(record)
+            full = len(self.pending) >= self.flush_size
+        self.start_flusher()
+        if full:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Grava o buffer e atualiza os rollups em uma transação.
+
+        O buffer é trocado sob o lock e gravado fora dele: `record` não
+        espera o banco.
+        """
+        with self._lock:
+            if not self.pending:
+                return 0
+            batch, self.pending = self.pending, []
+
+        rows = []
+        rollups = defaultdict(lambda: [0, 0])
+        for record in batch:
+            moment = datetime.fromisoformat(record['timestamp'])
+            action_type = record['action_type']
+            credits = int(record['credits_used'])
+            rows.append((
+                record['timestamp'], action_type, credits,
+                json.dumps(record.get('context') or {}, ensure_ascii=False, default=str)
+            ))
+            for key in (("hour", hour_bucket(moment), action_type), ("day", day_bucket(moment), action_type)):
+                rollups[key][0] += credits
+                rollups[key][1] += 1
+
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(sql_param(USAGE_INSERT), rows)
+                cursor.executemany(sql_param(ROLLUP_UPSERT), [
+                    (granularity, bucket, action_type, totals[0], totals[1])
+                    for (granularity, bucket, action_type), totals in rollups.items()
+                ])
+                cutoff = hour_bucket(datetime.now() - timedelta(days=HOURLY_RETENTION_DAYS))
+                cursor.execute(sql_param(
+                    "DELETE FROM manus_credit_rollups WHERE granularity = 'hour' AND bucket < ?"
+                ), (cutoff,))
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            # Devolver ao buffer para a próxima tentativa
+            with self._lock:
+                self.pending = batch + self.pending
+            print(f"[CREDIT METERING] ❌ Erro no flush: {e}")
+            return 0
+        return len(batch)
+
+    # ===== CONSULTAS =====
+
+    def totals_by_action(self, start: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+        """
+        Créditos e ações por tipo desde `start` (None = todo o histórico).
+        Resolução de 1 hora no início do período.
+        """
+        self.flush()
+        if start is None:
+            queries = [(ROLLUP_SELECT +
+                        "WHERE granularity = 'day' GROUP BY action_type", ())]
+        else:
+            first_day = start.replace(hour=0, minute=0, second=0, microsecond=0)
+            if start == first_day:
+                full_days_from = first_day
+                queries = []
+            else:
+                full_days_from = first_day + timedelta(days=1)
+                queries = [(ROLLUP_SELECT +
+                            "WHERE granularity = 'hour' AND bucket >= ? AND bucket < ? GROUP BY action_type",
+                            (hour_bucket(start), hour_bucket(full_days_from)))]
+            queries.append((ROLLUP_SELECT +
+                            "WHERE granularity = 'day' AND bucket >= ? GROUP BY action_type",
+                            (day_bucket(full_days_from),)))
+
+        totals: Dict[str, Dict[str, int]] = {}
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            for query, params in queries:
+                cursor.execute(sql_param(query), params)
+                for row in cursor.fetchall():
+                    if isinstance(row, dict):
+                        action_type, credits, actions = row["action_type"], row["credits"], row["actions"]
+                    else:
+                        action_type, credits, actions = row
+                    entry = totals.setdefault(action_type, {"credits": 0, "actions": 0})
+                    entry["credits"] += int(credits or 0)
+                    entry["actions"] += int(actions or 0)
+        finally:
+            conn.close()
+        return totals
+
+    def events(self, start: Optional[datetime] = None, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Eventos gravados desde `start` (None = todo o histórico), do mais
+        antigo ao mais recente; com `limit`, só os mais recentes.
+        """
+        self.flush()
+        query = "SELECT created_at, action_type, credits_used, context FROM manus_credit_usage"
+        params: List[Any] = []
+        if start is not None:
+            query += " WHERE created_at >= ?"
+            params.append(start.isoformat())
+        query += " ORDER BY id DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+        events = []
+        for row in reversed(rows):
+            if isinstance(row, dict):
+                row = (row["created_at"], row["action_type"], row["credits_used"], row["context"])
+            events.append({
+                'timestamp': row[0],
+                'action_type': row[1],
+                'credits_used': row[2],
+                'context': json.loads(row[3]) if row[3] else {}
+            })
+        return events
+
+    def active_days(self) -> int:
+        """Quantidade de dias com uso registrado"""
+        self.flush()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT COUNT(DISTINCT bucket) AS days FROM manus_credit_rollups WHERE granularity = 'day'"
+            )
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return int((row["days"] if isinstance(row, dict) else row[0]) or 0)
+
+    # ===== FLUSH PERIÓDICO =====
+
+    def start_flusher(self):
+        """Inicia a thread de flush periódico (idempotente)"""
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+
+            def run():
+                while not self._stop.wait(self.flush_interval):
+                    self.flush()
+
+            self._flusher = threading.Thread(target=run, name="credit-metering-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+
+    def close(self):
+        """Para a thread e grava o que estiver pendente"""
+        self._stop.set()
+        self.flush()
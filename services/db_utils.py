@@ -150,6 +150,24 @@ def execute_insert(query: str, params: tuple = ()) -> int:
         conn.close()
 
 
+def ensure_column(cursor, table: str, column: str, column_type: str):
+    """
+    Adiciona a coluna em tabelas criadas antes dela existir.
+    
+    Args:
+        cursor: Cursor da conexão atual
+        table: Nome da tabela
+        column: Nome da coluna
+        column_type: Tipo SQL da coluna (ex.: "TEXT", "INTEGER DEFAULT 0")
+    """
+    if USE_POSTGRES:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {column_type}")
+        return
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+
+
 def is_postgres() -> bool:
     """
     Verifica se está usando PostgreSQL.
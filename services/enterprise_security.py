@@ -2,16 +2,36 @@
 ENTERPRISE SECURITY - Seguranca Enterprise
 Sistema de seguranca com 2FA, LGPD, GDPR e compliance
 Nexora Prime V2 - Expansao Unicornio
+
+Sessoes, auditoria, consentimentos e hashes de senha ficam no
+SecurityStore (banco, compartilhado entre os workers); tentativas de login usam janela
+deslizante (SlidingWindowLimiter). Hash de senha (scrypt) roda no pool
+do CredentialService, fora da thread da requisicao.
 """
 
 import os
 import json
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
+import time
 import random
 import hashlib
 import secrets
 
+try:
+    from services.security_store import SecurityStore
+    from services.sliding_window_limiter import LimitRule, get_limiter
+    from services.credential_service import credential_service, parse_hash, CredentialServiceBusy
+except ImportError:
+    from security_store import SecurityStore
+    from sliding_window_limiter import LimitRule, get_limiter
+    from credential_service import credential_service, parse_hash, CredentialServiceBusy
+
+
+LOGIN_WINDOW_SECONDS = 15 * 60
+
+
 class EnterpriseSecurity:
     """Sistema de seguranca enterprise."""
     
@@ -29,16 +49,24 @@ class EnterpriseSecurity:
             "encryption_algorithm": "AES-256"
         }
         
-        # Usuarios e sessoes
+        # Usuarios
         self.users = {}
-        self.sessions = {}
-        self.login_attempts = {}
         
-        # Logs de auditoria
-        self.audit_logs = []
+        # Sessoes, logs de auditoria e consentimentos LGPD/GDPR (banco)
+        self.store = SecurityStore()
+        
+        # Falhas de login por usuario (janela deslizante)
+        self.login_limiter = get_limiter("login_failures", {
+            "failures": LimitRule(
+                window_seconds=LOGIN_WINDOW_SECONDS,
+                bucket_seconds=60,
+                max_count=self.security_config["max_login_attempts"]
+            )
+        })
         
-        # Consentimentos LGPD/GDPR
-        self.consents = {}
+        # Hash de senhas (pool de processos compartilhado)
+        self.credentials = credential_service
+        self._dummy_hash: Optional[str] = None
         
         # Dados pessoais rastreados
         self.personal_data_registry = {}
@@ -126,16 +154,14 @@ class EnterpriseSecurity:
         if consent_type not in consent_types:
             return {"error": f"Tipo de consentimento invalido. Validos: {consent_types}"}
         
-        if user_id not in self.consents:
-            self.consents[user_id] = {}
-        
-        self.consents[user_id][consent_type] = {
+        consent = {
             "granted": granted,
             "timestamp": datetime.now().isoformat(),
             "ip_address": details.get("ip_address") if details else None,
             "user_agent": details.get("user_agent") if details else None,
             "version": "1.0"
         }
+        self.store.save_consent(user_id, consent_type, consent)
         
         self._log_audit("consent_registered", user_id, {
             "type": consent_type,
@@ -147,18 +173,19 @@ class EnterpriseSecurity:
             "user_id": user_id,
             "consent_type": consent_type,
             "granted": granted,
-            "timestamp": self.consents[user_id][consent_type]["timestamp"]
+            "timestamp": consent["timestamp"]
         }
     
     def get_user_consents(self, user_id: str) -> Dict[str, Any]:
         """Obtem todos os consentimentos de um usuario."""
         
-        if user_id not in self.consents:
+        consents = self.store.get_consents(user_id)
+        if not consents:
             return {"user_id": user_id, "consents": {}}
         
         return {
             "user_id": user_id,
-            "consents": self.consents[user_id],
+            "consents": consents,
             "retrieved_at": datetime.now().isoformat()
         }
     
@@ -180,16 +207,16 @@ class EnterpriseSecurity:
             export["data_categories"]["profile"] = user_data
         
         # Consentimentos
-        if user_id in self.consents:
-            export["data_categories"]["consents"] = self.consents[user_id]
+        consents = self.store.get_consents(user_id)
+        if consents:
+            export["data_categories"]["consents"] = consents
         
         # Dados pessoais registrados
         if user_id in self.personal_data_registry:
             export["data_categories"]["personal_data"] = self.personal_data_registry[user_id]
         
         # Logs de auditoria do usuario
-        user_logs = [log for log in self.audit_logs if log.get("user_id") == user_id]
-        export["data_categories"]["activity_logs"] = user_logs[-100:]  # Ultimos 100
+        export["data_categories"]["activity_logs"] = self.store.recent_audit({"user_id": user_id})  # Ultimos 100
         
         self._log_audit("data_exported", user_id, {"categories": list(export["data_categories"].keys())})
         
@@ -212,9 +239,12 @@ class EnterpriseSecurity:
             del self.users[user_id]
             deleted_categories.append("profile")
         
+        # Deletar credenciais
+        if self.store.delete_credentials(user_id):
+            deleted_categories.append("credentials")
+        
         # Deletar consentimentos
-        if user_id in self.consents:
-            del self.consents[user_id]
+        if self.store.delete_consents(user_id):
             deleted_categories.append("consents")
         
         # Deletar dados pessoais
@@ -223,9 +253,7 @@ class EnterpriseSecurity:
             deleted_categories.append("personal_data")
         
         # Anonimizar logs (manter para compliance, mas anonimizar)
-        for log in self.audit_logs:
-            if log.get("user_id") == user_id:
-                log["user_id"] = f"deleted_{hashlib.sha256(user_id.encode()).hexdigest()[:8]}"
+        self.store.anonymize_audit(user_id, f"deleted_{hashlib.sha256(user_id.encode()).hexdigest()[:8]}")
         
         self._log_audit("data_deleted", f"deleted_{user_id[:8]}", {
             "categories": deleted_categories,
@@ -264,20 +292,10 @@ class EnterpriseSecurity:
     def get_audit_logs(self, filters: Dict = None) -> Dict[str, Any]:
         """Obtem logs de auditoria."""
         
-        logs = self.audit_logs.copy()
-        
-        if filters:
-            if filters.get("user_id"):
-                logs = [l for l in logs if l.get("user_id") == filters["user_id"]]
-            if filters.get("action"):
-                logs = [l for l in logs if l.get("action") == filters["action"]]
-            if filters.get("from_date"):
-                from_date = datetime.fromisoformat(filters["from_date"])
-                logs = [l for l in logs if datetime.fromisoformat(l["timestamp"]) >= from_date]
-        
+        # Filtros e contagem resolvidos pelos indices do log
         return {
-            "total_logs": len(logs),
-            "logs": logs[-100:],  # Ultimos 100
+            "total_logs": self.store.count_audit(filters),
+            "logs": self.store.recent_audit(filters),  # Ultimos 100
             "retrieved_at": datetime.now().isoformat()
         }
     
@@ -296,9 +314,9 @@ class EnterpriseSecurity:
         if report_type.lower() == "lgpd":
             report["summary"] = {
                 "total_users": len(self.users),
-                "users_with_consent": len(self.consents),
-                "data_export_requests": sum(1 for l in self.audit_logs if l.get("action") == "data_exported"),
-                "data_deletion_requests": sum(1 for l in self.audit_logs if l.get("action") == "data_deleted"),
+                "users_with_consent": self.store.count_consent_users(),
+                "data_export_requests": self.store.count_audit({"action": "data_exported"}),
+                "data_deletion_requests": self.store.count_audit({"action": "data_deleted"}),
                 "2fa_adoption_rate": f"{sum(1 for u in self.users.values() if u.get('2fa_enabled')) / max(1, len(self.users)) * 100:.1f}%"
             }
             
@@ -320,8 +338,9 @@ class EnterpriseSecurity:
         elif report_type.lower() == "gdpr":
             report["summary"] = {
                 "total_data_subjects": len(self.users),
-                "consent_records": len(self.consents),
-                "dsar_requests": sum(1 for l in self.audit_logs if l.get("action") in ["data_exported", "data_deleted"]),
+                "consent_records": self.store.count_consent_users(),
+                "dsar_requests": (self.store.count_audit({"action": "data_exported"}) +
+                                  self.store.count_audit({"action": "data_deleted"})),
                 "data_breaches": 0
             }
             
@@ -347,59 +366,88 @@ class EnterpriseSecurity:
         
         session_id = secrets.token_urlsafe(32)
         
-        self.sessions[session_id] = {
-            "user_id": user_id,
-            "created_at": datetime.now().isoformat(),
-            "expires_at": (datetime.now() + timedelta(minutes=self.security_config["session_timeout_minutes"])).isoformat(),
-            "ip_address": metadata.get("ip_address") if metadata else None,
-            "user_agent": metadata.get("user_agent") if metadata else None,
-            "is_active": True
-        }
+        expires_at = self.store.create_session(
+            session_id, user_id, self.security_config["session_timeout_minutes"] * 60, metadata
+        )
         
         self._log_audit("session_created", user_id, {"session_id": session_id[:8]})
         
         return {
             "session_id": session_id,
-            "expires_at": self.sessions[session_id]["expires_at"]
+            "expires_at": datetime.fromtimestamp(expires_at).isoformat()
         }
     
     def validate_session(self, session_id: str) -> Dict[str, Any]:
         """Valida sessao."""
         
-        if session_id not in self.sessions:
-            return {"valid": False, "error": "Sessao nao encontrada"}
+        # Busca pela chave primaria (hash do token)
+        session = self.store.get_session(session_id)
         
-        session = self.sessions[session_id]
+        if session is None:
+            return {"valid": False, "error": "Sessao nao encontrada"}
         
         if not session["is_active"]:
             return {"valid": False, "error": "Sessao inativa"}
         
-        if datetime.fromisoformat(session["expires_at"]) < datetime.now():
-            session["is_active"] = False
+        if session["expires_at"] < time.time():
             return {"valid": False, "error": "Sessao expirada"}
         
         return {
             "valid": True,
             "user_id": session["user_id"],
-            "expires_at": session["expires_at"]
+            "expires_at": datetime.fromtimestamp(session["expires_at"]).isoformat()
         }
     
     def invalidate_session(self, session_id: str) -> Dict[str, Any]:
         """Invalida sessao."""
         
-        if session_id not in self.sessions:
+        user_id = self.store.invalidate_session(session_id)
+        if user_id is None:
             return {"error": "Sessao nao encontrada"}
         
-        self.sessions[session_id]["is_active"] = False
-        self.sessions[session_id]["invalidated_at"] = datetime.now().isoformat()
-        
-        self._log_audit("session_invalidated", self.sessions[session_id]["user_id"], {"session_id": session_id[:8]})
+        self._log_audit("session_invalidated", user_id, {"session_id": session_id[:8]})
         
         return {
             "status": "invalidated",
             "session_id": session_id
         }
     
+    # ==================== Tentativas de Login ====================
+    
+    def check_login_allowed(self, user_id: str) -> Dict[str, Any]:
+        """Verifica se o usuario pode tentar login (falhas na janela deslizante)."""
+        
+        result = self.login_limiter.check(user_id)
+        failures = result["usage"]["failures"]["count"]
+        
+        if not result["allowed"]:
+            return {
+                "allowed": False,
+                "error": "Muitas tentativas de login. Tente novamente mais tarde",
+                "failed_attempts": failures,
+                "window_minutes": LOGIN_WINDOW_SECONDS // 60
+            }
+        
+        return {
+            "allowed": True,
+            "failed_attempts": failures,
+            "remaining_attempts": self.security_config["max_login_attempts"] - failures
+        }
+    
+    def register_login_attempt(self, user_id: str, success: bool, metadata: Dict = None) -> Dict[str, Any]:
+        """Registra tentativa de login; sucesso zera a janela de falhas."""
+        
+        if success:
+            self.login_limiter.reset(user_id)
+        else:
+            self.login_limiter.record(user_id, 0)
+        
+        self._log_audit("login_success" if success else "login_failed", user_id, {
+            "ip_address": metadata.get("ip_address") if metadata else None
+        })
+        
+        return self.check_login_allowed(user_id)
+    
     # ==================== Criptografia ====================
     
     def encrypt_data(self, data: str, purpose: str = "storage") -> Dict[str, Any]:
@@ -417,18 +465,78 @@ class EnterpriseSecurity:
         }
     
     def hash_password(self, password: str) -> Dict[str, Any]:
-        """Gera hash de senha."""
+        """Gera hash de senha (scrypt, no pool de processos)."""
         
-        salt = secrets.token_hex(16)
-        hashed = hashlib.pbkdf2_hmac('sha256', password.encode(), salt.encode(), 100000)
+        encoded = self.credentials.hash_password(password)
+        parsed = parse_hash(encoded)
         
         return {
-            "hash": hashed.hex(),
-            "salt": salt,
-            "algorithm": "pbkdf2_sha256",
-            "iterations": 100000
+            "hash": encoded,
+            "salt": parsed["salt"].hex(),
+            "algorithm": "scrypt",
+            "params": {"n": parsed["params"].n, "r": parsed["params"].r, "p": parsed["params"].p}
         }
     
+    def set_password(self, user_id: str, password: str) -> Dict[str, Any]:
+        """Define a senha do usuario (valida forca e grava o hash)."""
+        
+        strength = self.validate_password_strength(password)
+        if not strength["valid"]:
+            return {"error": "Senha fraca", "strength": strength}
+        
+        try:
+            hashed = self.hash_password(password)
+        except CredentialServiceBusy as e:
+            return {"error": str(e), "retry": True}
+        
+        self.store.save_password_hash(user_id, hashed["hash"])
+        
+        self._log_audit("password_set", user_id, {"algorithm": hashed["algorithm"]})
+        
+        return {"status": "updated", "user_id": user_id}
+    
+    def authenticate(self, user_id: str, password: str, metadata: Dict = None) -> Dict[str, Any]:
+        """
+        Login: limite de falhas, verificacao no pool, rehash automatico
+        quando o custo mudou e criacao da sessao.
+        """
+        
+        allowed = self.check_login_allowed(user_id)
+        if not allowed["allowed"]:
+            return {"authenticated": False, "error": allowed["error"]}
+        
+        stored = self.store.get_password_hash(user_id)
+        
+        try:
+            # Usuario inexistente tambem paga um scrypt: o tempo de resposta
+            # nao revela quais contas existem
+            result = self.credentials.verify(password, stored or self._get_dummy_hash())
+        except CredentialServiceBusy as e:
+            return {"authenticated": False, "error": str(e), "retry": True}
+        
+        valid = bool(stored) and result["valid"]
+        self.register_login_attempt(user_id, valid, metadata)
+        if not valid:
+            return {"authenticated": False, "error": "Credenciais invalidas"}
+        
+        if result["new_hash"] and self.store.replace_password_hash(user_id, stored, result["new_hash"]):
+            self._log_audit("password_rehashed", user_id, {"algorithm": "scrypt"})
+        
+        session = self.create_session(user_id, metadata)
+        return {
+            "authenticated": True,
+            "user_id": user_id,
+            "session_id": session["session_id"],
+            "expires_at": session["expires_at"]
+        }
+    
+    def _get_dummy_hash(self) -> str:
+        """Hash de uma senha aleatoria com os parametros atuais (login de usuario inexistente)"""
+        dummy = self._dummy_hash
+        if dummy is None or self.credentials.needs_rehash(dummy):
+            dummy = self._dummy_hash = self.credentials.hash_password(secrets.token_urlsafe(16))
+        return dummy
+    
     def validate_password_strength(self, password: str) -> Dict[str, Any]:
         """Valida forca da senha."""
         
@@ -462,13 +570,7 @@ class EnterpriseSecurity:
     def _log_audit(self, action: str, user_id: str, details: Dict = None):
         """Registra log de auditoria."""
         
-        self.audit_logs.append({
-            "timestamp": datetime.now().isoformat(),
-            "action": action,
-            "user_id": user_id,
-            "details": details or {},
-            "log_id": secrets.token_hex(8)
-        })
+        self.store.append_audit(action, user_id, details)
     
     def _generate_backup_codes(self, count: int = 10) -> List[str]:
         """Gera codigos de backup para 2FA."""
@@ -478,20 +580,26 @@ class EnterpriseSecurity:
     def _get_consent_breakdown(self) -> Dict[str, int]:
         """Obtem breakdown de consentimentos."""
         
-        breakdown = {}
-        
-        for user_consents in self.consents.values():
-            for consent_type, consent_data in user_consents.items():
-                if consent_type not in breakdown:
-                    breakdown[consent_type] = {"granted": 0, "denied": 0}
-                
-                if consent_data.get("granted"):
-                    breakdown[consent_type]["granted"] += 1
-                else:
-                    breakdown[consent_type]["denied"] += 1
-        
-        return breakdown
+        return self.store.consent_breakdown()
+
+
+# Instancia global (criada no primeiro uso: o construtor cria as tabelas no banco)
+_security_instance: Optional[EnterpriseSecurity] = None
+_security_lock = threading.Lock()
+
+
+def get_enterprise_security() -> EnterpriseSecurity:
+    """
+    Retorna instancia global da seguranca enterprise (singleton)
+
+    Returns:
+        EnterpriseSecurity: Instancia do sistema
+    """
+    global _security_instance
 
+    if _security_instance is None:
+        with _security_lock:
+            if _security_instance is None:
+                _security_instance = EnterpriseSecurity()
 
-# Instancia global
-enterprise_security = EnterpriseSecurity()
+    return _security_instance
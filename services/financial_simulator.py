@@ -19,21 +19,86 @@ Similarweb é usado APENAS para:
 - Alertar sobre expectativas irreais
 """
 
+import atexit
 import logging
-from typing import Dict, Optional
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
 from datetime import datetime
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 # Import Similarweb Intelligence (via Manus IA)
 try:
     from services.similarweb_intelligence import similarweb_intelligence
-    from services.manus_credit_tracker import manus_credit_tracker, ActionType
+    from services.manus_credit_tracker import get_manus_credit_tracker, ActionType
     SIMILARWEB_AVAILABLE = True
 except ImportError:
     SIMILARWEB_AVAILABLE = False
     similarweb_intelligence = None
-    manus_credit_tracker = None
+    get_manus_credit_tracker = None
+
+# Monte Carlo: cenários por bloco e tamanho a partir do qual usa processos
+MC_CHUNK_SIZE = 250_000
+MC_PARALLEL_THRESHOLD = 1_000_000
+MC_PERCENTILES = (5, 25, 50, 75, 95)
+
+# Dispersões das distribuições (log-normal: sigma; beta: concentração)
+MC_CTR_CONCENTRATION = 300
+MC_CVR_CONCENTRATION = 200
+MC_AOV_SIGMA = 0.35
+Z_95 = 1.6449
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Pool de processos compartilhado (criado no primeiro uso)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+                atexit.register(_executor.shutdown, wait=False)
+    return _executor
+
+
+def _simulate_chunk(params: Dict, seed: np.random.SeedSequence, size: int) -> Dict[str, np.ndarray]:
+    """
+    Sorteia `size` cenários de forma vetorizada.
+
+    Função de módulo para poder rodar em processo filho. Cada bloco tem a
+    própria SeedSequence, então o resultado não depende de rodar no pool
+    ou no processo atual.
+    """
+    rng = np.random.default_rng(seed)
+    budget = params['budget']
+
+    cpc = rng.lognormal(np.log(params['cpc_median']), params['cpc_sigma'], size)
+    ctr = rng.beta(params['ctr'] * MC_CTR_CONCENTRATION, (1 - params['ctr']) * MC_CTR_CONCENTRATION, size)
+    cvr = rng.beta(params['cvr'] * MC_CVR_CONCENTRATION, (1 - params['cvr']) * MC_CVR_CONCENTRATION, size)
+    aov = rng.lognormal(np.log(params['aov']), MC_AOV_SIGMA, size)
+
+    clicks = np.floor(budget / cpc)
+    conversions = rng.binomial(clicks.astype(np.int64), cvr).astype(np.float64)
+    revenue = conversions * aov
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cpa = np.where(conversions > 0, budget / conversions, np.inf)
+
+    return {
+        'cpc': cpc.astype(np.float32),
+        'clicks': clicks.astype(np.float32),
+        'impressions': (clicks / ctr).astype(np.float32),
+        'conversions': conversions.astype(np.float32),
+        'cpa': cpa.astype(np.float32),
+        'revenue': revenue.astype(np.float32),
+        'roas': (revenue / budget).astype(np.float32)
+    }
 
 
 class FinancialSimulator:
@@ -57,32 +122,30 @@ class FinancialSimulator:
             'saas': 0.03,       # 3%
             'info_product': 0.04  # 4%
         }
+        
+        # Estimativas de mercado para o Monte Carlo (não decidem nada)
+        self.default_ctrs = {
+            'facebook': 0.012,
+            'google': 0.035,
+            'instagram': 0.010,
+        }
+        
+        self.default_aov = {
+            'ecommerce': 150.0,
+            'lead_gen': 80.0,
+            'saas': 300.0,
+            'info_product': 200.0
+        }
     
-    def simulate_campaign(
-        self,
-        budget: float,
-        platform: str,
-        niche: str,
-        product_type: str = 'ecommerce',
-        competitor_domain: Optional[str] = None
-    ) -> Dict:
+    def _base_assumptions(self, platform: str, product_type: str, competitor_domain: Optional[str]):
         """
-        Simula resultados de uma campanha.
+        CPC e taxa de conversão base, ajustados pelo mercado quando disponível.
         
-        Args:
-            budget: Orçamento proposto (R$)
-            platform: Plataforma (facebook, google, instagram)
-            niche: Nicho de mercado
-            product_type: Tipo de produto (ecommerce, lead_gen, saas, info_product)
-            competitor_domain: Domínio do concorrente para análise de mercado
-            
         Returns:
-            Simulação com projeções ajustadas
+            (faixa de CPC, taxa de conversão, ajuste de mercado ou None)
         """
-        logger.info(f"📊 Simulando campanha: R$ {budget:.2f} em {platform}")
-        
         # Get base estimates
-        cpc_range = self.default_cpc_ranges.get(platform.lower(), self.default_cpc_ranges['facebook'])
+        cpc_range = dict(self.default_cpc_ranges.get(platform.lower(), self.default_cpc_ranges['facebook']))
         conversion_rate = self.default_conversion_rates.get(product_type, 0.02)
         
         # Adjust with market intelligence if available
@@ -109,6 +172,129 @@ class FinancialSimulator:
                 elif trend_signal in ['strong_down', 'down']:
                     conversion_rate *= 0.9  # Declining market = worse conversions
         
+        return cpc_range, conversion_rate, market_adjustment
+    
+    def simulate_monte_carlo(
+        self,
+        budget: float,
+        platform: str,
+        product_type: str = 'ecommerce',
+        competitor_domain: Optional[str] = None,
+        n_scenarios: int = 100_000,
+        seed: Optional[int] = None,
+        aov: Optional[float] = None,
+        target_roas: Optional[float] = None,
+        percentiles: Sequence[float] = MC_PERCENTILES
+    ) -> Dict:
+        """
+        Simulação estocástica: sorteia CPC, CTR, CVR e AOV por cenário.
+        
+        - CPC log-normal com mediana no CPC médio e p5/p95 na faixa min/max
+        - CTR e CVR beta centradas nas taxas padrão da plataforma/produto
+        - AOV log-normal; conversões binomiais sobre os cliques
+        
+        Blocos de MC_CHUNK_SIZE cenários com SeedSequence própria: o mesmo
+        seed dá o mesmo resultado em série ou no pool de processos (usado a
+        partir de MC_PARALLEL_THRESHOLD cenários).
+        
+        Args:
+            budget: Orçamento proposto (R$)
+            platform: Plataforma (facebook, google, instagram)
+            product_type: Tipo de produto
+            competitor_domain: Domínio do concorrente para ajuste de mercado
+            n_scenarios: Número de cenários
+            seed: Semente para reprodutibilidade
+            aov: Ticket médio (padrão por tipo de produto)
+            target_roas: Se informado, retorna a probabilidade de atingi-lo
+            percentiles: Percentis das bandas
+            
+        Returns:
+            Bandas de percentis por métrica
+        """
+        cpc_range, conversion_rate, market_adjustment = self._base_assumptions(
+            platform, product_type, competitor_domain
+        )
+        params = {
+            'budget': float(budget),
+            'cpc_median': cpc_range['avg'],
+            'cpc_sigma': max(np.log(cpc_range['max'] / cpc_range['min']) / (2 * Z_95), 0.01),
+            'ctr': self.default_ctrs.get(platform.lower(), self.default_ctrs['facebook']),
+            'cvr': conversion_rate,
+            'aov': aov or self.default_aov.get(product_type, self.default_aov['ecommerce'])
+        }
+        
+        n_scenarios = max(int(n_scenarios), 1)
+        sizes = [MC_CHUNK_SIZE] * (n_scenarios // MC_CHUNK_SIZE)
+        if n_scenarios % MC_CHUNK_SIZE:
+            sizes.append(n_scenarios % MC_CHUNK_SIZE)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        
+        chunks = None
+        if n_scenarios >= MC_PARALLEL_THRESHOLD and len(sizes) > 1:
+            try:
+                executor = _get_executor()
+                chunks = list(executor.map(_simulate_chunk, [params] * len(sizes), seeds, sizes))
+            except Exception as e:
+                logger.warning(f"Pool de processos indisponível, simulando em série: {str(e)}")
+        if chunks is None:
+            chunks = [_simulate_chunk(params, s, n) for s, n in zip(seeds, sizes)]
+        
+        draws = {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+        
+        bands = {}
+        for metric, values in draws.items():
+            finite = values[np.isfinite(values)]
+            points = np.percentile(finite, percentiles) if len(finite) else np.zeros(len(percentiles))
+            bands[metric] = {f"p{int(p)}": round(float(v), 2) for p, v in zip(percentiles, points)}
+            bands[metric]['mean'] = round(float(finite.mean()), 2) if len(finite) else 0.0
+        
+        probabilities = {
+            'break_even': round(float((draws['roas'] >= 1).mean()), 4),
+            'zero_conversions': round(float((draws['conversions'] == 0).mean()), 4)
+        }
+        if target_roas is not None:
+            probabilities['target_roas'] = round(float((draws['roas'] >= target_roas).mean()), 4)
+        
+        return {
+            'budget': budget,
+            'platform': platform,
+            'product_type': product_type,
+            'n_scenarios': n_scenarios,
+            'seed': seed,
+            'assumptions': {k: round(float(v), 4) for k, v in params.items() if k != 'budget'},
+            'bands': bands,
+            'probabilities': probabilities,
+            'market_intelligence': market_adjustment,
+            'disclaimer': '⚠️ Simulação baseada em estimativas - resultados reais podem variar'
+        }
+    
+    def simulate_campaign(
+        self,
+        budget: float,
+        platform: str,
+        niche: str,
+        product_type: str = 'ecommerce',
+        competitor_domain: Optional[str] = None
+    ) -> Dict:
+        """
+        Simula resultados de uma campanha.
+        
+        Args:
+            budget: Orçamento proposto (R$)
+            platform: Plataforma (facebook, google, instagram)
+            niche: Nicho de mercado
+            product_type: Tipo de produto (ecommerce, lead_gen, saas, info_product)
+            competitor_domain: Domínio do concorrente para análise de mercado
+            
+        Returns:
+            Simulação com projeções ajustadas
+        """
+        logger.info(f"📊 Simulando campanha: R$ {budget:.2f} em {platform}")
+        
+        cpc_range, conversion_rate, market_adjustment = self._base_assumptions(
+            platform, product_type, competitor_domain
+        )
+        
         # Calculate projections
         estimated_clicks = budget / cpc_range['avg']
         estimated_conversions = estimated_clicks * conversion_rate
@@ -169,15 +355,22 @@ class FinancialSimulator:
         self,
         budget: float,
         expected_roas: float,
-        competitor_domain: Optional[str] = None
+        competitor_domain: Optional[str] = None,
+        platform: str = 'facebook',
+        product_type: str = 'ecommerce'
     ) -> Dict:
         """
         Valida proposta de orçamento contra dados de mercado.
         
+        O ROAS esperado é comparado com a distribuição do Monte Carlo
+        (semente fixa, para a mesma proposta dar sempre a mesma resposta).
+        
         Args:
             budget: Orçamento proposto
             expected_roas: ROAS esperado
             competitor_domain: Domínio para análise de mercado
+            platform: Plataforma da campanha
+            product_type: Tipo de produto
             
         Returns:
             Validação com alertas
@@ -198,21 +391,42 @@ class FinancialSimulator:
         if budget < 100:
             validation['warnings'].append("Orçamento muito baixo - difícil obter dados significativos")
         
+        # Distribuição de resultados para o orçamento proposto
+        simulation = self.simulate_monte_carlo(
+            budget, platform, product_type,
+            competitor_domain=competitor_domain,
+            n_scenarios=20_000,
+            seed=0,
+            target_roas=expected_roas
+        )
+        probability = simulation['probabilities']['target_roas']
+        validation['monte_carlo'] = {
+            'roas_bands': simulation['bands']['roas'],
+            'probability_of_expected_roas': probability,
+            'probability_of_break_even': simulation['probabilities']['break_even']
+        }
+        if probability < 0.01:
+            validation['is_realistic'] = False
+            validation['warnings'].append(
+                f"ROAS esperado acima de 99% dos cenários simulados (p95: {simulation['bands']['roas']['p95']}x)"
+            )
+        elif probability < 0.10:
+            validation['warnings'].append(f"ROAS esperado atingido em apenas {probability * 100:.1f}% dos cenários")
+        
         # Market intelligence validation
-        if SIMILARWEB_AVAILABLE and competitor_domain:
-            market_data = self._get_market_adjustment(competitor_domain, 'facebook')
+        market_data = simulation['market_intelligence']
+        if market_data:
             
-            if market_data:
-                confidence_score = market_data['confidence_score']['score']
-                
-                if confidence_score < 40:
-                    validation['warnings'].append("Mercado de alto risco - começar com 50% do orçamento proposto")
-                    validation['recommendations'].append(f"Orçamento recomendado: R$ {budget * 0.5:.2f}")
-                
-                trend = market_data['trend']['signal']
-                if trend in ['strong_down', 'down']:
-                    validation['warnings'].append("Mercado em declínio - validar demanda antes de investir")
-                    validation['recommendations'].append("Realizar teste com orçamento mínimo primeiro")
+            confidence_score = market_data['confidence_score']['score']
+            
+            if confidence_score < 40:
+                validation['warnings'].append("Mercado de alto risco - começar com 50% do orçamento proposto")
+                validation['recommendations'].append(f"Orçamento recomendado: R$ {budget * 0.5:.2f}")
+            
+            trend = market_data['trend']['signal']
+            if trend in ['strong_down', 'down']:
+                validation['warnings'].append("Mercado em declínio - validar demanda antes de investir")
+                validation['recommendations'].append("Realizar teste com orçamento mínimo primeiro")
         
         return validation
     
@@ -235,8 +449,8 @@ class FinancialSimulator:
                 return None
             
             # Registrar uso de créditos
-            if manus_credit_tracker:
-                manus_credit_tracker.log_credit_usage(
+            if get_manus_credit_tracker:
+                get_manus_credit_tracker().log_credit_usage(
                     action_type=ActionType.SIMILARWEB_INSIGHT,
                     context={'domain': domain, 'source': 'financial_simulator', 'platform': platform}
                 )
@@ -10,6 +10,13 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import random
 
+import numpy as np
+
+try:
+    from services.budget_allocator import get_budget_allocator, fit_response_curves, DEFAULT_ELASTICITY
+except ImportError:
+    from budget_allocator import get_budget_allocator, fit_response_curves, DEFAULT_ELASTICITY
+
 class FunnelAccelerator:
     """Acelerador de funil automatizado."""
     
@@ -169,8 +176,21 @@ class FunnelAccelerator:
             "estimated_impact": self._estimate_optimization_impact(optimizations)
         }
     
-    def allocate_budget(self, funnel_id: str, total_budget: float, strategy: str = "balanced") -> Dict[str, Any]:
-        """Aloca orcamento entre etapas do funil."""
+    def allocate_budget(
+        self,
+        funnel_id: str,
+        total_budget: float,
+        strategy: str = "balanced",
+        max_step_change: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """Aloca orcamento entre etapas do funil.
+        
+        Os pesos da estrategia sao a curva a priori de cada etapa (sem
+        historico o resultado e exatamente proporcional aos pesos). Etapas
+        com performance["history"] (pontos spend/revenue) usam a curva
+        ajustada. Limites: stage["min_budget"]/["max_budget"] e
+        max_step_change relativo a alocacao atual.
+        """
         
         if funnel_id not in self.configured_funnels:
             return {"error": "Funil nao encontrado"}
@@ -187,13 +207,37 @@ class FunnelAccelerator:
         
         strategy_weights = allocation_strategies.get(strategy, allocation_strategies["balanced"])
         
+        stage_keys = list(funnel["stages"])
+        stages = [funnel["stages"][key] for key in stage_keys]
+        weights = np.array([strategy_weights.get(key, 0.1) for key in stage_keys])
+        weights = weights / weights.sum() if weights.sum() > 0 else weights
+        
+        # Curva a priori: com k igual para todos, o otimo e b_i proporcional a a_i^(1/(1-k))
+        prior_a = np.power(weights, 1 - DEFAULT_ELASTICITY)
+        history = [stage.get("performance", {}).get("history") for stage in stages]
+        fitted_a, k = fit_response_curves(np.zeros(len(stages)), np.zeros(len(stages)), history)
+        fitted = fitted_a > 0
+        if fitted.any():
+            # Coloca as etapas sem historico na mesma escala das ajustadas
+            prior_a = prior_a * (fitted_a[fitted].mean() / prior_a[fitted].mean())
+        a = np.where(fitted, fitted_a, prior_a)
+        
+        result = get_budget_allocator().allocate(
+            total_budget,
+            a, k,
+            current=[stage.get("budget_allocation", 0) for stage in stages],
+            min_budget=[stage.get("min_budget", 0) for stage in stages],
+            max_budget=[stage.get("max_budget", float("inf")) for stage in stages],
+            max_step_change=max_step_change
+        )
+        
         allocations = {}
-        for stage_key in funnel["stages"]:
-            weight = strategy_weights.get(stage_key, 0.1)
-            allocated = total_budget * weight
+        for i, stage_key in enumerate(stage_keys):
+            allocated = float(result.budgets[i])
             allocations[stage_key] = {
                 "budget": round(allocated, 2),
-                "percentage": round(weight * 100, 1)
+                "percentage": round(allocated / total_budget * 100, 1) if total_budget > 0 else 0,
+                "curve": "fitted" if fitted[i] else "strategy"
             }
             funnel["stages"][stage_key]["budget_allocation"] = allocated
         
@@ -204,7 +248,8 @@ class FunnelAccelerator:
             "funnel_id": funnel_id,
             "total_budget": total_budget,
             "strategy": strategy,
-            "allocations": allocations
+            "allocations": allocations,
+            "unallocated": round(result.unallocated, 2)
         }
     
     def get_stage_recommendations(self, stage: str, current_metrics: Dict) -> Dict[str, Any]:
@@ -0,0 +1,400 @@
+"""
+🔎 KNOWLEDGE SEARCH - Índice Invertido com Ranking BM25
+Nexora Prime
+
+Busca textual sobre toda a base de conhecimento do Velyra: módulos de
+treinamento, glossário, melhores práticas, memórias de campanhas, playbooks
+em `knowledge_base/*.md` e o conteúdo adicionado pela LivingKnowledgeBase.
+
+- Tokenizador sem acentos (NFKD), com stopwords e stemming leve de plurais
+- Índice invertido termo -> {documento: frequência}, ranking BM25
+- Construído uma vez e persistido em disco (JSON), reaproveitado enquanto a
+  impressão digital do corpus não mudar
+- Atualização incremental (add/remove) sem reconstruir o índice
+
+O custo de uma busca é proporcional às listas de postings dos termos da
+consulta, não ao tamanho da base.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Any, Optional, Iterable, Tuple
+
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+TITLE_BOOST = 2
+INDEX_VERSION = 1
+
+DEFAULT_INDEX_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "knowledge_index.json"
+)
+
+STOPWORDS = frozenset("""
+a as o os um uma uns umas de da das do dos e em no na nos nas para pra por
+pelo pela pelos pelas com sem que qual quais quando onde como se ou ao aos
+mais menos meu minha meus minhas seu sua seus suas isso isto esse essa este
+esta ser sao ter tem eu voce voces nao sim muito muita entre sobre ate ja
+the of and to in for is on
+""".split())
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+%?")
+
+
+def strip_accents(text: str) -> str:
+    """Remove acentos e coloca em minúsculas ("Conversão" -> "conversao")"""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _stem(token: str) -> str:
+    """Stemming leve: unifica plurais comuns do português"""
+    if len(token) <= 3 or token.isdigit():
+        return token
+    if token.endswith("coes"):
+        return token[:-4] + "cao"
+    if token.endswith("oes") or token.endswith("aes"):
+        return token[:-3] + "ao"
+    if token.endswith("ais") and len(token) > 4:
+        return token[:-3] + "al"
+    if token.endswith("eis") and len(token) > 4:
+        return token[:-3] + "el"
+    if token.endswith("ns"):
+        return token[:-2] + "m"
+    if token.endswith("res") or token.endswith("zes"):
+        return token[:-2]
+    if token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens normalizados (sem acento, sem stopwords, plural -> singular)"""
+    tokens = []
+    for token in _TOKEN_RE.findall(strip_accents(text).replace("_", " ")):
+        if token in STOPWORDS or (len(token) < 2 and not token.isdigit()):
+            continue
+        tokens.append(_stem(token))
+    return tokens
+
+
+def flatten_text(value: Any) -> str:
+    """Achata dicts/listas aninhados em texto (chaves com _ viram palavras)"""
+    parts = []
+
+    def walk(item):
+        if isinstance(item, dict):
+            for key, sub in item.items():
+                parts.append(str(key).replace("_", " "))
+                walk(sub)
+        elif isinstance(item, (list, tuple)):
+            for sub in item:
+                walk(sub)
+        elif item is not None:
+            parts.append(str(item))
+
+    walk(value)
+    return " ".join(parts)
+
+
+def split_markdown_sections(text: str) -> List[Tuple[str, str]]:
+    """Divide um markdown em seções por cabeçalho (## ...)
+
+    Returns:
+        Lista de (título, corpo); o título do documento (#) vai como prefixo
+    """
+    sections = []
+    document_title = ""
+    title, body = None, []
+    for line in text.splitlines():
+        if line.startswith("# ") and not document_title:
+            document_title = line[2:].strip()
+            continue
+        if line.startswith("## "):
+            if title is not None or any(l.strip() for l in body):
+                sections.append((title or document_title, "\n".join(body).strip()))
+            title, body = line[3:].strip(), []
+            continue
+        body.append(line)
+    if title is not None or any(l.strip() for l in body):
+        sections.append((title or document_title, "\n".join(body).strip()))
+    return [
+        (f"{document_title} - {t}" if document_title and t != document_title else t, b)
+        for t, b in sections if b
+    ]
+
+
+class KnowledgeSearchIndex:
+    """
+    Índice invertido BM25 em memória, com persistência em disco.
+
+    Documentos têm um id estável ("glossary:CPC", "memory:42", ...), uma
+    origem (`source`), título e texto. Só os metadados e os postings são
+    guardados: o conteúdo completo continua com quem indexou, que resolve
+    a resposta a partir do id. Documentos marcados como `persist=False`
+    (conteúdo aprendido em runtime) não vão para o arquivo.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.fingerprint: Optional[str] = None
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, doc_id: str):
+        return doc_id in self._docs
+
+    # ===== ATUALIZAÇÃO =====
+
+    def add_document(
+        self,
+        doc_id: str,
+        source: str,
+        title: str,
+        text: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        persist: bool = True
+    ):
+        """Adiciona (ou substitui) um documento; o título conta em dobro"""
+        terms = Counter(tokenize(text))
+        for token in tokenize(title):
+            terms[token] += TITLE_BOOST
+        with self._lock:
+            self._remove(doc_id)
+            self._insert(doc_id, {
+                "source": source,
+                "title": title,
+                "length": sum(terms.values()),
+                "metadata": metadata or {},
+                "persist": persist
+            }, dict(terms))
+
+    def remove_document(self, doc_id: str) -> bool:
+        with self._lock:
+            return self._remove(doc_id)
+
+    def _insert(self, doc_id: str, doc: Dict[str, Any], terms: Dict[str, int]):
+        self._docs[doc_id] = doc
+        self._terms[doc_id] = terms
+        self._total_length += doc["length"]
+        for term, tf in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = tf
+
+    def _remove(self, doc_id: str) -> bool:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return False
+        self._total_length -= doc["length"]
+        for term in self._terms.pop(doc_id, {}):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._postings, self._docs, self._terms = {}, {}, {}
+            self._total_length = 0
+            self.fingerprint = None
+
+    # ===== BUSCA =====
+
+    def search(
+        self,
+        query: str,
+        k: int = 5,
+        sources: Optional[Iterable[str]] = None,
+        min_score: float = 0.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca BM25.
+
+        Args:
+            query: Texto livre
+            k: Quantidade máxima de resultados
+            sources: Restringe às origens informadas (ex.: {"memory"})
+            min_score: Descarta resultados abaixo deste score
+
+        Returns:
+            Lista de {"id", "source", "title", "score", "matched_terms",
+            "metadata"} por score decrescente
+        """
+        allowed = set(sources) if sources is not None else None
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_length = self._total_length / n
+            scores: Dict[str, float] = {}
+            matched: Dict[str, int] = {}
+            for term, qtf in Counter(tokenize(query)).items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    doc = self._docs[doc_id]
+                    if allowed is not None and doc["source"] not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * doc["length"] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + qtf * idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+
+            ranked = sorted(
+                ((score, doc_id) for doc_id, score in scores.items() if score >= min_score),
+                key=lambda item: (-item[0], item[1])
+            )[:k]
+            return [
+                {
+                    "id": doc_id,
+                    "source": self._docs[doc_id]["source"],
+                    "title": self._docs[doc_id]["title"],
+                    "score": round(score, 4),
+                    "matched_terms": matched[doc_id],
+                    "metadata": self._docs[doc_id]["metadata"]
+                }
+                for score, doc_id in ranked
+            ]
+
+    # ===== CONSTRUÇÃO / PERSISTÊNCIA =====
+
+    @staticmethod
+    def compute_fingerprint(documents: List[Dict[str, Any]]) -> str:
+        digest = hashlib.sha256(f"v{INDEX_VERSION}".encode())
+        for doc in documents:
+            digest.update(json.dumps(
+                [doc["id"], doc["source"], doc["title"], doc["text"]], ensure_ascii=False
+            ).encode())
+        return digest.hexdigest()
+
+    def build(self, documents: List[Dict[str, Any]], force: bool = False) -> bool:
+        """
+        Garante o índice para o corpus estático `documents`
+        (dicts com id, source, title, text e metadata opcional).
+
+        Carrega do disco quando a impressão digital bate; senão reconstrui
+        e salva. Documentos não persistentes já indexados são mantidos.
+
+        Returns:
+            True se o índice foi reconstruído
+        """
+        fingerprint = self.compute_fingerprint(documents)
+        with self._lock:
+            if not force and self.fingerprint == fingerprint:
+                return False
+            if not force and self.load(fingerprint):
+                return False
+
+            runtime = {doc_id for doc_id, doc in self._docs.items() if not doc["persist"]}
+            for doc_id in list(self._docs):
+                if doc_id not in runtime:
+                    self._remove(doc_id)
+            for doc in documents:
+                self.add_document(doc["id"], doc["source"], doc["title"], doc["text"], doc.get("metadata"))
+            self.fingerprint = fingerprint
+            self.save()
+            return True
+
+    def save(self) -> bool:
+        """Grava os documentos persistentes (escrita atômica)"""
+        if not self.path:
+            return False
+        with self._lock:
+            persisted = [doc_id for doc_id, doc in self._docs.items() if doc["persist"]]
+            payload = {
+                "version": INDEX_VERSION,
+                "fingerprint": self.fingerprint,
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {
+                    doc_id: {key: self._docs[doc_id][key] for key in ("source", "title", "length", "metadata")}
+                    for doc_id in persisted
+                },
+                "terms": {doc_id: self._terms[doc_id] for doc_id in persisted}
+            }
+        tmp_path = None
+        try:
+            directory = os.path.dirname(self.path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # Temporário próprio de cada processo, no mesmo diretório (os.replace atômico)
+            fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"[KNOWLEDGE SEARCH] ⚠️ Não foi possível salvar o índice: {e}")
+            return False
+
+    def load(self, fingerprint: Optional[str] = None) -> bool:
+        """Carrega o índice do disco (se existir e, quando informado, bater a impressão digital)"""
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except Exception as e:
+            print(f"[KNOWLEDGE SEARCH] ⚠️ Índice em disco ilegível: {e}")
+            return False
+        if payload.get("version") != INDEX_VERSION:
+            return False
+        if fingerprint is not None and payload.get("fingerprint") != fingerprint:
+            return False
+
+        with self._lock:
+            runtime = {doc_id for doc_id, doc in self._docs.items() if not doc["persist"]}
+            for doc_id in list(self._docs):
+                if doc_id not in runtime:
+                    self._remove(doc_id)
+            terms = payload.get("terms", {})
+            for doc_id, doc in payload.get("docs", {}).items():
+                if doc_id in runtime:
+                    continue
+                self._insert(doc_id, dict(doc, persist=True), terms.get(doc_id, {}))
+            self.fingerprint = payload.get("fingerprint")
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            by_source = Counter(doc["source"] for doc in self._docs.values())
+            return {
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                "avg_length": round(self._total_length / len(self._docs), 2) if self._docs else 0,
+                "by_source": dict(by_source),
+                "fingerprint": self.fingerprint
+            }
+
+
+# Instância global do índice
+_knowledge_index: Optional[KnowledgeSearchIndex] = None
+_knowledge_index_lock = threading.Lock()
+
+
+def get_knowledge_index() -> KnowledgeSearchIndex:
+    """Retorna a instância global do índice de conhecimento"""
+    global _knowledge_index
+    if _knowledge_index is None:
+        with _knowledge_index_lock:
+            if _knowledge_index is None:
+                _knowledge_index = KnowledgeSearchIndex()
+    return _knowledge_index
@@ -8,6 +8,11 @@ import json
 from datetime import datetime
 from typing import Dict, List, Optional, Any
 
+try:
+    from services.knowledge_search import get_knowledge_index, flatten_text
+except ImportError:
+    from knowledge_search import get_knowledge_index, flatten_text
+
 
 class LivingKnowledgeBase:
     """Base de conhecimento dinâmica que evolui com o tempo."""
@@ -21,6 +26,8 @@ class LivingKnowledgeBase:
         
         # Inicializar playbooks padrão
         self._initialize_default_playbooks()
+        for playbook_id, playbook in self.playbooks.items():
+            self._index_playbook(playbook_id, playbook)
     
     def _initialize_default_playbooks(self):
         """Inicializa playbooks padrão do sistema."""
@@ -95,6 +102,24 @@ class LivingKnowledgeBase:
             }
         }
     
+    def _index_playbook(self, playbook_id: str, playbook: Dict):
+        steps = "\n".join(f"{step.get('order', i)}. {step.get('action', '')}"
+                          for i, step in enumerate(playbook.get("steps", []), 1))
+        self._index_document(
+            f"living:playbook:{playbook_id}", "living_playbook", playbook["name"],
+            flatten_text([playbook.get("steps"), playbook.get("success_metrics"), playbook.get("common_mistakes")]),
+            steps
+        )
+
+    def _index_document(self, doc_id: str, source: str, title: str, text: str, summary: str):
+        """Indexa conteúdo novo na busca do Velyra (incremental, só em memória)."""
+        try:
+            get_knowledge_index().add_document(
+                doc_id, source, title, text, metadata={"summary": summary}, persist=False
+            )
+        except Exception as e:
+            print(f"[LIVING KNOWLEDGE] ⚠️ Falha ao indexar {doc_id}: {e}")
+
     def get_playbook(self, playbook_id: str) -> Optional[Dict]:
         """Retorna um playbook específico."""
         return self.playbooks.get(playbook_id)
@@ -119,6 +144,7 @@ class LivingKnowledgeBase:
         }
         
         self.playbooks[playbook_id] = playbook
+        self._index_playbook(playbook_id, playbook)
         return {"success": True, "playbook": playbook}
     
     def update_playbook_effectiveness(self, playbook_id: str, outcome: str, metrics: Dict) -> Dict:
@@ -169,6 +195,10 @@ class LivingKnowledgeBase:
         }
         
         self.best_practices.append(practice)
+        self._index_document(
+            f"living:practice:{practice['id']}", "living_practice", title,
+            f"{category} {description}", description
+        )
         return {"success": True, "practice": practice}
     
     def get_best_practices(self, category: Optional[str] = None) -> List[Dict]:
@@ -192,6 +222,11 @@ class LivingKnowledgeBase:
         }
         
         self.case_studies.append(case)
+        self._index_document(
+            f"living:case:{case['id']}", "living_case", title,
+            flatten_text([context, actions, results, learnings]),
+            "\n".join(f"- {item}" for item in actions + learnings)
+        )
         return {"success": True, "case_study": case}
     
     def get_relevant_case_studies(self, context: Dict, limit: int = 5) -> List[Dict]:
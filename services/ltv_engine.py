@@ -10,12 +10,18 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import math
 
+try:
+    from services.cohort_ltv import get_cohort_ltv_store
+except ImportError:
+    from cohort_ltv import get_cohort_ltv_store
+
 class LTVEngine:
     """Motor de cálculo e otimização baseado em Lifetime Value."""
     
     def __init__(self):
         self.name = "LTV Engine"
         self.version = "2.0.0"
+        self._cohort_store = None
         
         # Benchmarks de LTV por nicho
         self.niche_ltv_benchmarks = {
@@ -113,10 +119,38 @@ class LTVEngine:
             "recommendations": self._generate_ltv_recommendations(ltv_result, benchmark)
         }
     
+    @property
+    def cohort_store(self):
+        """Store de coortes (criado no primeiro uso)"""
+        if self._cohort_store is None:
+            self._cohort_store = get_cohort_ltv_store()
+        return self._cohort_store
+    
+    def ingest_orders(self, orders: List[Dict]) -> Dict[str, int]:
+        """Ingere pedidos nas tabelas de coortes."""
+        return self.cohort_store.ingest_orders(orders)
+    
+    def get_cohort_curves(self, channel: str = None, max_months: int = 24) -> List[Dict]:
+        """Curvas de LTV cumulativo por coorte (mês de aquisição × canal)."""
+        return self.cohort_store.get_cohort_curves(channel, max_months)
+    
+    def _stored_ltv(self, dimension: str, dimension_id: str) -> Optional[Dict]:
+        """LTV agregado das tabelas de coortes (None se não houver dados)."""
+        try:
+            return self.cohort_store.get_dimension_ltv(dimension, dimension_id)
+        except Exception as e:
+            print(f"[LTV] ⚠️ Store de coortes indisponível: {e}")
+            return None
+    
     def calculate_ltv_by_campaign(self, campaign_id: str, campaign_data: Dict) -> Dict[str, Any]:
         """Calcula LTV específico de uma campanha."""
         
         customers = campaign_data.get("customers", [])
+        if not customers:
+            stored = self._stored_ltv("campaign", campaign_id)
+            if stored:
+                return self._campaign_ltv_result(campaign_id, stored)
+        
         total_revenue = sum(c.get("total_spent", 0) for c in customers)
         customer_count = len(customers)
         
@@ -133,15 +167,29 @@ class LTVEngine:
         repeat_rate = repeat_customers / customer_count
         avg_purchases = sum(c.get("purchases", 1) for c in customers) / customer_count
         
+        return self._campaign_ltv_result(campaign_id, {
+            "customer_count": customer_count,
+            "avg_first_purchase": avg_first_purchase,
+            "avg_ltv": avg_total_spent,
+            "repeat_rate": repeat_rate,
+            "avg_purchases": avg_purchases
+        })
+    
+    def _campaign_ltv_result(self, campaign_id: str, stats: Dict) -> Dict[str, Any]:
+        """Monta o resultado de LTV de campanha a partir das médias."""
+        avg_total_spent = stats["avg_ltv"]
+        repeat_rate = stats["repeat_rate"]
+        avg_purchases = stats["avg_purchases"]
+        
         # Projetar LTV futuro
         projected_ltv = self._project_future_ltv(avg_total_spent, repeat_rate, avg_purchases)
         
-        return {
+        result = {
             "campaign_id": campaign_id,
             "timestamp": datetime.now().isoformat(),
-            "customer_count": customer_count,
+            "customer_count": stats["customer_count"],
             "metrics": {
-                "avg_first_purchase": round(avg_first_purchase, 2),
+                "avg_first_purchase": round(stats["avg_first_purchase"], 2),
                 "avg_total_spent": round(avg_total_spent, 2),
                 "repeat_rate": round(repeat_rate * 100, 1),
                 "avg_purchases": round(avg_purchases, 2)
@@ -156,11 +204,28 @@ class LTVEngine:
                 avg_total_spent, repeat_rate, avg_purchases
             )
         }
+        if "distribution" in stats:
+            result["ltv_distribution"] = stats["distribution"]
+        return result
     
     def calculate_ltv_by_audience(self, audience_id: str, audience_data: Dict) -> Dict[str, Any]:
         """Calcula LTV por público/audiência."""
         
         segments = audience_data.get("segments", [])
+        if not segments:
+            stored = self._stored_ltv("audience", audience_id)
+            if stored:
+                return {
+                    "audience_id": audience_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "total_customers": stored["customer_count"],
+                    "weighted_avg_ltv": stored["avg_ltv"],
+                    "segments": [],
+                    "best_segment": None,
+                    "worst_segment": None,
+                    "repeat_rate": round(stored["repeat_rate"] * 100, 1),
+                    "ltv_distribution": stored["distribution"]
+                }
         
         segment_ltvs = []
         for segment in segments:
@@ -190,6 +255,16 @@ class LTVEngine:
         customers = creative_data.get("customers", [])
         
         if not customers:
+            stored = self._stored_ltv("creative", creative_id)
+            if stored:
+                return {
+                    "creative_id": creative_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "customer_count": stored["customer_count"],
+                    "avg_ltv": stored["avg_ltv"],
+                    "total_ltv": stored["total_revenue"],
+                    "ltv_distribution": stored["distribution"]
+                }
             return {
                 "creative_id": creative_id,
                 "error": "Sem dados de clientes"
@@ -11,16 +11,26 @@ Funcionalidades:
 - Gerar relatórios de consumo
 - Calcular ROI por uso de créditos
 
+Os eventos são gravados em lote no banco e as consultas por período usam
+rollups por hora/dia (ver services/credit_metering.py), então os números
+sobrevivem a reinícios e são os mesmos em todos os workers.
+
 Autor: Manus AI
 Data: 13 de Janeiro de 2026
 """
 
 import logging
 import json
+import threading
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from enum import Enum
 
+try:
+    from services.credit_metering import CreditUsageMeter
+except ImportError:
+    from credit_metering import CreditUsageMeter
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,9 +50,9 @@ class ManusCreditTracker:
     Gerencia o consumo de créditos e fornece insights sobre uso.
     """
     
-    def __init__(self, db_connection=None):
+    def __init__(self, db_connection=None, meter: Optional[CreditUsageMeter] = None):
         self.db = db_connection
-        self.usage_log = []  # In-memory log (substituir por DB em produção)
+        self.meter = meter or CreditUsageMeter()
         
         # Configurações
         self.credits_per_action = {
@@ -55,6 +65,24 @@ class ManusCreditTracker:
         
         logger.info("💳 Manus Credit Tracker inicializado")
     
+    @property
+    def usage_log(self) -> List[Dict]:
+        """Histórico completo de uso (eventos gravados e pendentes)"""
+        return self.get_usage_log()
+    
+    def get_usage_log(self, timeframe: Optional[str] = None, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Retorna os registros de uso.
+        
+        Args:
+            timeframe: Período ('today', '7d', '30d', 'all')
+            limit: Quantidade máxima (os mais recentes)
+            
+        Returns:
+            Registros do mais antigo ao mais recente
+        """
+        return self.meter.events(self._timeframe_start(timeframe), limit)
+    
     def log_credit_usage(
         self,
         action_type: ActionType,
@@ -82,14 +110,10 @@ class ManusCreditTracker:
             'context': context
         }
         
-        self.usage_log.append(record)
+        self.meter.record(record)
         
         logger.info(f"💳 Créditos usados: {credits_used} ({action_type.value})")
         
-        # TODO: Salvar no banco de dados
-        # if self.db:
-        #     self._save_to_database(record)
-        
         return record
     
     def get_total_credits_used(self, timeframe: Optional[str] = None) -> int:
@@ -102,14 +126,8 @@ class ManusCreditTracker:
         Returns:
             Total de créditos
         """
-        if timeframe:
-            filtered_log = self._filter_by_timeframe(self.usage_log, timeframe)
-        else:
-            filtered_log = self.usage_log
-        
-        total = sum(record['credits_used'] for record in filtered_log)
-        
-        return total
+        totals = self.meter.totals_by_action(self._timeframe_start(timeframe))
+        return sum(entry['credits'] for entry in totals.values())
     
     def get_credits_by_action_type(self, timeframe: Optional[str] = None) -> Dict[str, int]:
         """
@@ -121,22 +139,8 @@ class ManusCreditTracker:
         Returns:
             Dicionário {action_type: credits}
         """
-        if timeframe:
-            filtered_log = self._filter_by_timeframe(self.usage_log, timeframe)
-        else:
-            filtered_log = self.usage_log
-        
-        breakdown = {}
-        for record in filtered_log:
-            action_type = record['action_type']
-            credits = record['credits_used']
-            
-            if action_type not in breakdown:
-                breakdown[action_type] = 0
-            
-            breakdown[action_type] += credits
-        
-        return breakdown
+        totals = self.meter.totals_by_action(self._timeframe_start(timeframe))
+        return {action_type: entry['credits'] for action_type, entry in totals.items()}
     
     def get_usage_report(self, timeframe: str = '30d') -> Dict:
         """
@@ -148,10 +152,10 @@ class ManusCreditTracker:
         Returns:
             Relatório completo
         """
-        filtered_log = self._filter_by_timeframe(self.usage_log, timeframe)
+        totals = self.meter.totals_by_action(self._timeframe_start(timeframe))
         
-        total_credits = sum(record['credits_used'] for record in filtered_log)
-        breakdown = self.get_credits_by_action_type(timeframe)
+        total_credits = sum(entry['credits'] for entry in totals.values())
+        breakdown = {action_type: entry['credits'] for action_type, entry in totals.items()}
         
         # Top actions
         top_actions = sorted(
@@ -168,7 +172,7 @@ class ManusCreditTracker:
         elif timeframe == '30d':
             days = 30
         else:
-            days = max(1, len(set(r['timestamp'][:10] for r in filtered_log)))
+            days = max(1, self.meter.active_days())
         
         daily_avg = total_credits / days if days > 0 else 0
         
@@ -178,7 +182,7 @@ class ManusCreditTracker:
             'daily_average': round(daily_avg, 2),
             'breakdown_by_action': breakdown,
             'top_actions': top_actions,
-            'total_actions': len(filtered_log),
+            'total_actions': sum(entry['actions'] for entry in totals.values()),
             'report_generated_at': datetime.now().isoformat()
         }
     
@@ -211,10 +215,10 @@ class ManusCreditTracker:
         Returns:
             Análise de ROI
         """
-        filtered_log = self._filter_by_timeframe(self.usage_log, timeframe)
-        
-        total_credits = sum(record['credits_used'] for record in filtered_log)
-        
+        return self._estimate_roi(timeframe, self.get_total_credits_used(timeframe))
+    
+    def _estimate_roi(self, timeframe: str, total_credits: int) -> Dict:
+        """Estimativa de ROI para um total de créditos"""
         # TODO: Calcular ROI real baseado em resultados de campanhas
         # Por enquanto, retorna estimativa
         
@@ -237,30 +241,17 @@ class ManusCreditTracker:
             'note': 'Valores estimados - ROI real depende de resultados de campanhas'
         }
     
-    def _filter_by_timeframe(self, log: List[Dict], timeframe: str) -> List[Dict]:
-        """Filtra log por período de tempo"""
+    def _timeframe_start(self, timeframe: Optional[str]) -> Optional[datetime]:
+        """Início do período (None = todo o histórico)"""
         now = datetime.now()
         
         if timeframe == 'today':
-            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            return now.replace(hour=0, minute=0, second=0, microsecond=0)
         elif timeframe == '7d':
-            start = now - timedelta(days=7)
+            return now - timedelta(days=7)
         elif timeframe == '30d':
-            start = now - timedelta(days=30)
-        else:  # 'all'
-            return log
-        
-        filtered = [
-            record for record in log
-            if datetime.fromisoformat(record['timestamp']) >= start
-        ]
-        
-        return filtered
-    
-    def _save_to_database(self, record: Dict):
-        """Salva registro no banco de dados"""
-        # TODO: Implementar persistência em banco
-        pass
+            return now - timedelta(days=30)
+        return None  # 'all'
     
     def get_dashboard_metrics(self) -> Dict:
         """
@@ -275,14 +266,12 @@ class ManusCreditTracker:
         # Créditos usados últimos 7 dias
         week_credits = self.get_total_credits_used('7d')
         
-        # Créditos usados últimos 30 dias
-        month_credits = self.get_total_credits_used('30d')
-        
-        # Breakdown por ação (últimos 30 dias)
+        # Breakdown por ação (últimos 30 dias) - uma consulta para total, breakdown e ROI
         breakdown = self.get_credits_by_action_type('30d')
+        month_credits = sum(breakdown.values())
         
         # ROI estimado
-        roi_data = self.get_roi_by_credits('30d')
+        roi_data = self._estimate_roi('30d', month_credits)
         
         return {
             'credits_today': today_credits,
@@ -294,5 +283,23 @@ class ManusCreditTracker:
         }
 
 
-# Singleton instance
-manus_credit_tracker = ManusCreditTracker()
+# Singleton instance (criada no primeiro uso: o medidor cria as tabelas no banco)
+_tracker_instance: Optional[ManusCreditTracker] = None
+_tracker_lock = threading.Lock()
+
+
+def get_manus_credit_tracker() -> ManusCreditTracker:
+    """
+    Retorna instância global do rastreador de créditos (singleton)
+
+    Returns:
+        ManusCreditTracker: Instância do rastreador
+    """
+    global _tracker_instance
+
+    if _tracker_instance is None:
+        with _tracker_lock:
+            if _tracker_instance is None:
+                _tracker_instance = ManusCreditTracker()
+
+    return _tracker_instance
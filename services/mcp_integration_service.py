@@ -17,6 +17,10 @@ try:
 except ImportError:
     from db_utils import get_db_connection, sql_param, is_postgres
 
+try:
+    from services.webhook_dispatcher import get_dispatcher
+except ImportError:
+    from webhook_dispatcher import get_dispatcher
 
 
 class MCPIntegrationService:
@@ -413,6 +417,10 @@ class MCPIntegrationService:
         """
         Dispara webhooks registrados para um evento
         
+        A entrega HTTP é feita em background pelo WebhookDispatcher; aqui
+        o evento é apenas gravado na outbox, então um assinante lento não
+        atrasa a ação que emitiu o evento.
+        
         Args:
             event: Tipo de evento
             data: Dados do evento
@@ -421,54 +429,12 @@ class MCPIntegrationService:
             dict: Resultado do disparo
         """
         try:
-            conn = get_db_connection()
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            cursor.execute(sql_param("""
-                SELECT * FROM webhooks
-                WHERE event = ? AND active = 1
-            """), (event,))
-            
-            webhooks = cursor.fetchall()
-            conn.close()
-            
-            results = []
-            
-            for webhook in webhooks:
-                try:
-                    # Criar assinatura
-                    signature = self._create_webhook_signature(data, webhook['secret'])
-                    
-                    # Enviar webhook
-                    response = requests.post(
-                        webhook['url'],
-                        json=data,
-                        headers={
-                            'Content-Type': 'application/json',
-                            'X-Webhook-Signature': signature,
-                            'X-Webhook-Event': event
-                        },
-                        timeout=10
-                    )
-                    
-                    results.append({
-                        'webhook_id': webhook['id'],
-                        'success': response.status_code == 200,
-                        'status_code': response.status_code
-                    })
-                    
-                except Exception as e:
-                    results.append({
-                        'webhook_id': webhook['id'],
-                        'success': False,
-                        'error': str(e)
-                    })
+            queued = get_dispatcher().enqueue_for_subscribers(event, data, source='mcp')
             
             return {
                 'success': True,
-                'webhooks_triggered': len(results),
-                'results': results
+                'webhooks_triggered': queued,
+                'delivery': 'queued'
             }
             
         except Exception as e:
@@ -10,6 +10,22 @@ from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 import math
 import random
+from collections import deque
+
+try:
+    from services.streaming_anomaly_detector import get_anomaly_detector
+except ImportError:
+    from streaming_anomaly_detector import get_anomaly_detector
+
+try:
+    from services.prediction_service import get_prediction_service
+except ImportError:
+    from prediction_service import get_prediction_service
+
+try:
+    from services.budget_allocator import get_budget_allocator, fit_response_curves
+except ImportError:
+    from budget_allocator import get_budget_allocator, fit_response_curves
 
 class MLPredictionEngine:
     """Motor de predicao baseado em Machine Learning."""
@@ -29,14 +45,89 @@ class MLPredictionEngine:
             "audience_scorer": {"accuracy": 0.83, "last_trained": None}
         }
         
-        # Historico de predicoes
-        self.prediction_history = []
+        # Historico de predicoes (limitado; persistencia fica no PredictionLogWriter)
+        self.prediction_history = deque(maxlen=1000)
         
         # Cache de features
         self.feature_cache = {}
+        
+        # Servico de predicao (registro + cache), criado sob demanda
+        self._prediction_service = None
+    
+    @property
+    def prediction_service(self):
+        """Servico de predicao com os modelos heuristicos registrados."""
+        if self._prediction_service is None:
+            service = get_prediction_service()
+            for name, info in self.models.items():
+                service.registry.register(name, f"{self.version}:{info['accuracy']}", {"accuracy": info["accuracy"]})
+            self._prediction_service = service
+        return self._prediction_service
+    
+    def _cache_features(self, campaign_data: Dict, **params) -> Dict[str, Any]:
+        """Entradas que determinam uma predicao (dados + parametros + dia)."""
+        return {
+            "data": campaign_data,
+            "params": params,
+            "day": datetime.now().strftime("%Y-%m-%d")
+        }
     
     def predict_roas(self, campaign_data: Dict, days_ahead: int = 7) -> Dict[str, Any]:
         """Preve ROAS futuro de uma campanha."""
+        return self.prediction_service.cached(
+            "roas_predictor",
+            self._cache_features(campaign_data, days_ahead=days_ahead),
+            lambda: self._predict_roas(campaign_data, days_ahead),
+            campaign_data.get("campaign_id")
+        )
+    
+    def predict_cpa(self, campaign_data: Dict, target_cpa: float = None) -> Dict[str, Any]:
+        """Preve CPA futuro."""
+        return self.prediction_service.cached(
+            "cpa_predictor",
+            self._cache_features(campaign_data, target_cpa=target_cpa),
+            lambda: self._predict_cpa(campaign_data, target_cpa),
+            campaign_data.get("campaign_id")
+        )
+    
+    def predict_conversions(self, campaign_data: Dict, budget: float, days: int = 7) -> Dict[str, Any]:
+        """Preve conversoes para um orcamento."""
+        return self.prediction_service.cached(
+            "conversion_predictor",
+            self._cache_features(campaign_data, budget=budget, days=days),
+            lambda: self._predict_conversions(campaign_data, budget, days),
+            campaign_data.get("campaign_id")
+        )
+    
+    def predict_roas_batch(self, campaigns: List[Dict], days_ahead: int = 7) -> List[Dict[str, Any]]:
+        """Preve ROAS de varias campanhas (misses calculados de uma vez)."""
+        return self.prediction_service.cached_many(
+            "roas_predictor",
+            [self._cache_features(c, days_ahead=days_ahead) for c in campaigns],
+            lambda missing: [self._predict_roas(campaigns[i], days_ahead) for i in missing],
+            [c.get("campaign_id") for c in campaigns]
+        )
+    
+    def predict_cpa_batch(self, campaigns: List[Dict], target_cpa: float = None) -> List[Dict[str, Any]]:
+        """Preve CPA de varias campanhas."""
+        return self.prediction_service.cached_many(
+            "cpa_predictor",
+            [self._cache_features(c, target_cpa=target_cpa) for c in campaigns],
+            lambda missing: [self._predict_cpa(campaigns[i], target_cpa) for i in missing],
+            [c.get("campaign_id") for c in campaigns]
+        )
+    
+    def predict_conversions_batch(self, campaigns: List[Dict], budget: float, days: int = 7) -> List[Dict[str, Any]]:
+        """Preve conversoes de varias campanhas para o mesmo orcamento."""
+        return self.prediction_service.cached_many(
+            "conversion_predictor",
+            [self._cache_features(c, budget=budget, days=days) for c in campaigns],
+            lambda missing: [self._predict_conversions(campaigns[i], budget, days) for i in missing],
+            [c.get("campaign_id") for c in campaigns]
+        )
+    
+    def _predict_roas(self, campaign_data: Dict, days_ahead: int = 7) -> Dict[str, Any]:
+        """Calcula a predicao de ROAS (sem cache)."""
         
         # Extrair features
         features = self._extract_features(campaign_data)
@@ -87,8 +178,8 @@ class MLPredictionEngine:
         self._log_prediction(result)
         return result
     
-    def predict_cpa(self, campaign_data: Dict, target_cpa: float = None) -> Dict[str, Any]:
-        """Preve CPA futuro."""
+    def _predict_cpa(self, campaign_data: Dict, target_cpa: float = None) -> Dict[str, Any]:
+        """Calcula a predicao de CPA (sem cache)."""
         
         current_cpa = campaign_data.get("current_cpa", 50)
         target_cpa = target_cpa or campaign_data.get("target_cpa", current_cpa)
@@ -130,8 +221,8 @@ class MLPredictionEngine:
             "recommendations": self._generate_cpa_recommendations(current_cpa, predicted_cpa, target_cpa)
         }
     
-    def predict_conversions(self, campaign_data: Dict, budget: float, days: int = 7) -> Dict[str, Any]:
-        """Preve conversoes para um orcamento."""
+    def _predict_conversions(self, campaign_data: Dict, budget: float, days: int = 7) -> Dict[str, Any]:
+        """Calcula a predicao de conversoes (sem cache)."""
         
         current_cpa = campaign_data.get("current_cpa", 50)
         conversion_rate = campaign_data.get("conversion_rate", 2.0)
@@ -175,59 +266,46 @@ class MLPredictionEngine:
         }
     
     def optimize_budget(self, campaigns: List[Dict], total_budget: float) -> Dict[str, Any]:
-        """Otimiza distribuicao de orcamento entre campanhas."""
+        """Otimiza distribuicao de orcamento entre campanhas.
+        
+        Usa o BudgetAllocator (curvas de retorno decrescente, limites
+        min/max por campanha e mudanca maxima de 50% por passo).
+        """
         
         if not campaigns:
             return {"error": "Nenhuma campanha fornecida"}
         
-        # Calcular score de cada campanha
-        campaign_scores = []
-        for campaign in campaigns:
-            score = self._calculate_campaign_score(campaign)
-            campaign_scores.append({
-                "campaign_id": campaign.get("campaign_id"),
-                "score": score,
-                "current_budget": campaign.get("budget", 0),
-                "roas": campaign.get("roas", 0),
-                "cpa": campaign.get("cpa", 0)
-            })
-        
-        # Ordenar por score
-        campaign_scores.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Distribuir orcamento proporcionalmente ao score
-        total_score = sum(c["score"] for c in campaign_scores)
+        # Curvas de resposta: historico (spend x revenue) ou ponto atual
+        current = [c.get("budget", 0) or 0 for c in campaigns]
+        revenue = [(c.get("budget", 0) or 0) * (c.get("roas", 0) or 0) for c in campaigns]
+        a, k = fit_response_curves(current, revenue, [c.get("history") for c in campaigns])
+        
+        result = get_budget_allocator().allocate(
+            total_budget,
+            a, k,
+            current=current,
+            min_budget=[c.get("min_budget", 0) for c in campaigns],
+            max_budget=[c.get("max_budget", float("inf")) for c in campaigns],
+            max_step_change=0.5
+        )
+        expected_roas = result.expected_roas()
         
         allocations = []
-        remaining_budget = total_budget
-        
-        for i, campaign in enumerate(campaign_scores):
-            if total_score > 0:
-                proportion = campaign["score"] / total_score
-                allocated = total_budget * proportion
-            else:
-                allocated = total_budget / len(campaigns)
-            
-            # Limitar mudancas drasticas
-            current = campaign["current_budget"]
-            max_change = current * 0.5 if current > 0 else allocated
-            
-            if allocated > current + max_change:
-                allocated = current + max_change
-            elif allocated < current - max_change:
-                allocated = max(0, current - max_change)
-            
+        for i, campaign in enumerate(campaigns):
+            allocated = float(result.budgets[i])
+            previous = current[i]
             allocations.append({
-                "campaign_id": campaign["campaign_id"],
-                "current_budget": round(current, 2),
+                "campaign_id": campaign.get("campaign_id"),
+                "current_budget": round(previous, 2),
                 "recommended_budget": round(allocated, 2),
-                "change": round(allocated - current, 2),
-                "change_percent": round(((allocated - current) / current) * 100, 1) if current > 0 else 0,
-                "score": round(campaign["score"], 2),
-                "expected_roas": round(campaign["roas"] * (1 + (allocated - current) / current * 0.1), 2) if current > 0 else campaign["roas"]
+                "change": round(allocated - previous, 2),
+                "change_percent": round(((allocated - previous) / previous) * 100, 1) if previous > 0 else 0,
+                "score": round(self._calculate_campaign_score(campaign), 2),
+                "expected_roas": round(float(expected_roas[i]), 2) if allocated > 0 else campaign.get("roas", 0)
             })
-            
-            remaining_budget -= allocated
+        
+        # Ordenar por score
+        allocations.sort(key=lambda x: x["score"], reverse=True)
         
         return {
             "timestamp": datetime.now().isoformat(),
@@ -236,13 +314,29 @@ class MLPredictionEngine:
             "campaigns_analyzed": len(campaigns),
             "allocations": allocations,
             "summary": {
-                "total_allocated": round(total_budget - remaining_budget, 2),
-                "expected_total_roas": round(sum(a["expected_roas"] * a["recommended_budget"] for a in allocations) / total_budget, 2) if total_budget > 0 else 0
+                "total_allocated": round(result.total_allocated, 2),
+                "unallocated": round(result.unallocated, 2),
+                "marginal_roas": round(result.marginal_roas, 4),
+                "constraints_feasible": result.feasible,
+                "expected_total_roas": round(float(result.expected_revenue.sum()) / total_budget, 2) if total_budget > 0 else 0
             }
         }
     
-    def detect_anomalies(self, metrics_history: List[Dict]) -> Dict[str, Any]:
-        """Detecta anomalias nas metricas."""
+    def detect_anomalies(self, metrics_history: List[Dict], campaign_id: str = None) -> Dict[str, Any]:
+        """Detecta anomalias nas metricas.
+        
+        Com campaign_id, usa o estado incremental do StreamingAnomalyDetector:
+        apenas os pontos ainda nao vistos sao incorporados e o ultimo ponto e
+        pontuado contra a baseline acumulada, sem recalcular o historico.
+        Pontos sem timestamp nao tem como ser deduplicados entre chamadas:
+        ficam fora do estado, e sem timestamp no ultimo ponto o calculo e
+        feito so sobre a lista recebida.
+        """
+        
+        metrics_to_check = ["spend", "cpa", "roas", "ctr", "conversions"]
+        
+        if campaign_id is not None and metrics_history and self._point_timestamp(metrics_history[-1]):
+            return self._detect_anomalies_streaming(campaign_id, metrics_history, metrics_to_check)
         
         if len(metrics_history) < 5:
             return {"error": "Historico insuficiente para deteccao de anomalias"}
@@ -250,8 +344,6 @@ class MLPredictionEngine:
         anomalies = []
         
         # Calcular medias e desvios
-        metrics_to_check = ["spend", "cpa", "roas", "ctr", "conversions"]
-        
         for metric in metrics_to_check:
             values = [m.get(metric, 0) for m in metrics_history if metric in m]
             if len(values) < 3:
@@ -268,20 +360,65 @@ class MLPredictionEngine:
                 z_score = (latest - avg) / std_dev
                 
                 if abs(z_score) > 2:
-                    anomalies.append({
-                        "metric": metric,
-                        "current_value": round(latest, 2),
-                        "expected_value": round(avg, 2),
-                        "deviation": round(z_score, 2),
-                        "severity": "high" if abs(z_score) > 3 else "medium",
-                        "direction": "above" if z_score > 0 else "below",
-                        "description": f"{metric} esta {abs(z_score):.1f} desvios padrao {'acima' if z_score > 0 else 'abaixo'} da media"
-                    })
+                    anomalies.append(self._build_anomaly(metric, latest, avg, z_score))
+        
+        return self._anomaly_report(len(metrics_history), anomalies)
+    
+    def _detect_anomalies_streaming(self, campaign_id: str, metrics_history: List[Dict], metrics_to_check: List[str]) -> Dict[str, Any]:
+        """Deteccao incremental: O(pontos novos) em vez de O(historico)."""
         
+        detector = get_anomaly_detector()
+        latest = metrics_history[-1]
+        latest_ts = self._point_timestamp(latest)
+        
+        # Incorporar pontos anteriores ainda nao vistos (warm-up da baseline)
+        for point in metrics_history[:-1]:
+            ts = self._point_timestamp(point)
+            if not ts:
+                continue
+            for metric in metrics_to_check:
+                if metric in point and not detector.has_seen(campaign_id, metric, ts):
+                    detector.update(campaign_id, metric, point[metric], ts)
+        
+        anomalies = []
+        data_points = 0
+        for metric in metrics_to_check:
+            if metric not in latest:
+                continue
+            already_seen = detector.has_seen(campaign_id, metric, latest_ts)
+            scored = detector.score(campaign_id, metric, latest[metric], latest_ts, min_points=3)
+            if scored:
+                data_points = max(data_points, scored["data_points"])
+                if scored["is_anomaly"]:
+                    anomalies.append(self._build_anomaly(metric, latest[metric], scored["expected"], scored["z_score"]))
+            if not already_seen:
+                detector.update(campaign_id, metric, latest[metric], latest_ts)
+        
+        detector.maybe_flush()
+        return self._anomaly_report(data_points or len(metrics_history), anomalies)
+    
+    @staticmethod
+    def _point_timestamp(point: Dict) -> Optional[str]:
+        return point.get("timestamp") or point.get("date")
+    
+    def _build_anomaly(self, metric: str, latest: float, expected: float, z_score: float) -> Dict[str, Any]:
+        """Monta o registro de uma anomalia."""
+        return {
+            "metric": metric,
+            "current_value": round(latest, 2),
+            "expected_value": round(expected, 2),
+            "deviation": round(z_score, 2),
+            "severity": "high" if abs(z_score) > 3 else "medium",
+            "direction": "above" if z_score > 0 else "below",
+            "description": f"{metric} esta {abs(z_score):.1f} desvios padrao {'acima' if z_score > 0 else 'abaixo'} da media"
+        }
+    
+    def _anomaly_report(self, data_points: int, anomalies: List[Dict]) -> Dict[str, Any]:
+        """Monta o resultado da deteccao de anomalias."""
         return {
             "timestamp": datetime.now().isoformat(),
             "model": "anomaly_detector",
-            "data_points_analyzed": len(metrics_history),
+            "data_points_analyzed": data_points,
             "anomalies_found": len(anomalies),
             "anomalies": anomalies,
             "overall_status": "alert" if any(a["severity"] == "high" for a in anomalies) else "warning" if anomalies else "normal",
@@ -457,10 +594,8 @@ class MLPredictionEngine:
         return "Audiencia fraca - evitar ou refinar"
     
     def _log_prediction(self, prediction: Dict):
-        """Registra predicao no historico."""
+        """Registra predicao no historico em memoria (deque limitada)."""
         self.prediction_history.append(prediction)
-        if len(self.prediction_history) > 1000:
-            self.prediction_history = self.prediction_history[-1000:]
 
 
 # Instancia global
@@ -2,15 +2,92 @@
 MONETIZATION SYSTEM - Sistema de Monetização Interna
 Planos, créditos, faturamento e gestão de assinaturas
 Nexora Prime V2 - Expansão Unicórnio
+
+Assinaturas, saldos, uso diário e faturas ficam em tabelas indexadas
+(compartilhadas entre os workers). O consumo de créditos é um UPDATE
+condicional único; relatórios de uso são agregados no SQL.
 """
 
 import os
 import json
+import time
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from enum import Enum
 import secrets
 
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, get_db_connection_with_dict, sql_param
+except ImportError:
+    from db_utils import get_db_connection, get_db_connection_with_dict, sql_param
+
+
+PLAN_CACHE_TTL = 30.0  # segundos - outros workers veem mudanças de plano em até 30s
+PLAN_CACHE_SIZE = 1024
+
+# Períodos de relatório de uso (dias)
+USAGE_PERIODS = {"today": 0, "7d": 7, "30d": 30}
+
+SUBSCRIPTION_SELECT = """
+    SELECT id, user_id, plan, billing_cycle, price, status, created_at, current_period_start,
+           current_period_end, next_billing_date, cancel_at_period_end, cancelled_at
+    FROM monetization_subscriptions
+"""
+
+BALANCE_SELECT = """
+    SELECT credit_type, available, used, credit_limit, reset_date
+    FROM monetization_credit_balances WHERE user_id = ?
+"""
+
+BALANCE_RESET = """
+    INSERT INTO monetization_credit_balances (user_id, credit_type, available, used, credit_limit, reset_date)
+    VALUES (?, ?, ?, 0, ?, ?)
+    ON CONFLICT (user_id, credit_type) DO UPDATE SET
+        available = excluded.available, used = 0,
+        credit_limit = excluded.credit_limit, reset_date = excluded.reset_date
+"""
+
+BALANCE_INSERT_MISSING = """
+    INSERT INTO monetization_credit_balances (user_id, credit_type, available, used, credit_limit, reset_date)
+    VALUES (?, ?, ?, 0, ?, ?)
+    ON CONFLICT (user_id, credit_type) DO NOTHING
+"""
+
+# Débito condicional: uma instrução, atômica entre processos
+CONSUME_UPDATE = """
+    UPDATE monetization_credit_balances
+    SET available = CASE WHEN credit_limit = -1 THEN available ELSE available - ? END,
+        used = used + ?
+    WHERE user_id = ? AND credit_type = ? AND (credit_limit = -1 OR available >= ?)
+"""
+
+# Upgrade: soma ao saldo atual a diferença de limite, calculada na própria linha
+UPGRADE_UPDATE = """
+    UPDATE monetization_credit_balances
+    SET available = CASE
+            WHEN ? = -1 THEN -1
+            WHEN credit_limit = -1 THEN available
+            WHEN ? > credit_limit THEN available + (? - credit_limit)
+            ELSE available
+        END,
+        credit_limit = CASE
+            WHEN ? = -1 THEN -1
+            WHEN credit_limit = -1 THEN credit_limit
+            ELSE ?
+        END
+    WHERE user_id = ? AND credit_type = ?
+"""
+
+USAGE_UPSERT = """
+    INSERT INTO monetization_usage_daily (user_id, credit_type, day, amount)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, day, credit_type) DO UPDATE SET
+        amount = monetization_usage_daily.amount + excluded.amount
+"""
+
+
 class PlanType(Enum):
     FREE = "free"
     STARTER = "starter"
@@ -209,11 +286,79 @@ class MonetizationSystem:
             }
         }
         
-        # Armazenamento de dados
-        self.subscriptions = {}
-        self.credit_balances = {}
-        self.transactions = {}
-        self.invoices = {}
+        # Cache read-through de plano ativo por usuário: {user_id: (expira_em, assinatura)}
+        self._plan_cache: Dict[str, Any] = {}
+        self._plan_cache_lock = threading.Lock()
+        
+        self._init_tables()
+    
+    def _init_tables(self):
+        """Cria as tabelas de monetização (assinaturas, saldos, uso diário, faturas)."""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monetization_subscriptions (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    plan TEXT NOT NULL,
+                    billing_cycle TEXT NOT NULL,
+                    price REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    current_period_start TEXT,
+                    current_period_end TEXT,
+                    next_billing_date TEXT,
+                    cancel_at_period_end INTEGER NOT NULL DEFAULT 0,
+                    cancelled_at TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_monetization_subscriptions_user "
+                "ON monetization_subscriptions (user_id, status, created_at)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monetization_credit_balances (
+                    user_id TEXT NOT NULL,
+                    credit_type TEXT NOT NULL,
+                    available INTEGER NOT NULL DEFAULT 0,
+                    used INTEGER NOT NULL DEFAULT 0,
+                    credit_limit INTEGER NOT NULL DEFAULT 0,
+                    reset_date TEXT,
+                    PRIMARY KEY (user_id, credit_type)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monetization_usage_daily (
+                    user_id TEXT NOT NULL,
+                    credit_type TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    amount INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, day, credit_type)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS monetization_invoices (
+                    id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    subscription_id TEXT,
+                    amount REAL NOT NULL,
+                    currency TEXT NOT NULL,
+                    description TEXT,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    due_date TEXT,
+                    paid_at TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_monetization_invoices_user "
+                "ON monetization_invoices (user_id, created_at)"
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[MONETIZATION] ❌ Erro ao criar tabelas: {e}")
     
     def create_subscription(
         self, 
@@ -240,33 +385,32 @@ class MonetizationSystem:
             price = plan_details["price_monthly"]
             next_billing = datetime.now() + timedelta(days=30)
         
-        subscription = {
-            "id": subscription_id,
-            "user_id": user_id,
-            "plan": plan,
-            "plan_name": plan_details["name"],
-            "billing_cycle": billing_cycle,
-            "price": price,
-            "status": "active",
-            "created_at": datetime.now().isoformat(),
-            "current_period_start": datetime.now().isoformat(),
-            "current_period_end": next_billing.isoformat(),
-            "next_billing_date": next_billing.isoformat(),
-            "features": plan_details["features"],
-            "cancel_at_period_end": False
-        }
-        
-        self.subscriptions[subscription_id] = subscription
-        
-        # Inicializar créditos
-        self._initialize_credits(user_id, plan_type)
+        now = datetime.now().isoformat()
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO monetization_subscriptions
+                    (id, user_id, plan, billing_cycle, price, status, created_at,
+                     current_period_start, current_period_end, next_billing_date, cancel_at_period_end)
+                VALUES (?, ?, ?, ?, ?, 'active', ?, ?, ?, ?, 0)
+            """), (subscription_id, user_id, plan, billing_cycle, price, now, now,
+                   next_billing.isoformat(), next_billing.isoformat()))
+            
+            # Inicializar créditos
+            self._initialize_credits(cursor, user_id, plan_type)
+            
+            # Criar invoice
+            invoice = self._create_invoice(cursor, user_id, subscription_id, price, f"Assinatura {plan_details['name']}")
+            conn.commit()
+        finally:
+            conn.close()
         
-        # Criar invoice
-        invoice = self._create_invoice(user_id, subscription_id, price, f"Assinatura {plan_details['name']}")
+        self._invalidate_plan_cache(user_id)
         
         return {
             "subscription_id": subscription_id,
-            "subscription": subscription,
+            "subscription": self._get_subscription(subscription_id),
             "invoice": invoice,
             "message": "Assinatura criada com sucesso"
         }
@@ -278,10 +422,10 @@ class MonetizationSystem:
     ) -> Dict[str, Any]:
         """Faz upgrade de uma assinatura."""
         
-        if subscription_id not in self.subscriptions:
+        subscription = self._get_subscription(subscription_id)
+        if not subscription:
             return {"error": "Assinatura não encontrada"}
         
-        subscription = self.subscriptions[subscription_id]
         current_plan = subscription["plan"]
         
         try:
@@ -314,29 +458,38 @@ class MonetizationSystem:
         new_cost = new_daily_rate * days_remaining
         prorated_amount = max(0, new_cost - credit_remaining)
         
-        # Atualizar assinatura
-        subscription["plan"] = new_plan
-        subscription["plan_name"] = new_plan_details["name"]
-        subscription["features"] = new_plan_details["features"]
-        
         if subscription["billing_cycle"] == "yearly":
-            subscription["price"] = new_plan_details["price_yearly"]
+            new_price = new_plan_details["price_yearly"]
         else:
-            subscription["price"] = new_plan_details["price_monthly"]
+            new_price = new_plan_details["price_monthly"]
         
-        # Atualizar créditos
-        self._upgrade_credits(subscription["user_id"], new_plan_type)
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            # Atualizar assinatura
+            cursor.execute(sql_param(
+                "UPDATE monetization_subscriptions SET plan = ?, price = ? WHERE id = ?"
+            ), (new_plan, new_price, subscription_id))
+            
+            # Atualizar créditos
+            self._upgrade_credits(cursor, subscription["user_id"], new_plan_type)
+            
+            # Criar invoice do upgrade
+            if prorated_amount > 0:
+                invoice = self._create_invoice(
+                    cursor,
+                    subscription["user_id"],
+                    subscription_id,
+                    prorated_amount,
+                    f"Upgrade para {new_plan_details['name']} (prorata)"
+                )
+            else:
+                invoice = None
+            conn.commit()
+        finally:
+            conn.close()
         
-        # Criar invoice do upgrade
-        if prorated_amount > 0:
-            invoice = self._create_invoice(
-                subscription["user_id"],
-                subscription_id,
-                prorated_amount,
-                f"Upgrade para {new_plan_details['name']} (prorata)"
-            )
-        else:
-            invoice = None
+        self._invalidate_plan_cache(subscription["user_id"])
         
         return {
             "subscription_id": subscription_id,
@@ -355,16 +508,27 @@ class MonetizationSystem:
     ) -> Dict[str, Any]:
         """Cancela uma assinatura."""
         
-        if subscription_id not in self.subscriptions:
+        subscription = self._get_subscription(subscription_id)
+        if not subscription:
             return {"error": "Assinatura não encontrada"}
         
-        subscription = self.subscriptions[subscription_id]
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if immediate:
+                cursor.execute(sql_param(
+                    "UPDATE monetization_subscriptions SET status = 'cancelled', cancelled_at = ? WHERE id = ?"
+                ), (datetime.now().isoformat(), subscription_id))
+            else:
+                cursor.execute(sql_param(
+                    "UPDATE monetization_subscriptions SET cancel_at_period_end = 1 WHERE id = ?"
+                ), (subscription_id,))
+            conn.commit()
+        finally:
+            conn.close()
         
-        if immediate:
-            subscription["status"] = "cancelled"
-            subscription["cancelled_at"] = datetime.now().isoformat()
-        else:
-            subscription["cancel_at_period_end"] = True
+        self._invalidate_plan_cache(subscription["user_id"])
+        subscription = self._get_subscription(subscription_id)
         
         return {
             "subscription_id": subscription_id,
@@ -377,12 +541,8 @@ class MonetizationSystem:
     def get_subscription_status(self, user_id: str) -> Dict[str, Any]:
         """Obtém status da assinatura de um usuário."""
         
-        # Buscar assinatura ativa do usuário
-        user_subscription = None
-        for sub in self.subscriptions.values():
-            if sub["user_id"] == user_id and sub["status"] == "active":
-                user_subscription = sub
-                break
+        # Buscar assinatura ativa do usuário (cache read-through)
+        user_subscription = self._get_active_subscription(user_id)
         
         if not user_subscription:
             return {
@@ -412,24 +572,26 @@ class MonetizationSystem:
     def get_credit_balance(self, user_id: str) -> Dict[str, Any]:
         """Obtém saldo de créditos de um usuário."""
         
-        if user_id not in self.credit_balances:
+        balance = self._get_balances(user_id)
+        if not balance:
             # Inicializar com créditos do plano free
-            self._initialize_credits(user_id, PlanType.FREE)
+            self._ensure_credits(user_id)
+            balance = self._get_balances(user_id)
         
-        balance = self.credit_balances[user_id]
+        reset_date = next((row["reset_date"] for row in balance.values() if row["reset_date"]), None)
         
         return {
             "user_id": user_id,
             "timestamp": datetime.now().isoformat(),
             "balances": {
                 credit_type.value: {
-                    "available": balance.get(credit_type, {}).get("available", 0),
-                    "used_this_period": balance.get(credit_type, {}).get("used", 0),
-                    "limit": balance.get(credit_type, {}).get("limit", 0)
+                    "available": balance.get(credit_type.value, {}).get("available", 0),
+                    "used_this_period": balance.get(credit_type.value, {}).get("used", 0),
+                    "limit": balance.get(credit_type.value, {}).get("credit_limit", 0)
                 }
                 for credit_type in CreditType
             },
-            "reset_date": balance.get("reset_date", (datetime.now() + timedelta(days=30)).isoformat())
+            "reset_date": reset_date or (datetime.now() + timedelta(days=30)).isoformat()
         }
     
     def consume_credits(
@@ -438,49 +600,62 @@ class MonetizationSystem:
         credit_type: str, 
         amount: int = 1
     ) -> Dict[str, Any]:
-        """Consome créditos de um usuário."""
+        """Consome créditos de um usuário (débito atômico, seguro entre processos)."""
         
         try:
             credit_type_enum = CreditType(credit_type)
         except:
             return {"error": f"Tipo de crédito inválido: {credit_type}"}
         
-        if user_id not in self.credit_balances:
-            self._initialize_credits(user_id, PlanType.FREE)
-        
-        balance = self.credit_balances[user_id]
-        credit_balance = balance.get(credit_type_enum, {"available": 0, "used": 0, "limit": 0})
-        
-        # Verificar se é ilimitado
-        if credit_balance["limit"] == -1:
-            credit_balance["used"] += amount
-            return {
-                "success": True,
-                "consumed": amount,
-                "remaining": -1,  # Ilimitado
-                "message": "Créditos consumidos (plano ilimitado)"
-            }
+        for attempt in range(2):
+            conn = get_db_connection_with_dict()
+            try:
+                cursor = conn.cursor()
+                # Débito condicional: só passa com saldo (ou plano ilimitado)
+                cursor.execute(sql_param(CONSUME_UPDATE), (amount, amount, user_id, credit_type_enum.value, amount))
+                if cursor.rowcount == 1:
+                    cursor.execute(sql_param(USAGE_UPSERT), (
+                        user_id, credit_type_enum.value, datetime.now().strftime("%Y-%m-%d"), amount
+                    ))
+                    cursor.execute(sql_param(BALANCE_SELECT + " AND credit_type = ?"), (user_id, credit_type_enum.value))
+                    credit_balance = cursor.fetchone()
+                    conn.commit()
+                    
+                    # Verificar se é ilimitado
+                    if credit_balance["credit_limit"] == -1:
+                        return {
+                            "success": True,
+                            "consumed": amount,
+                            "remaining": -1,  # Ilimitado
+                            "message": "Créditos consumidos (plano ilimitado)"
+                        }
+                    
+                    return {
+                        "success": True,
+                        "consumed": amount,
+                        "remaining": credit_balance["available"],
+                        "message": "Créditos consumidos com sucesso"
+                    }
+                
+                cursor.execute(sql_param(BALANCE_SELECT + " AND credit_type = ?"), (user_id, credit_type_enum.value))
+                credit_balance = cursor.fetchone()
+                conn.rollback()
+            finally:
+                conn.close()
+            
+            if credit_balance is None and attempt == 0:
+                # Primeiro uso: inicializar com créditos do plano free e tentar de novo
+                self._ensure_credits(user_id)
+                continue
+            break
         
         # Verificar saldo
-        if credit_balance["available"] < amount:
-            return {
-                "success": False,
-                "error": "Créditos insuficientes",
-                "available": credit_balance["available"],
-                "required": amount,
-                "suggestion": "Compre mais créditos ou faça upgrade do plano"
-            }
-        
-        # Consumir
-        credit_balance["available"] -= amount
-        credit_balance["used"] += amount
-        balance[credit_type_enum] = credit_balance
-        
         return {
-            "success": True,
-            "consumed": amount,
-            "remaining": credit_balance["available"],
-            "message": "Créditos consumidos com sucesso"
+            "success": False,
+            "error": "Créditos insuficientes",
+            "available": credit_balance["available"] if credit_balance else 0,
+            "required": amount,
+            "suggestion": "Compre mais créditos ou faça upgrade do plano"
         }
     
     def purchase_credits(
@@ -513,23 +688,27 @@ class MonetizationSystem:
             return {"error": "Especifique um pacote ou créditos customizados"}
         
         # Adicionar créditos
-        if user_id not in self.credit_balances:
-            self._initialize_credits(user_id, PlanType.FREE)
-        
-        balance = self.credit_balances[user_id]
+        self._ensure_credits(user_id)
         
-        for credit_type, amount in credits_to_add.items():
-            if credit_type not in balance:
-                balance[credit_type] = {"available": 0, "used": 0, "limit": 0}
-            balance[credit_type]["available"] += amount
-        
-        # Criar invoice
-        invoice = self._create_invoice(
-            user_id,
-            None,
-            price,
-            f"Compra de créditos - {package or 'customizado'}"
-        )
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(sql_param("""
+                UPDATE monetization_credit_balances SET available = available + ?
+                WHERE user_id = ? AND credit_type = ?
+            """), [(amount, user_id, credit_type.value) for credit_type, amount in credits_to_add.items()])
+            
+            # Criar invoice
+            invoice = self._create_invoice(
+                cursor,
+                user_id,
+                None,
+                price,
+                f"Compra de créditos - {package or 'customizado'}"
+            )
+            conn.commit()
+        finally:
+            conn.close()
         
         return {
             "success": True,
@@ -544,16 +723,36 @@ class MonetizationSystem:
         user_id: str, 
         period: str = "current"
     ) -> Dict[str, Any]:
-        """Obtém relatório de uso."""
+        """
+        Obtém relatório de uso.
+        
+        period: "current" (período de cobrança atual) ou "today", "7d", "30d"
+        (consumo somado no SQL a partir do uso diário).
+        """
         
-        balance = self.credit_balances.get(user_id, {})
+        balance = self._get_balances(user_id)
         subscription = self.get_subscription_status(user_id)
         
+        period_usage = None
+        if period in USAGE_PERIODS:
+            start_day = (datetime.now() - timedelta(days=USAGE_PERIODS[period])).strftime("%Y-%m-%d")
+            conn = get_db_connection_with_dict()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql_param("""
+                    SELECT credit_type, SUM(amount) AS used FROM monetization_usage_daily
+                    WHERE user_id = ? AND day >= ?
+                    GROUP BY credit_type
+                """), (user_id, start_day))
+                period_usage = {row["credit_type"]: int(row["used"] or 0) for row in cursor.fetchall()}
+            finally:
+                conn.close()
+        
         usage = {}
         for credit_type in CreditType:
-            credit_data = balance.get(credit_type, {"available": 0, "used": 0, "limit": 0})
-            limit = credit_data["limit"]
-            used = credit_data["used"]
+            credit_data = balance.get(credit_type.value, {"available": 0, "used": 0, "credit_limit": 0})
+            limit = credit_data["credit_limit"]
+            used = credit_data["used"] if period_usage is None else period_usage.get(credit_type.value, 0)
             
             if limit == -1:
                 percentage = 0  # Ilimitado
@@ -580,17 +779,20 @@ class MonetizationSystem:
         }
     
     def get_invoices(self, user_id: str, limit: int = 10) -> List[Dict]:
-        """Obtém faturas de um usuário."""
-        
-        user_invoices = [
-            inv for inv in self.invoices.values()
-            if inv["user_id"] == user_id
-        ]
-        
-        # Ordenar por data (mais recente primeiro)
-        user_invoices.sort(key=lambda x: x["created_at"], reverse=True)
+        """Obtém faturas de um usuário (mais recente primeiro)."""
         
-        return user_invoices[:limit]
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT id, user_id, subscription_id, amount, currency, description, status,
+                       created_at, due_date, paid_at
+                FROM monetization_invoices WHERE user_id = ?
+                ORDER BY created_at DESC LIMIT ?
+            """), (user_id, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
     
     def compare_plans(self) -> Dict[str, Any]:
         """Compara todos os planos disponíveis."""
@@ -625,52 +827,114 @@ class MonetizationSystem:
         
         return comparison
     
-    def _initialize_credits(self, user_id: str, plan_type: PlanType):
+    # ===== ARMAZENAMENTO =====
+    
+    def _subscription_from_row(self, row: Dict) -> Dict[str, Any]:
+        plan_details = self.plans[PlanType(row["plan"])]
+        subscription = dict(row)
+        subscription["plan_name"] = plan_details["name"]
+        subscription["features"] = plan_details["features"]
+        subscription["cancel_at_period_end"] = bool(subscription["cancel_at_period_end"])
+        if not subscription.get("cancelled_at"):
+            subscription.pop("cancelled_at", None)
+        return subscription
+    
+    def _get_subscription(self, subscription_id: str) -> Optional[Dict[str, Any]]:
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(SUBSCRIPTION_SELECT + " WHERE id = ?"), (subscription_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        return self._subscription_from_row(row) if row else None
+    
+    def _get_active_subscription(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Assinatura ativa mais recente, com cache read-through de curta duração."""
+        now = time.monotonic()
+        with self._plan_cache_lock:
+            cached = self._plan_cache.get(user_id)
+            if cached and cached[0] > now:
+                return cached[1]
+        
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(
+                SUBSCRIPTION_SELECT + " WHERE user_id = ? AND status = 'active' ORDER BY created_at DESC LIMIT 1"
+            ), (user_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        
+        subscription = self._subscription_from_row(row) if row else None
+        with self._plan_cache_lock:
+            if len(self._plan_cache) >= PLAN_CACHE_SIZE:
+                self._plan_cache.pop(next(iter(self._plan_cache)))
+            self._plan_cache[user_id] = (now + PLAN_CACHE_TTL, subscription)
+        return subscription
+    
+    def _invalidate_plan_cache(self, user_id: str):
+        with self._plan_cache_lock:
+            self._plan_cache.pop(user_id, None)
+    
+    def _get_balances(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        """Saldos do usuário por tipo de crédito ({} se nunca inicializado)."""
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(BALANCE_SELECT), (user_id,))
+            return {row["credit_type"]: dict(row) for row in cursor.fetchall()}
+        finally:
+            conn.close()
+    
+    def _ensure_credits(self, user_id: str):
+        """Inicializa créditos do plano free se o usuário ainda não tiver saldo."""
+        conn = get_db_connection_with_dict()
+        try:
+            self._initialize_credits(conn.cursor(), user_id, PlanType.FREE, overwrite=False)
+            conn.commit()
+        finally:
+            conn.close()
+    
+    def _initialize_credits(self, cursor, user_id: str, plan_type: PlanType, overwrite: bool = True):
         """Inicializa créditos para um usuário."""
         
         plan_credits = self.plans[plan_type]["credits_included"]
+        reset_date = (datetime.now() + timedelta(days=30)).isoformat()
         
-        self.credit_balances[user_id] = {
-            credit_type: {
-                "available": amount,
-                "used": 0,
-                "limit": amount
-            }
-            for credit_type, amount in plan_credits.items()
-        }
-        
-        self.credit_balances[user_id]["reset_date"] = (
-            datetime.now() + timedelta(days=30)
-        ).isoformat()
+        query = BALANCE_RESET if overwrite else BALANCE_INSERT_MISSING
+        cursor.executemany(sql_param(query), [
+            (user_id, credit_type.value, plan_credits.get(credit_type, 0), plan_credits.get(credit_type, 0), reset_date)
+            for credit_type in CreditType
+        ])
     
-    def _upgrade_credits(self, user_id: str, new_plan_type: PlanType):
-        """Atualiza créditos após upgrade."""
+    def _upgrade_credits(self, cursor, user_id: str, new_plan_type: PlanType):
+        """
+        Atualiza créditos após upgrade.
+        
+        O novo saldo é calculado no próprio UPDATE (available + diferença de
+        limite), então um consume_credits concorrente nunca é sobrescrito.
+        """
         
         new_credits = self.plans[new_plan_type]["credits_included"]
         
-        if user_id not in self.credit_balances:
-            self._initialize_credits(user_id, new_plan_type)
+        cursor.execute(sql_param(BALANCE_SELECT + " LIMIT 1"), (user_id,))
+        if cursor.fetchone() is None:
+            self._initialize_credits(cursor, user_id, new_plan_type)
             return
         
-        balance = self.credit_balances[user_id]
-        
-        for credit_type, new_limit in new_credits.items():
-            if credit_type not in balance:
-                balance[credit_type] = {"available": 0, "used": 0, "limit": 0}
-            
-            old_limit = balance[credit_type]["limit"]
-            
-            # Adicionar diferença de créditos
-            if new_limit == -1:
-                balance[credit_type]["limit"] = -1
-                balance[credit_type]["available"] = -1
-            elif old_limit != -1:
-                additional = max(0, new_limit - old_limit)
-                balance[credit_type]["available"] += additional
-                balance[credit_type]["limit"] = new_limit
+        cursor.executemany(sql_param(BALANCE_INSERT_MISSING), [
+            (user_id, credit_type.value, 0, 0, None) for credit_type in CreditType
+        ])
+        cursor.executemany(sql_param(UPGRADE_UPDATE), [
+            (new_limit, new_limit, new_limit, new_limit, new_limit, user_id, credit_type.value)
+            for credit_type, new_limit in new_credits.items()
+        ])
     
     def _create_invoice(
         self, 
+        cursor,
         user_id: str, 
         subscription_id: str, 
         amount: float,
@@ -693,7 +957,14 @@ class MonetizationSystem:
             "paid_at": None
         }
         
-        self.invoices[invoice_id] = invoice
+        cursor.execute(sql_param("""
+            INSERT INTO monetization_invoices
+                (id, user_id, subscription_id, amount, currency, description, status, created_at, due_date, paid_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """), tuple(invoice[key] for key in (
+            "id", "user_id", "subscription_id", "amount", "currency", "description",
+            "status", "created_at", "due_date", "paid_at"
+        )))
         
         return invoice
     
@@ -750,5 +1021,23 @@ class MonetizationSystem:
         return recommendations
 
 
-# Instância global
-monetization_system = MonetizationSystem()
+# Instância global (criada no primeiro uso: o construtor cria as tabelas no banco)
+_monetization_instance: Optional[MonetizationSystem] = None
+_monetization_lock = threading.Lock()
+
+
+def get_monetization_system() -> MonetizationSystem:
+    """
+    Retorna instância global do sistema de monetização (singleton)
+
+    Returns:
+        MonetizationSystem: Instância do sistema
+    """
+    global _monetization_instance
+
+    if _monetization_instance is None:
+        with _monetization_lock:
+            if _monetization_instance is None:
+                _monetization_instance = MonetizationSystem()
+
+    return _monetization_instance
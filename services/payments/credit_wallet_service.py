@@ -1,6 +1,18 @@
 """
 Credit Wallet Service - Serviço de Gerenciamento de Carteira
 Gerencia operações de créditos com persistência e logs
+
+Persistência em ledger no banco (db_utils):
+- wallet_entries: lançamentos append-only (valor com sinal e saldo após)
+- wallet_balances: saldo materializado por usuário e tipo de crédito
+
+Créditos e débitos são instruções condicionais atômicas
+(UPDATE ... SET balance = balance - ? WHERE balance >= ?) na mesma
+transação do lançamento, então vários workers não perdem atualizações.
+Consultas de saldo são uma leitura pela chave primária.
+
+A referência (transaction_id) é única por operação: repetir um crédito ou
+débito com a mesma referência não altera o saldo de novo.
 """
 
 import os
@@ -14,241 +26,496 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 from models.payments.credit_wallet import CreditWallet, CreditType
 
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres
+
 logger = logging.getLogger(__name__)
 
+CREDIT_CURRENCIES = {
+    credit_type: balance['currency']
+    for credit_type, balance in CreditWallet(None).balances.items()
+}
+
+BALANCE_UPSERT = """
+    INSERT INTO wallet_balances (user_id, credit_type, balance, currency, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, credit_type) DO UPDATE SET
+        balance = wallet_balances.balance + excluded.balance,
+        updated_at = excluded.updated_at
+"""
+
+ENTRY_INSERT = """
+    INSERT INTO wallet_entries
+        (user_id, credit_type, amount, balance_after, operation, reference, source, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Lançamento com referência já aplicada (reentrega do webhook, retentativa)
+# não grava nada: o chamador desfaz a transação
+ENTRY_INSERT_ONCE = ENTRY_INSERT + " ON CONFLICT (reference, operation) DO NOTHING"
+
+
+def _row_values(row, columns):
+    return [row[c] for c in columns] if isinstance(row, dict) else list(row)
+
 
 class CreditWalletService:
     """
     Serviço de gerenciamento de carteira de créditos
     Responsável por operações seguras e auditáveis
     """
-    
+
     def __init__(self, storage_dir='data/wallets'):
         """
         Inicializa serviço
-        
+
         Args:
-            storage_dir (str): Diretório de armazenamento
+            storage_dir (str): Diretório das carteiras JSON legadas
+                (importadas para o ledger na primeira inicialização)
         """
         self.storage_dir = Path(storage_dir)
-        self.storage_dir.mkdir(parents=True, exist_ok=True)
-        
-        self.log_dir = Path('logs/payments')
-        self.log_dir.mkdir(parents=True, exist_ok=True)
-    
+        self._init_tables()
+        self._migrate_json_wallets()
+
+    def _init_tables(self):
+        """Cria as tabelas do ledger"""
+        id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS wallet_balances (
+                    user_id TEXT NOT NULL,
+                    credit_type TEXT NOT NULL,
+                    balance REAL NOT NULL DEFAULT 0,
+                    currency TEXT NOT NULL,
+                    updated_at TEXT,
+                    PRIMARY KEY (user_id, credit_type)
+                )
+            """)
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS wallet_entries (
+                    {id_column},
+                    user_id TEXT NOT NULL,
+                    credit_type TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    balance_after REAL NOT NULL,
+                    operation TEXT NOT NULL,
+                    reference TEXT,
+                    source TEXT,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_wallet_entries_user ON wallet_entries (user_id, credit_type, id)"
+            )
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_wallet_entries_reference "
+                "ON wallet_entries (reference, operation)"
+            )
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Erro ao criar tabelas do ledger: {e}")
+
+    def _migrate_json_wallets(self):
+        """Importa carteiras data/wallets/<user_id>.json (uma única vez)"""
+        if not self.storage_dir.is_dir():
+            return
+        for wallet_file in self.storage_dir.glob('*.json'):
+            try:
+                with open(wallet_file, 'r') as f:
+                    data = json.load(f)
+                self._import_wallet(data.get('user_id') or wallet_file.stem, data.get('balances', {}))
+                wallet_file.rename(wallet_file.with_name(wallet_file.name + '.migrated'))
+            except Exception as e:
+                logger.error(f"Erro ao migrar carteira {wallet_file}: {e}")
+
+    def _import_wallet(self, user_id, balances):
+        now = datetime.now().isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            for credit_type, info in balances.items():
+                balance = float(info.get('balance', 0) or 0)
+                if credit_type not in CREDIT_CURRENCIES or balance == 0:
+                    continue
+                cursor.execute(sql_param("""
+                    INSERT INTO wallet_balances (user_id, credit_type, balance, currency, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, credit_type) DO NOTHING
+                """), (user_id, credit_type, balance, info.get('currency', CREDIT_CURRENCIES[credit_type]),
+                       info.get('updated_at', now)))
+                if cursor.rowcount:
+                    cursor.execute(sql_param(ENTRY_INSERT), (
+                        user_id, credit_type, balance, balance, 'opening_balance', None, 'json_migration', now
+                    ))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ===== LEITURA =====
+
+    def _fetch_balances(self, user_id, credit_type=None):
+        """Saldos materializados do usuário (leitura pela chave primária)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if credit_type is None:
+                cursor.execute(sql_param(
+                    "SELECT credit_type, balance, currency, updated_at FROM wallet_balances WHERE user_id = ?"
+                ), (user_id,))
+            else:
+                cursor.execute(sql_param(
+                    "SELECT credit_type, balance, currency, updated_at FROM wallet_balances "
+                    "WHERE user_id = ? AND credit_type = ?"
+                ), (user_id, credit_type))
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        columns = ('credit_type', 'balance', 'currency', 'updated_at')
+        return {
+            values[0]: {'balance': values[1], 'currency': values[2], 'updated_at': values[3]}
+            for values in (_row_values(row, columns) for row in rows)
+        }
+
     def get_wallet(self, user_id):
         """
         Obtém carteira do usuário
-        
+
         Args:
             user_id (str): ID do usuário
-            
+
         Returns:
-            CreditWallet: Carteira do usuário
-        """
-        wallet_file = self.storage_dir / f"{user_id}.json"
-        
-        if wallet_file.exists():
-            with open(wallet_file, 'r') as f:
-                data = json.load(f)
-                wallet = CreditWallet(user_id)
-                wallet.balances = data['balances']
-                return wallet
-        else:
-            # Criar nova carteira
-            wallet = CreditWallet(user_id)
-            self._save_wallet(wallet)
-            return wallet
-    
+            CreditWallet: Carteira do usuário (saldos do ledger)
+        """
+        wallet = CreditWallet(user_id)
+        wallet.balances.update(self._fetch_balances(user_id))
+        return wallet
+
     def get_balances(self, user_id):
         """
         Obtém todos os saldos do usuário
-        
+
         Args:
             user_id (str): ID do usuário
-            
+
         Returns:
             dict: Todos os saldos
         """
         wallet = self.get_wallet(user_id)
         return wallet.get_all_balances()
-    
+
     def get_balance(self, user_id, credit_type):
         """
         Obtém saldo de um tipo específico
-        
+
         Args:
             user_id (str): ID do usuário
             credit_type (str): Tipo de crédito
-            
+
         Returns:
             dict: Informações do saldo
         """
-        wallet = self.get_wallet(user_id)
-        return wallet.get_balance(credit_type)
-    
-    def add_credits(self, user_id, credit_type, amount, transaction_id=None, source='manual'):
+        credit_type = self._validate(credit_type)
+        stored = self._fetch_balances(user_id, credit_type).get(credit_type)
+        if stored is not None:
+            return stored
+        return {
+            'balance': 0.0,
+            'currency': CREDIT_CURRENCIES[credit_type],
+            'updated_at': datetime.now().isoformat()
+        }
+
+    def get_entries(self, user_id, credit_type=None, limit=100):
+        """
+        Lançamentos mais recentes do ledger
+
+        Args:
+            user_id (str): ID do usuário
+            credit_type (str): Filtra por tipo de crédito (opcional)
+            limit (int): Quantidade máxima
+
+        Returns:
+            list: Lançamentos (mais recentes primeiro)
+        """
+        query = "SELECT * FROM wallet_entries WHERE user_id = ?"
+        params = [user_id]
+        if credit_type is not None:
+            query += " AND credit_type = ?"
+            params.append(credit_type)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return [dict(row) if isinstance(row, dict) else dict(zip(columns, row)) for row in rows]
+
+    # ===== ESCRITA =====
+
+    @staticmethod
+    def _validate(credit_type, amount=None):
+        """Valida e normaliza o tipo de crédito (aceita CreditType ou str)"""
+        if isinstance(credit_type, CreditType):
+            credit_type = credit_type.value
+        if credit_type not in CREDIT_CURRENCIES:
+            raise ValueError(f"Tipo de crédito inválido: {credit_type}")
+        if amount is not None and amount <= 0:
+            raise ValueError("Valor deve ser positivo")
+        return credit_type
+
+    @staticmethod
+    def _current_balance(cursor, user_id, credit_type):
+        cursor.execute(sql_param(
+            "SELECT balance FROM wallet_balances WHERE user_id = ? AND credit_type = ?"
+        ), (user_id, credit_type))
+        row = cursor.fetchone()
+        if row is None:
+            return 0.0
+        return row['balance'] if isinstance(row, dict) else row[0]
+
+    @staticmethod
+    def _insert_entry_once(cursor, values):
+        """Grava o lançamento; False se a referência já foi aplicada nesta operação"""
+        cursor.execute(sql_param(ENTRY_INSERT_ONCE), values)
+        return cursor.rowcount > 0
+
+    def _already_applied(self, user_id, credit_type, amount_key, amount):
+        logger.info(f"Lançamento já aplicado: {user_id} - {credit_type} - {amount}")
+        return {
+            'success': True,
+            'already_applied': True,
+            'credit_type': credit_type,
+            amount_key: amount,
+            'new_balance': self.get_balance(user_id, credit_type)['balance'],
+            'currency': CREDIT_CURRENCIES[credit_type]
+        }
+
+    def add_credits(self, user_id, credit_type, amount, transaction_id=None, source='manual', description=None):
         """
         Adiciona créditos com log de auditoria
-        
+
         Args:
             user_id (str): ID do usuário
-            credit_type (str): Tipo de crédito
+            credit_type (str | CreditType): Tipo de crédito
             amount (float): Valor a adicionar
             transaction_id (str): ID da transação (Stripe)
             source (str): Origem da adição
-            
+            description (str): Descrição (substitui a origem no lançamento)
+
         Returns:
             dict: Resultado da operação
         """
         try:
-            wallet = self.get_wallet(user_id)
-            
-            # Adicionar créditos
-            new_balance = wallet.add_credits(credit_type, amount)
-            
-            # Salvar carteira
-            self._save_wallet(wallet)
-            
-            # Registrar log
-            self._log_transaction({
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'operation': 'add_credits',
-                'credit_type': credit_type,
-                'amount': amount,
-                'new_balance': new_balance['balance'],
-                'transaction_id': transaction_id,
-                'source': source,
-                'status': 'success'
-            })
-            
+            credit_type = self._validate(credit_type, amount)
+            source = description or source
+            now = datetime.now().isoformat()
+
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql_param(BALANCE_UPSERT), (
+                    user_id, credit_type, amount, CREDIT_CURRENCIES[credit_type], now
+                ))
+                # A linha fica travada pela escrita acima até o commit
+                new_balance = self._current_balance(cursor, user_id, credit_type)
+                applied = self._insert_entry_once(cursor, (
+                    user_id, credit_type, amount, new_balance, 'add_credits', transaction_id, source, now
+                ))
+                if applied:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            finally:
+                conn.close()
+
+            if not applied:
+                return self._already_applied(user_id, credit_type, 'amount_added', amount)
+
             logger.info(f"Créditos adicionados: {user_id} - {credit_type} - {amount}")
-            
+
             return {
                 'success': True,
                 'credit_type': credit_type,
                 'amount_added': amount,
-                'new_balance': new_balance['balance'],
-                'currency': new_balance['currency']
+                'new_balance': new_balance,
+                'currency': CREDIT_CURRENCIES[credit_type]
             }
-            
+
         except Exception as e:
             logger.error(f"Erro ao adicionar créditos: {e}")
-            
-            # Registrar erro
-            self._log_transaction({
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'operation': 'add_credits',
-                'credit_type': credit_type,
-                'amount': amount,
-                'transaction_id': transaction_id,
-                'source': source,
-                'status': 'error',
+
+            return {
+                'success': False,
                 'error': str(e)
-            })
-            
+            }
+
+    def bulk_add_credits(self, credits, source='bulk'):
+        """
+        Adiciona créditos em lote (recargas em massa) em uma transação
+
+        Args:
+            credits (list): Itens {'user_id', 'credit_type', 'amount',
+                'transaction_id' (opcional), 'source' (opcional)}
+            source (str): Origem padrão dos itens
+
+        Returns:
+            dict: Resultado da operação (nada é gravado se algum item for inválido)
+        """
+        try:
+            credits = [
+                dict(item, credit_type=self._validate(item['credit_type'], item['amount']))
+                for item in credits
+            ]
+            if not credits:
+                return {'success': True, 'entries': 0, 'balances': {}}
+            now = datetime.now().isoformat()
+
+            # Um upsert por (usuário, tipo) com o total do lote
+            totals = {}
+            for item in credits:
+                key = (item['user_id'], item['credit_type'])
+                totals[key] = totals.get(key, 0.0) + item['amount']
+
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany(sql_param(BALANCE_UPSERT), [
+                    (user_id, credit_type, total, CREDIT_CURRENCIES[credit_type], now)
+                    for (user_id, credit_type), total in totals.items()
+                ])
+                final = {key: self._current_balance(cursor, *key) for key in totals}
+
+                # Saldo após cada item: reconstruído a partir do saldo final
+                running = {key: final[key] - totals[key] for key in totals}
+                rows = []
+                for item in credits:
+                    key = (item['user_id'], item['credit_type'])
+                    running[key] += item['amount']
+                    rows.append((
+                        item['user_id'], item['credit_type'], item['amount'], running[key],
+                        'add_credits', item.get('transaction_id'), item.get('source', source), now
+                    ))
+                cursor.executemany(sql_param(ENTRY_INSERT), rows)
+                conn.commit()
+            finally:
+                conn.close()
+
+            logger.info(f"Créditos adicionados em lote: {len(credits)} lançamentos")
+
+            balances = {}
+            for (user_id, credit_type), balance in final.items():
+                balances.setdefault(user_id, {})[credit_type] = balance
+            return {
+                'success': True,
+                'entries': len(rows),
+                'balances': balances
+            }
+
+        except Exception as e:
+            logger.error(f"Erro ao adicionar créditos em lote: {e}")
+
             return {
                 'success': False,
                 'error': str(e)
             }
-    
-    def deduct_credits(self, user_id, credit_type, amount, reason='usage'):
+
+    def deduct_credits(self, user_id, credit_type, amount, reason='usage', transaction_id=None, description=None):
         """
         Deduz créditos com log de auditoria
-        
+
         Args:
             user_id (str): ID do usuário
-            credit_type (str): Tipo de crédito
+            credit_type (str | CreditType): Tipo de crédito
             amount (float): Valor a deduzir
             reason (str): Motivo da dedução
-            
+            transaction_id (str): ID da transação (reembolso, funding)
+            description (str): Descrição (substitui o motivo no lançamento)
+
         Returns:
             dict: Resultado da operação
         """
         try:
-            wallet = self.get_wallet(user_id)
-            
-            # Deduzir créditos
-            new_balance = wallet.deduct_credits(credit_type, amount)
-            
-            # Salvar carteira
-            self._save_wallet(wallet)
-            
-            # Registrar log
-            self._log_transaction({
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'operation': 'deduct_credits',
-                'credit_type': credit_type,
-                'amount': amount,
-                'new_balance': new_balance['balance'],
-                'reason': reason,
-                'status': 'success'
-            })
-            
+            credit_type = self._validate(credit_type, amount)
+            reason = description or reason
+            now = datetime.now().isoformat()
+
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                # Débito condicional: nunca deixa o saldo negativo, mesmo com
+                # débitos concorrentes em outros workers
+                cursor.execute(sql_param("""
+                    UPDATE wallet_balances
+                    SET balance = balance - ?, updated_at = ?
+                    WHERE user_id = ? AND credit_type = ? AND balance >= ?
+                """), (amount, now, user_id, credit_type, amount))
+                if cursor.rowcount == 0:
+                    current_balance = self._current_balance(cursor, user_id, credit_type)
+                    conn.rollback()
+                    raise ValueError(
+                        f"Saldo insuficiente. Disponível: {current_balance}, "
+                        f"Necessário: {amount}"
+                    )
+                new_balance = self._current_balance(cursor, user_id, credit_type)
+                applied = self._insert_entry_once(cursor, (
+                    user_id, credit_type, -amount, new_balance, 'deduct_credits', transaction_id, reason, now
+                ))
+                if applied:
+                    conn.commit()
+                else:
+                    conn.rollback()
+            finally:
+                conn.close()
+
+            if not applied:
+                return self._already_applied(user_id, credit_type, 'amount_deducted', amount)
+
             logger.info(f"Créditos deduzidos: {user_id} - {credit_type} - {amount}")
-            
+
             return {
                 'success': True,
                 'credit_type': credit_type,
                 'amount_deducted': amount,
-                'new_balance': new_balance['balance'],
-                'currency': new_balance['currency']
+                'new_balance': new_balance,
+                'currency': CREDIT_CURRENCIES[credit_type]
             }
-            
+
         except Exception as e:
             logger.error(f"Erro ao deduzir créditos: {e}")
-            
-            # Registrar erro
-            self._log_transaction({
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'operation': 'deduct_credits',
-                'credit_type': credit_type,
-                'amount': amount,
-                'reason': reason,
-                'status': 'error',
-                'error': str(e)
-            })
-            
+
             return {
                 'success': False,
                 'error': str(e)
             }
-    
+
     def check_sufficient_balance(self, user_id, credit_type, amount):
         """
         Verifica se há saldo suficiente
-        
+
         Args:
             user_id (str): ID do usuário
             credit_type (str): Tipo de crédito
             amount (float): Valor necessário
-            
+
         Returns:
             dict: Resultado da verificação
         """
-        wallet = self.get_wallet(user_id)
-        has_balance = wallet.has_sufficient_balance(credit_type, amount)
-        current_balance = wallet.get_balance(credit_type)['balance']
-        
+        current_balance = self.get_balance(user_id, credit_type)['balance']
+        has_balance = current_balance >= amount
+
         return {
             'sufficient': has_balance,
             'current_balance': current_balance,
             'required_amount': amount,
             'deficit': max(0, amount - current_balance)
         }
-    
-    def _save_wallet(self, wallet):
-        """Salva carteira no disco"""
-        wallet_file = self.storage_dir / f"{wallet.user_id}.json"
-        with open(wallet_file, 'w') as f:
-            json.dump(wallet.to_dict(), f, indent=2)
-    
-    def _log_transaction(self, transaction_data):
-        """Registra transação em log"""
-        log_file = self.log_dir / 'wallet_transactions.jsonl'
-        with open(log_file, 'a') as f:
-            f.write(json.dumps(transaction_data) + '\n')
@@ -4,10 +4,23 @@ Serviço intermediário para adicionar saldo em contas Facebook Ads
 """
 import os
 import json
+import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional
 from services.payments.credit_wallet_service import CreditWalletService
+from services.payments.payment_event_store import PaymentEventStore
 from models.payments.credit_wallet import CreditType
+from services.sliding_window_limiter import LimitRule, get_limiter, DAY, HOUR
+from services.budget_guardian import BudgetGuardian
+
+
+MAX_DAILY_FUNDING = 50000.0  # Máximo R$ 50.000 em funding nas últimas 24h
+MAX_FUNDINGS_PER_HOUR = 10
+
+FUNDING_LIMIT_RULES = {
+    "daily_amount": LimitRule(window_seconds=DAY, bucket_seconds=HOUR, max_amount=MAX_DAILY_FUNDING),
+    "hourly_count": LimitRule(window_seconds=HOUR, bucket_seconds=60, max_count=MAX_FUNDINGS_PER_HOUR)
+}
 
 
 class FacebookAdsFundingService:
@@ -17,6 +30,9 @@ class FacebookAdsFundingService:
         self.wallet_service = CreditWalletService()
         self.funding_log_file = "data/payments/facebook_ads_funding.jsonl"
         self._ensure_log_file()
+        self.event_store = PaymentEventStore()
+        self.event_store.migrate_jsonl("facebook_funding", self.funding_log_file)
+        self.limiter = get_limiter("facebook_funding", FUNDING_LIMIT_RULES)
     
     def _ensure_log_file(self):
         """Garante que o arquivo de log existe"""
@@ -38,6 +54,7 @@ class FacebookAdsFundingService:
         
         with open(self.funding_log_file, 'a') as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+        self.event_store.append("facebook_funding", log_entry)
     
     def validate_facebook_account(self, user_id: str, ad_account_id: str) -> Dict[str, Any]:
         """
@@ -109,6 +126,14 @@ class FacebookAdsFundingService:
                 "error": f"Saldo máximo permitido: R$ {MAX_BALANCE:.2f}. Saldo atual: R$ {current_balance:.2f}"
             }
         
+        # Janelas deslizantes (valor em 24h, operações por hora)
+        window_check = self.limiter.check(user_id, amount)
+        if not window_check["allowed"]:
+            return {
+                "success": False,
+                "error": self._window_error(window_check)
+            }
+        
         return {
             "success": True,
             "current_balance": current_balance,
@@ -116,6 +141,14 @@ class FacebookAdsFundingService:
             "new_balance": current_balance + amount
         }
     
+    @staticmethod
+    def _window_error(window_check: Dict[str, Any]) -> str:
+        """Mensagem da regra de janela violada"""
+        if window_check["rule"] == "daily_amount":
+            used = window_check["usage"]["daily_amount"]["amount"]
+            return f"Limite diário de funding: R$ {MAX_DAILY_FUNDING:.2f}. Já utilizado nas últimas 24h: R$ {used:.2f}"
+        return f"Máximo de {MAX_FUNDINGS_PER_HOUR} operações de funding por hora"
+    
     def fund_account(self, user_id: str, ad_account_id: str, 
                     amount: float, transaction_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -130,6 +163,7 @@ class FacebookAdsFundingService:
         Returns:
             Dict com resultado da operação
         """
+        reserved = False
         try:
             # 1. Validar conta Facebook
             account_validation = self.validate_facebook_account(user_id, ad_account_id)
@@ -173,16 +207,37 @@ class FacebookAdsFundingService:
                     "error": error_msg
                 }
             
-            # 4. Deduzir da carteira
+            # 4. Reservar o valor nas janelas (verifica e registra de forma
+            # atômica: workers concorrentes não passam juntos do limite)
+            reservation = self.limiter.acquire(user_id, amount)
+            if not reservation["allowed"]:
+                error_msg = self._window_error(reservation)
+                self._log_funding_operation(
+                    user_id=user_id,
+                    operation="fund_account",
+                    amount=amount,
+                    status="failed",
+                    details={"error": error_msg, "step": "limits_reservation"}
+                )
+                return {
+                    "success": False,
+                    "error": error_msg
+                }
+            reserved = True
+            
+            # 5. Deduzir da carteira
+            funding_reference = transaction_id or f"fb_funding_{uuid.uuid4().hex}"
             deduct_result = self.wallet_service.deduct_credits(
                 user_id=user_id,
                 credit_type=CreditType.FACEBOOK_ADS,
                 amount=amount,
-                transaction_id=transaction_id or f"fb_funding_{datetime.now().timestamp()}",
+                transaction_id=funding_reference,
                 description=f"Funding Facebook Ads - Conta {ad_account_id}"
             )
             
             if not deduct_result["success"]:
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
+                reserved = False
                 self._log_funding_operation(
                     user_id=user_id,
                     operation="fund_account",
@@ -192,11 +247,14 @@ class FacebookAdsFundingService:
                 )
                 return deduct_result
             
-            # 5. TODO: Adicionar saldo na conta Facebook via API
+            # 6. TODO: Adicionar saldo na conta Facebook via API
             # Por enquanto, simular sucesso
             facebook_funding_success = True
             
             if facebook_funding_success:
+                # Gasto em mídia alimenta as janelas do BudgetGuardian da conta
+                BudgetGuardian(account_id=user_id).record_spending(amount)
+                
                 self._log_funding_operation(
                     user_id=user_id,
                     operation="fund_account",
@@ -218,12 +276,14 @@ class FacebookAdsFundingService:
                     "transaction_id": transaction_id
                 }
             else:
-                # Se falhar no Facebook, devolver créditos
+                # Se falhar no Facebook, devolver créditos e a reserva do limite
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
+                reserved = False
                 self.wallet_service.add_credits(
                     user_id=user_id,
                     credit_type=CreditType.FACEBOOK_ADS,
                     amount=amount,
-                    transaction_id=f"refund_{transaction_id}",
+                    transaction_id=f"refund_{funding_reference}",
                     description="Reembolso - Falha no funding Facebook"
                 )
                 
@@ -242,6 +302,8 @@ class FacebookAdsFundingService:
                 }
                 
         except Exception as e:
+            if reserved:
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
             error_msg = str(e)
             self._log_funding_operation(
                 user_id=user_id,
@@ -266,16 +328,4 @@ class FacebookAdsFundingService:
         Returns:
             Lista de operações de funding
         """
-        if not os.path.exists(self.funding_log_file):
-            return []
-        
-        history = []
-        with open(self.funding_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    if entry["user_id"] == user_id:
-                        history.append(entry)
-        
-        # Retornar os mais recentes
-        return history[-limit:]
+        return self.event_store.recent("facebook_funding", limit, user_id=user_id)
@@ -4,10 +4,23 @@ Serviço intermediário para adicionar saldo em contas Google Ads
 """
 import os
 import json
+import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional
 from services.payments.credit_wallet_service import CreditWalletService
+from services.payments.payment_event_store import PaymentEventStore
 from models.payments.credit_wallet import CreditType
+from services.sliding_window_limiter import LimitRule, get_limiter, DAY, HOUR
+from services.budget_guardian import BudgetGuardian
+
+
+MAX_DAILY_FUNDING = 50000.0  # Máximo R$ 50.000 em funding nas últimas 24h
+MAX_FUNDINGS_PER_HOUR = 10
+
+FUNDING_LIMIT_RULES = {
+    "daily_amount": LimitRule(window_seconds=DAY, bucket_seconds=HOUR, max_amount=MAX_DAILY_FUNDING),
+    "hourly_count": LimitRule(window_seconds=HOUR, bucket_seconds=60, max_count=MAX_FUNDINGS_PER_HOUR)
+}
 
 
 class GoogleAdsFundingService:
@@ -17,6 +30,9 @@ class GoogleAdsFundingService:
         self.wallet_service = CreditWalletService()
         self.funding_log_file = "data/payments/google_ads_funding.jsonl"
         self._ensure_log_file()
+        self.event_store = PaymentEventStore()
+        self.event_store.migrate_jsonl("google_funding", self.funding_log_file)
+        self.limiter = get_limiter("google_funding", FUNDING_LIMIT_RULES)
     
     def _ensure_log_file(self):
         """Garante que o arquivo de log existe"""
@@ -38,6 +54,7 @@ class GoogleAdsFundingService:
         
         with open(self.funding_log_file, 'a') as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+        self.event_store.append("google_funding", log_entry)
     
     def validate_google_account(self, user_id: str, customer_id: str) -> Dict[str, Any]:
         """
@@ -116,6 +133,14 @@ class GoogleAdsFundingService:
                 "error": f"Saldo máximo permitido: R$ {MAX_BALANCE:.2f}. Saldo atual: R$ {current_balance:.2f}"
             }
         
+        # Janelas deslizantes (valor em 24h, operações por hora)
+        window_check = self.limiter.check(user_id, amount)
+        if not window_check["allowed"]:
+            return {
+                "success": False,
+                "error": self._window_error(window_check)
+            }
+        
         return {
             "success": True,
             "current_balance": current_balance,
@@ -123,6 +148,14 @@ class GoogleAdsFundingService:
             "new_balance": current_balance + amount
         }
     
+    @staticmethod
+    def _window_error(window_check: Dict[str, Any]) -> str:
+        """Mensagem da regra de janela violada"""
+        if window_check["rule"] == "daily_amount":
+            used = window_check["usage"]["daily_amount"]["amount"]
+            return f"Limite diário de funding: R$ {MAX_DAILY_FUNDING:.2f}. Já utilizado nas últimas 24h: R$ {used:.2f}"
+        return f"Máximo de {MAX_FUNDINGS_PER_HOUR} operações de funding por hora"
+    
     def fund_account(self, user_id: str, customer_id: str, 
                     amount: float, transaction_id: Optional[str] = None) -> Dict[str, Any]:
         """
@@ -137,6 +170,7 @@ class GoogleAdsFundingService:
         Returns:
             Dict com resultado da operação
         """
+        reserved = False
         try:
             # 1. Validar conta Google
             account_validation = self.validate_google_account(user_id, customer_id)
@@ -180,16 +214,37 @@ class GoogleAdsFundingService:
                     "error": error_msg
                 }
             
-            # 4. Deduzir da carteira
+            # 4. Reservar o valor nas janelas (verifica e registra de forma
+            # atômica: workers concorrentes não passam juntos do limite)
+            reservation = self.limiter.acquire(user_id, amount)
+            if not reservation["allowed"]:
+                error_msg = self._window_error(reservation)
+                self._log_funding_operation(
+                    user_id=user_id,
+                    operation="fund_account",
+                    amount=amount,
+                    status="failed",
+                    details={"error": error_msg, "step": "limits_reservation"}
+                )
+                return {
+                    "success": False,
+                    "error": error_msg
+                }
+            reserved = True
+            
+            # 5. Deduzir da carteira
+            funding_reference = transaction_id or f"google_funding_{uuid.uuid4().hex}"
             deduct_result = self.wallet_service.deduct_credits(
                 user_id=user_id,
                 credit_type=CreditType.GOOGLE_ADS,
                 amount=amount,
-                transaction_id=transaction_id or f"google_funding_{datetime.now().timestamp()}",
+                transaction_id=funding_reference,
                 description=f"Funding Google Ads - Conta {customer_id}"
             )
             
             if not deduct_result["success"]:
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
+                reserved = False
                 self._log_funding_operation(
                     user_id=user_id,
                     operation="fund_account",
@@ -199,11 +254,14 @@ class GoogleAdsFundingService:
                 )
                 return deduct_result
             
-            # 5. TODO: Adicionar saldo na conta Google via API
+            # 6. TODO: Adicionar saldo na conta Google via API
             # Por enquanto, simular sucesso
             google_funding_success = True
             
             if google_funding_success:
+                # Gasto em mídia alimenta as janelas do BudgetGuardian da conta
+                BudgetGuardian(account_id=user_id).record_spending(amount)
+                
                 self._log_funding_operation(
                     user_id=user_id,
                     operation="fund_account",
@@ -225,12 +283,14 @@ class GoogleAdsFundingService:
                     "transaction_id": transaction_id
                 }
             else:
-                # Se falhar no Google, devolver créditos
+                # Se falhar no Google, devolver créditos e a reserva do limite
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
+                reserved = False
                 self.wallet_service.add_credits(
                     user_id=user_id,
                     credit_type=CreditType.GOOGLE_ADS,
                     amount=amount,
-                    transaction_id=f"refund_{transaction_id}",
+                    transaction_id=f"refund_{funding_reference}",
                     description="Reembolso - Falha no funding Google"
                 )
                 
@@ -249,6 +309,8 @@ class GoogleAdsFundingService:
                 }
                 
         except Exception as e:
+            if reserved:
+                self.limiter.release(user_id, amount, reservation["acquired_at"])
             error_msg = str(e)
             self._log_funding_operation(
                 user_id=user_id,
@@ -273,16 +335,4 @@ class GoogleAdsFundingService:
         Returns:
             Lista de operações de funding
         """
-        if not os.path.exists(self.funding_log_file):
-            return []
-        
-        history = []
-        with open(self.funding_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    if entry["user_id"] == user_id:
-                        history.append(entry)
-        
-        # Retornar os mais recentes
-        return history[-limit:]
+        return self.event_store.recent("google_funding", limit, user_id=user_id)
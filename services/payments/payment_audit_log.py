@@ -1,120 +1,283 @@
 """
 Payment Audit Log - NEXORA PRIME v12.4+
 Sistema unificado de logs e auditoria para rastreamento completo de pagamentos
+
+Consolidação incremental:
+- Offset em bytes por arquivo de origem: cada execução lê só as linhas novas
+- As origens já estão em ordem de tempo, então as linhas novas são
+  intercaladas com k-way merge (heapq.merge), sem ordenar tudo de novo
+- Saída segmentada por dia (data/payments/audit/AAAA-MM-DD.jsonl) com um
+  índice pequeno (entradas, bytes, primeiro/último timestamp por segmento)
+- Contadores do resumo atualizados a cada consolidação, então
+  generate_audit_summary não relê o histórico
+- O índice é a fonte da verdade: bytes gravados num segmento depois do
+  último índice salvo (queda entre o append e o _save_state) são cortados
+  antes da próxima consolidação, que relê essas linhas pelos offsets
 """
 import os
 import json
+import heapq
+import threading
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads
+    fcntl = None
+
+
+TAIL_BLOCK_SIZE = 64 * 1024
+UNDATED_SEGMENT = "undated"
+
+
+def _empty_summary(sources) -> Dict[str, Any]:
+    return {
+        "total_entries": 0,
+        "entries_by_source": {source: 0 for source in sources},
+        "error_count": 0,
+        "security_block_count": 0,
+        "successful_payments": 0,
+        "failed_payments": 0,
+        "refunds": 0
+    }
+
 
 class PaymentAuditLog:
     """Serviço de auditoria de pagamentos"""
-    
-    def __init__(self):
+
+    def __init__(self, base_dir: str = "data/payments"):
         self.log_files = {
-            "credit_wallet": "data/payments/credit_wallet_audit.jsonl",
-            "stripe_service": "data/payments/stripe_payment_service.jsonl",
-            "webhooks": "data/payments/webhook_events.jsonl",
-            "facebook_funding": "data/payments/facebook_ads_funding.jsonl",
-            "google_funding": "data/payments/google_ads_funding.jsonl",
-            "security_blocks": "data/payments/security_blocks.jsonl"
+            "credit_wallet": os.path.join(base_dir, "credit_wallet_audit.jsonl"),
+            "stripe_service": os.path.join(base_dir, "stripe_payment_service.jsonl"),
+            "webhooks": os.path.join(base_dir, "webhook_events.jsonl"),
+            "facebook_funding": os.path.join(base_dir, "facebook_ads_funding.jsonl"),
+            "google_funding": os.path.join(base_dir, "google_ads_funding.jsonl"),
+            "security_blocks": os.path.join(base_dir, "security_blocks.jsonl")
         }
-        self.consolidated_log_file = "data/payments/consolidated_audit_log.jsonl"
-    
-    def _read_log_file(self, file_path: str, source: str) -> List[Dict[str, Any]]:
-        """Lê um arquivo de log JSONL e adiciona a fonte"""
+        self.consolidated_dir = os.path.join(base_dir, "audit")
+        self.state_file = os.path.join(self.consolidated_dir, "index.json")
+        self._lock = threading.Lock()
+
+    # ===== ESTADO (offsets, índice de segmentos, contadores) =====
+
+    def _load_state(self) -> Dict[str, Any]:
+        state = {"offsets": {}, "segments": {}, "summary": _empty_summary(self.log_files)}
+        if os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    state.update(json.load(f))
+            except (OSError, json.JSONDecodeError):
+                pass
+        for source in self.log_files:
+            state["summary"]["entries_by_source"].setdefault(source, 0)
+        return state
+
+    def _save_state(self, state: Dict[str, Any]):
+        tmp_file = f"{self.state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_file, self.state_file)
+
+    def _truncate_to_index(self, state: Dict[str, Any]):
+        """Corta dos segmentos o que foi escrito depois do último índice salvo"""
+        for name in os.listdir(self.consolidated_dir):
+            if not name.endswith(".jsonl"):
+                continue
+            path = os.path.join(self.consolidated_dir, name)
+            recorded = state["segments"].get(name[:-len(".jsonl")], {}).get("bytes", 0)
+            if os.path.getsize(path) > recorded:
+                with open(path, 'r+b') as f:
+                    f.truncate(recorded)
+
+    def _exclusive(self):
+        """Lock entre threads e, quando disponível, entre processos"""
+        audit = self
+
+        class _Guard:
+            def __enter__(self):
+                audit._lock.acquire()
+                os.makedirs(audit.consolidated_dir, exist_ok=True)
+                self.handle = open(os.path.join(audit.consolidated_dir, ".lock"), 'a')
+                if fcntl is not None:
+                    fcntl.flock(self.handle, fcntl.LOCK_EX)
+                return self
+
+            def __exit__(self, *exc):
+                if fcntl is not None:
+                    fcntl.flock(self.handle, fcntl.LOCK_UN)
+                self.handle.close()
+                audit._lock.release()
+
+        return _Guard()
+
+    # ===== LEITURA INCREMENTAL DAS ORIGENS =====
+
+    def _read_new_entries(self, file_path: str, source: str, offset: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Lê as linhas completas a partir de `offset`.
+
+        Returns:
+            (entradas com 'source', novo offset) - uma linha ainda sem '\\n'
+            fica para a próxima execução
+        """
         if not os.path.exists(file_path):
-            return []
-        
+            return [], 0
+        if os.path.getsize(file_path) < offset:
+            # Arquivo truncado/rotacionado: recomeça do início
+            offset = 0
+
         entries = []
-        with open(file_path, 'r') as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        entry = json.loads(line)
-                        entry['source'] = source
-                        entries.append(entry)
-                    except json.JSONDecodeError:
-                        # Ignorar linhas malformadas
-                        pass
-        return entries
-    
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    break
+                offset += len(raw)
+                if not raw.strip():
+                    continue
+                try:
+                    entry = json.loads(raw)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # Ignorar linhas malformadas
+                    continue
+                if isinstance(entry, dict):
+                    entry['source'] = source
+                    entries.append(entry)
+        return entries, offset
+
+    @staticmethod
+    def _count(summary: Dict[str, Any], entry: Dict[str, Any]):
+        """Atualiza os contadores do resumo com uma entrada"""
+        source = entry.get('source')
+        summary["total_entries"] += 1
+        if source in summary["entries_by_source"]:
+            summary["entries_by_source"][source] += 1
+
+        # Contar erros e bloqueios
+        text = str(entry).lower()
+        if 'error' in text or 'failed' in text:
+            summary["error_count"] += 1
+
+        if source == 'security_blocks':
+            summary["security_block_count"] += 1
+
+        # Contar pagamentos
+        if entry.get('event_type') == 'payment_intent.succeeded':
+            summary["successful_payments"] += 1
+        elif entry.get('event_type') == 'payment_intent.payment_failed':
+            summary["failed_payments"] += 1
+        elif entry.get('event_type') == 'charge.refunded':
+            summary["refunds"] += 1
+
+    # ===== CONSOLIDAÇÃO =====
+
     def consolidate_logs(self) -> Dict[str, Any]:
-        """Consolida todos os logs de pagamento em um único arquivo"""
-        all_entries = []
-        
-        for source, file_path in self.log_files.items():
-            all_entries.extend(self._read_log_file(file_path, source))
-        
-        # Ordenar por timestamp
-        all_entries.sort(key=lambda x: x.get('timestamp', ''))
-        
-        # Salvar log consolidado
-        with open(self.consolidated_log_file, 'w') as f:
-            for entry in all_entries:
-                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
-        
+        """Consolida as entradas novas de todas as origens nos segmentos diários"""
+        with self._exclusive():
+            state = self._load_state()
+            self._truncate_to_index(state)
+
+            batches = []
+            for source, file_path in self.log_files.items():
+                entries, offset = self._read_new_entries(file_path, source, state["offsets"].get(source, 0))
+                state["offsets"][source] = offset
+                if entries:
+                    batches.append(entries)
+
+            # k-way merge: cada origem já está em ordem de timestamp
+            merged = heapq.merge(*batches, key=lambda x: x.get('timestamp', ''))
+            new_entries = 0
+            handles = {}
+            try:
+                for entry in merged:
+                    timestamp = entry.get('timestamp', '')
+                    day = timestamp[:10] if len(timestamp) >= 10 else UNDATED_SEGMENT
+                    handle = handles.get(day)
+                    if handle is None:
+                        handle = handles[day] = open(self._segment_path(day), 'a')
+                    line = json.dumps(entry, ensure_ascii=False) + '\n'
+                    handle.write(line)
+
+                    segment = state["segments"].setdefault(day, {"entries": 0, "bytes": 0, "first": timestamp, "last": timestamp})
+                    segment["entries"] += 1
+                    segment["bytes"] += len(line.encode('utf-8'))
+                    segment["first"] = min(segment["first"], timestamp)
+                    segment["last"] = max(segment["last"], timestamp)
+
+                    self._count(state["summary"], entry)
+                    new_entries += 1
+            finally:
+                for handle in handles.values():
+                    handle.close()
+
+            self._save_state(state)
+
         return {
             "success": True,
             "message": "Logs consolidados com sucesso",
-            "total_entries": len(all_entries),
-            "consolidated_log_file": self.consolidated_log_file
+            "total_entries": state["summary"]["total_entries"],
+            "new_entries": new_entries,
+            "segments": len(state["segments"]),
+            "consolidated_log_file": self.consolidated_dir
         }
-    
+
+    def _segment_path(self, day: str) -> str:
+        return os.path.join(self.consolidated_dir, f"{day}.jsonl")
+
+    # ===== CONSULTAS =====
+
+    @staticmethod
+    def _tail_lines(file_path: str, count: int) -> List[bytes]:
+        """Últimas `count` linhas de um arquivo, lendo blocos do fim"""
+        with open(file_path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b''
+            while position > 0 and buffer.count(b'\n') <= count:
+                step = min(TAIL_BLOCK_SIZE, position)
+                position -= step
+                f.seek(position)
+                buffer = f.read(step) + buffer
+        lines = [line for line in buffer.split(b'\n') if line.strip()]
+        return lines[-count:]
+
     def get_consolidated_logs(self, limit: int = 100) -> List[Dict[str, Any]]:
         """Retorna os logs consolidados mais recentes"""
-        if not os.path.exists(self.consolidated_log_file):
-            self.consolidate_logs()
-            
-        if not os.path.exists(self.consolidated_log_file):
-            return []
-            
-        with open(self.consolidated_log_file, 'r') as f:
-            lines = f.readlines()
-        
-        entries = [json.loads(line) for line in lines if line.strip()]
-        
+        self.consolidate_logs()
+        state = self._load_state()
+
+        # Segmentos do mais novo para o mais antigo, até completar o limite
+        # (sem data = mais antigo, como na ordenação do merge)
+        entries: List[Dict[str, Any]] = []
+        for day in sorted(state["segments"], key=lambda d: (d != UNDATED_SEGMENT, d), reverse=True):
+            if len(entries) >= limit:
+                break
+            path = self._segment_path(day)
+            if not os.path.exists(path):
+                continue
+            lines = self._tail_lines(path, limit - len(entries))
+            entries = [json.loads(line) for line in lines] + entries
+
         return entries[-limit:]
-    
+
+    def get_logs_for_day(self, day: str) -> Iterator[Dict[str, Any]]:
+        """Entradas consolidadas de um dia (AAAA-MM-DD), em streaming"""
+        path = self._segment_path(day)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    def get_segment_index(self) -> Dict[str, Dict[str, Any]]:
+        """Índice dos segmentos diários (entradas, bytes, primeiro/último timestamp)"""
+        return self._load_state()["segments"]
+
     def generate_audit_summary(self) -> Dict[str, Any]:
         """Gera um resumo de auditoria"""
         self.consolidate_logs()
-        
-        summary = {
-            "total_entries": 0,
-            "entries_by_source": {source: 0 for source in self.log_files.keys()},
-            "error_count": 0,
-            "security_block_count": 0,
-            "successful_payments": 0,
-            "failed_payments": 0,
-            "refunds": 0
-        }
-        
-        if not os.path.exists(self.consolidated_log_file):
-            return {"success": False, "error": "Nenhum log encontrado"}
-        
-        with open(self.consolidated_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    entry = json.loads(line)
-                    summary["total_entries"] += 1
-                    source = entry.get('source')
-                    if source in summary["entries_by_source"]:
-                        summary["entries_by_source"][source] += 1
-                    
-                    # Contar erros e bloqueios
-                    if 'error' in str(entry).lower() or 'failed' in str(entry).lower():
-                        summary["error_count"] += 1
-                    
-                    if source == 'security_blocks':
-                        summary["security_block_count"] += 1
-                    
-                    # Contar pagamentos
-                    if entry.get('event_type') == 'payment_intent.succeeded':
-                        summary["successful_payments"] += 1
-                    elif entry.get('event_type') == 'payment_intent.payment_failed':
-                        summary["failed_payments"] += 1
-                    elif entry.get('event_type') == 'charge.refunded':
-                        summary["refunds"] += 1
-                        
+        summary = self._load_state()["summary"]
+        summary["generated_at"] = datetime.now().isoformat()
         return {"success": True, "summary": summary}
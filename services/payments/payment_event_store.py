@@ -0,0 +1,300 @@
+"""
+Payment Event Store - NEXORA PRIME v12.4+
+Armazenamento indexado de eventos de pagamento (webhooks Stripe e funding)
+
+Os logs JSONL continuam sendo a trilha de auditoria; as consultas
+(confirmação de payment intent, eventos recentes, histórico de funding)
+passam a usar a tabela `payment_events`, indexada por payment_intent_id,
+usuário e ordem de chegada. A tabela `processed_webhook_events` garante
+idempotência por `event.id` do Stripe. Os JSONL já existentes são
+importados uma única vez (`migrate_jsonl`).
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+
+
+# Uma reserva 'processing' mais antiga que isso é de um worker que morreu
+# no meio do handler e pode ser retomada pelo reenvio do Stripe
+CLAIM_LEASE_SECONDS = 300
+
+EVENT_INSERT = """
+    INSERT INTO payment_events
+        (stream, event_type, event_id, status, user_id, payment_intent_id, amount, created_at, payload)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def extract_payment_intent_id(details: Dict[str, Any]) -> Optional[str]:
+    """payment_intent_id de um evento (detalhes processados ou objeto bruto do Stripe)"""
+    if not isinstance(details, dict):
+        return None
+    if details.get("payment_intent_id"):
+        return details["payment_intent_id"]
+    obj = (details.get("data") or {}).get("object") or details.get("payment_intent") or {}
+    if not isinstance(obj, dict):
+        return None
+    if obj.get("payment_intent"):
+        return obj["payment_intent"]
+    object_id = str(obj.get("id") or "")
+    return object_id if object_id.startswith("pi_") else None
+
+
+class PaymentEventStore:
+    """Eventos de pagamento por stream ("webhook", "facebook_funding", ...)"""
+
+    def __init__(self):
+        self._init_tables()
+
+    def _init_tables(self):
+        id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS payment_events (
+                    {id_column},
+                    stream TEXT NOT NULL,
+                    event_type TEXT,
+                    event_id TEXT,
+                    status TEXT,
+                    user_id TEXT,
+                    payment_intent_id TEXT,
+                    amount REAL,
+                    created_at TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_payment_events_intent ON payment_events (payment_intent_id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_payment_events_user ON payment_events (stream, user_id, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_payment_events_time ON payment_events (stream, created_at)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS processed_webhook_events (
+                    event_id TEXT PRIMARY KEY,
+                    event_type TEXT,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    received_at TEXT NOT NULL,
+                    claimed_at TEXT,
+                    processed_at TEXT
+                )
+            """)
+            ensure_column(cursor, "processed_webhook_events", "claimed_at", "TEXT")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS payment_event_migrations (
+                    stream TEXT PRIMARY KEY,
+                    source_path TEXT,
+                    imported INTEGER,
+                    migrated_at TEXT
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[PAYMENT EVENTS] ❌ Erro ao criar tabelas: {e}")
+
+    @staticmethod
+    def _row(stream: str, entry: Dict[str, Any]) -> tuple:
+        details = entry.get("details") or {}
+        user_id = entry.get("user_id") or (details.get("user_id") if isinstance(details, dict) else None)
+        amount = entry.get("amount")
+        if amount is None and isinstance(details, dict):
+            amount = details.get("amount")
+        return (
+            stream,
+            entry.get("event_type") or entry.get("operation"),
+            entry.get("event_id"),
+            entry.get("status"),
+            user_id,
+            extract_payment_intent_id(details),
+            amount,
+            entry.get("timestamp") or datetime.now().isoformat(),
+            json.dumps(entry, ensure_ascii=False, default=str)
+        )
+
+    # ===== ESCRITA =====
+
+    def append(self, stream: str, entry: Dict[str, Any]):
+        """Registra uma entrada de log (mesmo formato do JSONL)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(EVENT_INSERT), self._row(stream, entry))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def migrate_jsonl(self, stream: str, path: str) -> int:
+        """
+        Importa um JSONL legado para o stream (uma única vez por stream,
+        mesmo com vários workers: quem registra a migração primeiro importa).
+
+        Returns:
+            Quantidade de entradas importadas (0 se já migrado)
+        """
+        now = datetime.now().isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO payment_event_migrations (stream, source_path, imported, migrated_at)
+                VALUES (?, ?, 0, ?)
+                ON CONFLICT (stream) DO NOTHING
+            """), (stream, path, now))
+            if cursor.rowcount == 0:
+                conn.rollback()
+                return 0
+
+            rows = []
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            rows.append(self._row(stream, json.loads(line)))
+                        except (ValueError, AttributeError):
+                            continue
+            if rows:
+                cursor.executemany(sql_param(EVENT_INSERT), rows)
+            cursor.execute(sql_param(
+                "UPDATE payment_event_migrations SET imported = ? WHERE stream = ?"
+            ), (len(rows), stream))
+            conn.commit()
+            return len(rows)
+        finally:
+            conn.close()
+
+    # ===== CONSULTAS =====
+
+    def _query(self, query: str, params: tuple) -> List[Dict[str, Any]]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            rows = cursor.fetchall()
+        finally:
+            conn.close()
+        return [json.loads(row["payload"] if isinstance(row, dict) else row[0]) for row in rows]
+
+    def recent(self, stream: str, limit: int = 50, user_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Últimas `limit` entradas do stream, em ordem cronológica"""
+        if user_id is None:
+            entries = self._query(
+                "SELECT payload FROM payment_events WHERE stream = ? ORDER BY id DESC LIMIT ?",
+                (stream, limit)
+            )
+        else:
+            entries = self._query(
+                "SELECT payload FROM payment_events WHERE stream = ? AND user_id = ? ORDER BY id DESC LIMIT ?",
+                (stream, user_id, limit)
+            )
+        entries.reverse()
+        return entries
+
+    def is_payment_confirmed(self, payment_intent_id: str) -> bool:
+        """Webhook payment_intent.succeeded processado para o payment intent?"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT 1 FROM payment_events
+                WHERE payment_intent_id = ? AND event_type = 'payment_intent.succeeded' AND status = 'processed'
+                LIMIT 1
+            """), (payment_intent_id,))
+            return cursor.fetchone() is not None
+        finally:
+            conn.close()
+
+    # ===== IDEMPOTÊNCIA (event.id do Stripe) =====
+
+    def claim_event(self, event_id: str, event_type: Optional[str] = None,
+                    lease_seconds: int = CLAIM_LEASE_SECONDS) -> bool:
+        """
+        Reserva o processamento de um evento.
+
+        A reserva vale por `lease_seconds`: se o worker morrer no meio do
+        handler, o próximo reenvio do Stripe depois desse prazo retoma o
+        evento em vez de encontrá-lo preso em 'processing'.
+
+        Returns:
+            False se o evento já foi processado ou está reservado por outro worker
+        """
+        now = datetime.now()
+        now_iso = now.isoformat()
+        stale_iso = (now - timedelta(seconds=lease_seconds)).isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO processed_webhook_events (event_id, event_type, status, received_at, claimed_at)
+                VALUES (?, ?, 'processing', ?, ?)
+                ON CONFLICT (event_id) DO NOTHING
+            """), (event_id, event_type, now_iso, now_iso))
+            claimed = cursor.rowcount > 0
+            if not claimed:
+                # Retoma reservas vencidas (ou de antes da coluna claimed_at)
+                cursor.execute(sql_param("""
+                    UPDATE processed_webhook_events SET claimed_at = ?
+                    WHERE event_id = ? AND status = 'processing'
+                      AND (claimed_at IS NULL OR claimed_at < ?)
+                """), (now_iso, event_id, stale_iso))
+                claimed = cursor.rowcount > 0
+            conn.commit()
+            return claimed
+        finally:
+            conn.close()
+
+    def complete_event(self, event_id: str, result: Dict[str, Any]):
+        """Marca o evento como processado e guarda o resultado"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                UPDATE processed_webhook_events SET status = 'processed', result = ?, processed_at = ?
+                WHERE event_id = ?
+            """), (json.dumps(result, ensure_ascii=False, default=str), datetime.now().isoformat(), event_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def release_event(self, event_id: str):
+        """Libera um evento que falhou, para o reenvio do Stripe ser processado"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("DELETE FROM processed_webhook_events WHERE event_id = ?"), (event_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_processed_event(self, event_id: str) -> Optional[Dict[str, Any]]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(
+                "SELECT event_id, event_type, status, result, received_at, claimed_at, processed_at "
+                "FROM processed_webhook_events WHERE event_id = ?"
+            ), (event_id,))
+            columns = [d[0] for d in cursor.description]
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        record = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
+        record["result"] = json.loads(record["result"]) if record.get("result") else None
+        return record
@@ -4,9 +4,181 @@ Sistema de bloqueios absolutos para garantir segurança nos pagamentos
 """
 import os
 import json
+import time
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional
 from services.payments.credit_wallet_service import CreditWalletService
+from services.payments.payment_event_store import PaymentEventStore
+from services.sliding_window_limiter import LimitRule, get_limiter, DAY, HOUR
+from services.db_utils import get_db_connection, sql_param, ensure_column
+
+
+# Limites globais
+MIN_PAYMENT = 10.0  # Mínimo R$ 10 ou $ 10
+MAX_PAYMENT = 10000.0  # Máximo R$ 10.000 ou $ 10.000
+MAX_DAILY_AMOUNT = 50000.0  # Máximo R$ 50.000 ou $ 50.000 por dia
+MAX_PAYMENTS_PER_HOUR = 20
+
+PAYMENT_LIMIT_RULES = {
+    "daily_amount": LimitRule(window_seconds=DAY, bucket_seconds=HOUR, max_amount=MAX_DAILY_AMOUNT),
+    "hourly_count": LimitRule(window_seconds=HOUR, bucket_seconds=60, max_count=MAX_PAYMENTS_PER_HOUR)
+}
+
+
+def get_payment_limiter():
+    """Janelas deslizantes de pagamentos confirmados por usuário"""
+    return get_limiter("payments", PAYMENT_LIMIT_RULES)
+
+
+class PaymentLimitReservations:
+    """
+    Reserva do valor de um payment intent nas janelas de limite.
+
+    A validação reserva com `acquire` (verifica e registra de forma atômica),
+    então workers concorrentes não passam juntos do limite diário. O webhook
+    confirma a reserva no sucesso e a devolve na falha. Reservas de intents
+    abandonados saem sozinhas da janela de 24h.
+    """
+
+    def __init__(self):
+        self.limiter = get_payment_limiter()
+        self._init_table()
+
+    def _init_table(self):
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS payment_limit_reservations (
+                    payment_intent_id TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    status TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT,
+                    reserved_at REAL
+                )
+            """)
+            ensure_column(cursor, "payment_limit_reservations", "reserved_at", "REAL")
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[PAYMENT LIMITS] ❌ Erro ao criar tabela: {e}")
+
+    def _execute(self, query: str, params: tuple) -> int:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            affected = cursor.rowcount
+            conn.commit()
+            return affected
+        finally:
+            conn.close()
+
+    def _get(self, payment_intent_id: str) -> Optional[Dict[str, Any]]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT user_id, amount, status, reserved_at, created_at
+                FROM payment_limit_reservations WHERE payment_intent_id = ?
+            """), (payment_intent_id,))
+            row = cursor.fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        reservation = dict(row) if isinstance(row, dict) else {
+            "user_id": row[0], "amount": row[1], "status": row[2], "reserved_at": row[3], "created_at": row[4]
+        }
+        if reservation["reserved_at"] is None:
+            # Reservas gravadas antes da coluna existir
+            reservation["reserved_at"] = datetime.fromisoformat(reservation["created_at"]).timestamp()
+        return reservation
+
+    def reserve(self, user_id: str, payment_intent_id: str, amount: float) -> Dict[str, Any]:
+        """
+        Reserva o valor do intent (idempotente por payment_intent_id).
+
+        Intents já reservados ou confirmados não passam de novo pelo limite;
+        um intent cuja reserva foi devolvida (pagamento falhou) reserva outra vez.
+
+        Returns:
+            Resultado do limitador ({"allowed", "rule", "usage"})
+        """
+        reserved_at = time.time()
+        now = datetime.now().isoformat()
+        claimed = self._execute("""
+            INSERT INTO payment_limit_reservations
+                (payment_intent_id, user_id, amount, status, created_at, reserved_at)
+            VALUES (?, ?, ?, 'reserved', ?, ?)
+            ON CONFLICT (payment_intent_id) DO NOTHING
+        """, (payment_intent_id, user_id, amount, now, reserved_at))
+        if not claimed:
+            claimed = self._execute("""
+                UPDATE payment_limit_reservations
+                SET status = 'reserved', user_id = ?, amount = ?, reserved_at = ?, updated_at = ?
+                WHERE payment_intent_id = ? AND status = 'released'
+            """, (user_id, amount, reserved_at, now, payment_intent_id))
+        if not claimed:
+            # Intent já validado: a reserva existente continua valendo
+            result = self.limiter.check(user_id, 0.0)
+            result["allowed"], result["rule"] = True, None
+            return result
+
+        result = self.limiter.acquire(user_id, amount, now=reserved_at)
+        if not result["allowed"]:
+            self._execute("""
+                UPDATE payment_limit_reservations SET status = 'released', updated_at = ?
+                WHERE payment_intent_id = ?
+            """, (datetime.now().isoformat(), payment_intent_id))
+        return result
+
+    def settle(self, payment_intent_id: str, user_id: str, amount: float):
+        """Pagamento confirmado: mantém a reserva (ajustando o valor) ou registra"""
+        now = datetime.now().isoformat()
+        reservation = self._get(payment_intent_id)
+        if reservation and reservation["status"] == "reserved":
+            settled = self._execute("""
+                UPDATE payment_limit_reservations SET status = 'settled', amount = ?, updated_at = ?
+                WHERE payment_intent_id = ? AND status = 'reserved'
+            """, (amount, now, payment_intent_id))
+            if settled:
+                difference = amount - reservation["amount"]
+                if difference > 0:
+                    self.limiter.record(reservation["user_id"], difference, count=0)
+                elif difference < 0:
+                    self.limiter.release(reservation["user_id"], -difference,
+                                         reservation["reserved_at"], count=0)
+                return
+        elif reservation and reservation["status"] == "settled":
+            return
+
+        # Pagamento sem reserva (ou após uma falha que a devolveu)
+        claimed = self._execute("""
+            INSERT INTO payment_limit_reservations
+                (payment_intent_id, user_id, amount, status, created_at, updated_at, reserved_at)
+            VALUES (?, ?, ?, 'settled', ?, ?, ?)
+            ON CONFLICT (payment_intent_id) DO UPDATE SET
+                status = 'settled', amount = excluded.amount, updated_at = excluded.updated_at,
+                reserved_at = excluded.reserved_at
+            WHERE payment_limit_reservations.status = 'released'
+        """, (payment_intent_id, user_id, amount, now, now, time.time()))
+        if claimed:
+            self.limiter.record(user_id, amount)
+
+    def release(self, payment_intent_id: str):
+        """Pagamento falhou: devolve o valor reservado às janelas"""
+        reservation = self._get(payment_intent_id)
+        if not reservation or reservation["status"] != "reserved":
+            return
+        released = self._execute("""
+            UPDATE payment_limit_reservations SET status = 'released', updated_at = ?
+            WHERE payment_intent_id = ? AND status = 'reserved'
+        """, (datetime.now().isoformat(), payment_intent_id))
+        if released:
+            self.limiter.release(reservation["user_id"], reservation["amount"], reservation["reserved_at"])
 
 
 class PaymentSecurityBlocks:
@@ -16,6 +188,10 @@ class PaymentSecurityBlocks:
         self.wallet_service = CreditWalletService()
         self.blocks_log_file = "data/payments/security_blocks.jsonl"
         self._ensure_log_file()
+        self.event_store = PaymentEventStore()
+        self.event_store.migrate_jsonl("webhook", "data/payments/webhook_events.jsonl")
+        self.limiter = get_payment_limiter()
+        self.reservations = PaymentLimitReservations()
     
     def _ensure_log_file(self):
         """Garante que o arquivo de log existe"""
@@ -127,33 +303,8 @@ class PaymentSecurityBlocks:
         Returns:
             Dict com resultado da verificação
         """
-        # Verificar se existe log do webhook para este payment_intent
-        webhook_log_file = "data/payments/webhook_events.jsonl"
-        
-        if not os.path.exists(webhook_log_file):
-            self._log_block(
-                block_type="webhook_not_confirmed",
-                reason="Arquivo de log do webhook não encontrado",
-                details={"payment_intent_id": payment_intent_id}
-            )
-            return {
-                "success": False,
-                "blocked": True,
-                "reason": "Webhook não confirmou o pagamento",
-                "payment_intent_id": payment_intent_id
-            }
-        
-        # Procurar confirmação do webhook
-        webhook_confirmed = False
-        with open(webhook_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    event = json.loads(line)
-                    if (event.get('event_type') == 'payment_intent.succeeded' and
-                        event.get('status') == 'processed' and
-                        payment_intent_id in str(event.get('details', {}))):
-                        webhook_confirmed = True
-                        break
+        # Procurar confirmação do webhook (consulta pelo índice de payment_intent_id)
+        webhook_confirmed = self.event_store.is_payment_confirmed(payment_intent_id)
         
         if not webhook_confirmed:
             self._log_block(
@@ -229,7 +380,7 @@ class PaymentSecurityBlocks:
             }
     
     def check_payment_limits(self, user_id: str, amount: float, 
-                            credit_type: str) -> Dict[str, Any]:
+                            credit_type: str, payment_intent_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Verifica limites de pagamento
         
@@ -237,15 +388,12 @@ class PaymentSecurityBlocks:
             user_id: ID do usuário
             amount: Valor do pagamento
             credit_type: Tipo de crédito
+            payment_intent_id: Se informado, o valor é reservado nas janelas
+                (verificação e registro atômicos, idempotente por intent)
             
         Returns:
             Dict com resultado da verificação
         """
-        # Limites globais
-        MIN_PAYMENT = 10.0  # Mínimo R$ 10 ou $ 10
-        MAX_PAYMENT = 10000.0  # Máximo R$ 10.000 ou $ 10.000
-        MAX_DAILY_AMOUNT = 50000.0  # Máximo R$ 50.000 ou $ 50.000 por dia
-        
         # Verificar valor mínimo
         if amount < MIN_PAYMENT:
             self._log_block(
@@ -282,13 +430,44 @@ class PaymentSecurityBlocks:
                 "amount": amount
             }
         
-        # TODO: Verificar limite diário
-        # Por enquanto, apenas retornar sucesso
+        # Verificar janelas deslizantes (valor em 24h, pagamentos por hora)
+        if payment_intent_id:
+            window_check = self.reservations.reserve(user_id, payment_intent_id, amount)
+        else:
+            window_check = self.limiter.check(user_id, amount)
+        if not window_check["allowed"]:
+            return self._window_block(user_id, amount, window_check)
         
         return {
             "success": True,
             "blocked": False,
             "message": "Limites de pagamento OK",
+            "amount": amount,
+            "remaining_daily": window_check["usage"]["daily_amount"]["remaining_amount"]
+        }
+    
+    def _window_block(self, user_id: str, amount: float, window_check: Dict[str, Any]) -> Dict[str, Any]:
+        """Registra e retorna o bloqueio da regra de janela violada"""
+        usage = window_check["usage"][window_check["rule"]]
+        if window_check["rule"] == "daily_amount":
+            reason = (f"Limite diário de pagamentos: R$ {MAX_DAILY_AMOUNT:.2f}. "
+                      f"Já pago nas últimas 24h: R$ {usage['amount']:.2f}")
+        else:
+            reason = f"Máximo de {MAX_PAYMENTS_PER_HOUR} pagamentos por hora"
+        self._log_block(
+            block_type="payment_limit_exceeded",
+            reason=reason,
+            details={
+                "user_id": user_id,
+                "amount": amount,
+                "rule": window_check["rule"],
+                "usage": usage
+            }
+        )
+        return {
+            "success": False,
+            "blocked": True,
+            "reason": reason,
             "amount": amount
         }
     
@@ -319,8 +498,9 @@ class PaymentSecurityBlocks:
                 "validations": validations
             }
         
-        # 2. Verificar limites de pagamento
-        limits_check = self.check_payment_limits(user_id, amount, credit_type)
+        # 2. Verificar e reservar limites de pagamento (atômico entre workers;
+        # o webhook confirma a reserva no sucesso e a devolve na falha)
+        limits_check = self.check_payment_limits(user_id, amount, credit_type, payment_intent_id)
         validations.append(("Limites de pagamento", limits_check))
         if limits_check["blocked"]:
             return {
@@ -334,6 +514,7 @@ class PaymentSecurityBlocks:
         balance_check = self.check_balance_consistency(user_id)
         validations.append(("Consistência dos saldos", balance_check))
         if balance_check["blocked"]:
+            self.reservations.release(payment_intent_id)
             return {
                 "success": False,
                 "blocked": True,
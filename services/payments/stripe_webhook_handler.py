@@ -7,6 +7,8 @@ import json
 from datetime import datetime
 from typing import Dict, Any, Optional
 from services.payments.credit_wallet_service import CreditWalletService
+from services.payments.payment_event_store import PaymentEventStore
+from services.payments.payment_security_blocks import PaymentLimitReservations
 from models.payments.credit_wallet import CreditType
 
 
@@ -17,6 +19,9 @@ class StripeWebhookHandler:
         self.wallet_service = CreditWalletService()
         self.webhook_log_file = "data/payments/webhook_events.jsonl"
         self._ensure_log_file()
+        self.event_store = PaymentEventStore()
+        self.event_store.migrate_jsonl("webhook", self.webhook_log_file)
+        self.limit_reservations = PaymentLimitReservations()
     
     def _ensure_log_file(self):
         """Garante que o arquivo de log existe"""
@@ -37,6 +42,7 @@ class StripeWebhookHandler:
         
         with open(self.webhook_log_file, 'a') as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+        self.event_store.append("webhook", log_entry)
     
     def handle_event(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -51,6 +57,37 @@ class StripeWebhookHandler:
         event_type = event.get('type')
         event_id = event.get('id')
         
+        # Idempotência: o Stripe reenvia eventos; cada event.id é processado uma vez
+        if event_id and not self.event_store.claim_event(event_id, event_type):
+            processed = self.event_store.get_processed_event(event_id) or {}
+            if processed.get("status") != "processed":
+                # Outro worker está no meio do handler: o Stripe deve reenviar
+                self._log_webhook_event(
+                    event_type=event_type,
+                    event_id=event_id,
+                    status="in_progress",
+                    details={}
+                )
+                return {
+                    "success": False,
+                    "in_progress": True,
+                    "error": f"Evento {event_id} em processamento",
+                    "event_id": event_id
+                }
+            self._log_webhook_event(
+                event_type=event_type,
+                event_id=event_id,
+                status="duplicate",
+                details={}
+            )
+            return {
+                "success": True,
+                "duplicate": True,
+                "message": f"Evento {event_id} já processado",
+                "event_id": event_id,
+                "previous_result": processed.get("result")
+            }
+        
         # Log do evento recebido
         self._log_webhook_event(
             event_type=event_type,
@@ -59,19 +96,32 @@ class StripeWebhookHandler:
             details={"data": event.get('data', {})}
         )
         
-        # Roteamento de eventos
-        if event_type == 'payment_intent.succeeded':
-            return self._handle_payment_succeeded(event)
-        elif event_type == 'payment_intent.payment_failed':
-            return self._handle_payment_failed(event)
-        elif event_type == 'charge.refunded':
-            return self._handle_charge_refunded(event)
-        else:
-            return {
-                "success": True,
-                "message": f"Evento {event_type} recebido mas não processado",
-                "event_id": event_id
-            }
+        try:
+            # Roteamento de eventos
+            if event_type == 'payment_intent.succeeded':
+                result = self._handle_payment_succeeded(event)
+            elif event_type == 'payment_intent.payment_failed':
+                result = self._handle_payment_failed(event)
+            elif event_type == 'charge.refunded':
+                result = self._handle_charge_refunded(event)
+            else:
+                result = {
+                    "success": True,
+                    "message": f"Evento {event_type} recebido mas não processado",
+                    "event_id": event_id
+                }
+        except Exception:
+            if event_id:
+                self.event_store.release_event(event_id)
+            raise
+        
+        if event_id:
+            if result.get("success"):
+                self.event_store.complete_event(event_id, result)
+            else:
+                # Falha: libera para o reenvio do Stripe tentar de novo
+                self.event_store.release_event(event_id)
+        return result
     
     def _handle_payment_succeeded(self, event: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -117,6 +167,9 @@ class StripeWebhookHandler:
             )
             
             if result["success"]:
+                # Confirmar a reserva nas janelas de limite diário/horário
+                self.limit_reservations.settle(payment_intent_id, user_id, amount)
+                
                 self._log_webhook_event(
                     event_type='payment_intent.succeeded',
                     event_id=event_id,
@@ -171,6 +224,9 @@ class StripeWebhookHandler:
         amount = payment_intent.get('amount', 0) / 100
         error_message = payment_intent.get('last_payment_error', {}).get('message', 'Erro desconhecido')
         
+        # Devolver o valor reservado na validação
+        self.limit_reservations.release(payment_intent.get('id'))
+        
         self._log_webhook_event(
             event_type='payment_intent.payment_failed',
             event_id=event_id,
@@ -284,14 +340,4 @@ class StripeWebhookHandler:
         Returns:
             Lista de eventos recentes
         """
-        if not os.path.exists(self.webhook_log_file):
-            return []
-        
-        events = []
-        with open(self.webhook_log_file, 'r') as f:
-            for line in f:
-                if line.strip():
-                    events.append(json.loads(line))
-        
-        # Retornar os mais recentes
-        return events[-limit:]
+        return self.event_store.recent("webhook", limit)
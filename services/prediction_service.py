@@ -0,0 +1,457 @@
+"""
+🔮 PREDICTION SERVICE - Registro de Modelos e Cache de Predições
+Nexora Prime
+
+Camada de serviço para os endpoints de predição:
+- ModelRegistry: versões de modelos (persistidas), idempotente por fingerprint
+- PredictionCache: memoização LRU com TTL, chave = hash(features) + versão do modelo
+- PredictionLogWriter: log de predições limitado, persistido em background
+- PredictionService: APIs em lote para muitas campanhas de uma vez
+
+Dashboards pedem as mesmas previsões repetidamente; com a chave incluindo a
+versão do modelo, um novo treino invalida o cache automaticamente.
+"""
+
+import copy
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Callable, Tuple
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres
+
+
+def feature_hash(features: Dict[str, Any]) -> str:
+    """Hash estável de um vetor de features (ordem das chaves não importa)"""
+    payload = json.dumps(features, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class ModelRegistry:
+    """
+    Registro versionado de modelos.
+
+    `register` só cria uma nova versão quando o fingerprint do modelo muda,
+    então registrar o mesmo modelo a cada boot (ou em cada worker) mantém a
+    mesma versão e o mesmo espaço de cache.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, Dict[str, Any]] = {}
+        self._objects: Dict[Tuple[str, int], Any] = {}
+        self._lock = threading.Lock()
+        self._init_database()
+
+    def _init_database(self):
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS model_registry (
+                    name TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    metadata TEXT,
+                    created_at TEXT NOT NULL,
+                    PRIMARY KEY (name, version)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[MODEL REGISTRY] ❌ Erro ao inicializar registro: {e}")
+
+    def _latest_from_db(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT version, fingerprint, metadata, created_at
+                FROM model_registry
+                WHERE name = ?
+                ORDER BY version DESC
+                LIMIT 1
+            """), (name,))
+            row = cursor.fetchone()
+            conn.close()
+        except Exception as e:
+            print(f"[MODEL REGISTRY] ❌ Erro ao consultar registro: {e}")
+            return None
+
+        if not row:
+            return None
+        if isinstance(row, dict):
+            row = (row["version"], row["fingerprint"], row["metadata"], row["created_at"])
+        return {
+            "version": row[0],
+            "fingerprint": row[1],
+            "metadata": json.loads(row[2]) if row[2] else {},
+            "created_at": row[3]
+        }
+
+    def register(self, name: str, fingerprint: str, metadata: Dict[str, Any] = None, model: Any = None) -> int:
+        """
+        Registra (ou reaproveita) a versão de um modelo.
+
+        Returns:
+            int: Versão ativa do modelo
+        """
+        with self._lock:
+            current = self._versions.get(name) or self._latest_from_db(name)
+
+            if current and current["fingerprint"] == fingerprint:
+                self._versions[name] = current
+                if model is not None:
+                    self._objects[(name, current["version"])] = model
+                return current["version"]
+
+            version = (current["version"] + 1) if current else 1
+            entry = {
+                "version": version,
+                "fingerprint": fingerprint,
+                "metadata": metadata or {},
+                "created_at": datetime.now().isoformat()
+            }
+
+            try:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(sql_param("""
+                    INSERT INTO model_registry (name, version, fingerprint, metadata, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                """), (name, version, fingerprint, json.dumps(entry["metadata"], default=str), entry["created_at"]))
+                conn.commit()
+                conn.close()
+            except Exception as e:
+                print(f"[MODEL REGISTRY] ❌ Erro ao registrar {name} v{version}: {e}")
+
+            self._versions[name] = entry
+            if model is not None:
+                self._objects[(name, version)] = model
+            return version
+
+    def current_version(self, name: str) -> int:
+        entry = self._versions.get(name)
+        return entry["version"] if entry else 0
+
+    def get_model(self, name: str, version: int = None) -> Any:
+        return self._objects.get((name, version or self.current_version(name)))
+
+    def list_models(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(entry) for name, entry in self._versions.items()}
+
+
+class PredictionCache:
+    """Cache LRU com TTL para resultados de predição"""
+
+    def __init__(self, max_entries: int = 10000, ttl: int = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name: str, version: int, features: Dict[str, Any]) -> str:
+        return f"{model_name}:v{version}:{feature_hash(features)}"
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        with self._lock:
+            self._entries[key] = (time.time() + (ttl or self.ttl), copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: int = None) -> Any:
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        value = compute()
+        self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, model_name: str = None) -> int:
+        with self._lock:
+            if model_name is None:
+                count = len(self._entries)
+                self._entries.clear()
+                return count
+            prefix = f"{model_name}:"
+            keys = [k for k in self._entries if k.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class PredictionLogWriter:
+    """
+    Log de predições limitado e persistido em background.
+
+    O caminho de predição só faz um append numa deque limitada; uma thread
+    grava o acumulado na tabela prediction_log com executemany.
+    """
+
+    def __init__(self, max_buffer: int = 10000, flush_interval: float = 5.0, flush_size: int = 500):
+        self.buffer: deque = deque(maxlen=max_buffer)
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        self._init_database()
+
+    def _init_database(self):
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS prediction_log (
+                    {id_column},
+                    model TEXT NOT NULL,
+                    version INTEGER,
+                    feature_hash TEXT,
+                    campaign_id TEXT,
+                    prediction TEXT,
+                    created_at TEXT NOT NULL
+                )
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_prediction_log_model
+                ON prediction_log(model, created_at)
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[PREDICTION LOG] ❌ Erro ao inicializar log: {e}")
+
+    def log(self, model: str, version: int, features_key: str, campaign_id: Any, prediction: Dict[str, Any]):
+        with self._lock:
+            if len(self.buffer) == self.buffer.maxlen:
+                self.dropped += 1
+            self.buffer.append((
+                model,
+                version,
+                features_key,
+                str(campaign_id) if campaign_id is not None else None,
+                json.dumps(prediction, default=str),
+                datetime.now().isoformat()
+            ))
+            pending = len(self.buffer)
+
+        self._ensure_worker()
+        if pending >= self.flush_size:
+            self._wake.set()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="prediction-log-writer", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> int:
+        with self._lock:
+            rows = list(self.buffer)
+            self.buffer.clear()
+        if not rows:
+            return 0
+
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.executemany(sql_param("""
+                INSERT INTO prediction_log (model, version, feature_hash, campaign_id, prediction, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """), rows)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[PREDICTION LOG] ❌ Erro ao persistir log: {e}")
+            return 0
+
+        self.written += len(rows)
+        return len(rows)
+
+
+class PredictionService:
+    """
+    Fachada de predição com cache e APIs em lote.
+
+    As predições heurísticas do MLPredictionEngine e os modelos treinados do
+    PredictiveAnalyticsEngine passam pelo mesmo cache e pelo mesmo log.
+    """
+
+    def __init__(self, registry: ModelRegistry = None, cache: PredictionCache = None, log_writer: PredictionLogWriter = None):
+        self.registry = registry or ModelRegistry()
+        self.cache = cache or PredictionCache()
+        self.log_writer = log_writer or PredictionLogWriter()
+
+    def cached(
+        self,
+        model_name: str,
+        features: Dict[str, Any],
+        compute: Callable[[], Any],
+        campaign_id: Any = None,
+        log: bool = True
+    ) -> Any:
+        """
+        Retorna a predição memoizada ou calcula, guarda e registra no log.
+
+        Args:
+            model_name: Nome do modelo no registro
+            features: Entradas que determinam a predição (vetor de features + parâmetros)
+            compute: Função que calcula a predição em caso de miss
+        """
+        version = self.registry.current_version(model_name)
+        key = PredictionCache.make_key(model_name, version, features)
+
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        result = compute()
+        self.cache.set(key, result)
+        if log:
+            self._log(model_name, version, key, campaign_id, result)
+        return result
+
+    def cached_many(
+        self,
+        model_name: str,
+        features_list: List[Dict[str, Any]],
+        compute_many: Callable[[List[int]], List[Any]],
+        campaign_ids: List[Any] = None
+    ) -> List[Any]:
+        """
+        Versão em lote de `cached`: consulta o cache para todos os itens e
+        calcula os misses numa única chamada.
+
+        Args:
+            compute_many: Recebe os índices dos misses e retorna os resultados na mesma ordem
+        """
+        version = self.registry.current_version(model_name)
+        keys = [PredictionCache.make_key(model_name, version, f) for f in features_list]
+        results = [self.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if missing:
+            for i, result in zip(missing, compute_many(missing)):
+                results[i] = result
+                self.cache.set(keys[i], result)
+                self._log(model_name, version, keys[i], campaign_ids[i] if campaign_ids else None, result)
+
+        return results
+
+    def _log(self, model_name: str, version: int, key: str, campaign_id: Any, result: Any):
+        if hasattr(result, "to_dict"):
+            payload = result.to_dict()
+        elif isinstance(result, dict):
+            payload = result
+        else:
+            payload = {"value": result}
+        self.log_writer.log(model_name, version, key, campaign_id, payload)
+
+    # ===== APIs EM LOTE =====
+
+    def predict_roas_batch(self, campaigns: List[Dict], days_ahead: int = 7) -> List[Dict[str, Any]]:
+        return _get_ml_engine().predict_roas_batch(campaigns, days_ahead)
+
+    def predict_cpa_batch(self, campaigns: List[Dict], target_cpa: float = None) -> List[Dict[str, Any]]:
+        return _get_ml_engine().predict_cpa_batch(campaigns, target_cpa)
+
+    def predict_conversions_batch(self, campaigns: List[Dict], budget: float, days: int = 7) -> List[Dict[str, Any]]:
+        return _get_ml_engine().predict_conversions_batch(campaigns, budget, days)
+
+    def predict_metric_batch(self, campaigns: List[Dict], metric, horizon=None) -> List[Any]:
+        """
+        Predição de uma métrica para muitas campanhas.
+
+        Para modelos treinados, os misses do cache são resolvidos numa única
+        chamada vetorizada de PredictiveModel.predict_batch.
+        """
+        return _get_predictive_engine().predict_metric_batch(campaigns, metric, horizon)
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "models": self.registry.list_models(),
+            "cache": self.cache.get_stats(),
+            "log": {
+                "buffered": len(self.log_writer.buffer),
+                "written": self.log_writer.written,
+                "dropped": self.log_writer.dropped
+            }
+        }
+
+
+def _get_ml_engine():
+    from services.ml_prediction_engine import ml_prediction_engine
+    return ml_prediction_engine
+
+
+def _get_predictive_engine():
+    from services.predictive_analytics_engine import predictive_engine
+    return predictive_engine
+
+
+# Instância global do serviço
+_service_instance: Optional[PredictionService] = None
+_service_lock = threading.Lock()
+
+
+def get_prediction_service() -> PredictionService:
+    """
+    Retorna instância global do serviço de predição (singleton)
+
+    Returns:
+        PredictionService: Instância do serviço
+    """
+    global _service_instance
+
+    if _service_instance is None:
+        with _service_lock:
+            if _service_instance is None:
+                _service_instance = PredictionService()
+                atexit.register(_service_instance.log_writer.flush)
+
+    return _service_instance
@@ -15,6 +15,18 @@ from dataclasses import dataclass, field
 from enum import Enum
 from collections import defaultdict
 
+import numpy as np
+
+try:
+    from services.streaming_anomaly_detector import get_anomaly_detector
+except ImportError:
+    from streaming_anomaly_detector import get_anomaly_detector
+
+try:
+    from services.prediction_service import get_prediction_service, feature_hash
+except ImportError:
+    from prediction_service import get_prediction_service, feature_hash
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -191,39 +203,83 @@ class TimeSeriesAnalyzer:
 
 
 class PredictiveModel:
-    """Modelo preditivo base"""
+    """
+    Modelo preditivo linear (ridge) com solução fechada.
+    
+    As features são empacotadas numa matriz NumPy com ordem fixa
+    (`feature_names`), padronizadas por coluna e resolvidas por
+    (XᵀX + λI)β = Xᵀy. O intervalo de confiança usa o desvio dos resíduos
+    e a leverage do ponto previsto.
+    """
     
-    def __init__(self, metric: PredictionType):
+    def __init__(self, metric: PredictionType, l2: float = 1e-3):
         self.metric = metric
+        self.l2 = l2
+        self.feature_names: List[str] = []
         self.weights: Dict[str, float] = {}
         self.bias = 0.0
         self.trained = False
         self.accuracy_history: List[float] = []
         
-    def train(self, features: List[Dict[str, float]], targets: List[float]):
+        # Estado numérico do ajuste
+        self.feature_mean: Optional[np.ndarray] = None
+        self.feature_scale: Optional[np.ndarray] = None
+        self.coef: Optional[np.ndarray] = None
+        self.covariance: Optional[np.ndarray] = None
+        self.residual_std = 0.0
+        self.n_samples = 0
+        self.trained_at: Optional[str] = None
+        
+    def _to_matrix(self, features: List[Dict[str, float]]) -> np.ndarray:
+        """Empacota features na ordem fixa do modelo"""
+        names = self.feature_names
+        return np.array(
+            [[float(f.get(name, 0.0)) for name in names] for f in features],
+            dtype=np.float64
+        ).reshape(len(features), len(names))
+        
+    def train(self, features: List[Dict[str, float]], targets: List[float], feature_names: List[str] = None):
         """Treina o modelo com dados históricos"""
         if not features or not targets:
             return
             
-        # Inicializar pesos
-        feature_names = list(features[0].keys())
-        self.weights = {name: random.uniform(-0.1, 0.1) for name in feature_names}
-        self.bias = random.uniform(-0.1, 0.1)
-        
-        # Gradient descent simplificado
-        learning_rate = 0.01
-        epochs = 100
-        
-        for _ in range(epochs):
-            for i, (feature_dict, target) in enumerate(zip(features, targets)):
-                prediction = self._predict_single(feature_dict)
-                error = target - prediction
-                
-                # Atualizar pesos
-                for name, value in feature_dict.items():
-                    self.weights[name] += learning_rate * error * value
-                self.bias += learning_rate * error
-                
+        self.feature_names = list(feature_names) if feature_names else sorted(set().union(*features))
+        X = self._to_matrix(features)
+        y = np.asarray(targets, dtype=np.float64)
+        n, p = X.shape
+        
+        # Padronizar colunas (colunas constantes ficam zeradas)
+        self.feature_mean = X.mean(axis=0)
+        scale = X.std(axis=0)
+        scale[scale == 0] = 1.0
+        self.feature_scale = scale
+        Z = (X - self.feature_mean) / scale
+        y_mean = y.mean()
+        
+        # Ridge em forma fechada; intercepto não penalizado
+        gram = Z.T @ Z + self.l2 * np.eye(p)
+        try:
+            self.covariance = np.linalg.inv(gram)
+        except np.linalg.LinAlgError:
+            self.covariance = np.linalg.pinv(gram)
+        self.coef = self.covariance @ (Z.T @ (y - y_mean))
+        
+        # Pesos na escala original (compatível com _predict_single)
+        original = self.coef / scale
+        self.weights = dict(zip(self.feature_names, original.tolist()))
+        self.bias = float(y_mean - original @ self.feature_mean)
+        
+        # Resíduos
+        residuals = y - (Z @ self.coef + y_mean)
+        sse = float(residuals @ residuals)
+        dof = n - p - 1
+        self.residual_std = math.sqrt(sse / dof) if dof > 0 else math.sqrt(sse / n)
+        sst = float(((y - y_mean) ** 2).sum())
+        r2 = 1 - sse / sst if sst > 0 else 1.0
+        self.accuracy_history.append(round(r2, 4))
+        
+        self.n_samples = n
+        self.trained_at = datetime.now().isoformat()
         self.trained = True
         
     def _predict_single(self, features: Dict[str, float]) -> float:
@@ -233,18 +289,83 @@ class PredictiveModel:
             result += self.weights.get(name, 0) * value
         return result
     
-    def predict(self, features: Dict[str, float], confidence_level: float = 0.95) -> Tuple[float, Tuple[float, float]]:
-        """Faz predição com intervalo de confiança"""
-        prediction = self._predict_single(features)
-        
-        # Calcular intervalo de confiança baseado na variância histórica
-        std_error = 0.1 * abs(prediction) if prediction != 0 else 1.0
+    def predict_batch(
+        self,
+        features: List[Dict[str, float]],
+        confidence_level: float = 0.95
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Predição vetorizada: (previsões, limite inferior, limite superior)"""
+        X = self._to_matrix(features)
+        Z = (X - self.feature_mean) / self.feature_scale
+        predictions = Z @ self.coef + (self.bias + (self.coef / self.feature_scale) @ self.feature_mean)
+        
+        # Erro de previsão: ruído residual + incerteza dos coeficientes
+        leverage = np.einsum("ij,jk,ik->i", Z, self.covariance, Z) + 1.0 / max(self.n_samples, 1)
+        std_error = self.residual_std * np.sqrt(1.0 + leverage)
         z_score = 1.96 if confidence_level == 0.95 else 1.645
-        
         margin = z_score * std_error
-        confidence_interval = (prediction - margin, prediction + margin)
         
-        return prediction, confidence_interval
+        return predictions, predictions - margin, predictions + margin
+    
+    def predict(self, features: Dict[str, float], confidence_level: float = 0.95) -> Tuple[float, Tuple[float, float]]:
+        """Faz predição com intervalo de confiança"""
+        if self.coef is None:
+            prediction = self._predict_single(features)
+            std_error = 0.1 * abs(prediction) if prediction != 0 else 1.0
+            z_score = 1.96 if confidence_level == 0.95 else 1.645
+            margin = z_score * std_error
+            return prediction, (prediction - margin, prediction + margin)
+            
+        predictions, lower, upper = self.predict_batch([features], confidence_level)
+        return float(predictions[0]), (float(lower[0]), float(upper[0]))
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializa o modelo ajustado"""
+        return {
+            "metric": self.metric.value,
+            "l2": self.l2,
+            "feature_names": self.feature_names,
+            "weights": self.weights,
+            "bias": self.bias,
+            "feature_mean": self.feature_mean.tolist() if self.feature_mean is not None else None,
+            "feature_scale": self.feature_scale.tolist() if self.feature_scale is not None else None,
+            "coef": self.coef.tolist() if self.coef is not None else None,
+            "covariance": self.covariance.tolist() if self.covariance is not None else None,
+            "residual_std": self.residual_std,
+            "n_samples": self.n_samples,
+            "accuracy_history": self.accuracy_history,
+            "trained_at": self.trained_at,
+            "trained": self.trained
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PredictiveModel":
+        """Reconstrói um modelo serializado"""
+        model = cls(PredictionType(data["metric"]), l2=data.get("l2", 1e-3))
+        model.feature_names = data.get("feature_names", [])
+        model.weights = data.get("weights", {})
+        model.bias = data.get("bias", 0.0)
+        for attr in ("feature_mean", "feature_scale", "coef", "covariance"):
+            value = data.get(attr)
+            setattr(model, attr, np.asarray(value, dtype=np.float64) if value is not None else None)
+        model.residual_std = data.get("residual_std", 0.0)
+        model.n_samples = data.get("n_samples", 0)
+        model.accuracy_history = data.get("accuracy_history", [])
+        model.trained_at = data.get("trained_at")
+        model.trained = data.get("trained", False)
+        return model
+    
+    def save(self, path: str):
+        """Salva o modelo em JSON"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+            
+    @classmethod
+    def load(cls, path: str) -> "PredictiveModel":
+        """Carrega um modelo salvo com save()"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
 
 
 class PredictiveAnalyticsEngine:
@@ -253,21 +374,67 @@ class PredictiveAnalyticsEngine:
     Coordena modelos de ML para previsões de campanhas
     """
     
-    def __init__(self):
+    ANOMALY_METRICS = ["ctr", "cpc", "cpa", "roas", "conversion_rate"]
+    
+    # Ordem fixa das colunas da matriz de features
+    FEATURE_NAMES = [
+        "daily_budget", "bid_amount", "audience_size", "days_running",
+        "creative_count", "historical_ctr", "historical_cvr", "competition_level",
+        "seasonality_factor", "day_of_week", "hour_of_day"
+    ]
+    
+    def __init__(self, models_dir: str = "data/models"):
+        self.models_dir = models_dir
         self.models: Dict[PredictionType, PredictiveModel] = {}
         self.time_series_analyzer = TimeSeriesAnalyzer()
         self.predictions_cache: Dict[str, List[Prediction]] = {}
         self.anomaly_alerts: List[AnomalyAlert] = []
         self.feature_importance: Dict[str, float] = {}
         
+        # Registro + cache de predições (criado sob demanda)
+        self._prediction_service = None
+        
         # Inicializar modelos
         self._initialize_models()
         
+    @property
+    def anomaly_detector(self):
+        """Detector de anomalias compartilhado (cria a tabela de estado no primeiro uso)"""
+        return get_anomaly_detector()
+    
+    @property
+    def prediction_service(self):
+        """Serviço de predição com os modelos atuais registrados"""
+        if self._prediction_service is None:
+            self._prediction_service = get_prediction_service()
+            self._register_models()
+        return self._prediction_service
+    
+    @staticmethod
+    def _registry_name(metric: PredictionType) -> str:
+        return f"predictive_{metric.value}"
+    
+    def _register_models(self):
+        """Registra a versão atual de cada modelo (nova versão = cache novo)"""
+        if self._prediction_service is None:
+            return
+        for metric, model in self.models.items():
+            fingerprint = feature_hash(model.to_dict()) if model.trained else "heuristic"
+            metadata = {"trained": model.trained, "samples": model.n_samples, "trained_at": model.trained_at}
+            self._prediction_service.registry.register(self._registry_name(metric), fingerprint, metadata, model)
+        
     def _initialize_models(self):
         """Inicializa modelos preditivos"""
         for pred_type in PredictionType:
             self.models[pred_type] = PredictiveModel(pred_type)
             
+        # Modelos ajustados anteriormente (se houver)
+        if os.path.isdir(self.models_dir):
+            try:
+                self.load_models()
+            except Exception as e:
+                logger.error(f"Erro ao carregar modelos salvos: {e}")
+            
         logger.info(f"Predictive Analytics Engine inicializado com {len(self.models)} modelos")
         
     def ingest_historical_data(self, campaign_id: str, data: List[Dict[str, Any]]):
@@ -282,7 +449,64 @@ class PredictiveAnalyticsEngine:
                         record[metric],
                         timestamp
                     )
+            
+            # Estado incremental usado por detect_anomalies
+            for metric in self.ANOMALY_METRICS:
+                if metric in record:
+                    self.anomaly_detector.update(campaign_id, metric, record[metric], timestamp)
+        
+        self.anomaly_detector.maybe_flush()
                     
+    def train_models(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Treina os modelos com o histórico de campanhas.
+        
+        Args:
+            records: Dados de campanha (mesmos campos de predict_metric) com o
+                valor observado de cada métrica alvo (revenue, roas, ...)
+        
+        Returns:
+            Resumo do treinamento por métrica
+        """
+        features = [self._extract_features(record) for record in records]
+        summary = {}
+        
+        for metric, model in self.models.items():
+            rows = [(f, r[metric.value]) for f, r in zip(features, records) if metric.value in r]
+            if len(rows) < 2:
+                continue
+            model.train([f for f, _ in rows], [t for _, t in rows], feature_names=self.FEATURE_NAMES)
+            summary[metric.value] = {
+                "samples": model.n_samples,
+                "r2": model.accuracy_history[-1],
+                "residual_std": round(model.residual_std, 4)
+            }
+            
+        self._register_models()
+        return summary
+    
+    def save_models(self, directory: str = None) -> int:
+        """Salva os modelos treinados (um JSON por métrica)"""
+        directory = directory or self.models_dir
+        saved = 0
+        for metric, model in self.models.items():
+            if model.trained:
+                model.save(os.path.join(directory, f"{metric.value}.json"))
+                saved += 1
+        return saved
+    
+    def load_models(self, directory: str = None) -> int:
+        """Carrega modelos salvos com save_models()"""
+        directory = directory or self.models_dir
+        loaded = 0
+        for metric in PredictionType:
+            path = os.path.join(directory, f"{metric.value}.json")
+            if os.path.exists(path):
+                self.models[metric] = PredictiveModel.load(path)
+                loaded += 1
+        self._register_models()
+        return loaded
+    
     def _extract_features(self, campaign_data: Dict[str, Any]) -> Dict[str, float]:
         """Extrai features para predição"""
         features = {
@@ -319,20 +543,67 @@ class PredictiveAnalyticsEngine:
         metric: PredictionType,
         horizon: TimeHorizon = TimeHorizon.NEXT_DAY
     ) -> Prediction:
-        """Gera predição para uma métrica específica"""
+        """Gera predição para uma métrica específica (memoizada por features + versão do modelo)"""
+        return self.predict_metric_batch([campaign_data], metric, horizon)[0]
+    
+    def predict_metric_batch(
+        self,
+        campaigns: List[Dict[str, Any]],
+        metric: PredictionType,
+        horizon: TimeHorizon = None
+    ) -> List[Prediction]:
+        """Gera predições de uma métrica para várias campanhas"""
+        horizon = horizon or TimeHorizon.NEXT_DAY
+        features_list = [self._extract_features(c) for c in campaigns]
+        trends = [
+            self.time_series_analyzer.calculate_trend(f"{c.get('id', '')}_{metric.value}")
+            for c in campaigns
+        ]
+        keys = [
+            {
+                "features": features,
+                "current_value": c.get(metric.value, 0),
+                "horizon": horizon.value,
+                "trend": trend.value
+            }
+            for c, features, trend in zip(campaigns, features_list, trends)
+        ]
+        
+        def compute(missing: List[int]) -> List[Prediction]:
+            return self._compute_predictions(
+                [campaigns[i] for i in missing],
+                metric,
+                horizon,
+                [features_list[i] for i in missing],
+                [trends[i] for i in missing]
+            )
         
-        features = self._extract_features(campaign_data)
+        return self.prediction_service.cached_many(
+            self._registry_name(metric),
+            keys,
+            compute,
+            [c.get("id") for c in campaigns]
+        )
+    
+    def _compute_predictions(
+        self,
+        campaigns: List[Dict[str, Any]],
+        metric: PredictionType,
+        horizon: TimeHorizon,
+        features_list: List[Dict[str, float]],
+        trends: List[TrendDirection]
+    ) -> List[Prediction]:
+        """Calcula predições sem cache; modelos treinados prevêem o lote de uma vez"""
         model = self.models.get(metric)
         
-        current_value = campaign_data.get(metric.value, 0)
-        
-        # Se modelo não treinado, usar heurísticas
-        if not model.trained:
-            # Predição baseada em tendência e sazonalidade
-            trend = self.time_series_analyzer.calculate_trend(
-                f"{campaign_data.get('id', '')}_{metric.value}"
-            )
-            
+        if model.trained:
+            values, lower, upper = model.predict_batch(features_list)
+            estimates = [
+                (float(v), (float(lo), float(hi)), 0.85)
+                for v, lo, hi in zip(values, lower, upper)
+            ]
+        else:
+            # Se modelo não treinado, usar heurísticas
             trend_multipliers = {
                 TrendDirection.STRONG_UP: 1.15,
                 TrendDirection.UP: 1.05,
@@ -349,37 +620,32 @@ class PredictiveAnalyticsEngine:
                 TimeHorizon.NEXT_QUARTER: 90
             }
             
-            base_prediction = current_value * trend_multipliers[trend]
-            predicted_value = base_prediction * horizon_multipliers[horizon]
-            
-            # Adicionar variação baseada em sazonalidade
+            # Variação baseada em sazonalidade
             seasonality = self._get_seasonality_factor()
-            predicted_value *= seasonality
-            
-            confidence = 0.7
-            margin = predicted_value * 0.15
-            confidence_interval = (predicted_value - margin, predicted_value + margin)
+            estimates = []
+            for campaign_data, trend in zip(campaigns, trends):
+                base_prediction = campaign_data.get(metric.value, 0) * trend_multipliers[trend]
+                predicted_value = base_prediction * horizon_multipliers[horizon] * seasonality
+                margin = predicted_value * 0.15
+                estimates.append((predicted_value, (predicted_value - margin, predicted_value + margin), 0.7))
+        
+        predictions = []
+        for campaign_data, trend, (predicted_value, confidence_interval, confidence) in zip(campaigns, trends, estimates):
+            # Identificar fatores influenciadores
+            factors = self._identify_prediction_factors(campaign_data, metric, predicted_value)
             
-        else:
-            predicted_value, confidence_interval = model.predict(features)
-            confidence = 0.85
-            trend = self.time_series_analyzer.calculate_trend(
-                f"{campaign_data.get('id', '')}_{metric.value}"
-            )
+            predictions.append(Prediction(
+                metric=metric,
+                current_value=campaign_data.get(metric.value, 0),
+                predicted_value=max(0, predicted_value),  # Não permitir valores negativos
+                confidence=confidence,
+                confidence_interval=(max(0, confidence_interval[0]), max(0, confidence_interval[1])),
+                time_horizon=horizon,
+                trend=trend,
+                factors=factors
+            ))
         
-        # Identificar fatores influenciadores
-        factors = self._identify_prediction_factors(campaign_data, metric, predicted_value)
-        
-        return Prediction(
-            metric=metric,
-            current_value=current_value,
-            predicted_value=max(0, predicted_value),  # Não permitir valores negativos
-            confidence=confidence,
-            confidence_interval=(max(0, confidence_interval[0]), max(0, confidence_interval[1])),
-            time_horizon=horizon,
-            trend=trend,
-            factors=factors
-        )
+        return predictions
     
     def _identify_prediction_factors(
         self,
@@ -458,31 +724,21 @@ class PredictiveAnalyticsEngine:
         return predictions
     
     def detect_anomalies(self, campaign_data: Dict[str, Any]) -> List[AnomalyAlert]:
-        """Detecta anomalias nos dados da campanha"""
+        """Detecta anomalias nos dados da campanha (contra o estado incremental)"""
         alerts = []
         campaign_id = campaign_data.get("id", "")
         
-        metrics_to_check = ["ctr", "cpc", "cpa", "roas", "conversion_rate"]
-        
-        for metric in metrics_to_check:
+        for metric in self.ANOMALY_METRICS:
             current_value = campaign_data.get(metric, 0)
             
-            # Calcular média e desvio padrão históricos
-            history_key = f"{campaign_id}_{metric}"
-            history = self.time_series_analyzer.history.get(history_key, [])
-            
-            if len(history) < 7:
-                continue
-                
-            values = [v for _, v in history]
-            mean = sum(values) / len(values)
-            variance = sum((v - mean) ** 2 for v in values) / len(values)
-            std_dev = variance ** 0.5
-            
-            if std_dev == 0:
+            # Média e desvio vêm do estado online, sem reprocessar o histórico
+            scored = self.anomaly_detector.score(campaign_id, metric, current_value, min_points=7)
+            if not scored:
                 continue
                 
-            z_score = (current_value - mean) / std_dev
+            mean = scored["expected"]
+            std_dev = scored["std_dev"]
+            z_score = scored["z_score"]
             
             if abs(z_score) > 3:
                 severity = "critical"
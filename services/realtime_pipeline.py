@@ -12,6 +12,17 @@ from collections import deque
 import threading
 import time
 
+try:
+    from services.webhook_dispatcher import get_dispatcher
+except ImportError:
+    from webhook_dispatcher import get_dispatcher
+
+try:
+    from services.streaming_anomaly_detector import get_anomaly_detector
+except ImportError:
+    from streaming_anomaly_detector import get_anomaly_detector
+
+
 class RealtimePipeline:
     """Pipeline de dados em tempo real."""
     
@@ -106,6 +117,9 @@ class RealtimePipeline:
         # Agregar dados
         self._aggregate_data(data_type, data)
         
+        # Checar anomalias a cada ingestao de metricas (O(1) por metrica)
+        anomalies = self._detect_anomalies(data_type, data)
+        
         # Disparar webhooks se configurados
         self._trigger_webhooks(data_type, data)
         
@@ -113,6 +127,7 @@ class RealtimePipeline:
             "status": "ingested",
             "data_type": data_type,
             "processed": processed,
+            "anomalies": anomalies,
             "buffer_size": len(self.data_buffers.get(data_type, []))
         }
     
@@ -230,13 +245,15 @@ class RealtimePipeline:
             "data_types": data_types
         }
     
-    def configure_webhook(self, webhook_id: str, url: str, events: List[str], filters: Dict = None) -> Dict[str, Any]:
-        """Configura um webhook."""
+    def configure_webhook(self, webhook_id: str, url: str, events: List[str], filters: Dict = None,
+                          batch: bool = False) -> Dict[str, Any]:
+        """Configura um webhook (batch=True: aceita vários eventos por POST)."""
         
         self.webhooks[webhook_id] = {
             "url": url,
             "events": events,
             "filters": filters or {},
+            "batch": batch,
             "created_at": datetime.now().isoformat(),
             "calls_made": 0,
             "last_call": None
@@ -357,6 +374,30 @@ class RealtimePipeline:
         # Limpar agregados antigos (manter apenas ultimas 24h)
         self._cleanup_old_aggregates()
     
+    def _detect_anomalies(self, data_type: str, data: Dict) -> List[Dict]:
+        """Pontua as metricas recebidas contra o estado incremental da campanha."""
+        
+        if data_type != "metrics" or "campaign_id" not in data:
+            return []
+        
+        metrics = {k: v for k, v in data.items() if k not in ("campaign_id", "timestamp")}
+        
+        try:
+            anomalies = get_anomaly_detector().ingest(data["campaign_id"], metrics, data.get("timestamp"))
+        except Exception:
+            self.pipeline_status["errors"] += 1
+            return []
+        
+        for anomaly in anomalies:
+            self.data_buffers["alerts"].append({
+                "type": "anomaly",
+                "campaign_id": data["campaign_id"],
+                "timestamp": data["timestamp"],
+                **anomaly
+            })
+        
+        return anomalies
+    
     def _cleanup_old_aggregates(self):
         """Limpa agregados antigos."""
         cutoff = datetime.now() - timedelta(hours=24)
@@ -368,15 +409,26 @@ class RealtimePipeline:
                 del self.aggregators[interval][key]
     
     def _trigger_webhooks(self, data_type: str, data: Dict):
-        """Dispara webhooks configurados."""
+        """Dispara webhooks configurados (entrega em background via outbox)."""
         
+        endpoints = []
         for webhook_id, webhook in self.webhooks.items():
             if data_type in webhook["events"]:
                 # Aplicar filtros
                 if self._apply_filters(data, webhook["filters"]):
-                    # Em producao, faria chamada HTTP real
+                    endpoints.append({
+                        "url": webhook["url"], "webhook_id": webhook_id, "batch": webhook.get("batch", False)
+                    })
                     webhook["calls_made"] += 1
                     webhook["last_call"] = datetime.now().isoformat()
+        
+        if not endpoints:
+            return
+        
+        try:
+            get_dispatcher().enqueue(data_type, data, endpoints, source="realtime_pipeline")
+        except Exception:
+            self.pipeline_status["errors"] += 1
     
     def _apply_filters(self, data: Dict, filters: Dict) -> bool:
         """Aplica filtros aos dados."""
@@ -16,6 +16,11 @@ try:
 except ImportError:
     from db_utils import get_db_connection, sql_param, is_postgres
 
+try:
+    from services.budget_allocator import get_budget_allocator, fit_response_curves
+except ImportError:
+    from budget_allocator import get_budget_allocator, fit_response_curves
+
 
 
 class RemoteControlService:
@@ -263,8 +268,42 @@ class RemoteControlService:
         })
     
     def _action_optimize_budget(self, params: Dict) -> Dict:
-        """Otimiza orçamento baseado em performance"""
-        # Implementação simplificada
+        """Otimiza orçamento baseado em performance
+        
+        Com `campaigns` + `total_budget`, redistribui o portfólio pelo
+        BudgetAllocator (mesmo otimizador do MLPredictionEngine).
+        """
+        campaigns = params.get('campaigns')
+        if campaigns:
+            total_budget = params.get('total_budget', sum(c.get('budget', 0) or 0 for c in campaigns))
+            current = [c.get('budget', 0) or 0 for c in campaigns]
+            revenue = [c.get('revenue', (c.get('budget', 0) or 0) * (c.get('roas', 0) or 0)) for c in campaigns]
+            a, k = fit_response_curves(current, revenue, [c.get('history') for c in campaigns])
+            result = get_budget_allocator().allocate(
+                total_budget, a, k,
+                current=current,
+                min_budget=[c.get('min_budget', 0) for c in campaigns],
+                max_budget=[c.get('max_budget', float('inf')) for c in campaigns],
+                max_step_change=params.get('max_step_change', 0.5)
+            )
+            return {
+                'success': True,
+                'optimization': {
+                    'total_budget': total_budget,
+                    'allocations': [
+                        {
+                            'campaign_id': c.get('campaign_id', c.get('id')),
+                            'current_budget': current[i],
+                            'suggested_budget': round(float(result.budgets[i]), 2)
+                        }
+                        for i, c in enumerate(campaigns)
+                    ],
+                    'unallocated': round(result.unallocated, 2),
+                    'marginal_roas': round(result.marginal_roas, 4)
+                }
+            }
+        
+        # Implementação simplificada (campanha única)
         return {
             'success': True,
             'optimization': {
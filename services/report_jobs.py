@@ -0,0 +1,539 @@
+"""
+📑 REPORT JOBS - Geração Assíncrona de Relatórios
+Nexora Prime
+
+Relatórios grandes rodam fora do request:
+- A API só registra o job e devolve o job_id
+- O worker agrega o resumo no próprio SQL
+- As linhas são lidas do cursor em blocos (server-side cursor no PostgreSQL)
+  e gravadas direto em arquivo CSV, NDJSON ou Parquet
+- O arquivo final é servido com suporte a Range (download retomável)
+
+Nada do resultado fica inteiro em memória, e o worker do gunicorn não
+espera a consulta terminar. O job em execução renova `heartbeat_at`; jobs
+órfãos (worker reiniciado no meio) são reenfileirados até MAX_JOB_ATTEMPTS
+tentativas:
+- Na inicialização: os em queued na hora e os em running sem heartbeat vivo
+- Na varredura periódica: running sem heartbeat e queued há mais de
+  STALE_JOB_SECONDS
+"""
+
+import os
+import csv
+import json
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+
+# Parquet é opcional (pyarrow)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+REPORT_QUERY = """
+    SELECT c.*, m.impressions, m.clicks, m.conversions, m.spend, m.revenue, m.roas
+    FROM campaigns c
+    LEFT JOIN campaign_metrics m ON c.id = m.campaign_id
+    WHERE c.created_at BETWEEN ? AND ?
+"""
+
+SUMMARY_QUERY = """
+    SELECT
+        COUNT(*) AS total_campaigns,
+        COALESCE(SUM(m.spend), 0) AS total_spend,
+        COALESCE(SUM(m.revenue), 0) AS total_revenue,
+        COALESCE(AVG(COALESCE(m.roas, 0)), 0) AS avg_roas
+    FROM campaigns c
+    LEFT JOIN campaign_metrics m ON c.id = m.campaign_id
+    WHERE c.created_at BETWEEN ? AND ?
+"""
+
+STALE_JOB_SECONDS = 3600  # job em queued há mais que isso ficou órfão (varredura periódica)
+HEARTBEAT_SECONDS = 10  # intervalo de renovação do heartbeat de um job em execução
+HEARTBEAT_TIMEOUT = 60  # job em running sem heartbeat há mais que isso ficou órfão
+SWEEP_INTERVAL = 60  # intervalo da varredura periódica de jobs órfãos
+MAX_JOB_ATTEMPTS = 3
+
+FORMAT_EXTENSIONS = {
+    "csv": "csv",
+    "ndjson": "ndjson",
+    "parquet": "parquet"
+}
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+
+class _CsvWriter:
+    def __init__(self, path: str, columns: List[str]):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.columns = columns
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.writer.writerows([[row.get(c) for c in self.columns] for row in rows])
+
+    def close(self):
+        self.file.close()
+
+
+class _NdjsonWriter:
+    def __init__(self, path: str, columns: List[str]):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self.file.writelines(json.dumps(row, default=str) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _ParquetWriter:
+    """Um row group por bloco; o schema é inferido do primeiro bloco"""
+
+    def __init__(self, path: str, columns: List[str]):
+        self.path = path
+        self.columns = columns
+        self.schema = None
+        self.writer = None
+
+    def write(self, rows: List[Dict[str, Any]]):
+        if self.schema is None:
+            inferred = pa.Table.from_pylist(rows).schema
+            # Colunas só com NULL no primeiro bloco viram texto
+            self.schema = pa.schema([
+                pa.field(f.name, pa.string() if pa.types.is_null(f.type) else f.type)
+                for f in inferred
+            ])
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        self.writer.write_table(pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        if self.writer is None:
+            # Relatório vazio: arquivo com as colunas e nenhuma linha
+            schema = pa.schema([pa.field(c, pa.string()) for c in self.columns])
+            pq.write_table(pa.Table.from_pylist([], schema=schema), self.path)
+        else:
+            self.writer.close()
+
+
+WRITERS = {
+    "csv": _CsvWriter,
+    "ndjson": _NdjsonWriter,
+    "parquet": _ParquetWriter
+}
+
+
+class ReportJobManager:
+    """
+    Fila de jobs de relatório executada num pool de threads.
+
+    O estado de cada job fica na tabela report_jobs, então qualquer worker
+    do gunicorn consegue responder ao status e ao download.
+    """
+
+    def __init__(self, output_dir: str = "data/reports", max_workers: int = 2, chunk_size: int = 1000):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._sweeper: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._init_database()
+        try:
+            self.recover_orphaned_jobs(startup=True)
+        except Exception as e:
+            print(f"[REPORT JOBS] ⚠️ Erro ao recuperar jobs órfãos: {e}")
+
+    def _init_database(self):
+        """Cria a tabela de jobs"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS report_jobs (
+                    id TEXT PRIMARY KEY,
+                    report_name TEXT NOT NULL,
+                    report_type TEXT NOT NULL,
+                    date_range_start TEXT,
+                    date_range_end TEXT,
+                    format TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    rows_written INTEGER DEFAULT 0,
+                    summary_json TEXT,
+                    file_path TEXT,
+                    file_size INTEGER,
+                    report_id INTEGER,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    heartbeat_at TEXT
+                )
+            """)
+            ensure_column(cursor, "report_jobs", "heartbeat_at", "TEXT")
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_report_jobs_status
+                ON report_jobs(status, created_at)
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[REPORT JOBS] ❌ Erro ao inicializar tabela: {e}")
+
+    # ===== API =====
+
+    def submit(
+        self,
+        date_range_start: str,
+        date_range_end: str,
+        report_name: str = "Relatório Personalizado",
+        report_type: str = "performance",
+        fmt: str = "csv"
+    ) -> str:
+        """
+        Registra um job e agenda a execução em background.
+
+        Returns:
+            str: ID do job
+        """
+        fmt = (fmt or "csv").lower()
+        if fmt not in WRITERS:
+            raise ValueError(f"Formato não suportado: {fmt}")
+        if fmt == "parquet" and not PYARROW_AVAILABLE:
+            raise ValueError("Formato parquet requer pyarrow instalado")
+
+        job_id = uuid.uuid4().hex
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO report_jobs (
+                    id, report_name, report_type, date_range_start, date_range_end,
+                    format, status, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?)
+            """), (job_id, report_name, report_type, date_range_start, date_range_end, fmt, datetime.now().isoformat()))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._get_executor().submit(self.run_job, job_id)
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Status do job (None se não existir)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("SELECT * FROM report_jobs WHERE id = ?"), (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(row) if isinstance(row, dict) else dict(zip([d[0] for d in cursor.description], row))
+        finally:
+            conn.close()
+
+        summary_json = job.pop("summary_json", None)
+        job["summary"] = json.loads(summary_json) if summary_json else None
+        return job
+
+    def list_jobs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                SELECT id, report_name, report_type, format, status, rows_written, file_size, created_at, finished_at
+                FROM report_jobs
+                ORDER BY created_at DESC
+                LIMIT ?
+            """), (limit,))
+            rows = cursor.fetchall()
+            columns = [d[0] for d in cursor.description]
+        finally:
+            conn.close()
+        return [dict(r) if isinstance(r, dict) else dict(zip(columns, r)) for r in rows]
+
+    def get_download(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Caminho, nome e MIME do arquivo de um job concluído"""
+        job = self.get_job(job_id)
+        if not job or job["status"] != "done" or not job.get("file_path") or not os.path.exists(job["file_path"]):
+            return None
+        return {
+            "path": job["file_path"],
+            "filename": f"report_{job_id}.{FORMAT_EXTENSIONS[job['format']]}",
+            "mimetype": MIME_TYPES[job["format"]]
+        }
+
+    # ===== EXECUÇÃO =====
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="report-job")
+        return self._executor
+
+    def _update_job(self, job_id: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(f"UPDATE report_jobs SET {assignments} WHERE id = ?"), (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _cutoff(seconds: float) -> str:
+        return (datetime.now() - timedelta(seconds=seconds)).isoformat()
+
+    def recover_orphaned_jobs(self, startup: bool = False) -> List[str]:
+        """
+        Reenfileira jobs órfãos (o worker que os tinha morreu); os que já
+        esgotaram as tentativas viram failed.
+
+        Args:
+            startup: Inicialização do processo - jobs em queued voltam na
+                hora (a fila em memória do processo anterior se perdeu)
+
+        Returns:
+            IDs reenfileirados
+        """
+        queued_cutoff = datetime.now().isoformat() if startup else self._cutoff(STALE_JOB_SECONDS)
+        orphaned = """(
+            (status = 'running' AND COALESCE(heartbeat_at, started_at, created_at) < ?)
+            OR (status = 'queued' AND created_at <= ?)
+        )"""
+        cutoffs = (self._cutoff(HEARTBEAT_TIMEOUT), queued_cutoff)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(f"""
+                UPDATE report_jobs SET status = 'failed', error = ?, finished_at = ?
+                WHERE {orphaned} AND attempts >= ?
+            """), ("Job interrompido (worker reiniciado) em todas as tentativas",
+                   datetime.now().isoformat(), *cutoffs, MAX_JOB_ATTEMPTS))
+            cursor.execute(sql_param(f"SELECT id FROM report_jobs WHERE {orphaned} ORDER BY created_at"), cutoffs)
+            job_ids = [row["id"] if isinstance(row, dict) else row[0] for row in cursor.fetchall()]
+            conn.commit()
+        finally:
+            conn.close()
+
+        for job_id in job_ids:
+            self._get_executor().submit(self.run_job, job_id)
+        if job_ids:
+            print(f"[REPORT JOBS] ♻️ {len(job_ids)} job(s) órfão(s) reenfileirado(s)")
+        return job_ids
+
+    def start_sweeper(self):
+        """Inicia a varredura periódica de jobs órfãos (idempotente)"""
+        if self._sweeper is not None:
+            return
+        with self._lock:
+            if self._sweeper is not None:
+                return
+
+            def run():
+                while not self._stop.wait(SWEEP_INTERVAL):
+                    try:
+                        self.recover_orphaned_jobs()
+                    except Exception as e:
+                        print(f"[REPORT JOBS] ⚠️ Erro na varredura de jobs órfãos: {e}")
+
+            self._sweeper = threading.Thread(target=run, name="report-job-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _claim_job(self, job_id: str) -> bool:
+        """Marca o job como running; falso se outro worker já o pegou"""
+        now = datetime.now().isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                UPDATE report_jobs SET status = 'running', started_at = ?, heartbeat_at = ?, attempts = attempts + 1
+                WHERE id = ? AND (
+                    status = 'queued'
+                    OR (status = 'running' AND COALESCE(heartbeat_at, started_at) < ?)
+                )
+            """), (now, now, job_id, self._cutoff(HEARTBEAT_TIMEOUT)))
+            claimed = cursor.rowcount > 0
+            conn.commit()
+        finally:
+            conn.close()
+        return claimed
+
+    @contextmanager
+    def _heartbeat(self, job_id: str):
+        """Renova heartbeat_at a cada HEARTBEAT_SECONDS enquanto o job roda"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(HEARTBEAT_SECONDS):
+                try:
+                    self._update_job(job_id, heartbeat_at=datetime.now().isoformat())
+                except Exception as e:
+                    print(f"[REPORT JOBS] ⚠️ Erro no heartbeat do job {job_id}: {e}")
+
+        thread = threading.Thread(target=beat, name=f"report-job-heartbeat-{job_id[:8]}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+
+    def run_job(self, job_id: str):
+        """Executa o job (chamado pelo pool; pode ser chamado direto)"""
+        if not self._claim_job(job_id):
+            return
+        job = self.get_job(job_id)
+
+        params = (job["date_range_start"], job["date_range_end"])
+        os.makedirs(self.output_dir, exist_ok=True)
+        final_path = os.path.join(self.output_dir, f"{job_id}.{FORMAT_EXTENSIONS[job['format']]}")
+        tmp_path = final_path + ".part"
+
+        try:
+            with self._heartbeat(job_id):
+                summary = self._compute_summary(params)
+                rows_written = self._export_rows(params, job["format"], tmp_path)
+            os.replace(tmp_path, final_path)
+
+            report_id = self._save_report(job, summary, final_path)
+            self._update_job(
+                job_id,
+                status="done",
+                rows_written=rows_written,
+                summary_json=json.dumps(summary),
+                file_path=final_path,
+                file_size=os.path.getsize(final_path),
+                report_id=report_id,
+                finished_at=datetime.now().isoformat()
+            )
+            print(f"[REPORT JOBS] ✅ Job {job_id} concluído ({rows_written} linhas)")
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._update_job(job_id, status="failed", error=str(e), finished_at=datetime.now().isoformat())
+            print(f"[REPORT JOBS] ❌ Job {job_id} falhou: {e}")
+
+    def _compute_summary(self, params: tuple) -> Dict[str, Any]:
+        """Resumo calculado pelo banco (sem trazer as linhas)"""
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(SUMMARY_QUERY), params)
+            row = cursor.fetchone()
+            if not isinstance(row, dict):
+                row = dict(zip([d[0] for d in cursor.description], row))
+        finally:
+            conn.close()
+
+        return {
+            "total_campaigns": int(row["total_campaigns"] or 0),
+            "total_spend": float(row["total_spend"] or 0),
+            "total_revenue": float(row["total_revenue"] or 0),
+            "avg_roas": float(row["avg_roas"] or 0)
+        }
+
+    def _export_rows(self, params: tuple, fmt: str, path: str) -> int:
+        """Lê o cursor em blocos e grava cada bloco no arquivo"""
+        conn = get_db_connection()
+        writer = None
+        total = 0
+        try:
+            # No PostgreSQL um cursor nomeado mantém o resultado no servidor
+            cursor = conn.cursor(name="report_export") if is_postgres() else conn.cursor()
+            if is_postgres():
+                cursor.itersize = self.chunk_size
+            cursor.execute(sql_param(REPORT_QUERY), params)
+
+            columns = None
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if columns is None:
+                    columns = [d[0] for d in cursor.description]
+                    writer = WRITERS[fmt](path, columns)
+                if not rows:
+                    break
+                if not isinstance(rows[0], dict):
+                    rows = [dict(zip(columns, r)) for r in rows]
+                else:
+                    rows = [dict(r) for r in rows]
+                writer.write(rows)
+                total += len(rows)
+        finally:
+            if writer is not None:
+                writer.close()
+            conn.close()
+
+        return total
+
+    def _save_report(self, job: Dict[str, Any], summary: Dict[str, Any], file_path: str) -> Optional[int]:
+        """Registra o relatório em `reports` (só resumo + referência ao arquivo)"""
+        data_json = json.dumps({
+            "summary": summary,
+            "job_id": job["id"],
+            "format": job["format"],
+            "file": os.path.basename(file_path)
+        })
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            query = """
+                INSERT INTO reports (report_name, report_type, date_range_start, date_range_end, data_json)
+                VALUES (?, ?, ?, ?, ?)
+            """
+            values = (job["report_name"], job["report_type"], job["date_range_start"], job["date_range_end"], data_json)
+            if is_postgres():
+                cursor.execute(sql_param(query + " RETURNING id"), values)
+                row = cursor.fetchone()
+                report_id = row["id"] if isinstance(row, dict) else row[0]
+            else:
+                cursor.execute(query, values)
+                report_id = cursor.lastrowid
+            conn.commit()
+            return report_id
+        finally:
+            conn.close()
+
+
+# Instância global do gerenciador
+_manager_instance: Optional[ReportJobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_report_job_manager() -> ReportJobManager:
+    """
+    Retorna instância global do gerenciador de jobs (singleton)
+
+    Returns:
+        ReportJobManager: Instância do gerenciador
+    """
+    global _manager_instance
+
+    if _manager_instance is None:
+        with _manager_lock:
+            if _manager_instance is None:
+                _manager_instance = ReportJobManager()
+                _manager_instance.start_sweeper()
+
+    return _manager_instance
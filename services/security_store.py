@@ -0,0 +1,304 @@
+"""
+🔐 SECURITY STORE - Estado de Segurança Compartilhado
+Nexora Prime
+
+Backend do EnterpriseSecurity, compartilhado entre os workers:
+- Sessões: uma linha por sessão, chave = SHA-256 do token (o token em si
+  nunca é gravado); validação é uma busca pela chave primária. Expiração
+  por TTL com índice em `expires_at` e limpeza periódica das expiradas
+- Auditoria: log só de inserção (`security_audit_log`) com índices por
+  usuário, ação e tempo; consultas filtradas e contagens no SQL
+- Consentimentos LGPD/GDPR: uma linha por (usuário, tipo)
+- Credenciais: hash de senha por usuário (`security_credentials`); o
+  rehash do login só grava se o hash não mudou desde a leitura
+"""
+
+import json
+import time
+import hashlib
+import secrets
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, get_db_connection_with_dict, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, get_db_connection_with_dict, sql_param, is_postgres
+
+
+PURGE_INTERVAL_SECONDS = 60.0
+AUDIT_PAGE_SIZE = 100
+
+
+def hash_session_token(session_id: str) -> str:
+    return hashlib.sha256(session_id.encode()).hexdigest()
+
+
+class SecurityStore:
+    """Sessões com TTL, log de auditoria indexado, consentimentos e credenciais"""
+
+    def __init__(self):
+        self._last_purge = 0.0
+        self._purge_lock = threading.Lock()
+        self._init_tables()
+
+    def _init_tables(self):
+        id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS security_sessions (
+                    token_hash TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    is_active INTEGER NOT NULL DEFAULT 1,
+                    invalidated_at TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_security_sessions_expires ON security_sessions (expires_at)"
+            )
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS security_audit_log (
+                    {id_column},
+                    log_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    user_id TEXT,
+                    details TEXT
+                )
+            """)
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_security_audit_user ON security_audit_log (user_id, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_security_audit_action ON security_audit_log (action, id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_security_audit_time ON security_audit_log (timestamp)"
+            )
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS security_consents (
+                    user_id TEXT NOT NULL,
+                    consent_type TEXT NOT NULL,
+                    granted INTEGER NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    ip_address TEXT,
+                    user_agent TEXT,
+                    version TEXT,
+                    PRIMARY KEY (user_id, consent_type)
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS security_credentials (
+                    user_id TEXT PRIMARY KEY,
+                    password_hash TEXT NOT NULL,
+                    changed_at TEXT NOT NULL
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[SECURITY STORE] ❌ Erro ao criar tabelas: {e}")
+
+    def _execute(self, query: str, params: tuple = ()) -> int:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            conn.commit()
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def _fetch(self, query: str, params: tuple = ()) -> List[Dict[str, Any]]:
+        conn = get_db_connection_with_dict()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(query), params)
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+    # ===== SESSÕES =====
+
+    def create_session(self, session_id: str, user_id: str, ttl_seconds: float,
+                       metadata: Optional[Dict] = None) -> float:
+        """Grava a sessão; retorna o epoch de expiração"""
+        expires_at = time.time() + ttl_seconds
+        self._execute("""
+            INSERT INTO security_sessions (token_hash, user_id, created_at, expires_at, ip_address, user_agent, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+        """, (
+            hash_session_token(session_id), user_id, datetime.now().isoformat(), expires_at,
+            metadata.get("ip_address") if metadata else None,
+            metadata.get("user_agent") if metadata else None
+        ))
+        self.purge_expired()
+        return expires_at
+
+    def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Sessão pela chave primária (hash do token)"""
+        rows = self._fetch(
+            "SELECT user_id, expires_at, is_active FROM security_sessions WHERE token_hash = ?",
+            (hash_session_token(session_id),)
+        )
+        return rows[0] if rows else None
+
+    def invalidate_session(self, session_id: str) -> Optional[str]:
+        """Desativa a sessão; retorna o user_id (None se não existe)"""
+        session = self.get_session(session_id)
+        if session is None:
+            return None
+        self._execute(
+            "UPDATE security_sessions SET is_active = 0, invalidated_at = ? WHERE token_hash = ?",
+            (datetime.now().isoformat(), hash_session_token(session_id))
+        )
+        return session["user_id"]
+
+    def purge_expired(self, force: bool = False) -> int:
+        """Remove sessões expiradas (no máximo a cada PURGE_INTERVAL_SECONDS)"""
+        now = time.time()
+        with self._purge_lock:
+            if not force and now - self._last_purge < PURGE_INTERVAL_SECONDS:
+                return 0
+            self._last_purge = now
+        return self._execute("DELETE FROM security_sessions WHERE expires_at < ?", (now,))
+
+    # ===== AUDITORIA =====
+
+    def append_audit(self, action: str, user_id: str, details: Optional[Dict] = None) -> Dict[str, Any]:
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "action": action,
+            "user_id": user_id,
+            "details": details or {},
+            "log_id": secrets.token_hex(8)
+        }
+        self._execute("""
+            INSERT INTO security_audit_log (log_id, timestamp, action, user_id, details)
+            VALUES (?, ?, ?, ?, ?)
+        """, (entry["log_id"], entry["timestamp"], action, user_id,
+              json.dumps(entry["details"], ensure_ascii=False, default=str)))
+        return entry
+
+    @staticmethod
+    def _audit_where(filters: Optional[Dict]) -> tuple:
+        clauses, params = [], []
+        if filters:
+            if filters.get("user_id"):
+                clauses.append("user_id = ?")
+                params.append(filters["user_id"])
+            if filters.get("action"):
+                clauses.append("action = ?")
+                params.append(filters["action"])
+            if filters.get("from_date"):
+                clauses.append("timestamp >= ?")
+                params.append(datetime.fromisoformat(filters["from_date"]).isoformat())
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, tuple(params)
+
+    def count_audit(self, filters: Optional[Dict] = None) -> int:
+        where, params = self._audit_where(filters)
+        rows = self._fetch(f"SELECT COUNT(*) AS total FROM security_audit_log{where}", params)
+        return int(rows[0]["total"])
+
+    def recent_audit(self, filters: Optional[Dict] = None, limit: int = AUDIT_PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Últimos `limit` logs que casam com os filtros, em ordem cronológica"""
+        where, params = self._audit_where(filters)
+        rows = self._fetch(
+            f"SELECT log_id, timestamp, action, user_id, details FROM security_audit_log{where} "
+            f"ORDER BY id DESC LIMIT ?",
+            params + (limit,)
+        )
+        rows.reverse()
+        return [{
+            "timestamp": row["timestamp"],
+            "action": row["action"],
+            "user_id": row["user_id"],
+            "details": json.loads(row["details"]) if row["details"] else {},
+            "log_id": row["log_id"]
+        } for row in rows]
+
+    def anonymize_audit(self, user_id: str, pseudonym: str) -> int:
+        """
+        Única alteração permitida no log: trocar o user_id por um pseudônimo
+        (direito ao esquecimento - LGPD/GDPR)
+        """
+        return self._execute("UPDATE security_audit_log SET user_id = ? WHERE user_id = ?", (pseudonym, user_id))
+
+    # ===== CONSENTIMENTOS =====
+
+    def save_consent(self, user_id: str, consent_type: str, consent: Dict[str, Any]):
+        self._execute("""
+            INSERT INTO security_consents (user_id, consent_type, granted, timestamp, ip_address, user_agent, version)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, consent_type) DO UPDATE SET
+                granted = excluded.granted, timestamp = excluded.timestamp, ip_address = excluded.ip_address,
+                user_agent = excluded.user_agent, version = excluded.version
+        """, (user_id, consent_type, 1 if consent["granted"] else 0, consent["timestamp"],
+              consent["ip_address"], consent["user_agent"], consent["version"]))
+
+    def get_consents(self, user_id: str) -> Dict[str, Dict[str, Any]]:
+        rows = self._fetch("""
+            SELECT consent_type, granted, timestamp, ip_address, user_agent, version
+            FROM security_consents WHERE user_id = ?
+        """, (user_id,))
+        return {
+            row["consent_type"]: {
+                "granted": bool(row["granted"]),
+                "timestamp": row["timestamp"],
+                "ip_address": row["ip_address"],
+                "user_agent": row["user_agent"],
+                "version": row["version"]
+            }
+            for row in rows
+        }
+
+    def delete_consents(self, user_id: str) -> int:
+        return self._execute("DELETE FROM security_consents WHERE user_id = ?", (user_id,))
+
+    def count_consent_users(self) -> int:
+        rows = self._fetch("SELECT COUNT(DISTINCT user_id) AS total FROM security_consents")
+        return int(rows[0]["total"])
+
+    def consent_breakdown(self) -> Dict[str, Dict[str, int]]:
+        rows = self._fetch("""
+            SELECT consent_type,
+                   SUM(CASE WHEN granted = 1 THEN 1 ELSE 0 END) AS granted,
+                   SUM(CASE WHEN granted = 1 THEN 0 ELSE 1 END) AS denied
+            FROM security_consents GROUP BY consent_type
+        """)
+        return {row["consent_type"]: {"granted": int(row["granted"]), "denied": int(row["denied"])} for row in rows}
+
+    # ===== CREDENCIAIS =====
+
+    def save_password_hash(self, user_id: str, password_hash: str) -> str:
+        """Grava (ou troca) o hash de senha; retorna o momento da troca"""
+        changed_at = datetime.now().isoformat()
+        self._execute("""
+            INSERT INTO security_credentials (user_id, password_hash, changed_at) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                password_hash = excluded.password_hash, changed_at = excluded.changed_at
+        """, (user_id, password_hash, changed_at))
+        return changed_at
+
+    def get_password_hash(self, user_id: str) -> Optional[str]:
+        rows = self._fetch("SELECT password_hash FROM security_credentials WHERE user_id = ?", (user_id,))
+        return rows[0]["password_hash"] if rows else None
+
+    def replace_password_hash(self, user_id: str, old_hash: str, new_hash: str) -> bool:
+        """Rehash: não sobrescreve uma troca de senha feita em outro worker"""
+        return self._execute(
+            "UPDATE security_credentials SET password_hash = ? WHERE user_id = ? AND password_hash = ?",
+            (new_hash, user_id, old_hash)
+        ) > 0
+
+    def delete_credentials(self, user_id: str) -> int:
+        return self._execute("DELETE FROM security_credentials WHERE user_id = ?", (user_id,))
@@ -0,0 +1,332 @@
+"""
+⏱️ SLIDING WINDOW LIMITER - Limites de Valor e Frequência por Janela Deslizante
+Nexora Prime
+
+Contadores por chave (usuário, conta) em janelas deslizantes aproximadas:
+- Cada regra é um anel de tamanho fixo de baldes de tempo (ex.: 24 baldes
+  de 1h para "valor nas últimas 24h"), com soma de valor e contagem
+- Checar um limite custa O(baldes) - constante, sem varrer histórico
+- O estado de cada chave fica numa linha da tabela `sliding_window_state`
+  (persistido a cada registro, sobrevive a reinícios)
+- Cada escrita trava a linha (BEGIN IMMEDIATE no SQLite, SELECT ... FOR
+  UPDATE no PostgreSQL) e incrementa `version`; os anéis ficam em cache
+  em memória e só são recarregados quando outro processo alterou a chave
+
+Usado por PaymentSecurityBlocks, pelos serviços de funding (Facebook/Google
+Ads) e pelo BudgetGuardian.
+"""
+
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres
+
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+@dataclass(frozen=True)
+class LimitRule:
+    """Janela deslizante com limite de valor e/ou de quantidade"""
+    window_seconds: int
+    bucket_seconds: int
+    max_amount: Optional[float] = None
+    max_count: Optional[int] = None
+
+    @property
+    def buckets(self) -> int:
+        return max(1, self.window_seconds // self.bucket_seconds)
+
+
+class BucketRing:
+    """Anel de baldes de tempo de tamanho fixo"""
+
+    __slots__ = ("size", "bucket_seconds", "ids", "amounts", "counts")
+
+    def __init__(self, rule: LimitRule, data: Optional[Dict[str, list]] = None):
+        self.size = rule.buckets
+        self.bucket_seconds = rule.bucket_seconds
+        if data and len(data.get("ids", [])) == self.size:
+            self.ids = list(data["ids"])
+            self.amounts = list(data["amounts"])
+            self.counts = list(data["counts"])
+        else:
+            self.ids = [-1] * self.size
+            self.amounts = [0.0] * self.size
+            self.counts = [0] * self.size
+
+    def add(self, now: float, amount: float, count: int = 1):
+        bucket_id = int(now // self.bucket_seconds)
+        slot = bucket_id % self.size
+        if self.ids[slot] != bucket_id:
+            # Balde expirado: reaproveitar o slot
+            self.ids[slot] = bucket_id
+            self.amounts[slot] = 0.0
+            self.counts[slot] = 0
+        self.amounts[slot] += amount
+        self.counts[slot] += count
+
+    def remove(self, at: float, now: float, amount: float, count: int = 1):
+        """
+        Desconta do balde do instante `at` (o do registro original).
+
+        Se o balde já saiu da janela (ou o slot foi reaproveitado), não há o
+        que devolver.
+        """
+        bucket_id = int(at // self.bucket_seconds)
+        slot = bucket_id % self.size
+        current = int(now // self.bucket_seconds)
+        if self.ids[slot] != bucket_id or bucket_id < current - self.size + 1:
+            return
+        self.amounts[slot] = max(self.amounts[slot] - amount, 0.0)
+        self.counts[slot] = max(self.counts[slot] - count, 0)
+
+    def totals(self, now: float) -> Tuple[float, int]:
+        current = int(now // self.bucket_seconds)
+        oldest = current - self.size + 1
+        amount, count = 0.0, 0
+        for bucket_id, bucket_amount, bucket_count in zip(self.ids, self.amounts, self.counts):
+            if oldest <= bucket_id <= current:
+                amount += bucket_amount
+                count += bucket_count
+        return round(max(amount, 0.0), 2), max(count, 0)
+
+    def to_dict(self) -> Dict[str, list]:
+        return {"ids": self.ids, "amounts": self.amounts, "counts": self.counts}
+
+
+class SlidingWindowLimiter:
+    """
+    Limitador nomeado com um conjunto de regras ({nome_regra: LimitRule}).
+    Todas as chaves de um limitador compartilham as mesmas regras.
+    """
+
+    def __init__(self, name: str, rules: Dict[str, LimitRule]):
+        self.name = name
+        self.rules = dict(rules)
+        # chave -> (version, {regra: BucketRing})
+        self._cache: Dict[str, Tuple[int, Dict[str, BucketRing]]] = {}
+        self._cache_lock = threading.Lock()
+        self._init_table()
+
+    def _init_table(self):
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sliding_window_state (
+                    limiter TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    updated_at TEXT,
+                    PRIMARY KEY (limiter, key)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[LIMITER] ❌ Erro ao criar tabela: {e}")
+
+    # ===== ESTADO =====
+
+    def _rings(self, key: str, version: int, state: Optional[str]) -> Dict[str, BucketRing]:
+        """Anéis da chave - do cache se a versão no banco não mudou"""
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == version:
+                return cached[1]
+        rings = self._parse(state)
+        with self._cache_lock:
+            self._cache[key] = (version, rings)
+        return rings
+
+    def _parse(self, state: Optional[str]) -> Dict[str, BucketRing]:
+        data = json.loads(state) if state else {}
+        return {name: BucketRing(rule, data.get(name)) for name, rule in self.rules.items()}
+
+    @staticmethod
+    def _unpack(row) -> Tuple[Optional[str], int]:
+        if row is None:
+            return None, 0
+        if isinstance(row, dict):
+            return row["state"], row["version"]
+        return row[0], row[1]
+
+    def _read(self, key: str) -> Dict[str, BucketRing]:
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param(
+                "SELECT state, version FROM sliding_window_state WHERE limiter = ? AND key = ?"
+            ), (self.name, key))
+            state, version = self._unpack(cursor.fetchone())
+        finally:
+            conn.close()
+        return self._rings(key, version, state)
+
+    @contextmanager
+    def _locked(self, key: str):
+        """
+        Transação com a linha da chave travada.
+
+        Yields:
+            dict com os anéis ("rings") - marque "dirty" = True para gravar
+        """
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if is_postgres():
+                cursor.execute(sql_param("""
+                    INSERT INTO sliding_window_state (limiter, key, state, version)
+                    VALUES (?, ?, '{}', 0)
+                    ON CONFLICT (limiter, key) DO NOTHING
+                """), (self.name, key))
+                cursor.execute(sql_param(
+                    "SELECT state, version FROM sliding_window_state WHERE limiter = ? AND key = ? FOR UPDATE"
+                ), (self.name, key))
+            else:
+                conn.isolation_level = None
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(sql_param(
+                    "SELECT state, version FROM sliding_window_state WHERE limiter = ? AND key = ?"
+                ), (self.name, key))
+            state, version = self._unpack(cursor.fetchone())
+            # Cópia própria da transação: leitores do cache não veem escrita não confirmada
+            rings = self._parse(state)
+            txn = {"rings": rings, "dirty": False}
+            yield txn
+
+            if txn["dirty"]:
+                payload = json.dumps({name: ring.to_dict() for name, ring in rings.items()})
+                cursor.execute(sql_param("""
+                    INSERT INTO sliding_window_state (limiter, key, state, version, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (limiter, key) DO UPDATE SET
+                        state = excluded.state, version = excluded.version, updated_at = excluded.updated_at
+                """), (self.name, key, payload, version + 1, datetime.now().isoformat()))
+            if is_postgres():
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+            if txn["dirty"]:
+                # Só depois do COMMIT: o cache nunca guarda versão que não está no banco
+                with self._cache_lock:
+                    self._cache[key] = (version + 1, rings)
+        except Exception:
+            if is_postgres():
+                conn.rollback()
+            elif conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    # ===== API =====
+
+    def _evaluate(self, rings: Dict[str, BucketRing], amount: float, now: float) -> Dict[str, Any]:
+        usage = {}
+        violated = None
+        for name, rule in self.rules.items():
+            used_amount, used_count = rings[name].totals(now)
+            usage[name] = {
+                "amount": used_amount,
+                "count": used_count,
+                "max_amount": rule.max_amount,
+                "max_count": rule.max_count,
+                "window_seconds": rule.window_seconds
+            }
+            if rule.max_amount is not None:
+                usage[name]["remaining_amount"] = round(max(rule.max_amount - used_amount, 0.0), 2)
+            if violated is None:
+                if rule.max_amount is not None and used_amount + amount > rule.max_amount:
+                    violated = name
+                elif rule.max_count is not None and used_count + 1 > rule.max_count:
+                    violated = name
+        return {"allowed": violated is None, "rule": violated, "usage": usage}
+
+    def usage(self, key: str, now: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Uso atual de cada regra para a chave"""
+        now = time.time() if now is None else now
+        return self._evaluate(self._read(key), 0.0, now)["usage"]
+
+    def check(self, key: str, amount: float = 0.0, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Verifica se mais uma operação de `amount` cabe nos limites (sem registrar).
+
+        Returns:
+            {"allowed", "rule" (regra violada ou None), "usage"}
+        """
+        now = time.time() if now is None else now
+        return self._evaluate(self._read(key), amount, now)
+
+    def record(self, key: str, amount: float, count: int = 1, now: Optional[float] = None):
+        """Registra uma operação já realizada"""
+        now = time.time() if now is None else now
+        with self._locked(key) as txn:
+            for ring in txn["rings"].values():
+                ring.add(now, amount, count)
+            txn["dirty"] = True
+
+    def acquire(self, key: str, amount: float, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Verifica e registra atomicamente (só registra se couber nos limites).
+
+        Returns:
+            Resultado de `check` mais "acquired_at" - guarde para o `release`
+        """
+        now = time.time() if now is None else now
+        with self._locked(key) as txn:
+            result = self._evaluate(txn["rings"], amount, now)
+            if result["allowed"]:
+                for ring in txn["rings"].values():
+                    ring.add(now, amount)
+                txn["dirty"] = True
+        result["acquired_at"] = now
+        return result
+
+    def release(self, key: str, amount: float, acquired_at: float, count: int = 1,
+                now: Optional[float] = None):
+        """
+        Desfaz um `acquire` (ex.: operação falhou depois da reserva).
+
+        Desconta do balde em que o `acquire` registrou; regras cujo balde já
+        saiu da janela não mudam.
+        """
+        now = time.time() if now is None else now
+        with self._locked(key) as txn:
+            for ring in txn["rings"].values():
+                ring.remove(acquired_at, now, amount, count)
+            txn["dirty"] = True
+
+    def reset(self, key: str):
+        """Zera todas as janelas da chave"""
+        with self._locked(key) as txn:
+            txn["rings"].update({name: BucketRing(rule) for name, rule in self.rules.items()})
+            txn["dirty"] = True
+
+
+_limiters: Dict[str, SlidingWindowLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str, rules: Dict[str, LimitRule]) -> SlidingWindowLimiter:
+    """Instância compartilhada por nome (um cache em memória por processo)"""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None or limiter.rules != rules:
+            limiter = _limiters[name] = SlidingWindowLimiter(name, rules)
+        else:
+            # Garante a tabela, como os serviços fazem a cada instanciação
+            limiter._init_table()
+        return limiter
@@ -6,11 +6,14 @@ Versão: 1.0 - Expansão Avançada
 
 import os
 import json
+import time
+import queue
 import asyncio
 import logging
 import hashlib
 import smtplib
 import requests
+import numpy as np
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
@@ -298,6 +301,205 @@ class NotificationDispatcher:
         return True
 
 
+class BackgroundNotificationDispatcher(NotificationDispatcher):
+    """
+    Despachante de notificações em background.
+    
+    O caminho de avaliação apenas coloca (alerta, canais, preferências) numa
+    fila. Uma thread consome a fila, agrupa as notificações por usuário em
+    janelas de `digest_window` segundos e envia um digest por canal,
+    reutilizando uma única conexão SMTP e uma única sessão HTTP.
+    """
+    
+    def __init__(self, digest_window: float = 5.0, max_digest_size: int = 50):
+        super().__init__()
+        self.digest_window = digest_window
+        self.max_digest_size = max_digest_size
+        self.queue: "queue.Queue" = queue.Queue()
+        
+        self.smtp_host = os.getenv("SMTP_HOST")
+        self.smtp_port = int(os.getenv("SMTP_PORT", "587"))
+        self.smtp_user = os.getenv("SMTP_USER")
+        self.smtp_password = os.getenv("SMTP_PASSWORD")
+        self.smtp_from = os.getenv("SMTP_FROM", self.smtp_user or "alerts@nexora.app")
+        
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._http = requests.Session()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.digests_sent = 0
+        
+    def enqueue(self, alert: Alert, channels: List[NotificationChannel], preferences: NotificationPreferences):
+        """Coloca uma notificação na fila (não bloqueia)"""
+        self.queue.put((alert, channels, preferences))
+        self._ensure_worker()
+        
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run,
+                    name="alerts-notification-dispatcher",
+                    daemon=True
+                )
+                self._worker.start()
+                
+    def _run(self):
+        while True:
+            first = self.queue.get()
+            batch = [first]
+            deadline = time.time() + self.digest_window
+            
+            # Acumular a janela de digest
+            while len(batch) < self.max_digest_size * 10:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+                    
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logger.error(f"Erro ao despachar notificações: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+                    
+    def drain(self) -> int:
+        """Envia imediatamente tudo o que estiver na fila (scripts e testes)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self.flush(batch)
+            for _ in batch:
+                self.queue.task_done()
+        return len(batch)
+        
+    def flush(self, batch: List[tuple]):
+        """Agrupa por usuário e canal e envia um digest por grupo"""
+        digests: Dict[tuple, Dict[str, Any]] = {}
+        for alert, channels, preferences in batch:
+            for channel in channels:
+                key = (preferences.user_id, channel)
+                entry = digests.setdefault(key, {"preferences": preferences, "alerts": []})
+                entry["alerts"].append(alert)
+                
+        for (user_id, channel), entry in digests.items():
+            alerts = entry["alerts"]
+            preferences = entry["preferences"]
+            for start in range(0, len(alerts), self.max_digest_size):
+                chunk = alerts[start:start + self.max_digest_size]
+                try:
+                    self._send_digest(channel, chunk, preferences)
+                except Exception as e:
+                    logger.error(f"Erro ao enviar digest ({channel.value}) para {user_id}: {e}")
+                    
+    def _send_digest(self, channel: NotificationChannel, alerts: List[Alert], preferences: NotificationPreferences):
+        if channel == NotificationChannel.EMAIL:
+            self._send_email_digest(alerts, preferences.email)
+        elif channel == NotificationChannel.SLACK:
+            self._send_slack_digest(alerts, preferences.slack_webhook)
+        elif channel == NotificationChannel.IN_APP:
+            for alert in alerts:
+                self._record("in_app", alert, user_id=preferences.user_id)
+        elif channel == NotificationChannel.TELEGRAM:
+            if preferences.telegram_chat_id:
+                logger.info(f"Telegram digest para {preferences.telegram_chat_id}: {len(alerts)} alertas")
+                for alert in alerts:
+                    self._record("telegram", alert, chat_id=preferences.telegram_chat_id)
+        elif channel == NotificationChannel.WEBHOOK:
+            logger.info(f"Webhook digest: {len(alerts)} alertas")
+        else:
+            logger.warning(f"Canal não suportado: {channel}")
+            
+    def _record(self, channel: str, alert: Alert, **extra):
+        entry = {"channel": channel, "alert_id": alert.id, "timestamp": datetime.now().isoformat()}
+        entry.update(extra)
+        self.sent_notifications.append(entry)
+        
+    def _get_smtp(self) -> smtplib.SMTP:
+        """Conexão SMTP persistente (reconecta se o servidor a fechou)"""
+        if self._smtp is not None:
+            try:
+                if self._smtp.noop()[0] == 250:
+                    return self._smtp
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+            
+        smtp = smtplib.SMTP(self.smtp_host, self.smtp_port, timeout=10)
+        smtp.starttls()
+        if self.smtp_user and self.smtp_password:
+            smtp.login(self.smtp_user, self.smtp_password)
+        self._smtp = smtp
+        return smtp
+        
+    def _send_email_digest(self, alerts: List[Alert], email: str):
+        if not email:
+            return
+            
+        if len(alerts) == 1:
+            subject = alerts[0].title
+        else:
+            subject = f"{len(alerts)} novos alertas"
+            
+        lines = []
+        for alert in alerts:
+            campaign = f" (campanha {alert.campaign_id})" if alert.campaign_id else ""
+            lines.append(f"[{alert.severity.value.upper()}] {alert.title}{campaign}: {alert.message}")
+            
+        if self.smtp_host:
+            msg = MIMEMultipart()
+            msg["From"] = self.smtp_from
+            msg["To"] = email
+            msg["Subject"] = f"Nexora - {subject}"
+            msg.attach(MIMEText("\n".join(lines), "plain"))
+            self._get_smtp().send_message(msg)
+        else:
+            # Sem SMTP configurado: apenas registrar
+            logger.info(f"Email digest para {email}: {subject}")
+            
+        for alert in alerts:
+            self._record("email", alert, recipient=email)
+        self.digests_sent += 1
+        
+    def _send_slack_digest(self, alerts: List[Alert], webhook_url: str):
+        if not webhook_url:
+            return
+            
+        blocks = [
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*{alert.title}* ({alert.severity.value})\n{alert.message}"}
+            }
+            for alert in alerts
+        ]
+        payload = {"text": f"📢 {len(alerts)} alerta(s)", "blocks": blocks}
+        
+        if webhook_url.startswith("http"):
+            self._http.post(webhook_url, json=payload, timeout=10)
+            
+        for alert in alerts:
+            self._record("slack", alert, webhook=webhook_url[:30] + "...")
+        self.digests_sent += 1
+        
+    def close(self):
+        """Fecha a conexão SMTP persistente"""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
 class AlertRuleEngine:
     """Motor de regras de alerta"""
     
@@ -481,6 +683,204 @@ class AlertRuleEngine:
             self.rules[rule_id].is_active = is_active
 
 
+class AlertStateIndex:
+    """
+    Cooldowns e snoozes indexados por (regra, campanha).
+    
+    Cada campanha recebe uma posição fixa; para cada regra mantemos arrays
+    NumPy com o instante (epoch) até o qual a campanha está bloqueada, de
+    forma que a checagem de cooldown de todas as campanhas é uma única
+    comparação vetorizada.
+    """
+    
+    def __init__(self):
+        self.campaign_index: Dict[str, int] = {}
+        self.campaign_ids: List[str] = []
+        self.cooldown_until: Dict[str, np.ndarray] = {}
+        self.snoozed_until: Dict[str, np.ndarray] = {}
+        
+    def rows_for(self, campaign_ids: List[str]) -> np.ndarray:
+        """Retorna as posições das campanhas, registrando as novas"""
+        rows = np.empty(len(campaign_ids), dtype=np.int64)
+        for i, campaign_id in enumerate(campaign_ids):
+            row = self.campaign_index.get(campaign_id)
+            if row is None:
+                row = len(self.campaign_ids)
+                self.campaign_index[campaign_id] = row
+                self.campaign_ids.append(campaign_id)
+            rows[i] = row
+        return rows
+        
+    def _array(self, store: Dict[str, np.ndarray], rule_id: str) -> np.ndarray:
+        size = len(self.campaign_ids)
+        array = store.get(rule_id)
+        if array is None:
+            array = np.zeros(max(size, 16), dtype=np.float64)
+            store[rule_id] = array
+        elif array.shape[0] < size:
+            grown = np.zeros(max(size, array.shape[0] * 2), dtype=np.float64)
+            grown[:array.shape[0]] = array
+            store[rule_id] = array = grown
+        return array
+        
+    def blocked_mask(self, rule_id: str, rows: np.ndarray, now: float) -> np.ndarray:
+        """Máscara das campanhas em cooldown ou snooze para a regra"""
+        cooldown = self._array(self.cooldown_until, rule_id)[rows]
+        snoozed = self._array(self.snoozed_until, rule_id)[rows]
+        return (cooldown > now) | (snoozed > now)
+        
+    def set_cooldown(self, rule_id: str, rows: np.ndarray, until: float):
+        self._array(self.cooldown_until, rule_id)[rows] = until
+        
+    def snooze(self, rule_id: str, campaign_id: str, until: float):
+        rows = self.rows_for([campaign_id])
+        self._array(self.snoozed_until, rule_id)[rows] = until
+        
+    def clear_snooze(self, rule_id: str, campaign_id: str):
+        row = self.campaign_index.get(campaign_id)
+        if row is not None and rule_id in self.snoozed_until:
+            self._array(self.snoozed_until, rule_id)[row] = 0.0
+
+
+class BatchAlertEvaluator:
+    """
+    Avaliação vetorizada de todas as regras sobre todas as campanhas.
+    
+    Recebe uma matriz de métricas (campanhas x métricas) e avalia cada regra
+    como uma comparação NumPy sobre a coluna da métrica, com os thresholds
+    ajustados pelos targets de cada campanha.
+    """
+    
+    COMPARATORS = {
+        "gt": np.greater,
+        "lt": np.less,
+        "gte": np.greater_equal,
+        "lte": np.less_equal,
+        "eq": np.equal
+    }
+    
+    def __init__(self, rule_engine: AlertRuleEngine, state: AlertStateIndex = None):
+        self.rule_engine = rule_engine
+        self.state = state or AlertStateIndex()
+        
+    def _thresholds(
+        self,
+        rule: AlertRule,
+        n: int,
+        target_names: List[str],
+        targets: Optional[np.ndarray]
+    ) -> np.ndarray:
+        """Mesmo ajuste de threshold de AlertRuleEngine.evaluate_rule, por campanha"""
+        base = np.full(n, float(rule.threshold))
+        
+        if rule.metric in ["cpa", "cpc"] or (rule.metric == "roas" and rule.comparison == "lt"):
+            if targets is not None and rule.metric in target_names:
+                target = targets[:, target_names.index(rule.metric)]
+                # Sem target (NaN) o threshold "target" é o próprio threshold
+                target = np.where(np.isnan(target), rule.threshold, target)
+            else:
+                target = base
+            return target * rule.threshold
+            
+        return base
+        
+    def evaluate_matrix(
+        self,
+        campaign_ids: List[str],
+        metric_names: List[str],
+        metrics: np.ndarray,
+        target_names: List[str] = None,
+        targets: np.ndarray = None,
+        now: datetime = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Avalia todas as regras ativas sobre a matriz de métricas.
+        
+        Args:
+            campaign_ids: IDs das campanhas (linhas)
+            metric_names: Nomes das métricas (colunas de `metrics`)
+            metrics: Matriz (n_campanhas x n_métricas); NaN = métrica ausente
+            target_names: Nomes das colunas de `targets`
+            targets: Matriz de targets por campanha; NaN = sem target
+            now: Instante da avaliação
+            
+        Returns:
+            Lista de disparos {"rule", "campaign_id", "metric_value", "threshold"}
+        """
+        now = now or datetime.now()
+        now_ts = now.timestamp()
+        metrics = np.asarray(metrics, dtype=np.float64)
+        n = len(campaign_ids)
+        if n == 0:
+            return []
+            
+        target_names = target_names or []
+        if targets is not None:
+            targets = np.asarray(targets, dtype=np.float64)
+            
+        rows = self.state.rows_for(campaign_ids)
+        column_of = {name: i for i, name in enumerate(metric_names)}
+        triggers = []
+        
+        for rule in self.rule_engine.rules.values():
+            if not rule.is_active:
+                continue
+            compare = self.COMPARATORS.get(rule.comparison)
+            if compare is None:
+                continue
+                
+            col = column_of.get(rule.metric)
+            if col is None:
+                values = np.zeros(n)
+            else:
+                # Métrica ausente vale 0, como em metrics.get(rule.metric, 0)
+                values = np.nan_to_num(metrics[:, col], nan=0.0)
+                
+            thresholds = self._thresholds(rule, n, target_names, targets)
+            mask = compare(values, thresholds) & ~self.state.blocked_mask(rule.id, rows, now_ts)
+            hits = np.flatnonzero(mask)
+            if hits.size == 0:
+                continue
+                
+            self.state.set_cooldown(rule.id, rows[hits], now_ts + rule.cooldown_minutes * 60)
+            rule.last_triggered = now
+            rule.trigger_count += int(hits.size)
+            
+            for i in hits:
+                triggers.append({
+                    "rule": rule,
+                    "campaign_id": campaign_ids[i],
+                    "metric_value": float(values[i]),
+                    "threshold": float(thresholds[i])
+                })
+                
+        return triggers
+        
+    def evaluate_campaigns(
+        self,
+        metrics_by_campaign: Dict[str, Dict[str, float]],
+        targets_by_campaign: Dict[str, Dict[str, float]] = None,
+        now: datetime = None
+    ) -> List[Dict[str, Any]]:
+        """Monta a matriz a partir de dicts por campanha e avalia"""
+        campaign_ids = list(metrics_by_campaign.keys())
+        metric_names = sorted({rule.metric for rule in self.rule_engine.rules.values()})
+        matrix = np.array(
+            [[metrics_by_campaign[c].get(m, np.nan) for m in metric_names] for c in campaign_ids],
+            dtype=np.float64
+        ).reshape(len(campaign_ids), len(metric_names))
+        
+        target_names, targets = [], None
+        if targets_by_campaign:
+            target_names = ["cpa", "cpc", "roas"]
+            targets = np.array(
+                [[targets_by_campaign.get(c, {}).get(t, np.nan) for t in target_names] for c in campaign_ids],
+                dtype=np.float64
+            ).reshape(len(campaign_ids), len(target_names))
+            
+        return self.evaluate_matrix(campaign_ids, metric_names, matrix, target_names, targets, now)
+
+
 class SmartAlertsSystem:
     """
     Sistema principal de Alertas Inteligentes
@@ -489,7 +889,8 @@ class SmartAlertsSystem:
     
     def __init__(self):
         self.rule_engine = AlertRuleEngine()
-        self.notification_dispatcher = NotificationDispatcher()
+        self.notification_dispatcher = BackgroundNotificationDispatcher()
+        self.batch_evaluator = BatchAlertEvaluator(self.rule_engine)
         self.alerts: Dict[str, Alert] = {}
         self.user_preferences: Dict[str, NotificationPreferences] = {}
         self.alert_history: List[Alert] = []
@@ -547,6 +948,40 @@ class SmartAlertsSystem:
                 
         return generated_alerts
     
+    def evaluate_all_campaigns(
+        self,
+        metrics_by_campaign: Dict[str, Dict[str, float]],
+        targets_by_campaign: Dict[str, Dict[str, float]] = None,
+        owners: Dict[str, str] = None,
+        default_user_id: str = None
+    ) -> List[Alert]:
+        """
+        Avalia todas as regras para todas as campanhas de uma vez.
+        
+        Args:
+            metrics_by_campaign: {campaign_id: {métrica: valor}}
+            targets_by_campaign: {campaign_id: {"cpa"|"cpc"|"roas": target}}
+            owners: {campaign_id: user_id} para roteamento das notificações
+            default_user_id: Usuário usado quando a campanha não tem dono
+        """
+        owners = owners or {}
+        generated_alerts = []
+        
+        triggers = self.batch_evaluator.evaluate_campaigns(metrics_by_campaign, targets_by_campaign)
+        
+        for trigger in triggers:
+            campaign_id = trigger["campaign_id"]
+            alert = self._create_alert(trigger, campaign_id, metrics_by_campaign[campaign_id])
+            self.alerts[alert.id] = alert
+            self.alert_history.append(alert)
+            generated_alerts.append(alert)
+            
+            user_id = owners.get(campaign_id, default_user_id)
+            if user_id:
+                self._enqueue_notifications(user_id, alert, trigger["rule"])
+                
+        return generated_alerts
+    
     def _create_alert(
         self,
         trigger_result: Dict[str, Any],
@@ -658,6 +1093,15 @@ class SmartAlertsSystem:
         rule: AlertRule
     ):
         """Despacha notificações para todos os canais configurados"""
+        self._enqueue_notifications(user_id, alert, rule)
+        
+    def _enqueue_notifications(
+        self,
+        user_id: str,
+        alert: Alert,
+        rule: AlertRule
+    ):
+        """Filtra por preferências e coloca a notificação na fila de envio"""
         preferences = self.user_preferences.get(user_id)
         
         if not preferences:
@@ -675,10 +1119,10 @@ class SmartAlertsSystem:
                 if alert.severity not in [AlertSeverity.CRITICAL, AlertSeverity.EMERGENCY]:
                     return
                     
-        # Enviar para cada canal configurado
-        for channel in rule.channels:
-            if channel in preferences.enabled_channels:
-                await self.notification_dispatcher.send_notification(alert, channel, preferences)
+        # Enfileirar para os canais configurados
+        channels = [channel for channel in rule.channels if channel in preferences.enabled_channels]
+        if channels:
+            self.notification_dispatcher.enqueue(alert, channels, preferences)
                 
     def acknowledge_alert(self, alert_id: str) -> Dict[str, Any]:
         """Reconhece um alerta"""
@@ -712,8 +1156,12 @@ class SmartAlertsSystem:
             return {"error": "Alerta não encontrado"}
             
         alert.status = AlertStatus.SNOOZED
+        snooze_until = datetime.now() + timedelta(minutes=minutes)
+        
+        if alert.campaign_id:
+            self.batch_evaluator.state.snooze(alert.rule_id, alert.campaign_id, snooze_until.timestamp())
         
-        return {"alert_id": alert_id, "status": "snoozed", "snooze_until": (datetime.now() + timedelta(minutes=minutes)).isoformat()}
+        return {"alert_id": alert_id, "status": "snoozed", "snooze_until": snooze_until.isoformat()}
     
     def get_active_alerts(self, campaign_id: str = None) -> List[Dict[str, Any]]:
         """Obtém alertas ativos"""
@@ -0,0 +1,412 @@
+"""
+📈 STREAMING ANOMALY DETECTOR - Detecção Incremental de Anomalias
+Nexora Prime
+
+Mantém estatísticas online por (campanha, métrica):
+- Média e variância de Welford
+- EWMA (média e variância exponencialmente ponderadas)
+- Baseline sazonal por dia da semana (Welford por bucket)
+
+Cada novo ponto é pontuado contra o estado atual e depois incorporado em
+O(1), então a checagem pode rodar a cada ingestão de métricas. O estado é
+persistido no banco (write-behind) para que um restart comece "quente".
+
+Vários workers gravam as mesmas séries: o flush não sobrescreve o estado
+do banco, e sim aplica sobre ele (travado na transação) os pontos
+recebidos desde o último flush, descartando os que o banco já tem.
+"""
+
+import json
+import math
+import time
+import atexit
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres
+
+
+def _parse_timestamp(timestamp: Any) -> Optional[datetime]:
+    if timestamp is None:
+        return None
+    if isinstance(timestamp, datetime):
+        return timestamp
+    try:
+        return datetime.fromisoformat(str(timestamp))
+    except ValueError:
+        return None
+
+
+class MetricStream:
+    """Estado online de uma série (campanha, métrica)"""
+
+    __slots__ = ("count", "mean", "m2", "ewma", "ewvar", "seasonal", "last_ts")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.ewma = None
+        self.ewvar = 0.0
+        # weekday -> [count, mean, m2]
+        self.seasonal: Dict[int, List[float]] = {}
+        self.last_ts: Optional[str] = None
+
+    @property
+    def std_dev(self) -> float:
+        return math.sqrt(self.m2 / self.count) if self.count > 0 else 0.0
+
+    def update(self, value: float, timestamp: Optional[datetime], alpha: float):
+        """Incorpora um ponto em O(1)"""
+        # Welford
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+        # EWMA
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewvar = (1 - alpha) * (self.ewvar + diff * increment)
+
+        # Baseline sazonal
+        if timestamp is not None:
+            bucket = self.seasonal.setdefault(timestamp.weekday(), [0, 0.0, 0.0])
+            bucket[0] += 1
+            bucket_delta = value - bucket[1]
+            bucket[1] += bucket_delta / bucket[0]
+            bucket[2] += bucket_delta * (value - bucket[1])
+            self.last_ts = timestamp.isoformat()
+
+    def baseline(self, timestamp: Optional[datetime], min_seasonal: int) -> Tuple[float, float, str]:
+        """Retorna (média esperada, desvio, tipo de baseline)"""
+        if timestamp is not None:
+            bucket = self.seasonal.get(timestamp.weekday())
+            if bucket and bucket[0] >= min_seasonal and bucket[2] > 0:
+                return bucket[1], math.sqrt(bucket[2] / bucket[0]), "seasonal"
+        return self.mean, self.std_dev, "global"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "ewma": self.ewma,
+            "ewvar": self.ewvar,
+            "seasonal": {str(k): v for k, v in self.seasonal.items()},
+            "last_ts": self.last_ts
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MetricStream":
+        stream = cls()
+        stream.count = data.get("count", 0)
+        stream.mean = data.get("mean", 0.0)
+        stream.m2 = data.get("m2", 0.0)
+        stream.ewma = data.get("ewma")
+        stream.ewvar = data.get("ewvar", 0.0)
+        stream.seasonal = {int(k): list(v) for k, v in data.get("seasonal", {}).items()}
+        stream.last_ts = data.get("last_ts")
+        return stream
+
+
+class StreamingAnomalyDetector:
+    """
+    Detector de anomalias incremental.
+
+    `ingest` pontua cada métrica do novo ponto contra o estado anterior e só
+    então atualiza o estado, de forma que um pico não "contamina" a própria
+    baseline antes de ser avaliado.
+    """
+
+    def __init__(
+        self,
+        z_threshold: float = 2.0,
+        min_points: int = 5,
+        min_seasonal: int = 3,
+        alpha: float = 0.3,
+        flush_interval: float = 30.0,
+        autoload: bool = True
+    ):
+        self.z_threshold = z_threshold
+        self.min_points = min_points
+        self.min_seasonal = min_seasonal
+        self.alpha = alpha
+        self.flush_interval = flush_interval
+
+        self.streams: Dict[Tuple[str, str], MetricStream] = {}
+        # Pontos ainda não gravados: {(campanha, métrica): [(timestamp ISO | None, valor)]}
+        self._pending: Dict[Tuple[str, str], List[Tuple[Optional[str], float]]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.time()
+
+        self._init_database()
+        if autoload:
+            self.load()
+
+    def _init_database(self):
+        """Cria a tabela de estado"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS anomaly_stream_state (
+                    campaign_id TEXT NOT NULL,
+                    metric TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (campaign_id, metric)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[ANOMALY DETECTOR] ❌ Erro ao inicializar estado: {e}")
+
+    # ===== PONTUAÇÃO E ATUALIZAÇÃO =====
+
+    def score(
+        self,
+        campaign_id: str,
+        metric: str,
+        value: float,
+        timestamp: Any = None,
+        min_points: int = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Pontua um valor contra o estado atual, sem atualizá-lo.
+
+        Returns:
+            Dict com z-scores e baseline, ou None se ainda não há histórico suficiente
+        """
+        stream = self.streams.get((str(campaign_id), metric))
+        if stream is None or stream.count < (min_points or self.min_points):
+            return None
+
+        ts = _parse_timestamp(timestamp)
+        expected, std_dev, baseline = stream.baseline(ts, self.min_seasonal)
+        if std_dev <= 0:
+            return None
+
+        z_score = (value - expected) / std_dev
+        ewma_std = math.sqrt(stream.ewvar) if stream.ewvar > 0 else 0.0
+        ewma_z = (value - stream.ewma) / ewma_std if ewma_std > 0 else 0.0
+
+        return {
+            "metric": metric,
+            "value": value,
+            "expected": expected,
+            "std_dev": std_dev,
+            "z_score": z_score,
+            "ewma": stream.ewma,
+            "ewma_z_score": ewma_z,
+            "baseline": baseline,
+            "data_points": stream.count,
+            "is_anomaly": abs(z_score) > self.z_threshold
+        }
+
+    def update(self, campaign_id: str, metric: str, value: float, timestamp: Any = None):
+        """Incorpora um ponto ao estado da série"""
+        key = (str(campaign_id), metric)
+        with self._lock:
+            stream = self.streams.get(key)
+            if stream is None:
+                stream = MetricStream()
+                self.streams[key] = stream
+            ts = _parse_timestamp(timestamp)
+            stream.update(float(value), ts, self.alpha)
+            self._pending.setdefault(key, []).append((ts.isoformat() if ts else None, float(value)))
+
+    def ingest(self, campaign_id: str, metrics: Dict[str, Any], timestamp: Any = None) -> List[Dict[str, Any]]:
+        """
+        Pontua e incorpora um novo ponto de métricas.
+
+        Args:
+            campaign_id: ID da campanha
+            metrics: {métrica: valor}; valores não numéricos são ignorados
+            timestamp: Instante do ponto (datetime ou ISO)
+
+        Returns:
+            Lista de anomalias detectadas
+        """
+        anomalies = []
+        for metric, value in metrics.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            scored = self.score(campaign_id, metric, value, timestamp)
+            if scored and scored["is_anomaly"]:
+                anomalies.append(scored)
+            self.update(campaign_id, metric, value, timestamp)
+
+        self.maybe_flush()
+        return anomalies
+
+    def has_seen(self, campaign_id: str, metric: str, timestamp: Any) -> bool:
+        """Indica se um ponto com esse timestamp já foi incorporado à série"""
+        stream = self.streams.get((str(campaign_id), metric))
+        ts = _parse_timestamp(timestamp)
+        if stream is None or stream.last_ts is None or ts is None:
+            return False
+        return ts.isoformat() <= stream.last_ts
+
+    def get_state(self, campaign_id: str, metric: str) -> Optional[Dict[str, Any]]:
+        stream = self.streams.get((str(campaign_id), metric))
+        if stream is None:
+            return None
+        state = stream.to_dict()
+        state["std_dev"] = stream.std_dev
+        return state
+
+    def reset(self, campaign_id: str = None):
+        """Descarta o estado (de uma campanha ou de todas) em memória e no banco"""
+        with self._lock:
+            if campaign_id is None:
+                self.streams.clear()
+                self._pending.clear()
+            else:
+                for key in [k for k in self.streams if k[0] == str(campaign_id)]:
+                    del self.streams[key]
+                    self._pending.pop(key, None)
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if campaign_id is None:
+                cursor.execute("DELETE FROM anomaly_stream_state")
+            else:
+                cursor.execute(sql_param("DELETE FROM anomaly_stream_state WHERE campaign_id = ?"), (str(campaign_id),))
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ===== PERSISTÊNCIA =====
+
+    def maybe_flush(self):
+        if self._pending and time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _merge(self, stream: MetricStream, points: List[Tuple[Optional[str], float]]) -> MetricStream:
+        """Aplica os pontos pendentes sobre o estado, ignorando os que ele já incorporou"""
+        for ts, value in points:
+            if ts is not None and stream.last_ts is not None and ts <= stream.last_ts:
+                continue
+            stream.update(value, _parse_timestamp(ts), self.alpha)
+        return stream
+
+    def flush(self) -> int:
+        """Mescla no banco os pontos recebidos desde o último flush"""
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._last_flush = time.time()
+
+        if not pending:
+            return 0
+
+        keys = sorted(pending)
+        merged = {}
+        now = datetime.now().isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if not is_postgres():
+                conn.isolation_level = None
+                cursor.execute("BEGIN IMMEDIATE")
+            lock = " FOR UPDATE" if is_postgres() else ""
+            for key in keys:
+                cursor.execute(sql_param(
+                    f"SELECT state FROM anomaly_stream_state WHERE campaign_id = ? AND metric = ?{lock}"
+                ), key)
+                row = cursor.fetchone()
+                if row is None:
+                    stored = MetricStream()
+                else:
+                    stored = MetricStream.from_dict(json.loads(row["state"] if isinstance(row, dict) else row[0]))
+                merged[key] = self._merge(stored, pending[key])
+            cursor.executemany(sql_param("""
+                INSERT INTO anomaly_stream_state (campaign_id, metric, state, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (campaign_id, metric)
+                DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            """), [(key[0], key[1], json.dumps(merged[key].to_dict()), now) for key in keys])
+            if is_postgres():
+                conn.commit()
+            else:
+                cursor.execute("COMMIT")
+        except Exception as e:
+            if is_postgres():
+                conn.rollback()
+            elif conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"[ANOMALY DETECTOR] ❌ Erro ao persistir estado: {e}")
+            with self._lock:
+                for key, points in pending.items():
+                    self._pending[key] = points + self._pending.get(key, [])
+            return 0
+        finally:
+            conn.close()
+
+        # Estado local passa a ser o mesclado (com os outros workers), mais
+        # o que chegou durante o flush
+        with self._lock:
+            for key, stream in merged.items():
+                if key in self.streams:
+                    self.streams[key] = self._merge(
+                        MetricStream.from_dict(stream.to_dict()), self._pending.get(key, [])
+                    )
+
+        return len(keys)
+
+    def load(self) -> int:
+        """Carrega o estado persistido (warm start)"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT campaign_id, metric, state FROM anomaly_stream_state")
+            rows = cursor.fetchall()
+            conn.close()
+        except Exception as e:
+            print(f"[ANOMALY DETECTOR] ❌ Erro ao carregar estado: {e}")
+            return 0
+
+        with self._lock:
+            for row in rows:
+                if isinstance(row, dict):
+                    campaign_id, metric, state = row["campaign_id"], row["metric"], row["state"]
+                else:
+                    campaign_id, metric, state = row
+                self.streams[(campaign_id, metric)] = MetricStream.from_dict(json.loads(state))
+
+        return len(rows)
+
+
+# Instância global do detector
+_detector_instance: Optional[StreamingAnomalyDetector] = None
+_detector_lock = threading.Lock()
+
+
+def get_anomaly_detector() -> StreamingAnomalyDetector:
+    """
+    Retorna instância global do detector (singleton)
+
+    Returns:
+        StreamingAnomalyDetector: Instância do detector
+    """
+    global _detector_instance
+
+    if _detector_instance is None:
+        with _detector_lock:
+            if _detector_instance is None:
+                _detector_instance = StreamingAnomalyDetector()
+                atexit.register(_detector_instance.flush)
+
+    return _detector_instance
@@ -0,0 +1,224 @@
+"""
+🧭 VELYRA COMMAND ROUTER - Roteador de Comandos Pré-compilado
+Nexora Prime
+
+Classifica mensagens do chat (saudação, ação, pergunta) em uma passada:
+- Todos os padrões de `command_patterns` viram UMA regex combinada, com um
+  grupo nomeado por comando. Uma única chamada `match` devolve o primeiro
+  comando (na ordem do dicionário) que casa em qualquer posição - a mesma
+  semântica do loop `re.search` por padrão, sem o custo do loop em Python
+- Listas de palavras (saudações, indicadores de pergunta, métricas)
+  viram alternâncias compiladas
+- Regexes de extração de parâmetros compiladas uma única vez
+
+Usado por VelyraPrimeV3 (/api/operator/chat, /api/velyra/chat e
+/api/v2/velyra/chat).
+"""
+
+import re
+import time
+from typing import Dict, List, Any, Tuple, Iterable
+
+
+GREETINGS = ['olá', 'ola', 'oi', 'hey', 'hello', 'bom dia', 'boa tarde', 'boa noite']
+GREETING_MAX_LENGTH = 30
+
+QUESTION_INDICATORS = [
+    'o que é', 'o que e', 'como', 'qual', 'quando', 'por que', 'porque',
+    'explica', 'significa', 'diferença', 'diferenca', 'melhor', 'dica'
+]
+CAMPAIGN_WORDS = ['campanha', 'anúncio', 'anuncio', 'meta ads', 'google ads', 'facebook']
+METRIC_WORDS = ['cpa', 'roas', 'ctr', 'cpc', 'conversão', 'conversao', 'vendas']
+STATUS_WORDS = ['como está', 'como esta', 'status', 'resultado']
+
+KNOWN_PRODUCTS = ['synadentix', 'clareador', 'suplemento']
+
+
+def _any_of(words: Iterable[str]) -> "re.Pattern":
+    """Alternância compilada equivalente a `any(w in text for w in words)`"""
+    return re.compile("|".join(re.escape(w) for w in words))
+
+
+_GREETING_RE = _any_of(GREETINGS)
+_QUESTION_RE = _any_of(QUESTION_INDICATORS)
+_CAMPAIGN_OR_METRIC_RE = _any_of(CAMPAIGN_WORDS + METRIC_WORDS)
+_STATUS_RE = _any_of(STATUS_WORDS)
+
+_PRODUCT_AFTER_RE = re.compile(r'(?:para|do|da)\s+(?:o\s+)?(\w+)')
+_META_RE = _any_of(['meta', 'facebook', 'instagram'])
+_BUDGET_RE = re.compile(r'(?:budget|orçamento|orcamento|r\$)\s*(?:de\s+)?(\d+(?:[.,]\d+)?)')
+_OBJECTIVE_CONVERSIONS_RE = _any_of(['venda', 'conversão', 'conversao'])
+_OBJECTIVE_TRAFFIC_RE = _any_of(['tráfego', 'trafego', 'clique'])
+_OBJECTIVE_LEADS_RE = _any_of(['lead', 'cadastro'])
+_CAMPAIGN_NAME_RE = re.compile(r'campanha\s+["\']?([^"\']+)["\']?')
+_PERCENTAGE_RE = re.compile(r'(\d+)\s*%')
+_TERM_RE = re.compile(r'(?:o que [eé]|explica(?:r)?|significado de)\s+(\w+)')
+
+
+class CommandRouter:
+    """
+    Roteador compilado a partir de `command_patterns`
+    ({nome: {'patterns': [...], 'action': str, 'extract': [...]}}).
+    """
+
+    def __init__(self, command_patterns: Dict[str, Dict[str, Any]]):
+        self.commands: List[Tuple[str, Dict[str, Any]]] = list(command_patterns.items())
+
+        # Um ramo por comando, em ordem: ".*?" faz cada ramo varrer a
+        # mensagem inteira antes de o próximo comando ser tentado, então o
+        # primeiro comando (em ordem) que casa em qualquer posição vence -
+        # a semântica do loop de re.search, numa única chamada em C
+        branches = [
+            f".*?(?P<c{index}>{'|'.join(f'(?:{pattern})' for pattern in config['patterns'])})"
+            for index, (_, config) in enumerate(self.commands)
+            if config['patterns']
+        ]
+        self._combined = re.compile("|".join(branches), re.DOTALL) if branches else None
+
+    def match_command(self, message_lower: str) -> int:
+        """Índice do comando de maior prioridade que casa, ou -1"""
+        if self._combined is None:
+            return -1
+        match = self._combined.match(message_lower)
+        return int(match.lastgroup[1:]) if match else -1
+
+    def route(self, message: str) -> Tuple[str, Dict[str, Any]]:
+        """
+        Identifica o tipo de comando.
+
+        Returns:
+            Tuple com (tipo_comando, parâmetros)
+        """
+        message_lower = message.lower().strip()
+
+        # Verificar saudações
+        if len(message_lower) < GREETING_MAX_LENGTH and _GREETING_RE.search(message_lower):
+            return ('greeting', {})
+
+        # Verificar comandos de ação
+        cmd_index = self.match_command(message_lower)
+        if cmd_index >= 0:
+            cmd_name, cmd_config = self.commands[cmd_index]
+            return ('action', {
+                'action': cmd_config['action'],
+                'data': self.extract_params(message, cmd_config.get('extract', [])),
+                'command_name': cmd_name
+            })
+
+        # Verificar se é pergunta técnica
+        if _QUESTION_RE.search(message_lower):
+            return ('question', {'question': message})
+
+        # Se menciona campanha, produto ou métrica e pede status, é análise
+        if _CAMPAIGN_OR_METRIC_RE.search(message_lower) and _STATUS_RE.search(message_lower):
+            return ('action', {
+                'action': 'analyze_performance',
+                'data': self.extract_params(message, ['campaign_name']),
+                'command_name': 'analyze_performance'
+            })
+
+        # Comando não reconhecido - tentar responder como pergunta
+        return ('question', {'question': message})
+
+    @staticmethod
+    def extract_params(message: str, param_names: List[str]) -> Dict[str, Any]:
+        """Extrai parâmetros da mensagem."""
+        params = {}
+        message_lower = message.lower()
+
+        for param in param_names:
+            if param == 'product':
+                product = next((p for p in KNOWN_PRODUCTS if p in message_lower), None)
+                if product:
+                    params['product'] = product.title()
+                else:
+                    match = _PRODUCT_AFTER_RE.search(message_lower)
+                    if match:
+                        params['product'] = match.group(1).title()
+
+            elif param == 'platform':
+                if _META_RE.search(message_lower):
+                    params['platform'] = 'meta_ads'
+                elif 'google' in message_lower:
+                    params['platform'] = 'google_ads'
+                elif 'tiktok' in message_lower:
+                    params['platform'] = 'tiktok_ads'
+
+            elif param == 'budget':
+                match = _BUDGET_RE.search(message_lower)
+                if match:
+                    params['budget'] = float(match.group(1).replace(',', '.'))
+
+            elif param == 'objective':
+                if _OBJECTIVE_CONVERSIONS_RE.search(message_lower):
+                    params['objective'] = 'conversions'
+                elif _OBJECTIVE_TRAFFIC_RE.search(message_lower):
+                    params['objective'] = 'traffic'
+                elif _OBJECTIVE_LEADS_RE.search(message_lower):
+                    params['objective'] = 'leads'
+
+            elif param == 'campaign_name' or param == 'campaign_id':
+                match = _CAMPAIGN_NAME_RE.search(message_lower)
+                if match:
+                    params['campaign_name'] = match.group(1).strip()
+
+            elif param == 'percentage':
+                match = _PERCENTAGE_RE.search(message_lower)
+                if match:
+                    params['percentage'] = int(match.group(1))
+
+            elif param == 'term':
+                match = _TERM_RE.search(message_lower)
+                if match:
+                    params['term'] = match.group(1).upper()
+
+        return params
+
+
+def benchmark_parse(parse, messages: List[str], iterations: int = 200) -> Dict[str, float]:
+    """
+    Micro-benchmark de latência de parse.
+
+    Args:
+        parse: Função message -> (tipo, params)
+        messages: Mensagens de exemplo
+        iterations: Repetições do conjunto
+
+    Returns:
+        {"calls", "total_ms", "avg_us"}
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for message in messages:
+            parse(message)
+    elapsed = time.perf_counter() - start
+    calls = iterations * len(messages)
+    return {
+        "calls": calls,
+        "total_ms": round(elapsed * 1000, 3),
+        "avg_us": round(elapsed / calls * 1e6, 3) if calls else 0.0
+    }
+
+
+SAMPLE_MESSAGES = [
+    "Oi",
+    "Crie uma campanha para o Synadentix no Meta com orçamento de 500",
+    "Escalar a campanha Black Friday em 30%",
+    "Pausar a campanha 'Teste Verão'",
+    "O que é ROAS?",
+    "Qual a diferença entre CBO e ABO?",
+    "Como está a campanha de remarketing?",
+    "Me mostre o resultado de CPA de ontem",
+    "Preciso de ajuda",
+    "Quero entender por que minhas vendas caíram tanto nas últimas duas semanas no Google",
+]
+
+
+if __name__ == "__main__":
+    try:
+        from services.velyra_prime_v3 import VelyraPrimeV3
+    except ImportError:
+        from velyra_prime_v3 import VelyraPrimeV3
+
+    agent = VelyraPrimeV3()
+    print(benchmark_parse(agent._parse_command, SAMPLE_MESSAGES, iterations=2000))
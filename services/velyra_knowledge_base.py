@@ -18,10 +18,42 @@ Versão: 1.0
 Data: 03/02/2026
 """
 
+import os
 import re
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
+try:
+    from services.knowledge_search import (
+        get_knowledge_index, tokenize, strip_accents, flatten_text, split_markdown_sections
+    )
+except ImportError:
+    from knowledge_search import (
+        get_knowledge_index, tokenize, strip_accents, flatten_text, split_markdown_sections
+    )
+
+
+PLAYBOOKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base")
+
+# Score BM25 mínimo para uma resposta vinda da busca
+MIN_SEARCH_SCORE = 3.0
+
+# Fração mínima dos termos da pergunta presentes no documento
+MIN_QUERY_COVERAGE = 0.5
+
+# Indícios de pergunta de definição ("o que é CPA?")
+DEFINITION_CUES = ('o que e', 'significa', 'defini', 'formula', 'calcul', 'conceito')
+
+# Sinônimos indexados junto com cada categoria de melhores práticas
+BEST_PRACTICE_ALIASES = {
+    'criacao_campanha': 'criar criação campanha lançamento estrutura',
+    'otimizacao': 'otimizar otimização ajustes',
+    'criativos': 'criativo imagem vídeo',
+    'copy': 'copywriting texto headline',
+    'publicos': 'público audiência segmentação',
+    'metricas': 'métrica kpi indicadores',
+}
+
 
 class VelyraKnowledgeBase:
     """
@@ -36,6 +68,11 @@ class VelyraKnowledgeBase:
         self.memories = self._load_campaign_memories()
         self.glossary = self._load_glossary()
         self.best_practices = self._load_best_practices()
+        self.playbook_sections = self._load_playbook_sections()
+        self._memories_by_id = {m['id']: m for m in self.memories}
+        self._glossary_lookup = self._build_glossary_lookup()
+        self.search_index = get_knowledge_index()
+        self.search_index.build(self._build_search_documents())
         
     def _load_training_modules(self) -> Dict[str, Dict[str, Any]]:
         """Carrega os 11 módulos de treinamento."""
@@ -721,6 +758,89 @@ class VelyraKnowledgeBase:
             ]
         }
     
+    def _load_playbook_sections(self) -> Dict[str, Dict[str, str]]:
+        """Carrega as seções dos playbooks em knowledge_base/*.md."""
+        sections = {}
+        if not os.path.isdir(PLAYBOOKS_DIR):
+            return sections
+        for filename in sorted(os.listdir(PLAYBOOKS_DIR)):
+            if not filename.endswith('.md'):
+                continue
+            try:
+                with open(os.path.join(PLAYBOOKS_DIR, filename), 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except OSError as e:
+                print(f"[KNOWLEDGE] ⚠️ Playbook ilegível {filename}: {e}")
+                continue
+            for i, (title, body) in enumerate(split_markdown_sections(content)):
+                sections[f"playbook:{filename}#{i}"] = {'file': filename, 'title': title, 'body': body}
+        return sections
+
+    def _build_glossary_lookup(self) -> Dict[str, str]:
+        """Mapa (sigla ou nome normalizado) -> termo do glossário."""
+        lookup = {}
+        for term, definition in self.glossary.items():
+            for label in (term, definition['name']):
+                key = ' '.join(tokenize(label))
+                if key:
+                    lookup.setdefault(key, term)
+        return lookup
+
+    def _build_search_documents(self) -> List[Dict[str, Any]]:
+        """Corpus estático do índice de busca (ids estáveis por origem)."""
+        documents = []
+        for term, definition in self.glossary.items():
+            documents.append({
+                'id': f"glossary:{term}",
+                'source': 'glossary',
+                'title': f"{term} {definition['name']}",
+                'text': f"{definition['definition']} {definition['formula']} {definition['example']}"
+            })
+        for module_id, module in self.modules.items():
+            for topic_id, topic in module.get('topics', {}).items():
+                documents.append({
+                    'id': f"module:{module_id}:{topic_id}",
+                    'source': 'module',
+                    'title': f"{module['title']}: {topic_id.replace('_', ' ')}",
+                    'text': flatten_text(topic)
+                })
+        for category, practices in self.best_practices.items():
+            documents.append({
+                'id': f"practice:{category}",
+                'source': 'best_practice',
+                'title': f"{category.replace('_', ' ')} {BEST_PRACTICE_ALIASES.get(category, '')}",
+                'text': ' '.join(practices)
+            })
+        for memory in self.memories:
+            documents.append({
+                'id': f"memory:{memory['id']}",
+                'source': 'memory',
+                'title': memory['campaign_name'],
+                'text': flatten_text([
+                    memory.get('category'), memory.get('product_type'), memory.get('platform'),
+                    memory.get('objective'), memory.get('winning_elements'),
+                    memory.get('learnings'), memory.get('tags')
+                ])
+            })
+        for doc_id, section in self.playbook_sections.items():
+            documents.append({
+                'id': doc_id,
+                'source': 'playbook',
+                'title': section['title'],
+                'text': section['body']
+            })
+        return documents
+
+    def _find_glossary_term(self, question: str) -> Optional[str]:
+        """Termo do glossário citado na pergunta (n-gramas de tokens, mais longo primeiro)."""
+        tokens = tokenize(question)
+        for size in (3, 2, 1):
+            for start in range(len(tokens) - size + 1):
+                term = self._glossary_lookup.get(' '.join(tokens[start:start + size]))
+                if term:
+                    return term
+        return None
+
     def answer_question(self, question: str) -> Dict[str, Any]:
         """
         Responde perguntas técnicas usando a base de conhecimento.
@@ -731,18 +851,8 @@ class VelyraKnowledgeBase:
         Returns:
             Resposta estruturada com conhecimento relevante
         """
-        question_lower = question.lower()
-        
-        # Verificar se é pergunta sobre glossário
-        for term, definition in self.glossary.items():
-            if term.lower() in question_lower or definition['name'].lower() in question_lower:
-                return {
-                    'success': True,
-                    'type': 'glossary',
-                    'term': term,
-                    'answer': f"**{definition['name']} ({term})**\n\n{definition['definition']}\n\n**Fórmula:** {definition['formula']}\n\n**Exemplo:** {definition['example']}",
-                    'related_terms': self._get_related_terms(term)
-                }
+        # Sem acentos: "Diferença"/"diferenca" e "público"/"publico" casam igual
+        question_lower = strip_accents(question)
         
         # Verificar se é pergunta sobre diferença entre conceitos
         if 'diferen' in question_lower:
@@ -852,67 +962,37 @@ Para reduzir o Custo por Aquisição, siga estas ações em ordem de prioridade:
                     'source': 'Módulo 7: Otimização de Campanhas'
                 }
         
+        # Verificar se é pergunta sobre glossário (lookup direto, sem varrer termos)
+        # Termo citado no meio de uma pergunta mais ampla fica para a busca
+        term = self._find_glossary_term(question)
+        query_terms = set(tokenize(question))
+        if term and (
+            len(query_terms) <= 2 * len(tokenize(term))
+            or any(cue in question_lower for cue in DEFINITION_CUES)
+        ):
+            return self._glossary_answer(term)
+        
         # Verificar se é pergunta sobre melhores práticas
-        if 'melhor' in question_lower or 'dica' in question_lower or 'prática' in question_lower:
-            category = None
-            if 'criativo' in question_lower:
-                category = 'criativos'
-            elif 'copy' in question_lower or 'texto' in question_lower:
-                category = 'copy'
-            elif 'público' in question_lower or 'audiência' in question_lower:
-                category = 'publicos'
-            elif 'métrica' in question_lower:
-                category = 'metricas'
-            elif 'otimiz' in question_lower:
-                category = 'otimizacao'
-            else:
-                category = 'criacao_campanha'
-            
-            practices = self.best_practices.get(category, self.best_practices['criacao_campanha'])
-            
-            answer = f"""**Melhores Práticas: {category.replace('_', ' ').title()}**
-
-"""
-            for i, practice in enumerate(practices, 1):
-                answer += f"{i}. {practice}\n"
-            
-            return {
-                'success': True,
-                'type': 'best_practices',
-                'answer': answer,
-                'category': category
-            }
+        if 'melhor' in question_lower or 'dica' in question_lower or 'pratica' in question_lower:
+            hits = self.search_index.search(question, k=1, sources={'best_practice'})
+            category = hits[0]['id'].split(':', 1)[1] if hits else 'criacao_campanha'
+            return self._best_practices_answer(category)
         
-        # Buscar em memórias de campanhas
-        relevant_memories = self._search_memories(question)
-        if relevant_memories:
-            memory = relevant_memories[0]
-            answer = f"""**Caso Similar Encontrado**
-
-**Campanha:** {memory['campaign_name']}
-**Plataforma:** {memory['platform']}
-**Objetivo:** {memory['objective']}
-**Budget:** R$ {memory['budget']}
-
-**Resultados:**
-- ROAS: {memory['results']['roas']}x
-- CPA: R$ {memory['results']['cpa']}
-- Conversões: {memory['results']['conversions']}
-
-**Elementos Vencedores:**
-- Headline: {memory['winning_elements']['headline']}
-- Criativo: {memory['winning_elements']['creative_type']}
-- Público: {memory['winning_elements']['audience']}
-
-**Aprendizados:**
-{chr(10).join('- ' + l for l in memory['learnings'])}"""
-            
-            return {
-                'success': True,
-                'type': 'case_study',
-                'answer': answer,
-                'memory_id': memory['id']
-            }
+        # Busca BM25 em toda a base (módulos, playbooks, memórias, ...)
+        hits = [
+            hit for hit in self.search_index.search(question, k=5, min_score=MIN_SEARCH_SCORE)
+            if hit['matched_terms'] >= MIN_QUERY_COVERAGE * len(query_terms)
+        ]
+        for hit in hits:
+            response = self._answer_from_hit(hit)
+            if response:
+                response['sources'] = [
+                    {'id': h['id'], 'title': h['title'], 'score': h['score']} for h in hits[:3]
+                ]
+                return response
+        
+        if term:
+            return self._glossary_answer(term)
         
         # Resposta genérica com sugestões
         return {
@@ -944,6 +1024,132 @@ Reformule sua pergunta e terei prazer em ajudar!""",
             ]
         }
     
+    def _glossary_answer(self, term: str) -> Dict[str, Any]:
+        definition = self.glossary[term]
+        return {
+            'success': True,
+            'type': 'glossary',
+            'term': term,
+            'answer': f"**{definition['name']} ({term})**\n\n{definition['definition']}\n\n**Fórmula:** {definition['formula']}\n\n**Exemplo:** {definition['example']}",
+            'related_terms': self._get_related_terms(term)
+        }
+    
+    def _best_practices_answer(self, category: str) -> Dict[str, Any]:
+        practices = self.best_practices.get(category, self.best_practices['criacao_campanha'])
+        
+        answer = f"""**Melhores Práticas: {category.replace('_', ' ').title()}**
+
+"""
+        for i, practice in enumerate(practices, 1):
+            answer += f"{i}. {practice}\n"
+        
+        return {
+            'success': True,
+            'type': 'best_practices',
+            'answer': answer,
+            'category': category
+        }
+    
+    def _case_study_answer(self, memory: Dict[str, Any]) -> Dict[str, Any]:
+        answer = f"""**Caso Similar Encontrado**
+
+**Campanha:** {memory['campaign_name']}
+**Plataforma:** {memory['platform']}
+**Objetivo:** {memory['objective']}
+**Budget:** R$ {memory['budget']}
+
+**Resultados:**
+- ROAS: {memory['results']['roas']}x
+- CPA: R$ {memory['results']['cpa']}
+- Conversões: {memory['results']['conversions']}
+
+**Elementos Vencedores:**
+- Headline: {memory['winning_elements']['headline']}
+- Criativo: {memory['winning_elements']['creative_type']}
+- Público: {memory['winning_elements']['audience']}
+
+**Aprendizados:**
+{chr(10).join('- ' + l for l in memory['learnings'])}"""
+        
+        return {
+            'success': True,
+            'type': 'case_study',
+            'answer': answer,
+            'memory_id': memory['id']
+        }
+    
+    def _answer_from_hit(self, hit: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Monta a resposta a partir de um resultado da busca (None se o documento sumiu)."""
+        source, key = hit['source'], hit['id'].split(':', 1)[1]
+        
+        if source == 'glossary' and key in self.glossary:
+            return self._glossary_answer(key)
+        
+        if source == 'best_practice' and key in self.best_practices:
+            return self._best_practices_answer(key)
+        
+        if source == 'memory':
+            memories = self._search_memories_ranked([hit])
+            return self._case_study_answer(memories[0]) if memories else None
+        
+        if source == 'module':
+            module_id, _, topic_id = key.partition(':')
+            topic = self.modules.get(module_id, {}).get('topics', {}).get(topic_id)
+            if topic is None:
+                return None
+            return {
+                'success': True,
+                'type': 'knowledge',
+                'answer': f"**{topic_id.replace('_', ' ').title()}**\n\n{self._format_topic(topic)}",
+                'source': self.modules[module_id]['title']
+            }
+        
+        if source == 'playbook':
+            section = self.playbook_sections.get(hit['id'])
+            if section is None:
+                return None
+            body = section['body']
+            if len(body) > 1500:
+                body = body[:1500].rsplit('\n', 1)[0] + '\n...'
+            return {
+                'success': True,
+                'type': 'knowledge',
+                'answer': f"**{section['title']}**\n\n{body}",
+                'source': section['file']
+            }
+        
+        # Conteúdo aprendido em runtime (LivingKnowledgeBase)
+        summary = hit['metadata'].get('summary')
+        if summary:
+            return {
+                'success': True,
+                'type': 'knowledge',
+                'answer': f"**{hit['title']}**\n\n{summary}",
+                'source': 'Base de Conhecimento Viva'
+            }
+        return None
+    
+    @staticmethod
+    def _format_topic(topic: Any, indent: str = '') -> str:
+        """Formata um tópico de módulo (dicts/listas aninhados) como lista."""
+        if isinstance(topic, dict):
+            lines = []
+            for key, value in topic.items():
+                label = key.replace('_', ' ').capitalize()
+                if isinstance(value, (dict, list)):
+                    lines.append(f"{indent}- **{label}:**")
+                    lines.append(VelyraKnowledgeBase._format_topic(value, indent + '  '))
+                else:
+                    lines.append(f"{indent}- **{label}:** {value}")
+            return '\n'.join(lines)
+        if isinstance(topic, list):
+            return '\n'.join(
+                VelyraKnowledgeBase._format_topic(item, indent) if isinstance(item, (dict, list))
+                else f"{indent}- {item}"
+                for item in topic
+            )
+        return f"{indent}{topic}"
+    
     def _get_related_terms(self, term: str) -> List[str]:
         """Retorna termos relacionados."""
         related = {
@@ -961,29 +1167,19 @@ Reformule sua pergunta e terei prazer em ajudar!""",
         return related.get(term, [])
     
     def _search_memories(self, query: str) -> List[Dict[str, Any]]:
-        """Busca memórias relevantes para a query."""
-        query_lower = query.lower()
-        
-        # Extrair tags da query
-        query_tags = []
-        for tag in ['saude', 'beleza', 'fitness', 'moda', 'educacao', 'meta_ads', 'google_ads', 'tiktok_ads', 'conversions', 'traffic', 'ugc', 'video', 'carrossel']:
-            if tag in query_lower:
-                query_tags.append(tag)
-        
-        if not query_tags:
-            return []
-        
-        # Buscar memórias com tags correspondentes
-        relevant = []
-        for memory in self.memories:
-            score = sum(1 for tag in query_tags if tag in memory.get('tags', []))
-            if score > 0:
-                relevant.append((score, memory))
-        
-        # Ordenar por relevância
-        relevant.sort(key=lambda x: x[0], reverse=True)
-        
-        return [m for _, m in relevant[:5]]
+        """Busca memórias relevantes para a query (BM25 no índice)."""
+        hits = self.search_index.search(query, k=50, sources={'memory'}, min_score=MIN_SEARCH_SCORE)
+        return self._search_memories_ranked(hits)[:5]
+    
+    def _search_memories_ranked(self, hits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Resolve hits de memória; empates de score ficam com o maior ROAS."""
+        ranked = []
+        for hit in hits:
+            memory = self._memories_by_id.get(int(hit['id'].split(':', 1)[1]))
+            if memory is not None:
+                ranked.append((-round(hit['score'], 3), -memory['results']['roas'], memory['id'], memory))
+        ranked.sort(key=lambda item: item[:3])
+        return [item[3] for item in ranked]
     
     def get_module(self, module_name: str) -> Optional[Dict[str, Any]]:
         """Retorna um módulo específico."""
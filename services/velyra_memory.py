@@ -7,9 +7,11 @@ Nexora Prime V2 - Expansão Unicórnio
 import os
 import json
 import hashlib
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from collections import defaultdict
+from functools import lru_cache
 import sqlite3
 
 # Importar utilitários de banco de dados
@@ -18,6 +20,43 @@ try:
 except ImportError:
     from db_utils import get_db_connection, sql_param, is_postgres
 
+try:
+    from services.campaign_similarity import CampaignSimilarityIndex
+except ImportError:
+    from campaign_similarity import CampaignSimilarityIndex
+
+try:
+    from services.velyra_memory_cache import WriteBehindMemoryCache
+except ImportError:
+    from velyra_memory_cache import WriteBehindMemoryCache
+
+
+@lru_cache(maxsize=4096)
+def _loads_cached(raw: str) -> Any:
+    """JSON decodificado uma vez por valor (objeto compartilhado: não modificar)."""
+    return json.loads(raw)
+
+
+WINNING_STRATEGY_UPSERT = """
+    INSERT OR REPLACE INTO winning_strategies
+    (id, niche, country, platform, strategy_type, strategy_details, 
+     success_rate, avg_roas, times_used, times_succeeded, created_at, last_used)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, 
+            COALESCE((SELECT times_used FROM winning_strategies WHERE id = ?), 0) + 1,
+            COALESCE((SELECT times_succeeded FROM winning_strategies WHERE id = ?), 0) + 1,
+            COALESCE((SELECT created_at FROM winning_strategies WHERE id = ?), ?),
+            ?)
+"""
+
+PATTERN_UPSERT = """
+    INSERT OR REPLACE INTO learned_patterns
+    (id, pattern_type, pattern_key, pattern_value, confidence, occurrences, last_seen, context)
+    VALUES (?, ?, ?, ?, 
+            COALESCE((SELECT confidence FROM learned_patterns WHERE id = ?), 0.5),
+            COALESCE((SELECT occurrences FROM learned_patterns WHERE id = ?), 0) + 1,
+            ?, ?)
+"""
+
 
 class VelyraMemory:
     """Sistema de memória evolutiva da IA Velyra."""
@@ -27,17 +66,6 @@ class VelyraMemory:
         self.version = "2.0.0"
         self.db_path = db_path
         
-        # Memória em cache para acesso rápido
-        self.memory_cache = {
-            "accounts": defaultdict(dict),
-            "niches": defaultdict(dict),
-            "countries": defaultdict(dict),
-            "products": defaultdict(dict),
-            "platforms": defaultdict(dict),
-            "strategies": defaultdict(list),
-            "patterns": defaultdict(list)
-        }
-        
         # Pesos de aprendizado
         self.learning_weights = {
             "winner_campaign": 1.5,
@@ -48,8 +76,27 @@ class VelyraMemory:
             "low_roas": 0.6
         }
         
+        # Índice kNN do histórico (carregado no primeiro uso)
+        self.similarity_index = CampaignSimilarityIndex()
+        
         # Inicializar banco de dados
         self._init_database()
+        
+        # Memória em cache para acesso rápido (limitada, write-behind,
+        # aquecida pelo snapshot em memory_stats; criada no primeiro uso)
+        self._memory_cache: Optional[WriteBehindMemoryCache] = None
+        self._memory_cache_lock = threading.Lock()
+    
+    @property
+    def memory_cache(self) -> WriteBehindMemoryCache:
+        """Cache write-behind das estatísticas (cria memory_stats no primeiro uso)"""
+        if self._memory_cache is None:
+            with self._memory_cache_lock:
+                if self._memory_cache is None:
+                    cache = WriteBehindMemoryCache()
+                    cache.warm_load()
+                    self._memory_cache = cache
+        return self._memory_cache
     
     def _init_database(self):
         """Inicializa o banco de dados de memória."""
@@ -146,22 +193,58 @@ class VelyraMemory:
     def learn_from_campaign(self, campaign_data: Dict) -> Dict[str, Any]:
         """Aprende com os resultados de uma campanha."""
         
+        learning = self._prepare_learning(campaign_data)
+        self._write_learnings([learning])
+        learnings = learning["learnings"]
+        
+        return {
+            "campaign_id": learning["record"]["id"],
+            "status": learning["status"],
+            "success_score": learning["record"]["success_score"],
+            "learnings": learnings,
+            "memory_updated": True,
+            "patterns_recorded": len(learnings.get("patterns", [])),
+            "insights_generated": len(learnings.get("insights", []))
+        }
+    
+    def learn_from_campaigns(self, campaigns: List[Dict], batch_size: int = 5000) -> Dict[str, Any]:
+        """Aprende com várias campanhas encerradas (backfill).
+        
+        Cada lote de `batch_size` campanhas é gravado em uma única transação
+        (histórico, estratégias vencedoras e padrões via executemany), com o
+        mesmo resultado de chamar learn_from_campaign uma a uma.
+        """
+        started = datetime.now()
+        by_status = defaultdict(int)
+        patterns = 0
+        
+        for i in range(0, len(campaigns), batch_size):
+            batch = [self._prepare_learning(c) for c in campaigns[i:i + batch_size]]
+            self._write_learnings(batch)
+            for learning in batch:
+                by_status[learning["status"]] += 1
+                patterns += len(learning["learnings"].get("patterns", []))
+        
+        return {
+            "campaigns_learned": len(campaigns),
+            "by_status": dict(by_status),
+            "patterns_recorded": patterns,
+            "duration_ms": round((datetime.now() - started).total_seconds() * 1000, 1),
+            "memory_updated": True
+        }
+    
+    def _prepare_learning(self, campaign_data: Dict) -> Dict[str, Any]:
+        """Calcula score, status e aprendizados de uma campanha (sem I/O)."""
+        
         campaign_id = campaign_data.get("id", f"camp_{datetime.now().strftime('%Y%m%d%H%M%S')}")
         
         # Extrair dados relevantes
-        account_id = campaign_data.get("account_id", "default")
-        niche = campaign_data.get("niche", "geral")
-        country = campaign_data.get("country", "BR")
-        product_type = campaign_data.get("product_type", "digital")
-        platform = campaign_data.get("platform", "facebook")
         strategy = campaign_data.get("strategy", {})
         
         # Métricas
         spend = campaign_data.get("spend", 0)
         revenue = campaign_data.get("revenue", 0)
         conversions = campaign_data.get("conversions", 0)
-        roas = revenue / spend if spend > 0 else 0
-        cpa = spend / conversions if conversions > 0 else 0
         
         # Calcular score de sucesso
         success_score = self._calculate_success_score(campaign_data)
@@ -169,50 +252,81 @@ class VelyraMemory:
         # Determinar status
         status = "winner" if success_score >= 70 else "average" if success_score >= 50 else "loser"
         
-        # Extrair aprendizados
-        learnings = self._extract_learnings(campaign_data, status)
-        
-        # Salvar no banco
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO campaigns_history 
-            (id, account_id, niche, country, product_type, platform, strategy, 
-             budget, spend, revenue, roas, cpa, conversions, status, success_score,
-             created_at, ended_at, learnings)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            campaign_id, account_id, niche, country, product_type, platform,
-            json.dumps(strategy), campaign_data.get("budget", 0), spend, revenue,
-            roas, cpa, conversions, status, success_score,
-            campaign_data.get("created_at", datetime.now().isoformat()),
-            datetime.now().isoformat(), json.dumps(learnings)
-        ))
-        
-        conn.commit()
-        conn.close()
-        
-        # Atualizar cache
-        self._update_memory_cache(campaign_data, learnings, status)
-        
-        # Atualizar estratégias vencedoras se aplicável
-        if status == "winner":
-            self._record_winning_strategy(campaign_data, strategy)
-        
-        # Registrar padrões
-        self._record_patterns(campaign_data, status)
+        record = {
+            "id": campaign_id,
+            "account_id": campaign_data.get("account_id", "default"),
+            "niche": campaign_data.get("niche", "geral"),
+            "country": campaign_data.get("country", "BR"),
+            "product_type": campaign_data.get("product_type", "digital"),
+            "platform": campaign_data.get("platform", "facebook"),
+            "strategy": strategy,
+            "budget": campaign_data.get("budget", 0),
+            "spend": spend,
+            "revenue": revenue,
+            "roas": revenue / spend if spend > 0 else 0,
+            "cpa": spend / conversions if conversions > 0 else 0,
+            "conversions": conversions,
+            "status": status,
+            "success_score": success_score,
+            "created_at": campaign_data.get("created_at", datetime.now().isoformat()),
+            "ended_at": datetime.now().isoformat(),
+            # Extrair aprendizados
+            "learnings": self._extract_learnings(campaign_data, status)
+        }
         
         return {
-            "campaign_id": campaign_id,
+            "campaign_data": campaign_data,
+            "record": record,
             "status": status,
-            "success_score": success_score,
-            "learnings": learnings,
-            "memory_updated": True,
-            "patterns_recorded": len(learnings.get("patterns", [])),
-            "insights_generated": len(learnings.get("insights", []))
+            "learnings": record["learnings"]
         }
     
+    def _write_learnings(self, batch: List[Dict[str, Any]]):
+        """Grava um lote de aprendizados em uma transação e atualiza caches."""
+        
+        history_rows, strategy_rows, pattern_rows = [], [], []
+        for learning in batch:
+            r = learning["record"]
+            history_rows.append((
+                r["id"], r["account_id"], r["niche"], r["country"], r["product_type"], r["platform"],
+                json.dumps(r["strategy"]), r["budget"], r["spend"], r["revenue"],
+                r["roas"], r["cpa"], r["conversions"], r["status"], r["success_score"],
+                r["created_at"], r["ended_at"], json.dumps(r["learnings"])
+            ))
+            # Atualizar estratégias vencedoras se aplicável
+            if learning["status"] == "winner":
+                strategy_rows.append(self._winning_strategy_row(learning["campaign_data"], r["strategy"]))
+            # Registrar padrões
+            pattern_rows.extend(self._pattern_rows(learning["campaign_data"], learning["status"]))
+        
+        # Salvar no banco
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT OR REPLACE INTO campaigns_history 
+                (id, account_id, niche, country, product_type, platform, strategy, 
+                 budget, spend, revenue, roas, cpa, conversions, status, success_score,
+                 created_at, ended_at, learnings)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, history_rows)
+            if strategy_rows:
+                cursor.executemany(WINNING_STRATEGY_UPSERT, strategy_rows)
+            cursor.executemany(PATTERN_UPSERT, pattern_rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        for learning in batch:
+            # Atualizar índice de similaridade
+            self.similarity_index.upsert(learning["record"])
+            # Atualizar cache
+            self._update_memory_cache(learning["campaign_data"], learning["learnings"], learning["status"])
+        self.memory_cache.start_flusher()
+    
     def get_recommendations(
         self,
         niche: str,
@@ -271,6 +385,12 @@ class VelyraMemory:
         
         conn.close()
         
+        # Vizinhos mais próximos no histórico (orçamento incluído na distância)
+        neighbors = self.similarity_index.search(
+            {"niche": niche, "country": country, "platform": platform, "budget": budget}, k=20
+        )
+        similar_campaigns = [self._format_similar(record, similarity) for record, similarity in neighbors[:5]]
+        
         # Formatar recomendações
         recommendations = {
             "timestamp": datetime.now().isoformat(),
@@ -283,7 +403,7 @@ class VelyraMemory:
             "recommended_strategies": [
                 {
                     "type": s[0],
-                    "details": json.loads(s[1]) if s[1] else {},
+                    "details": _loads_cached(s[1]) if s[1] else {},
                     "success_rate": s[2],
                     "avg_roas": s[3],
                     "proven_times": s[4]
@@ -315,6 +435,8 @@ class VelyraMemory:
                 }
                 for e in errors_to_avoid
             ],
+            "similar_campaigns": similar_campaigns,
+            "strategies_from_similar": self._strategies_from_similar(neighbors),
             "budget_recommendation": self._get_budget_recommendation(niche, country, budget),
             "confidence_level": self._calculate_recommendation_confidence(
                 len(winning_strategies), len(patterns), len(insights)
@@ -383,7 +505,7 @@ class VelyraMemory:
             },
             "best_strategies": [
                 {
-                    "strategy": json.loads(s[0]) if s[0] else {},
+                    "strategy": _loads_cached(s[0]) if s[0] else {},
                     "avg_roas": round(s[1], 2),
                     "times_used": s[2]
                 }
@@ -499,40 +621,58 @@ class VelyraMemory:
         }
     
     def get_similar_campaigns(self, campaign_params: Dict, limit: int = 5) -> List[Dict]:
-        """Encontra campanhas similares no histórico."""
+        """Encontra campanhas similares no histórico.
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, niche, country, platform, strategy, roas, cpa, status, learnings
-            FROM campaigns_history
-            WHERE niche = ? AND country = ? AND platform = ?
-            ORDER BY success_score DESC
-            LIMIT ?
-        """, (
-            campaign_params.get("niche", "geral"),
-            campaign_params.get("country", "BR"),
-            campaign_params.get("platform", "facebook"),
-            limit
-        ))
-        
-        similar = cursor.fetchall()
-        conn.close()
+        Busca kNN no índice em memória: nicho, país e plataforma pesam mais,
+        mas orçamento, objetivo, público e tipo de criativo (quando
+        informados) também aproximam as campanhas.
+        """
+        params = dict(campaign_params)
+        for field, default in (("niche", "geral"), ("country", "BR"), ("platform", "facebook")):
+            params.setdefault(field, default)
         
+        return [
+            self._format_similar(record, similarity)
+            for record, similarity in self.similarity_index.search(params, k=limit)
+        ]
+    
+    def _format_similar(self, record: Dict, similarity: float) -> Dict:
+        """Formata um vizinho do índice no formato de get_similar_campaigns."""
+        return {
+            "id": record["id"],
+            "niche": record.get("niche"),
+            "country": record.get("country"),
+            "platform": record.get("platform"),
+            "strategy": record.get("strategy") or {},
+            "roas": round(record["roas"], 2) if record.get("roas") else 0,
+            "cpa": round(record["cpa"], 2) if record.get("cpa") else 0,
+            "status": record.get("status"),
+            "learnings": record.get("learnings") or {},
+            "similarity": round(similarity, 4)
+        }
+    
+    def _strategies_from_similar(self, neighbors: List, limit: int = 5) -> List[Dict]:
+        """Agrupa as estratégias vencedoras dos vizinhos, ponderando pela similaridade."""
+        grouped = {}
+        for record, similarity in neighbors:
+            if record.get("status") != "winner":
+                continue
+            strategy = record.get("strategy") or {}
+            key = json.dumps(strategy, sort_keys=True)
+            entry = grouped.setdefault(key, {"strategy": strategy, "weight": 0.0, "weighted_roas": 0.0, "campaigns": 0})
+            entry["weight"] += similarity
+            entry["weighted_roas"] += similarity * (record.get("roas") or 0)
+            entry["campaigns"] += 1
+        
+        ranked = sorted(grouped.values(), key=lambda e: (e["weight"], e["weighted_roas"]), reverse=True)
         return [
             {
-                "id": c[0],
-                "niche": c[1],
-                "country": c[2],
-                "platform": c[3],
-                "strategy": json.loads(c[4]) if c[4] else {},
-                "roas": round(c[5], 2) if c[5] else 0,
-                "cpa": round(c[6], 2) if c[6] else 0,
-                "status": c[7],
-                "learnings": json.loads(c[8]) if c[8] else {}
+                "strategy": e["strategy"],
+                "avg_roas": round(e["weighted_roas"] / e["weight"], 2) if e["weight"] > 0 else 0,
+                "similar_winners": e["campaigns"],
+                "similarity_weight": round(e["weight"], 3)
             }
-            for c in similar
+            for e in ranked[:limit]
         ]
     
     def _calculate_success_score(self, campaign_data: Dict) -> float:
@@ -607,43 +747,23 @@ class VelyraMemory:
         return learnings
     
     def _update_memory_cache(self, campaign_data: Dict, learnings: Dict, status: str):
-        """Atualiza cache de memória."""
-        niche = campaign_data.get("niche", "geral")
-        country = campaign_data.get("country", "BR")
-        platform = campaign_data.get("platform", "facebook")
-        
-        # Atualizar estatísticas do nicho
-        if niche not in self.memory_cache["niches"]:
-            self.memory_cache["niches"][niche] = {
-                "campaigns": 0,
-                "winners": 0,
-                "total_roas": 0
-            }
+        """Atualiza cache de memória (gravado no banco pelo flush periódico)."""
+        roas = campaign_data.get("roas", 0)
         
-        self.memory_cache["niches"][niche]["campaigns"] += 1
-        if status == "winner":
-            self.memory_cache["niches"][niche]["winners"] += 1
-        self.memory_cache["niches"][niche]["total_roas"] += campaign_data.get("roas", 0)
+        # Atualizar estatísticas de conta, nicho, país, plataforma e produto
+        self.memory_cache.record("accounts", campaign_data.get("account_id", "default"), status, roas)
+        self.memory_cache.record("niches", campaign_data.get("niche", "geral"), status, roas)
+        self.memory_cache.record("countries", campaign_data.get("country", "BR"), status, roas)
+        self.memory_cache.record("platforms", campaign_data.get("platform", "facebook"), status, roas)
+        self.memory_cache.record("products", campaign_data.get("product_type", "digital"), status, roas)
     
-    def _record_winning_strategy(self, campaign_data: Dict, strategy: Dict):
-        """Registra estratégia vencedora."""
+    def _winning_strategy_row(self, campaign_data: Dict, strategy: Dict) -> tuple:
+        """Parâmetros de WINNING_STRATEGY_UPSERT para uma estratégia vencedora."""
         strategy_id = hashlib.md5(
             json.dumps(strategy, sort_keys=True).encode()
         ).hexdigest()[:12]
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT OR REPLACE INTO winning_strategies
-            (id, niche, country, platform, strategy_type, strategy_details, 
-             success_rate, avg_roas, times_used, times_succeeded, created_at, last_used)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 
-                    COALESCE((SELECT times_used FROM winning_strategies WHERE id = ?), 0) + 1,
-                    COALESCE((SELECT times_succeeded FROM winning_strategies WHERE id = ?), 0) + 1,
-                    COALESCE((SELECT created_at FROM winning_strategies WHERE id = ?), ?),
-                    ?)
-        """, (
+        return (
             strategy_id,
             campaign_data.get("niche", "geral"),
             campaign_data.get("country", "BR"),
@@ -655,13 +775,10 @@ class VelyraMemory:
             strategy_id, strategy_id, strategy_id,
             datetime.now().isoformat(),
             datetime.now().isoformat()
-        ))
-        
-        conn.commit()
-        conn.close()
+        )
     
-    def _record_patterns(self, campaign_data: Dict, status: str):
-        """Registra padrões identificados."""
+    def _pattern_rows(self, campaign_data: Dict, status: str) -> List[tuple]:
+        """Parâmetros de PATTERN_UPSERT para os padrões identificados."""
         patterns = []
         
         # Padrão de nicho + país
@@ -680,22 +797,13 @@ class VelyraMemory:
             "context": json.dumps({"cpa": campaign_data.get("cpa", 0)})
         })
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
+        rows = []
         for pattern in patterns:
             pattern_id = hashlib.md5(
                 f"{pattern['type']}_{pattern['key']}".encode()
             ).hexdigest()[:12]
             
-            cursor.execute("""
-                INSERT OR REPLACE INTO learned_patterns
-                (id, pattern_type, pattern_key, pattern_value, confidence, occurrences, last_seen, context)
-                VALUES (?, ?, ?, ?, 
-                        COALESCE((SELECT confidence FROM learned_patterns WHERE id = ?), 0.5),
-                        COALESCE((SELECT occurrences FROM learned_patterns WHERE id = ?), 0) + 1,
-                        ?, ?)
-            """, (
+            rows.append((
                 pattern_id,
                 pattern["type"],
                 pattern["key"],
@@ -704,9 +812,7 @@ class VelyraMemory:
                 datetime.now().isoformat(),
                 pattern["context"]
             ))
-        
-        conn.commit()
-        conn.close()
+        return rows
     
     def _get_budget_recommendation(self, niche: str, country: str, proposed_budget: float) -> Dict:
         """Recomenda orçamento baseado em histórico."""
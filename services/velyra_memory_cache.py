@@ -0,0 +1,254 @@
+"""
+🧠 VELYRA MEMORY CACHE - Cache de Memória Limitado com Write-Behind
+Nexora Prime
+
+Estatísticas agregadas da memória (por conta, nicho, país, plataforma e
+tipo de produto) mantidas em memória com:
+- LRU limitado (max_entries) em vez de defaultdicts sem fim
+- Write-behind: incrementos acumulados em deltas e gravados em lote
+  (upsert aditivo, seguro com vários processos) a cada `flush_interval`
+- Snapshot compacto na tabela `memory_stats` (uma linha por seção/chave),
+  usado para aquecer o cache na inicialização
+"""
+
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param
+except ImportError:
+    from db_utils import get_db_connection, sql_param
+
+
+SECTIONS = ("accounts", "niches", "countries", "platforms", "products")
+COUNTERS = ("campaigns", "winners", "total_roas")
+
+
+def _empty() -> Dict[str, float]:
+    return {"campaigns": 0, "winners": 0, "total_roas": 0.0}
+
+
+class WriteBehindMemoryCache:
+    """
+    Cache LRU de estatísticas com gravação atrasada.
+
+    Entradas guardam totais (snapshot do banco + deltas locais); `_pending`
+    guarda só o que ainda não foi gravado. Uma chave que não estava em
+    memória começa em zero e é completada com o banco na primeira leitura.
+    """
+
+    def __init__(self, max_entries: int = 5000, max_pending: int = 10000, flush_interval: float = 60.0):
+        self.max_entries = max_entries
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, float]]" = OrderedDict()
+        self._pending: Dict[Tuple[str, str], Dict[str, float]] = {}
+        self._needs_load = set()
+        self._lock = threading.RLock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._init_table()
+
+    def _init_table(self):
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS memory_stats (
+                    section TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    campaigns INTEGER NOT NULL DEFAULT 0,
+                    winners INTEGER NOT NULL DEFAULT 0,
+                    total_roas REAL NOT NULL DEFAULT 0,
+                    updated_at TEXT,
+                    PRIMARY KEY (section, key)
+                )
+            """)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[MEMORY CACHE] ❌ Erro ao criar tabela: {e}")
+
+    # ===== ESCRITA =====
+
+    def record(self, section: str, key: str, status: str, roas: float):
+        """Registra uma campanha na estatística (seção, chave)"""
+        delta = {"campaigns": 1, "winners": 1 if status == "winner" else 0, "total_roas": roas or 0}
+        with self._lock:
+            cache_key = (section, str(key))
+            pending = self._pending.setdefault(cache_key, _empty())
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                entry = _empty()
+                self._needs_load.add(cache_key)
+                self._entries[cache_key] = entry
+            for counter in COUNTERS:
+                pending[counter] += delta[counter]
+                entry[counter] += delta[counter]
+            self._entries.move_to_end(cache_key)
+            self._evict()
+            over_limit = len(self._pending) >= self.max_pending
+
+        if over_limit:
+            self.flush()
+
+    def _evict(self):
+        # Deltas pendentes sobrevivem à remoção da entrada até o próximo flush
+        while len(self._entries) > self.max_entries:
+            cache_key, _ = self._entries.popitem(last=False)
+            self._needs_load.discard(cache_key)
+
+    def flush(self) -> int:
+        """Grava os deltas pendentes em uma transação (upsert aditivo)
+
+        Roda sob o lock: uma leitura concorrente encontra cada delta em
+        exatamente um lugar (no banco ou em `_pending`).
+        """
+        with self._lock:
+            if not self._pending:
+                return 0
+
+            now = datetime.now().isoformat()
+            rows = [
+                (section, key, int(d["campaigns"]), int(d["winners"]), d["total_roas"], now)
+                for (section, key), d in self._pending.items()
+            ]
+            try:
+                conn = get_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.executemany(sql_param("""
+                        INSERT INTO memory_stats (section, key, campaigns, winners, total_roas, updated_at)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (section, key) DO UPDATE SET
+                            campaigns = memory_stats.campaigns + excluded.campaigns,
+                            winners = memory_stats.winners + excluded.winners,
+                            total_roas = memory_stats.total_roas + excluded.total_roas,
+                            updated_at = excluded.updated_at
+                    """), rows)
+                    conn.commit()
+                finally:
+                    conn.close()
+            except Exception as e:
+                # Deltas ficam pendentes para a próxima tentativa
+                print(f"[MEMORY CACHE] ❌ Erro no flush: {e}")
+                return 0
+
+            self._pending = {}
+            return len(rows)
+
+    # ===== LEITURA =====
+
+    def get_stats(self, section: str, key: str) -> Dict[str, float]:
+        """Totais de (seção, chave), combinando banco e deltas locais"""
+        cache_key = (section, str(key))
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and cache_key not in self._needs_load:
+                self._entries.move_to_end(cache_key)
+                return dict(entry)
+
+            row = self._fetch(cache_key)
+            entry = dict(row) if row else _empty()
+            # O banco ainda não tem o que está pendente
+            for counter, value in self._pending.get(cache_key, {}).items():
+                entry[counter] += value
+            self._needs_load.discard(cache_key)
+            self._entries[cache_key] = entry
+            self._evict()
+            return dict(entry)
+
+    def _fetch(self, cache_key: Tuple[str, str]) -> Optional[Dict[str, float]]:
+        try:
+            conn = get_db_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(sql_param(
+                    "SELECT campaigns, winners, total_roas FROM memory_stats WHERE section = ? AND key = ?"
+                ), cache_key)
+                row = cursor.fetchone()
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"[MEMORY CACHE] ⚠️ Erro ao ler estatística: {e}")
+            return None
+        if row is None:
+            return None
+        values = [row[c] for c in COUNTERS] if isinstance(row, dict) else list(row)
+        return dict(zip(COUNTERS, values))
+
+    def warm_load(self) -> int:
+        """Carrega as entradas mais recentes do snapshot (até max_entries)"""
+        with self._lock:
+            try:
+                conn = get_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(sql_param("""
+                        SELECT section, key, campaigns, winners, total_roas
+                        FROM memory_stats
+                        ORDER BY updated_at DESC
+                        LIMIT ?
+                    """), (self.max_entries,))
+                    rows = cursor.fetchall()
+                finally:
+                    conn.close()
+            except Exception as e:
+                print(f"[MEMORY CACHE] ⚠️ Snapshot indisponível: {e}")
+                return 0
+
+            # Mais antigas primeiro, para a ordem LRU refletir updated_at
+            for row in reversed(rows):
+                values = [row[c] for c in ("section", "key") + COUNTERS] if isinstance(row, dict) else list(row)
+                cache_key = (values[0], values[1])
+                if cache_key in self._entries and cache_key not in self._needs_load:
+                    continue
+                entry = dict(zip(COUNTERS, values[2:]))
+                for counter, value in self._pending.get(cache_key, {}).items():
+                    entry[counter] += value
+                self._needs_load.discard(cache_key)
+                self._entries[cache_key] = entry
+            self._evict()
+        return len(rows)
+
+    # ===== COMPATIBILIDADE (memory_cache["niches"], .get) =====
+
+    def section(self, name: str) -> Dict[str, Dict[str, float]]:
+        """Visão (cópia) das entradas em memória de uma seção"""
+        with self._lock:
+            return {key: dict(entry) for (section, key), entry in self._entries.items() if section == name}
+
+    def __getitem__(self, name: str) -> Dict[str, Dict[str, float]]:
+        if name not in SECTIONS:
+            raise KeyError(name)
+        return self.section(name)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.section(name) if name in SECTIONS else default
+
+    def __len__(self):
+        return len(self._entries)
+
+    # ===== FLUSH PERIÓDICO =====
+
+    def start_flusher(self):
+        """Inicia a thread de flush periódico (idempotente)"""
+        if self._flusher is not None:
+            return
+
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+
+        self._flusher = threading.Thread(target=run, name="memory-cache-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Para a thread e grava o que estiver pendente"""
+        self._stop.set()
+        self.flush()
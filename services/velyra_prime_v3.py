@@ -47,6 +47,11 @@ try:
 except ImportError:
     from db_utils import get_db_connection, sql_param, is_postgres
 
+try:
+    from services.velyra_command_router import CommandRouter
+except ImportError:
+    from velyra_command_router import CommandRouter
+
 
 # Importar serviços criados
 try:
@@ -112,6 +117,7 @@ class VelyraPrimeV3:
         
         # Padrões de comando
         self.command_patterns = self._load_command_patterns()
+        self.command_router = CommandRouter(self.command_patterns)
         
     def _load_command_patterns(self) -> Dict[str, Dict[str, Any]]:
         """Carrega padrões de reconhecimento de comandos."""
@@ -332,110 +338,17 @@ class VelyraPrimeV3:
         """
         Analisa a mensagem e identifica o tipo de comando.
         
+        Os padrões são compilados uma única vez no CommandRouter
+        (regex combinada, uma passada por mensagem).
+        
         Returns:
             Tuple com (tipo_comando, parâmetros)
         """
-        message_lower = message.lower().strip()
-        
-        # Verificar saudações
-        greetings = ['olá', 'ola', 'oi', 'hey', 'hello', 'bom dia', 'boa tarde', 'boa noite']
-        if any(g in message_lower for g in greetings) and len(message_lower) < 30:
-            return ('greeting', {})
-        
-        # Verificar comandos de ação
-        for cmd_name, cmd_config in self.command_patterns.items():
-            for pattern in cmd_config['patterns']:
-                if re.search(pattern, message_lower):
-                    # Extrair parâmetros
-                    params = self._extract_params(message, cmd_config.get('extract', []))
-                    return ('action', {
-                        'action': cmd_config['action'],
-                        'data': params,
-                        'command_name': cmd_name
-                    })
-        
-        # Verificar se é pergunta técnica
-        question_indicators = [
-            'o que é', 'o que e', 'como', 'qual', 'quando', 'por que', 'porque',
-            'explica', 'significa', 'diferença', 'diferenca', 'melhor', 'dica'
-        ]
-        if any(q in message_lower for q in question_indicators):
-            return ('question', {'question': message})
-        
-        # Se menciona campanha, produto ou métrica, tentar identificar intenção
-        campaign_words = ['campanha', 'anúncio', 'anuncio', 'meta ads', 'google ads', 'facebook']
-        metric_words = ['cpa', 'roas', 'ctr', 'cpc', 'conversão', 'conversao', 'vendas']
-        
-        if any(w in message_lower for w in campaign_words + metric_words):
-            # Provavelmente quer análise ou ação
-            if any(w in message_lower for w in ['como está', 'como esta', 'status', 'resultado']):
-                return ('action', {
-                    'action': 'analyze_performance',
-                    'data': self._extract_params(message, ['campaign_name']),
-                    'command_name': 'analyze_performance'
-                })
-        
-        # Comando não reconhecido - tentar responder como pergunta
-        return ('question', {'question': message})
+        return self.command_router.route(message)
     
     def _extract_params(self, message: str, param_names: List[str]) -> Dict[str, Any]:
         """Extrai parâmetros da mensagem."""
-        params = {}
-        message_lower = message.lower()
-        
-        for param in param_names:
-            if param == 'product':
-                # Extrair nome do produto
-                products = ['synadentix', 'clareador', 'suplemento']
-                for p in products:
-                    if p in message_lower:
-                        params['product'] = p.title()
-                        break
-                if 'product' not in params:
-                    # Tentar extrair após "para" ou "do"
-                    match = re.search(r'(?:para|do|da)\s+(?:o\s+)?(\w+)', message_lower)
-                    if match:
-                        params['product'] = match.group(1).title()
-            
-            elif param == 'platform':
-                if 'meta' in message_lower or 'facebook' in message_lower or 'instagram' in message_lower:
-                    params['platform'] = 'meta_ads'
-                elif 'google' in message_lower:
-                    params['platform'] = 'google_ads'
-                elif 'tiktok' in message_lower:
-                    params['platform'] = 'tiktok_ads'
-            
-            elif param == 'budget':
-                match = re.search(r'(?:budget|orçamento|orcamento|r\$)\s*(?:de\s+)?(\d+(?:[.,]\d+)?)', message_lower)
-                if match:
-                    params['budget'] = float(match.group(1).replace(',', '.'))
-            
-            elif param == 'objective':
-                if 'venda' in message_lower or 'conversão' in message_lower or 'conversao' in message_lower:
-                    params['objective'] = 'conversions'
-                elif 'tráfego' in message_lower or 'trafego' in message_lower or 'clique' in message_lower:
-                    params['objective'] = 'traffic'
-                elif 'lead' in message_lower or 'cadastro' in message_lower:
-                    params['objective'] = 'leads'
-            
-            elif param == 'campaign_name' or param == 'campaign_id':
-                # Tentar extrair nome da campanha
-                match = re.search(r'campanha\s+["\']?([^"\']+)["\']?', message_lower)
-                if match:
-                    params['campaign_name'] = match.group(1).strip()
-            
-            elif param == 'percentage':
-                match = re.search(r'(\d+)\s*%', message_lower)
-                if match:
-                    params['percentage'] = int(match.group(1))
-            
-            elif param == 'term':
-                # Extrair termo para explicação
-                match = re.search(r'(?:o que [eé]|explica(?:r)?|significado de)\s+(\w+)', message_lower)
-                if match:
-                    params['term'] = match.group(1).upper()
-        
-        return params
+        return self.command_router.extract_params(message, param_names)
     
     def _handle_greeting(self) -> str:
         """Responde a saudações."""
@@ -0,0 +1,731 @@
+"""
+📤 WEBHOOK DISPATCHER - Entrega Assíncrona de Webhooks
+Nexora Prime
+
+Desacopla a emissão de eventos da entrega HTTP aos assinantes:
+- Outbox persistente (tabela webhook_outbox): emitir um evento custa um INSERT local
+- Pool de senders em background reutilizando conexões keep-alive (requests.Session)
+- Limite de concorrência por endpoint
+- Circuit breaker por endpoint
+- Retry com backoff exponencial e jitter
+- Assinaturas com `batch` recebem os eventos pendentes em lote
+  ({"events": [...]}); as demais, um POST por evento no formato original
+- O poller sobe na inicialização da aplicação (main.py), então linhas
+  pendentes de antes de um restart são entregues sem esperar novo evento
+
+Usado por MCPIntegrationService.trigger_webhook e RealtimePipeline._trigger_webhooks.
+"""
+
+import os
+import json
+import hmac
+import time
+import uuid
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional, Tuple
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    requests = None
+    HTTPAdapter = None
+    REQUESTS_AVAILABLE = False
+
+# Importar utilitários de banco de dados
+try:
+    from services.db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+except ImportError:
+    from db_utils import get_db_connection, sql_param, is_postgres, ensure_column
+
+
+def _fetch_dicts(cursor) -> List[Dict[str, Any]]:
+    """Converte o resultado do cursor em lista de dicts (SQLite ou PostgreSQL)"""
+    rows = cursor.fetchall()
+    if not rows:
+        return []
+    if isinstance(rows[0], dict):
+        return [dict(row) for row in rows]
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in rows]
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um endpoint.
+
+    closed -> open após `failure_threshold` falhas consecutivas;
+    open -> half_open após `reset_timeout` segundos (uma única entrega de teste);
+    half_open -> closed no primeiro sucesso, ou volta para open na falha.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_inflight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Indica se uma entrega pode ser tentada agora (em half_open, só o probe)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self.probe_inflight:
+                self.probe_inflight = True
+                return True
+            return False
+
+    def is_probing(self) -> bool:
+        with self._lock:
+            return self.state == self.HALF_OPEN
+
+    def retry_at(self) -> float:
+        """Timestamp a partir do qual o endpoint volta a aceitar tentativas"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return self.opened_at + self.reset_timeout
+            # half_open com probe em andamento: o resultado sai em até um timeout
+            return time.time() + self.reset_timeout
+
+    def cancel_probe(self):
+        """Devolve a vaga do probe sem registrar resultado"""
+        with self._lock:
+            self.probe_inflight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.probe_inflight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.probe_inflight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "probe_inflight": self.probe_inflight,
+            "opened_at": datetime.fromtimestamp(self.opened_at).isoformat() if self.opened_at else None
+        }
+
+
+class WebhookDispatcher:
+    """
+    Dispatcher de webhooks com outbox persistente.
+
+    O caminho de emissão (enqueue*) apenas grava na outbox. Um poller em
+    background reivindica as linhas vencidas (de forma atômica, para que
+    vários workers do gunicorn possam dividir a mesma outbox), agrupa por
+    endpoint e entrega pelo pool de senders.
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_DELIVERED = "delivered"
+    STATUS_DEAD = "dead"
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        per_endpoint_concurrency: int = 2,
+        batch_size: int = 20,
+        max_attempts: int = 6,
+        backoff_base: float = 2.0,
+        backoff_max: float = 900.0,
+        poll_interval: float = 1.0,
+        request_timeout: float = 10.0,
+        lock_timeout: float = 120.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        autostart: bool = True
+    ):
+        self.max_workers = max_workers
+        self.per_endpoint_concurrency = per_endpoint_concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.lock_timeout = lock_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.autostart = autostart
+
+        # Identifica este processo nas linhas reivindicadas
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._inflight: Dict[str, int] = {}
+        self._deferrals: Dict[str, int] = {}
+        self._state_lock = threading.Lock()
+        self._local = threading.local()
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._poller: Optional[threading.Thread] = None
+        self._running = False
+        self._wake = threading.Event()
+
+        self.stats = {
+            "enqueued": 0,
+            "delivered": 0,
+            "failed_attempts": 0,
+            "dead": 0,
+            "batches_sent": 0
+        }
+
+        self._init_database()
+
+    def _init_database(self):
+        """Cria a tabela de outbox e seus índices"""
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            id_column = "id SERIAL PRIMARY KEY" if is_postgres() else "id INTEGER PRIMARY KEY AUTOINCREMENT"
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS webhook_outbox (
+                    {id_column},
+                    endpoint_url TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    secret TEXT,
+                    source TEXT,
+                    webhook_id TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at TEXT NOT NULL,
+                    locked_by TEXT,
+                    locked_at TEXT,
+                    last_error TEXT,
+                    created_at TEXT NOT NULL,
+                    delivered_at TEXT,
+                    batch INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            ensure_column(cursor, "webhook_outbox", "batch", "INTEGER NOT NULL DEFAULT 0")
+
+            # Índice principal do poller: linhas pendentes por vencimento
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_webhook_outbox_due
+                ON webhook_outbox(status, next_attempt_at)
+            """)
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS idx_webhook_outbox_endpoint
+                ON webhook_outbox(endpoint_url, status)
+            """)
+
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"[WEBHOOK DISPATCHER] ❌ Erro ao inicializar outbox: {e}")
+
+    # ===== EMISSÃO =====
+
+    def enqueue(self, event: str, data: Dict, endpoints: List[Dict[str, Any]], source: str = None) -> int:
+        """
+        Enfileira um evento para uma lista de endpoints.
+
+        Args:
+            event: Tipo do evento
+            data: Payload do evento
+            endpoints: Lista de dicts com 'url' e opcionalmente 'secret', 'webhook_id'
+                e 'batch' (True: aceita vários eventos por POST)
+            source: Origem do evento (mcp, realtime_pipeline, ...)
+
+        Returns:
+            int: Número de entregas enfileiradas
+        """
+        if not endpoints:
+            return 0
+
+        now = datetime.now().isoformat()
+        payload = json.dumps(data, sort_keys=True, default=str)
+        rows = [
+            (
+                endpoint["url"],
+                event,
+                payload,
+                endpoint.get("secret"),
+                source,
+                str(endpoint["webhook_id"]) if endpoint.get("webhook_id") is not None else None,
+                self.STATUS_PENDING,
+                now,
+                now,
+                1 if endpoint.get("batch") else 0
+            )
+            for endpoint in endpoints
+        ]
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(sql_param("""
+                INSERT INTO webhook_outbox (
+                    endpoint_url, event, payload, secret, source, webhook_id,
+                    status, next_attempt_at, created_at, batch
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """), rows)
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._after_enqueue(len(rows))
+        return len(rows)
+
+    def enqueue_for_subscribers(self, event: str, data: Dict, source: str = "mcp") -> int:
+        """
+        Enfileira um evento para todos os webhooks ativos da tabela `webhooks`.
+
+        O fan-out é feito no próprio banco (INSERT ... SELECT), então a
+        emissão custa um único statement independentemente do número de
+        assinantes.
+
+        Returns:
+            int: Número de entregas enfileiradas
+        """
+        now = datetime.now().isoformat()
+        payload = json.dumps(data, sort_keys=True, default=str)
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                INSERT INTO webhook_outbox (
+                    endpoint_url, event, payload, secret, source, webhook_id,
+                    status, next_attempt_at, created_at
+                )
+                SELECT url, event, ?, secret, ?, CAST(id AS TEXT), ?, ?, ?
+                FROM webhooks
+                WHERE event = ? AND active = 1
+            """), (payload, source, self.STATUS_PENDING, now, now, event))
+            queued = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+            conn.commit()
+        finally:
+            conn.close()
+
+        self._after_enqueue(queued)
+        return queued
+
+    def _after_enqueue(self, count: int):
+        if count <= 0:
+            return
+        with self._state_lock:
+            self.stats["enqueued"] += count
+        if self.autostart:
+            self.start()
+        self._wake.set()
+
+    # ===== CICLO DE VIDA =====
+
+    def start(self):
+        """Inicia o poller e o pool de senders (idempotente)"""
+        with self._state_lock:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="webhook-sender"
+            )
+            self._poller = threading.Thread(
+                target=self._poll_loop,
+                name="webhook-dispatcher",
+                daemon=True
+            )
+            self._poller.start()
+
+    def stop(self, wait: bool = True):
+        """Para o poller; entregas em andamento terminam se wait=True"""
+        with self._state_lock:
+            if not self._running:
+                return
+            self._running = False
+        self._wake.set()
+        if self._poller and wait:
+            self._poller.join(timeout=5)
+        if self._executor:
+            self._executor.shutdown(wait=wait)
+        self._executor = None
+        self._poller = None
+
+    def _poll_loop(self):
+        while self._running:
+            try:
+                dispatched = self._dispatch_due(submit=self._executor.submit)
+            except Exception as e:
+                print(f"[WEBHOOK DISPATCHER] ❌ Erro no poller: {e}")
+                dispatched = 0
+            # Só volta direto ao banco quando algo saiu de fato para entrega;
+            # linhas adiadas voltam com next_attempt_at no futuro
+            if not dispatched:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def process_pending(self, limit: int = 500) -> int:
+        """
+        Entrega de forma síncrona as linhas vencidas (útil em workers
+        dedicados, scripts e testes).
+
+        Returns:
+            int: Número de linhas enviadas para entrega
+        """
+        return self._dispatch_due(submit=lambda fn, *args: fn(*args), limit=limit)
+
+    # ===== RECLAMAÇÃO E AGRUPAMENTO =====
+
+    def _dispatch_due(self, submit, limit: int = None) -> int:
+        """
+        Reivindica as linhas vencidas e submete os lotes.
+
+        Returns:
+            int: Número de linhas efetivamente enviadas para entrega (as
+            adiadas por circuito aberto ou endpoint sem vaga não contam)
+        """
+        rows = self._claim_due(limit or self.batch_size * self.max_workers)
+        if not rows:
+            return 0
+
+        # Agrupar por (endpoint, secret, batch): cada grupo sai numa tarefa do pool
+        groups: Dict[Tuple[str, Optional[str], int], List[Dict]] = {}
+        for row in rows:
+            groups.setdefault((row["endpoint_url"], row["secret"], row["batch"]), []).append(row)
+
+        dispatched = 0
+        for (url, secret, _), group_rows in groups.items():
+            breaker = self._get_breaker(url)
+            if not breaker.allow_request():
+                self._release(group_rows, next_attempt=breaker.retry_at())
+                continue
+
+            if breaker.is_probing():
+                # half_open: uma única linha testa o endpoint, o resto espera
+                probe, deferred = group_rows[:1], group_rows[1:]
+                if deferred:
+                    self._release(deferred, next_attempt=breaker.retry_at())
+                if not self._acquire_slot(url):
+                    breaker.cancel_probe()
+                    self._release(probe, next_attempt=time.time() + self._defer_delay(url))
+                    continue
+                submit(self._deliver_batch, url, secret, probe)
+                dispatched += 1
+                continue
+
+            for start in range(0, len(group_rows), self.batch_size):
+                batch = group_rows[start:start + self.batch_size]
+                if not self._acquire_slot(url):
+                    # Endpoint sem vaga: devolve o restante do grupo com backoff
+                    remaining = group_rows[start:]
+                    self._release(remaining, next_attempt=time.time() + self._defer_delay(url))
+                    break
+                submit(self._deliver_batch, url, secret, batch)
+                dispatched += len(batch)
+
+        return dispatched
+
+    def _defer_delay(self, url: str) -> float:
+        """Atraso para linhas adiadas por falta de vaga (cresce a cada adiamento seguido)"""
+        with self._state_lock:
+            deferrals = self._deferrals.get(url, 0) + 1
+            self._deferrals[url] = deferrals
+        delay = min(self.backoff_max, self.poll_interval * (2 ** (deferrals - 1)))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _claim_due(self, limit: int) -> List[Dict[str, Any]]:
+        """Reivindica atomicamente as linhas vencidas para este worker"""
+        now = datetime.now()
+        now_iso = now.isoformat()
+        stale_iso = (now - timedelta(seconds=self.lock_timeout)).isoformat()
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+
+            # Recuperar linhas presas por workers que morreram no meio da entrega
+            cursor.execute(sql_param("""
+                UPDATE webhook_outbox
+                SET status = ?, locked_by = NULL, locked_at = NULL
+                WHERE status = ? AND locked_at < ?
+            """), (self.STATUS_PENDING, self.STATUS_SENDING, stale_iso))
+
+            cursor.execute(sql_param("""
+                UPDATE webhook_outbox
+                SET status = ?, locked_by = ?, locked_at = ?
+                WHERE id IN (
+                    SELECT id FROM webhook_outbox
+                    WHERE status = ? AND next_attempt_at <= ?
+                    ORDER BY id
+                    LIMIT ?
+                ) AND status = ?
+            """), (
+                self.STATUS_SENDING, self.worker_id, now_iso,
+                self.STATUS_PENDING, now_iso, limit,
+                self.STATUS_PENDING
+            ))
+            conn.commit()
+
+            cursor.execute(sql_param("""
+                SELECT id, endpoint_url, event, payload, secret, webhook_id, attempts, batch
+                FROM webhook_outbox
+                WHERE status = ? AND locked_by = ? AND locked_at = ?
+                ORDER BY id
+            """), (self.STATUS_SENDING, self.worker_id, now_iso))
+            return _fetch_dicts(cursor)
+        finally:
+            conn.close()
+
+    def _release(self, rows: List[Dict], next_attempt: float = None):
+        """Devolve linhas à fila sem consumir tentativa"""
+        next_iso = datetime.fromtimestamp(next_attempt).isoformat() if next_attempt else datetime.now().isoformat()
+        self._update_rows(
+            [row["id"] for row in rows],
+            "status = ?, locked_by = NULL, locked_at = NULL, next_attempt_at = ?",
+            (self.STATUS_PENDING, next_iso)
+        )
+
+    def _acquire_slot(self, url: str) -> bool:
+        with self._state_lock:
+            if self._inflight.get(url, 0) >= self.per_endpoint_concurrency:
+                return False
+            self._inflight[url] = self._inflight.get(url, 0) + 1
+            self._deferrals.pop(url, None)
+            return True
+
+    def _release_slot(self, url: str):
+        with self._state_lock:
+            remaining = self._inflight.get(url, 1) - 1
+            if remaining > 0:
+                self._inflight[url] = remaining
+            else:
+                self._inflight.pop(url, None)
+
+    def _get_breaker(self, url: str) -> CircuitBreaker:
+        with self._state_lock:
+            breaker = self._breakers.get(url)
+            if breaker is None:
+                breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._breakers[url] = breaker
+            return breaker
+
+    # ===== ENTREGA =====
+
+    def _get_session(self):
+        """Session por thread: mantém o pool de conexões keep-alive"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=32, pool_maxsize=self.per_endpoint_concurrency * 2)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def _build_request(self, secret: Optional[str], batch: List[Dict]) -> Tuple[str, Dict[str, str]]:
+        """Monta corpo e headers; um único evento mantém o formato original"""
+        headers = {"Content-Type": "application/json"}
+
+        if len(batch) == 1:
+            body = batch[0]["payload"]
+            headers["X-Webhook-Event"] = batch[0]["event"]
+            headers["X-Webhook-Delivery"] = str(batch[0]["id"])
+        else:
+            body = json.dumps({
+                "events": [
+                    {"delivery_id": row["id"], "event": row["event"], "data": json.loads(row["payload"])}
+                    for row in batch
+                ]
+            }, sort_keys=True)
+            headers["X-Webhook-Event"] = "batch"
+            headers["X-Webhook-Batch-Size"] = str(len(batch))
+
+        if secret:
+            headers["X-Webhook-Signature"] = hmac.new(
+                secret.encode(), body.encode(), hashlib.sha256
+            ).hexdigest()
+
+        return body, headers
+
+    def _send(self, url: str, body: str, headers: Dict[str, str]) -> int:
+        """Executa o POST e retorna o status HTTP"""
+        response = self._get_session().post(url, data=body.encode(), headers=headers, timeout=self.request_timeout)
+        return response.status_code
+
+    def _deliver_batch(self, url: str, secret: Optional[str], batch: List[Dict]):
+        """
+        Entrega um grupo de linhas do endpoint.
+
+        Assinatura com `batch`: um único POST. Sem `batch`: um POST por
+        evento, em sequência pela mesma conexão keep-alive.
+        """
+        breaker = self._get_breaker(url)
+        posts = [batch] if batch[0]["batch"] else [[row] for row in batch]
+        try:
+            for index, rows in enumerate(posts):
+                if index and not breaker.allow_request():
+                    # Circuito abriu no meio do grupo: o resto espera o reset
+                    self._release([row for rest in posts[index:] for row in rest], next_attempt=breaker.retry_at())
+                    break
+                self._deliver_post(url, secret, rows, breaker)
+        finally:
+            self._release_slot(url)
+
+    def _deliver_post(self, url: str, secret: Optional[str], rows: List[Dict], breaker: CircuitBreaker):
+        recorded = False
+        try:
+            body, headers = self._build_request(secret, rows)
+            try:
+                status_code = self._send(url, body, headers)
+                error = None if 200 <= status_code < 300 else f"HTTP {status_code}"
+            except Exception as e:
+                error = str(e)
+
+            recorded = True
+            if error is None:
+                breaker.record_success()
+                self._mark_delivered(rows)
+            else:
+                breaker.record_failure()
+                self._schedule_retry(rows, error)
+        except Exception as e:
+            print(f"[WEBHOOK DISPATCHER] ❌ Erro ao entregar lote para {url}: {e}")
+            if not recorded:
+                # Libera o probe do half_open; as linhas voltam pelo lock_timeout
+                breaker.cancel_probe()
+
+    def _mark_delivered(self, batch: List[Dict]):
+        self._update_rows(
+            [row["id"] for row in batch],
+            "status = ?, attempts = attempts + 1, delivered_at = ?, locked_by = NULL, locked_at = NULL, last_error = NULL",
+            (self.STATUS_DELIVERED, datetime.now().isoformat())
+        )
+        with self._state_lock:
+            self.stats["delivered"] += len(batch)
+            self.stats["batches_sent"] += 1
+
+    def _schedule_retry(self, batch: List[Dict], error: str):
+        """Backoff exponencial com jitter; após max_attempts a linha vai para 'dead'"""
+        attempts = max(row["attempts"] for row in batch) + 1
+        error = (error or "")[:500]
+        ids = [row["id"] for row in batch]
+
+        if attempts >= self.max_attempts:
+            self._update_rows(
+                ids,
+                "status = ?, attempts = attempts + 1, last_error = ?, locked_by = NULL, locked_at = NULL",
+                (self.STATUS_DEAD, error)
+            )
+            with self._state_lock:
+                self.stats["dead"] += len(batch)
+        else:
+            delay = self.backoff_delay(attempts)
+            next_iso = (datetime.now() + timedelta(seconds=delay)).isoformat()
+            self._update_rows(
+                ids,
+                "status = ?, attempts = attempts + 1, next_attempt_at = ?, last_error = ?, locked_by = NULL, locked_at = NULL",
+                (self.STATUS_PENDING, next_iso, error)
+            )
+
+        with self._state_lock:
+            self.stats["failed_attempts"] += len(batch)
+
+    def backoff_delay(self, attempts: int) -> float:
+        """Atraso (segundos) antes da próxima tentativa"""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _update_rows(self, ids: List[int], set_clause: str, params: tuple):
+        if not ids:
+            return
+        placeholders = ", ".join("?" for _ in ids)
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                sql_param(f"UPDATE webhook_outbox SET {set_clause} WHERE id IN ({placeholders})"),
+                tuple(params) + tuple(ids)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    # ===== CONSULTA =====
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Estatísticas da outbox e estado dos circuit breakers"""
+        by_status = {}
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) AS total FROM webhook_outbox GROUP BY status")
+            by_status = {row["status"]: row["total"] for row in _fetch_dicts(cursor)}
+            conn.close()
+        except Exception as e:
+            print(f"[WEBHOOK DISPATCHER] ❌ Erro ao obter estatísticas: {e}")
+
+        with self._state_lock:
+            return {
+                "running": self._running,
+                "worker_id": self.worker_id,
+                "outbox": by_status,
+                "inflight": dict(self._inflight),
+                "circuit_breakers": {url: b.to_dict() for url, b in self._breakers.items()},
+                "counters": dict(self.stats)
+            }
+
+    def purge_delivered(self, older_than_days: int = 7) -> int:
+        """Remove entregas concluídas antigas da outbox"""
+        cutoff = (datetime.now() - timedelta(days=older_than_days)).isoformat()
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(sql_param("""
+                DELETE FROM webhook_outbox
+                WHERE status = ? AND delivered_at < ?
+            """), (self.STATUS_DELIVERED, cutoff))
+            deleted = cursor.rowcount
+            conn.commit()
+            return deleted
+        finally:
+            conn.close()
+
+
+# Instância global do dispatcher
+_dispatcher_instance: Optional[WebhookDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> WebhookDispatcher:
+    """
+    Retorna instância global do dispatcher (singleton)
+
+    Returns:
+        WebhookDispatcher: Instância do dispatcher
+    """
+    global _dispatcher_instance
+
+    if _dispatcher_instance is None:
+        with _dispatcher_lock:
+            if _dispatcher_instance is None:
+                _dispatcher_instance = WebhookDispatcher()
+
+    return _dispatcher_instance
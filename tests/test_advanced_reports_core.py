@@ -0,0 +1,86 @@
+"""
+🧪 TESTES - Núcleo de métricas do AdvancedReportsEngine
+Nexora Prime
+
+Valida:
+- Cálculo vetorizado igual a MetricsCalculator.calculate_metrics
+- Contexto compartilhado entre os quatro relatórios
+- Séries diárias derivadas das mesmas colunas
+- Armazenamento em disco limitado
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.advanced_reports_engine import AdvancedReportsEngine, ReportStore
+
+
+class TestReportsCore(unittest.TestCase):
+    """Testes do contexto compartilhado e do ReportStore"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.engine = AdvancedReportsEngine(reports_dir=self.tmp_dir, max_reports=3)
+        self.date_range = (datetime(2026, 1, 1), datetime(2026, 1, 3))
+        self.current = {"impressions": 10000, "clicks": 300, "spend": 337.38, "conversions": 12, "revenue": 1500.0, "reach": 4000}
+        self.previous = {"impressions": 9000, "clicks": 250, "spend": 300.0, "conversions": 10, "revenue": 1100.0, "reach": 3500}
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_batch_matches_single_calculation(self):
+        """Teste: métricas e comparação iguais ao cálculo por dict"""
+        context = self.engine.build_context(self.current, self.date_range, self.previous)
+        calculator = self.engine.metrics_calculator
+
+        current = calculator.calculate_metrics(self.current)
+        previous = calculator.calculate_metrics(self.previous)
+        self.assertEqual(context.current_metrics, current)
+        self.assertEqual(context.previous_metrics, previous)
+        self.assertEqual(context.comparison, calculator.compare_periods(current, previous))
+
+    def test_reports_share_context(self):
+        """Teste: os quatro relatórios saem de um único contexto"""
+        reports = self.engine.generate_all_reports(self.current, self.date_range)
+
+        self.assertEqual(len(reports), 4)
+        self.assertEqual(len(self.engine._contexts), 1)
+        executive = reports["executive_summary"]
+        self.assertEqual(executive.summary["avg_cpa"], 28.11)
+
+    def test_daily_rows_feed_totals_and_trend(self):
+        """Teste: linhas diárias geram totais e série de tendência"""
+        daily = [
+            {"date": "2026-01-01", "spend": 100, "revenue": 300, "conversions": 3},
+            {"date": "2026-01-02", "spend": 50, "revenue": 200, "conversions": 2},
+        ]
+        context = self.engine.build_context({"daily": daily}, self.date_range)
+
+        self.assertEqual(context.current_metrics["spend"], 150)
+        self.assertEqual(context.current_metrics["roas"], 3.33)
+        self.assertEqual([p["revenue"] for p in context.trend_series], [300, 200])
+        self.assertEqual([p["roi"] for p in context.roi_trend], [200, 300])
+
+    def test_store_is_bounded(self):
+        """Teste: relatórios antigos saem do disco ao passar do limite"""
+        store_dir = os.path.join(self.tmp_dir, "store")
+        store = ReportStore(store_dir, max_reports=2)
+        for i in range(3):
+            report = self.engine.generate_audience_insights({}, self.date_range)
+            report.id = f"r{i}"
+            store.save(report)
+
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get("r0"))
+        self.assertFalse(os.path.exists(os.path.join(store_dir, "r0.json")))
+        self.assertEqual(ReportStore(store_dir, max_reports=2).get("r1")["id"], "r1")
+
+
+if __name__ == "__main__":
+    unittest.main()
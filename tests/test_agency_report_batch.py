@@ -0,0 +1,225 @@
+"""
+🧪 TESTES - Relatórios white-label em lote (AgencyReportBatch)
+Nexora Prime
+
+Valida:
+- Um relatório JSON + HTML por cliente, listado no manifest do lote
+- Renderização no pool de processos igual à do processo atual
+- Benchmark de mercado calculado uma vez por nicho, não por cliente
+- Download só de lotes concluídos e clientes do lote
+- Pool de processos quebrado é recriado; lotes em running sem heartbeat viram failed
+- Lote só roda se ainda estiver em queued (reivindicação condicional)
+- AgencyGhostMode dispara o lote da agência
+"""
+
+import os
+import sys
+import json
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services import agency_report_batch
+from services.agency_mode import AgencyMode
+from services.agency_report_batch import AgencyReportBatch, PARALLEL_THRESHOLD
+from services.agency_ghost_mode import AgencyGhostMode
+from services.benchmark_global import BenchmarkGlobal
+
+
+class _CountingBenchmark:
+    """BenchmarkGlobal real contando as consultas"""
+
+    def __init__(self):
+        self.inner = BenchmarkGlobal()
+        self.calls = []
+
+    def get_benchmark(self, niche, **kwargs):
+        self.calls.append(niche)
+        return self.inner.get_benchmark(niche, **kwargs)
+
+    def get_industry_trends(self, niche, **kwargs):
+        return self.inner.get_industry_trends(niche, **kwargs)
+
+
+class _InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class _QueuedExecutor:
+    """Só registra o lote (o teste chama run_batch)"""
+
+    def submit(self, fn, *args):
+        pass
+
+
+class TestAgencyReportBatch(unittest.TestCase):
+    """Testes dos lotes de relatórios"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+
+        self.agency_mode = AgencyMode()
+        self.agency_id = self.agency_mode.create_agency({
+            "name": "Agência <Alfa>", "plan": "enterprise"
+        })["agency_id"]
+        self.clients = []
+        for i in range(PARALLEL_THRESHOLD + 2):
+            client_id = self.agency_mode.create_client(self.agency_id, {
+                "name": f"Cliente {i}", "niche": "ecommerce" if i % 2 else "infoprodutos"
+            })["client_id"]
+            self.agency_mode.update_client_metrics(client_id, {"total_spend": 100.0, "total_revenue": 100.0 * i})
+            self.clients.append(client_id)
+
+        self.benchmark = _CountingBenchmark()
+        self.batches = AgencyReportBatch(
+            output_dir=os.path.join(self.tmp_dir, "reports"), agency=self.agency_mode, benchmark=self.benchmark
+        )
+        # Execução síncrona nos testes
+        self.batches._get_executor = lambda: _InlineExecutor()
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_batch_writes_one_report_per_client(self):
+        batch_id = self.batches.submit(self.agency_id)["batch_id"]
+        batch = self.batches.get_batch(batch_id)
+
+        self.assertEqual(batch["status"], "done")
+        self.assertEqual(batch["total_clients"], len(self.clients))
+        self.assertEqual(batch["reports_written"], len(self.clients))
+        self.assertEqual(batch["failed"], 0)
+        self.assertCountEqual([r["client_id"] for r in batch["reports"]], self.clients)
+
+        # Mercado consultado uma vez por nicho
+        self.assertCountEqual(self.benchmark.calls, ["ecommerce", "infoprodutos"])
+
+        download = self.batches.get_download(batch_id, self.clients[3], "json")
+        with open(download["path"], encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertEqual(report["client"]["name"], "Cliente 3")
+        self.assertEqual(report["performance_metrics"]["roas"], 3.0)
+        self.assertEqual(report["market_benchmark"]["niche"], "ecommerce")
+        self.assertEqual(report["period"]["start"], batch["period_start"])
+
+        html_path = self.batches.get_download(batch_id, self.clients[3])["path"]
+        with open(html_path, encoding="utf-8") as f:
+            page = f.read()
+        self.assertIn("Agência &lt;Alfa&gt;", page)
+        self.assertIn("Cliente 3", page)
+
+        with open(os.path.join(batch["output_dir"], "manifest.json"), encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["agency_id"], self.agency_id)
+
+    def test_process_pool_matches_inline(self):
+        shared = {
+            "agency": self.agency_mode._get_agency(self.agency_id),
+            "report_type": "monthly",
+            "period": {"start": "2026-09-01T00:00:00", "end": "2026-09-30T23:59:59"},
+            "market": {}
+        }
+        clients = self.agency_mode.list_clients(self.agency_id)[:3]
+        inline_dir = os.path.join(self.tmp_dir, "inline")
+        pool_dir = os.path.join(self.tmp_dir, "pool")
+        os.makedirs(inline_dir)
+        os.makedirs(pool_dir)
+
+        inline = agency_report_batch._render_chunk(shared, clients, inline_dir)
+        pooled = agency_report_batch._get_process_pool().submit(
+            agency_report_batch._render_chunk, shared, clients, pool_dir
+        ).result()
+
+        self.assertEqual([r["client_id"] for r in inline], [r["client_id"] for r in pooled])
+        for client in clients:
+            with open(os.path.join(inline_dir, f"{client['id']}.json"), encoding="utf-8") as f:
+                a = json.load(f)
+            with open(os.path.join(pool_dir, f"{client['id']}.json"), encoding="utf-8") as f:
+                b = json.load(f)
+            self.assertEqual(a["performance_metrics"], b["performance_metrics"])
+            self.assertEqual(a["executive_summary"], b["executive_summary"])
+
+    def test_broken_process_pool_is_recreated(self):
+        broken = ProcessPoolExecutor(max_workers=1, mp_context=agency_report_batch._pool_context())
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()
+        original = agency_report_batch._process_pool
+        agency_report_batch._process_pool = broken
+        try:
+            batch_id = self.batches.submit(self.agency_id)["batch_id"]
+            self.assertEqual(self.batches.get_batch(batch_id)["status"], "done")
+            self.assertIsNot(agency_report_batch._process_pool, broken)
+        finally:
+            if original is not None:
+                original.shutdown(wait=False)
+
+    def test_stale_batches_are_marked_failed(self):
+        old = (datetime.now() - timedelta(hours=2)).isoformat()
+        recent = datetime.now().isoformat()
+        conn = db_utils.get_db_connection()
+        conn.executemany("""
+            INSERT INTO agency_report_batches (id, agency_id, report_type, status, created_at, started_at, heartbeat_at)
+            VALUES (?, ?, 'monthly', ?, ?, ?, ?)
+        """, [("orfao", self.agency_id, "running", old, old, old),
+              ("longo", self.agency_id, "running", old, old, recent),
+              ("na_fila", self.agency_id, "queued", old, None, None)])
+        conn.commit()
+        conn.close()
+
+        AgencyReportBatch(output_dir=os.path.join(self.tmp_dir, "reports"), agency=self.agency_mode)
+        self.assertEqual(self.batches.get_batch("orfao")["status"], "failed")
+        # Heartbeat em dia e lote esperando na fila não são órfãos
+        self.assertEqual(self.batches.get_batch("longo")["status"], "running")
+        self.assertEqual(self.batches.get_batch("na_fila")["status"], "queued")
+
+    def test_run_batch_only_runs_queued_batches(self):
+        self.batches._get_executor = lambda: _QueuedExecutor()
+        batch_id = self.batches.submit(self.agency_id)["batch_id"]
+        self.batches._update_batch(batch_id, status="failed", error="cancelado")
+
+        self.batches.run_batch(batch_id)
+        batch = self.batches.get_batch(batch_id)
+        self.assertEqual(batch["status"], "failed")
+        self.assertEqual(batch["error"], "cancelado")
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, "reports", batch_id)))
+
+        # Duas execuções do mesmo lote: só a primeira roda
+        other_id = self.batches.submit(self.agency_id)["batch_id"]
+        self.batches.run_batch(other_id)
+        finished_at = self.batches.get_batch(other_id)["finished_at"]
+        self.batches.run_batch(other_id)
+        self.assertEqual(self.batches.get_batch(other_id)["finished_at"], finished_at)
+
+    def test_download_guards_and_plan(self):
+        batch_id = self.batches.submit(self.agency_id)["batch_id"]
+        self.assertIsNone(self.batches.get_download(batch_id, "client_de_outro_lote"))
+        self.assertIsNone(self.batches.get_download(batch_id, self.clients[0], "pdf"))
+        self.assertIsNone(self.batches.get_download("lote_inexistente", self.clients[0]))
+
+        starter = self.agency_mode.create_agency({"name": "Pequena", "plan": "starter"})["agency_id"]
+        self.assertIn("error", self.batches.submit(starter))
+        self.assertIn("error", self.batches.submit("agency_inexistente"))
+
+    def test_ghost_mode_submits_batch(self):
+        ghost = AgencyGhostMode()
+        original = agency_report_batch._batch_instance
+        agency_report_batch._batch_instance = self.batches
+        try:
+            ghost.enable_autopilot({"report_agency_id": self.agency_id})
+            action = ghost._send_reports()
+        finally:
+            agency_report_batch._batch_instance = original
+        self.assertEqual(self.batches.get_batch(action["batch"]["batch_id"])["status"], "done")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+🧪 TESTES - Modelo multi-tenant do AgencyMode
+Nexora Prime
+
+Valida:
+- Agências, clientes e usuários persistidos e visíveis em outra instância
+- Limite de clientes do plano reservado de forma atômica
+- Conjuntos de acesso e bitmap de permissões (role + específicas)
+- Cache de acesso validado por versão (atribuições e novos clientes vistos por outros workers)
+- Totais da agência mantidos de forma incremental em update_client_metrics
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services.agency_mode import AgencyMode, UserRole
+
+
+class TestAgencyTenants(unittest.TestCase):
+    """Testes do armazenamento de tenants"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.agency_mode = AgencyMode()
+        created = self.agency_mode.create_agency({"name": "Agência X", "plan": "professional"})
+        self.agency_id = created["agency_id"]
+        self.owner_id = created["owner_user"]["user_id"]
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _client(self, name="Cliente"):
+        return self.agency_mode.create_client(self.agency_id, {"name": name})["client_id"]
+
+    def test_persisted_between_instances(self):
+        client_id = self._client("Loja A")
+        other_worker = AgencyMode()
+
+        dashboard = other_worker.get_client_dashboard(client_id, user_id=self.owner_id)
+        self.assertEqual(dashboard["client_name"], "Loja A")
+        self.assertEqual(len(other_worker.list_clients(self.agency_id)), 1)
+        self.assertEqual(other_worker.get_user(self.owner_id)["role"], UserRole.OWNER.value)
+        self.assertIn("error", other_worker.create_client("agency_inexistente", {}))
+
+    def test_client_limit(self):
+        starter = self.agency_mode.create_agency({"name": "Pequena", "plan": "starter"})["agency_id"]
+        for i in range(5):
+            self.assertIn("client_id", self.agency_mode.create_client(starter, {"name": f"C{i}"}))
+        result = self.agency_mode.create_client(starter, {"name": "C5"})
+        self.assertIn("Limite de 5 clientes", result["error"])
+        self.assertEqual(len(self.agency_mode.list_clients(starter)), 5)
+
+    def test_access_sets_and_permission_bitmap(self):
+        client_a, client_b = self._client("A"), self._client("B")
+        analyst = self.agency_mode.create_user({
+            "agency_id": self.agency_id, "role": UserRole.ANALYST.value, "assigned_clients": [client_a]
+        })["user_id"]
+
+        self.assertEqual([c["id"] for c in self.agency_mode.get_user_accessible_clients(analyst)], [client_a])
+        self.assertTrue(self.agency_mode.check_permission(analyst, "can_view_reports", client_a))
+        self.assertFalse(self.agency_mode.check_permission(analyst, "can_view_reports", client_b))
+        self.assertFalse(self.agency_mode.check_permission(analyst, "can_edit_campaigns"))
+        self.assertFalse(self.agency_mode.check_permission(analyst, "permissao_inexistente"))
+        self.assertFalse(self.agency_mode.check_permission("user_inexistente", "can_view_reports"))
+
+        # Atribuição com permissões específicas invalida o cache do usuário
+        self.agency_mode.assign_user_to_client(analyst, client_b, {
+            "can_edit_campaigns": True, "can_export_data": False
+        })
+        self.assertTrue(self.agency_mode.check_permission(analyst, "can_edit_campaigns", client_b))
+        self.assertFalse(self.agency_mode.check_permission(analyst, "can_export_data", client_b))
+        self.assertTrue(self.agency_mode.check_permission(analyst, "can_export_data", client_a))
+        self.assertEqual(len(self.agency_mode.get_user_accessible_clients(analyst)), 2)
+        self.assertCountEqual(self.agency_mode.get_user(analyst)["assigned_clients"], [client_a, client_b])
+
+    def test_owner_sees_new_clients_of_own_agency_only(self):
+        client_a = self._client("A")
+        self.assertTrue(self.agency_mode.check_permission(self.owner_id, "can_delete_clients", client_a))
+
+        client_b = self._client("B")
+        self.assertEqual(len(self.agency_mode.get_user_accessible_clients(self.owner_id)), 2)
+        self.assertTrue(self.agency_mode.check_permission(self.owner_id, "can_view_reports", client_b))
+
+        other = self.agency_mode.create_agency({"name": "Outra", "plan": "professional"})["agency_id"]
+        foreign = self.agency_mode.create_client(other, {"name": "Z"})["client_id"]
+        self.assertFalse(self.agency_mode.check_permission(self.owner_id, "can_view_reports", foreign))
+        self.assertIn("error", self.agency_mode.get_client_dashboard(foreign, user_id=self.owner_id))
+
+    def test_access_changes_reach_other_workers(self):
+        client_a = self._client("A")
+        analyst = self.agency_mode.create_user({
+            "agency_id": self.agency_id, "role": UserRole.ANALYST.value
+        })["user_id"]
+        self.agency_mode.assign_user_to_client(analyst, client_a, {"can_edit_campaigns": True})
+
+        worker_2 = AgencyMode()
+        self.assertTrue(worker_2.check_permission(analyst, "can_edit_campaigns", client_a))
+        self.assertTrue(worker_2.check_permission(self.owner_id, "can_view_reports", client_a))
+
+        # Revogação e novo cliente feitos no worker 1
+        self.agency_mode.assign_user_to_client(analyst, client_a, {"can_edit_campaigns": False})
+        client_b = self._client("B")
+
+        self.assertFalse(worker_2.check_permission(analyst, "can_edit_campaigns", client_a))
+        dashboard = worker_2.get_client_dashboard(client_b, user_id=self.owner_id)
+        self.assertEqual(dashboard["client_name"], "B")
+
+    def test_incremental_totals(self):
+        client_a, client_b = self._client("A"), self._client("B")
+        self.agency_mode.update_client_metrics(client_a, {"total_spend": 100.0, "total_revenue": 300.0})
+        self.agency_mode.update_client_metrics(client_b, {"total_spend": 50.0, "active_campaigns": 2})
+        self.agency_mode.update_client_metrics(client_a, {"total_spend": 25.0}, increment=True)
+        result = self.agency_mode.update_client_metrics(client_b, {"total_spend": 10.0, "ignorada": 1})
+        self.assertEqual(result["updated_metrics"]["total_spend"], 10.0)
+        self.assertIn("error", self.agency_mode.update_client_metrics("client_inexistente", {"total_spend": 1}))
+
+        overview = self.agency_mode.get_agency_overview(self.agency_id)
+        self.assertEqual(overview["summary"]["total_spend"], 135.0)
+        self.assertEqual(overview["summary"]["total_revenue"], 300.0)
+        self.assertEqual(overview["summary"]["active_campaigns"], 2)
+        self.assertEqual(overview["summary"]["total_clients"], 2)
+        self.assertEqual(overview["summary"]["total_users"], 1)
+        self.assertEqual([c["id"] for c in overview["clients"]], [client_a, client_b])
+
+        # Totais batem com a soma dos clientes
+        clients = self.agency_mode.list_clients(self.agency_id)
+        self.assertEqual(sum(c["metrics"]["total_spend"] for c in clients), 135.0)
+
+        report = self.agency_mode.generate_white_label_report(self.agency_id, client_a)
+        self.assertEqual(report["performance_metrics"]["spend"], 125.0)
+        self.assertEqual(report["performance_metrics"]["roas"], 2.4)
+
+
+if __name__ == "__main__":
+    unittest.main()
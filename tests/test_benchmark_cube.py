@@ -0,0 +1,94 @@
+"""
+🧪 TESTES - Cubo de benchmarks do BenchmarkGlobal
+Nexora Prime
+
+Valida:
+- Lookup no cubo igual aos multiplicadores aplicados à mão
+- Scoring em lote igual a calculate_performance_score
+- Recompute a partir dos percentis de campaign_metrics
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.benchmark_global import BenchmarkGlobal
+
+
+class TestBenchmarkCube(unittest.TestCase):
+    """Testes do cubo pré-calculado"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.benchmark = BenchmarkGlobal()
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_lookup_applies_multipliers(self):
+        """Teste: país ajusta custo/ROAS e plataforma ajusta CTR"""
+        result = self.benchmark.get_benchmark("infoprodutos", "US", "instagram")["benchmarks"]
+
+        self.assertEqual(result["cpa"]["avg"], round(80 * 2.5, 2))
+        self.assertEqual(result["roas"]["top"], round(10.0 * 1.2, 2))
+        self.assertEqual(result["ctr"]["min"], round(0.5 * 1.2, 2))
+        self.assertEqual(result["aov"]["avg"], 497)
+
+    def test_batch_matches_single_score(self):
+        """Teste: lote reproduz o score individual e ranqueia"""
+        campaigns = [
+            {"campaign_id": "a", "metrics": {"roas": 5.2, "cpa": 20, "ctr": 2.6}},
+            {"campaign_id": "b", "metrics": {"roas": 1.0, "cpa": 90}},
+            {"campaign_id": "c", "metrics": {"roas": 3.0, "cpa": 40, "conversion_rate": 3.1}, "niche": "saas"},
+        ]
+        results = self.benchmark.score_campaigns_batch(campaigns)
+
+        for campaign, result in zip(campaigns, results):
+            single = self.benchmark.calculate_performance_score(campaign["metrics"], campaign.get("niche", "ecommerce"))
+            self.assertEqual(result["overall_score"], single["overall_score"])
+            self.assertEqual(result["metric_scores"], single["metric_scores"])
+
+        self.assertEqual([r["rank"] for r in results], [1, 3, 2])
+
+    def test_recompute_from_history(self):
+        """Teste: percentis do histórico viram o nicho 'historico'"""
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        conn.executescript("""
+            CREATE TABLE campaigns (id INTEGER PRIMARY KEY, platform TEXT);
+            CREATE TABLE campaign_metrics (
+                campaign_id INTEGER, clicks INTEGER, conversions INTEGER,
+                ctr REAL, cpc REAL, cpa REAL, roas REAL
+            );
+        """)
+        for i in range(1, 101):
+            conn.execute("INSERT INTO campaigns VALUES (?, 'Meta')", (i,))
+            conn.execute("INSERT INTO campaign_metrics VALUES (?, 100, 3, ?, 1.0, ?, ?)", (i, i / 50, i, i / 10))
+        conn.commit()
+        conn.close()
+
+        result = self.benchmark.recompute_from_history(min_samples=20)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["scopes"], ["_all", "facebook"])
+
+        roas = self.benchmark.get_benchmark("historico")["benchmarks"]["roas"]
+        self.assertAlmostEqual(roas["avg"], 5.05)
+        self.assertLess(roas["min"], roas["avg"])
+        self.assertGreater(roas["top"], roas["avg"])
+
+        # Outro processo carrega o snapshot sem recalcular
+        other = BenchmarkGlobal()
+        self.assertTrue(other.load_history_snapshot())
+        self.assertEqual(other.get_benchmark("historico")["benchmarks"]["roas"], roas)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+🧪 TESTES - Budget Allocator (portfólio com retornos decrescentes)
+Nexora Prime
+
+Valida:
+- Ótimo: retorno marginal igual entre campanhas livres
+- Limites min/max e mudança máxima por passo
+- Ajuste da curva pelo histórico
+- Chamadores (MLPredictionEngine e FunnelAccelerator) usando o alocador
+"""
+
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.budget_allocator import BudgetAllocator, fit_response_curves
+from services.funnel_accelerator import FunnelAccelerator
+
+
+class TestBudgetAllocator(unittest.TestCase):
+    """Testes do alocador"""
+
+    def setUp(self):
+        self.allocator = BudgetAllocator()
+
+    def test_equal_marginal_returns(self):
+        """Teste: orçamento todo alocado com marginais iguais"""
+        rng = np.random.default_rng(3)
+        a = rng.uniform(1, 20, 2000)
+        k = rng.uniform(0.3, 0.9, 2000)
+        result = self.allocator.allocate(100000, a, k)
+
+        self.assertAlmostEqual(result.total_allocated, 100000, places=4)
+        marginal = a * k * np.power(result.budgets, k - 1)
+        self.assertLess(marginal.max() / marginal.min() - 1, 1e-6)
+
+        # Determinístico
+        again = self.allocator.allocate(100000, a, k)
+        np.testing.assert_array_equal(result.budgets, again.budgets)
+
+    def test_bounds_and_step_limit(self):
+        """Teste: mín/máx e ±50% sobre o orçamento atual"""
+        result = self.allocator.allocate(
+            1000, a=[50, 1, 1], k=[0.7, 0.7, 0.7],
+            current=[200, 400, 0], min_budget=[0, 0, 100], max_budget=[1000, 1000, 150],
+            max_step_change=0.5
+        )
+        budgets = result.budgets
+        self.assertAlmostEqual(budgets[0], 300)
+        self.assertGreaterEqual(budgets[1], 200)
+        self.assertTrue(100 <= budgets[2] <= 150)
+
+        infeasible = self.allocator.allocate(50, a=[1, 1], k=[0.5, 0.5], min_budget=[50, 50])
+        self.assertFalse(infeasible.feasible)
+        self.assertAlmostEqual(infeasible.total_allocated, 50)
+
+    def test_fit_from_history(self):
+        """Teste: regressão log-log recupera a elasticidade"""
+        history = [[{"spend": s, "revenue": 3 * s ** 0.6} for s in (100, 200, 400, 800)], None]
+        a, k = fit_response_curves([800, 100], [0, 250], history)
+        self.assertAlmostEqual(k[0], 0.6)
+        self.assertAlmostEqual(a[0], 3)
+        self.assertAlmostEqual(a[1] * 100 ** k[1], 250)
+
+    def test_callers_use_allocator(self):
+        """Teste: funil sem histórico segue os pesos; ML respeita o passo"""
+        funnel = FunnelAccelerator()
+        funnel.create_funnel("f1", {})
+        result = funnel.allocate_budget("f1", 1000, "balanced")
+        self.assertEqual(result["allocations"]["awareness"]["budget"], 250)
+        self.assertEqual(result["allocations"]["loyalty"]["budget"], 50)
+
+        from services.ml_prediction_engine import MLPredictionEngine
+        optimized = MLPredictionEngine().optimize_budget([
+            {"campaign_id": "a", "budget": 100, "roas": 4},
+            {"campaign_id": "b", "budget": 100, "roas": 1},
+        ], 200)
+        budgets = {a["campaign_id"]: a["recommended_budget"] for a in optimized["allocations"]}
+        self.assertEqual(budgets, {"a": 150, "b": 50})
+        self.assertEqual(optimized["summary"]["total_allocated"], 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
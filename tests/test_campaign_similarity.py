@@ -0,0 +1,83 @@
+"""
+🧪 TESTES - Índice de similaridade da VelyraMemory
+Nexora Prime
+
+Valida:
+- Índice atualizado incrementalmente em learn_from_campaign
+- Vizinhos respeitando nicho/país/plataforma e orçamento
+- Carga do índice a partir do banco em outro processo
+- Estratégias recomendadas a partir de campanhas similares
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.velyra_memory import VelyraMemory
+
+
+class TestCampaignSimilarity(unittest.TestCase):
+    """Testes do índice kNN"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.memory = VelyraMemory()
+
+        campaigns = [
+            ("a1", "fitness", "BR", "facebook", 500, 4.0, {"type": "cbo", "objective": "sales"}),
+            ("a2", "fitness", "BR", "facebook", 5000, 3.5, {"type": "abo", "objective": "sales"}),
+            ("a3", "fitness", "BR", "google", 500, 0.5, {"type": "search"}),
+            ("a4", "finance", "US", "facebook", 500, 3.2, {"type": "cbo"}),
+        ]
+        for cid, niche, country, platform, budget, roas, strategy in campaigns:
+            self.memory.learn_from_campaign({
+                "id": cid, "niche": niche, "country": country, "platform": platform,
+                "budget": budget, "spend": budget, "revenue": budget * roas, "roas": roas,
+                "conversions": 60, "strategy": strategy
+            })
+
+    def tearDown(self):
+        self.memory.memory_cache.close()
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_nearest_neighbours(self):
+        """Teste: mesmo contexto primeiro, orçamento desempata"""
+        similar = self.memory.get_similar_campaigns(
+            {"niche": "fitness", "country": "BR", "platform": "facebook", "budget": 600}, limit=3
+        )
+        self.assertEqual([c["id"] for c in similar], ["a1", "a2", "a3"])
+        self.assertEqual(similar[0]["strategy"]["type"], "cbo")
+        self.assertGreater(similar[0]["similarity"], similar[2]["similarity"])
+
+    def test_index_loads_from_database(self):
+        """Teste: outra instância reconstrói o índice do banco"""
+        other = VelyraMemory()
+        similar = other.get_similar_campaigns({"niche": "finance", "country": "US", "platform": "facebook"}, limit=1)
+        self.assertEqual(similar[0]["id"], "a4")
+        self.assertEqual(len(other.similarity_index), 4)
+
+        # Reaprender a mesma campanha substitui a entrada
+        other.learn_from_campaign({"id": "a4", "niche": "finance", "country": "US", "platform": "facebook", "roas": 1.0})
+        self.assertEqual(len(other.similarity_index), 4)
+        self.assertEqual(other.similarity_index.get("a4")["status"], "average")
+        other.memory_cache.close()
+
+    def test_recommendations_from_similar(self):
+        """Teste: estratégias dos vencedores similares"""
+        result = self.memory.get_recommendations("fitness", "BR", "facebook", budget=500)
+        self.assertEqual(result["similar_campaigns"][0]["id"], "a1")
+        strategies = [s["strategy"]["type"] for s in result["strategies_from_similar"]]
+        self.assertEqual(strategies[0], "cbo")
+        self.assertNotIn("search", strategies)
+
+
+if __name__ == "__main__":
+    unittest.main()
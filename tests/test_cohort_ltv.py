@@ -0,0 +1,156 @@
+"""
+🧪 TESTES - Cohort LTV (coortes e sketches de quantis)
+Nexora Prime
+
+Valida:
+- Sketch de quantis dentro do erro relativo e com remoção
+- Ingestão incremental idempotente por order_id
+- Curvas cumulativas por coorte mês × canal
+- LTVEngine respondendo campanha/criativo a partir das tabelas
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.cohort_ltv import CohortLTVStore, QuantileSketch
+from services.ltv_engine import LTVEngine
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Testes do sketch de quantis"""
+
+    def test_quantiles_within_relative_error(self):
+        """Teste: quantis próximos dos exatos e remoção consistente"""
+        rng = random.Random(7)
+        values = [rng.lognormvariate(5, 1) for _ in range(5000)]
+        sketch = QuantileSketch(alpha=0.01)
+        for v in values:
+            sketch.add(v)
+
+        ordered = sorted(values)
+        for q in (0.25, 0.5, 0.75):
+            exact = ordered[int(q * (len(ordered) - 1))]
+            self.assertLess(abs(sketch.quantile(q) - exact) / exact, 0.02)
+
+        for v in values[:2500]:
+            sketch.remove(v)
+        self.assertEqual(sketch.count, 2500)
+        restored = QuantileSketch.from_dict(sketch.to_dict())
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+
+
+class TestCohortStore(unittest.TestCase):
+    """Testes do store de coortes"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.store = CohortLTVStore()
+
+        self.store.ingest_customers([
+            {"customer_id": "c1", "channel": "meta", "campaign_id": "camp1", "creative_id": "cr1"},
+            {"customer_id": "c2", "channel": "meta", "campaign_id": "camp1", "creative_id": "cr2"},
+        ])
+        self.orders = [
+            {"order_id": "o1", "customer_id": "c1", "amount": 100, "created_at": "2026-01-05T10:00:00"},
+            {"order_id": "o2", "customer_id": "c2", "amount": 50, "created_at": "2026-01-20T10:00:00"},
+            {"order_id": "o3", "customer_id": "c1", "amount": 80, "created_at": "2026-03-02T10:00:00"},
+            {"order_id": "o4", "customer_id": "c3", "amount": 40, "created_at": "2026-02-10T10:00:00", "channel": "google"},
+        ]
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_incremental_ingest_is_idempotent(self):
+        """Teste: lotes parciais e reenvio dão o mesmo agregado"""
+        self.store.ingest_orders(self.orders[:2])
+        result = self.store.ingest_orders(self.orders)
+        self.assertEqual(result, {"ingested": 2, "duplicates": 2, "new_customers": 1})
+
+        campaign = self.store.get_dimension_ltv("campaign", "camp1")
+        self.assertEqual(campaign["customer_count"], 2)
+        self.assertEqual(campaign["total_revenue"], 230)
+        self.assertEqual(campaign["avg_first_purchase"], 75)
+        self.assertEqual(campaign["repeat_rate"], 0.5)
+        self.assertAlmostEqual(campaign["distribution"]["max"], 180, delta=180 * 0.01)
+        self.assertIsNone(self.store.get_dimension_ltv("campaign", "camp2"))
+
+        # Outro processo reconstrói os sketches a partir do banco
+        other = CohortLTVStore()
+        self.assertEqual(other.get_dimension_ltv("campaign", "camp1"), campaign)
+
+    def test_workers_share_stats_and_sketches(self):
+        """Teste: ingestões em instâncias diferentes somam e os sketches se mesclam"""
+        worker_a, worker_b = self.store, CohortLTVStore()
+        worker_a.ingest_orders(self.orders[:1])
+        self.assertAlmostEqual(worker_b.get_dimension_ltv("campaign", "camp1")["distribution"]["max"], 100, delta=1)
+
+        worker_b.ingest_orders(self.orders[1:2])
+        worker_a.ingest_orders(self.orders[2:])
+        for worker in (worker_a, worker_b):
+            campaign = worker.get_dimension_ltv("campaign", "camp1")
+            self.assertEqual(campaign["customer_count"], 2)
+            self.assertEqual(campaign["total_revenue"], 230)
+            self.assertAlmostEqual(campaign["distribution"]["max"], 180, delta=180 * 0.01)
+            self.assertAlmostEqual(campaign["distribution"]["min"], 50, delta=50 * 0.01)
+
+    def test_concurrent_ingest_keeps_every_order(self):
+        """Teste: lotes concorrentes do mesmo cliente não perdem pedidos"""
+        def ingest(worker_id):
+            store = CohortLTVStore()
+            for i in range(10):
+                store.ingest_orders([{
+                    "order_id": f"w{worker_id}-{i}", "customer_id": "c1", "amount": 10,
+                    "created_at": "2026-01-05T10:00:00"
+                }])
+
+        threads = [threading.Thread(target=ingest, args=(w,)) for w in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        campaign = self.store.get_dimension_ltv("campaign", "camp1")
+        self.assertEqual(campaign["total_revenue"], 400)
+        self.assertEqual(campaign["customer_count"], 1)
+        self.assertEqual(campaign["avg_purchases"], 40)
+        self.assertAlmostEqual(campaign["distribution"]["max"], 400, delta=400 * 0.01)
+
+    def test_cohort_curves(self):
+        """Teste: receita acumulada por cliente desde o mês de aquisição"""
+        self.store.ingest_orders(self.orders)
+        curves = {(c["cohort_month"], c["channel"]): c for c in self.store.get_cohort_curves(max_months=3)}
+
+        meta = curves[("2026-01", "meta")]
+        self.assertEqual(meta["customers"], 2)
+        self.assertEqual(meta["cumulative_ltv"][:4], [75.0, 75.0, 115.0, 115.0])
+        self.assertEqual(curves[("2026-02", "google")]["cumulative_ltv"][0], 40.0)
+
+    def test_engine_answers_from_tables(self):
+        """Teste: LTVEngine usa as tabelas quando não recebe clientes"""
+        self.store.ingest_orders(self.orders)
+        engine = LTVEngine()
+        engine._cohort_store = self.store
+
+        campaign = engine.calculate_ltv_by_campaign("camp1", {})
+        self.assertEqual(campaign["customer_count"], 2)
+        self.assertEqual(campaign["metrics"]["avg_total_spent"], 115)
+        self.assertEqual(campaign["metrics"]["repeat_rate"], 50.0)
+
+        creative = engine.calculate_ltv_by_creative("cr2", {})
+        self.assertEqual(creative["avg_ltv"], 50)
+        self.assertIn("error", engine.calculate_ltv_by_creative("cr9", {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+🧪 TESTES - Serviço de credenciais (scrypt em pool de processos)
+Nexora Prime
+
+Valida:
+- Hash autodescritivo e verificação em tempo constante
+- Rehash automático quando os parâmetros de custo mudam
+- Hashes pbkdf2_sha256 legados continuam válidos e são migrados
+- Fila limitada recusa excesso com CredentialServiceBusy
+- Login do EnterpriseSecurity grava o hash novo (credenciais no banco)
+- Usuário inexistente também paga um scrypt; vaga presa até o cálculo terminar
+- Benchmark de parâmetros respeita a latência alvo
+"""
+
+import os
+import sys
+import shutil
+import time
+import hashlib
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services import sliding_window_limiter
+from services import credential_service
+from services.credential_service import (
+    CredentialService, CredentialServiceBusy, ScryptParams, benchmark_params, parse_hash
+)
+from services.enterprise_security import EnterpriseSecurity
+
+# Custo baixo para os testes
+FAST = ScryptParams(n=2 ** 10, r=8, p=1)
+STRONGER = ScryptParams(n=2 ** 11, r=8, p=1)
+
+
+class TestCredentialService(unittest.TestCase):
+    """Testes do CredentialService"""
+
+    def setUp(self):
+        self.service = CredentialService(params=FAST, max_workers=2)
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def test_hash_and_verify(self):
+        encoded = self.service.hash_password("Senha@Forte1")
+        self.assertTrue(encoded.startswith("scrypt$1024$8$1$"))
+        self.assertNotEqual(encoded, self.service.hash_password("Senha@Forte1"))  # salt aleatório
+
+        result = self.service.verify("Senha@Forte1", encoded)
+        self.assertTrue(result["valid"])
+        self.assertFalse(result["needs_rehash"])
+        self.assertFalse(self.service.verify("errada", encoded)["valid"])
+        self.assertFalse(self.service.verify("Senha@Forte1", "lixo")["valid"])
+
+    def test_rehash_on_new_params(self):
+        encoded = self.service.hash_password("Senha@Forte1")
+        stronger = CredentialService(params=STRONGER, max_workers=1)
+        try:
+            result = stronger.verify("Senha@Forte1", encoded)
+            self.assertTrue(result["valid"])
+            self.assertTrue(result["needs_rehash"])
+            self.assertEqual(parse_hash(result["new_hash"])["params"], STRONGER)
+
+            # Senha errada nunca gera hash novo
+            self.assertIsNone(stronger.verify("errada", encoded)["new_hash"])
+        finally:
+            stronger.shutdown()
+
+    def test_legacy_pbkdf2(self):
+        salt = "ab" * 16
+        digest = hashlib.pbkdf2_hmac('sha256', b"Senha@Forte1", salt.encode(), 1000).hex()
+        legacy = f"pbkdf2_sha256$1000${salt}${digest}"
+
+        result = self.service.verify("Senha@Forte1", legacy)
+        self.assertTrue(result["valid"])
+        self.assertTrue(result["new_hash"].startswith("scrypt$"))
+        self.assertFalse(self.service.verify("errada", legacy)["valid"])
+
+    def test_bounded_queue(self):
+        service = CredentialService(params=FAST, max_workers=1, max_pending=1)
+        try:
+            # Única vaga ocupada por outra verificação em andamento
+            service._slots.acquire()
+            with self.assertRaises(CredentialServiceBusy):
+                service.hash_password("Senha@Forte1")
+            service._slots.release()
+            self.assertTrue(service.hash_password("Senha@Forte1").startswith("scrypt$"))
+        finally:
+            service.shutdown()
+
+    def test_slot_held_until_computation_finishes(self):
+        service = CredentialService(params=FAST, max_workers=1, max_pending=1)
+        original_timeout = credential_service.VERIFY_TIMEOUT_SECONDS
+        credential_service.VERIFY_TIMEOUT_SECONDS = 0.05
+        try:
+            with self.assertRaises(CredentialServiceBusy):
+                service._run(time.sleep, 1.0)
+            # O filho ainda está calculando: a vaga continua ocupada
+            with self.assertRaisesRegex(CredentialServiceBusy, "Muitas"):
+                service._run(time.sleep, 0)
+        finally:
+            credential_service.VERIFY_TIMEOUT_SECONDS = original_timeout
+        service.shutdown()
+        self.assertTrue(service._slots.acquire(blocking=False))
+
+    def test_broken_pool_is_recreated(self):
+        # Filho morre no meio do cálculo: o pool fica quebrado
+        with self.assertRaisesRegex(CredentialServiceBusy, "reiniciado"):
+            self.service._run(os._exit, 1)
+        encoded = self.service.hash_password("Senha@Forte1")
+        self.assertTrue(self.service.verify("Senha@Forte1", encoded)["valid"])
+        # Nenhuma vaga da fila ficou presa pela chamada que falhou
+        self.assertTrue(all(self.service._slots.acquire(blocking=False)
+                            for _ in range(self.service.max_pending)))
+
+    def test_benchmark_picks_params_under_target(self):
+        result = benchmark_params(target_ms=10_000, min_n=2 ** 10, max_n=2 ** 11, samples=1)
+        self.assertEqual(result["params"]["n"], 2 ** 11)
+        self.assertEqual([t["n"] for t in result["timings"]], [2 ** 10, 2 ** 11])
+
+        result = benchmark_params(target_ms=0.0, min_n=2 ** 10, max_n=2 ** 12, samples=1)
+        self.assertEqual(result["params"]["n"], 2 ** 10)
+        self.assertEqual(len(result["timings"]), 1)
+
+
+class TestEnterpriseLogin(unittest.TestCase):
+    """Login do EnterpriseSecurity com o CredentialService"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        sliding_window_limiter._limiters.clear()
+        self.security = EnterpriseSecurity()
+        self.security.credentials = CredentialService(params=FAST, max_workers=1)
+
+    def tearDown(self):
+        self.security.credentials.shutdown()
+        db_utils.DATABASE_PATH = self._original_path
+        sliding_window_limiter._limiters.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_authenticate_and_rehash(self):
+        self.assertIn("error", self.security.set_password("user_1", "fraca"))
+        self.assertEqual(self.security.set_password("user_1", "Senha@Forte1")["status"], "updated")
+
+        self.assertFalse(self.security.authenticate("user_1", "errada")["authenticated"])
+        result = self.security.authenticate("user_1", "Senha@Forte1")
+        self.assertTrue(result["authenticated"])
+        self.assertTrue(self.security.validate_session(result["session_id"])["valid"])
+
+        # Custo aumentado: o próximo login grava o hash novo
+        old_hash = self.security.store.get_password_hash("user_1")
+        self.security.credentials.shutdown()
+        self.security.credentials = CredentialService(params=STRONGER, max_workers=1)
+        self.assertTrue(self.security.authenticate("user_1", "Senha@Forte1")["authenticated"])
+        new_hash = self.security.store.get_password_hash("user_1")
+        self.assertNotEqual(old_hash, new_hash)
+        self.assertEqual(parse_hash(new_hash)["params"], STRONGER)
+        self.assertEqual(self.security.get_audit_logs({"action": "password_rehashed"})["total_logs"], 1)
+
+    def test_credentials_shared_between_workers(self):
+        self.security.set_password("user_1", "Senha@Forte1")
+        other = EnterpriseSecurity()
+        other.credentials = self.security.credentials
+        self.assertTrue(other.authenticate("user_1", "Senha@Forte1")["authenticated"])
+
+        self.security.delete_user_data("user_1", confirm=True)
+        self.assertFalse(other.authenticate("user_1", "Senha@Forte1")["authenticated"])
+
+    def test_unknown_user_still_runs_verify(self):
+        verified = []
+        original_verify = self.security.credentials.verify
+        self.security.credentials.verify = lambda password, encoded: (
+            verified.append(encoded) or original_verify(password, encoded)
+        )
+        result = self.security.authenticate("ninguem", "Senha@Forte1")
+        self.assertFalse(result["authenticated"])
+        self.assertEqual(result["error"], "Credenciais invalidas")
+        self.assertEqual(len(verified), 1)
+        self.assertTrue(verified[0].startswith("scrypt$1024$"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+🧪 TESTES - Medição durável de créditos Manus
+Nexora Prime
+
+Valida:
+- Eventos bufferizados e gravados em lote
+- Rollups por hora e por dia de cada tipo de ação
+- Consultas por período ('today', '7d', '30d', 'all') a partir dos rollups
+- Números sobrevivem a reinícios e são compartilhados entre instâncias
+- Histórico detalhado (usage_log) inclui eventos já gravados
+- `record` não espera a gravação do flush
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services.credit_metering import CreditUsageMeter
+from services.manus_credit_tracker import ManusCreditTracker, ActionType
+
+
+def usage(moment, action_type="copywriting", credits=1):
+    return {
+        "timestamp": moment.isoformat(),
+        "action_type": action_type,
+        "credits_used": credits,
+        "context": {}
+    }
+
+
+class TestCreditMetering(unittest.TestCase):
+    """Testes do meter de créditos"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.meters = []
+
+    def tearDown(self):
+        for meter in self.meters:
+            meter.close()
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_meter(self, **kwargs):
+        meter = CreditUsageMeter(**kwargs)
+        self.meters.append(meter)
+        return meter
+
+    def count_rows(self):
+        conn = db_utils.get_db_connection()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM manus_credit_usage").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_events_are_buffered_and_bulk_inserted(self):
+        meter = self.make_meter(flush_size=3, flush_interval=60)
+        now = datetime.now()
+        meter.record(usage(now))
+        meter.record(usage(now))
+        self.assertEqual(self.count_rows(), 0)
+        self.assertEqual(len(meter.pending), 2)
+
+        meter.record(usage(now))
+        self.assertEqual(self.count_rows(), 3)
+        self.assertEqual(meter.pending, [])
+
+    def test_timeframes_from_rollups(self):
+        meter = self.make_meter(flush_size=1000, flush_interval=60)
+        now = datetime.now()
+        meter.record(usage(now, "copywriting", 1))
+        meter.record(usage(now, "market_research", 2))
+        meter.record(usage(now - timedelta(days=3), "copywriting", 3))
+        meter.record(usage(now - timedelta(days=10), "copywriting", 5))
+        meter.record(usage(now - timedelta(days=60), "copywriting", 7))
+
+        tracker = ManusCreditTracker(meter=meter)
+        self.assertEqual(tracker.get_total_credits_used('today'), 3)
+        self.assertEqual(tracker.get_total_credits_used('7d'), 6)
+        self.assertEqual(tracker.get_total_credits_used('30d'), 11)
+        self.assertEqual(tracker.get_total_credits_used('all'), 18)
+        self.assertEqual(tracker.get_credits_by_action_type('30d'), {"copywriting": 9, "market_research": 2})
+
+        report = tracker.get_usage_report('all')
+        self.assertEqual(report['total_actions'], 5)
+        self.assertEqual(report['daily_average'], round(18 / 4, 2))
+
+    def test_partial_first_day_uses_hourly_rollups(self):
+        meter = self.make_meter(flush_size=1000, flush_interval=60)
+        start = datetime.now() - timedelta(days=7)
+        meter.record(usage(start + timedelta(hours=1), credits=4))
+        meter.record(usage(start - timedelta(hours=2), credits=100))
+
+        totals = meter.totals_by_action(start)
+        self.assertEqual(totals["copywriting"]["credits"], 4)
+
+    def test_usage_survives_restart_and_is_shared(self):
+        first = ManusCreditTracker(meter=self.make_meter(flush_interval=60))
+        first.log_credit_usage(ActionType.CAMPAIGN_OPTIMIZATION, {"campaign": "c1"})
+        first.meter.close()
+
+        second = ManusCreditTracker(meter=self.make_meter(flush_interval=60))
+        metrics = second.get_dashboard_metrics()
+        self.assertEqual(metrics['credits_today'], 3)
+        self.assertEqual(metrics['credits_month'], 3)
+        self.assertEqual(metrics['breakdown'], {"campaign_optimization": 3})
+        self.assertEqual(metrics['value_generated'], 150.0)
+
+    def test_usage_log_keeps_flushed_history(self):
+        tracker = ManusCreditTracker(meter=self.make_meter(flush_size=2, flush_interval=60))
+        tracker.log_credit_usage(ActionType.COPYWRITING, {"product": "p1"})
+        tracker.log_credit_usage(ActionType.MARKET_RESEARCH, {"product": "p2"})
+        tracker.log_credit_usage(ActionType.COPYWRITING, {"product": "p3"})
+        self.assertEqual(len(tracker.meter.pending), 1)
+
+        log = tracker.usage_log
+        self.assertEqual([r['context']['product'] for r in log], ["p1", "p2", "p3"])
+        self.assertEqual(log[1]['credits_used'], 2)
+        self.assertEqual(len(tracker.get_usage_log('today', limit=2)), 2)
+        self.assertEqual(tracker.get_usage_log(limit=1)[0]['context']['product'], "p3")
+
+    def test_record_does_not_wait_for_flush(self):
+        meter = self.make_meter(flush_size=1000, flush_interval=60)
+        meter.record(usage(datetime.now()))
+        writing, release = threading.Event(), threading.Event()
+        original = db_utils.get_db_connection
+
+        def slow_connection():
+            writing.set()
+            release.wait(5)
+            return original()
+
+        with patch("services.credit_metering.get_db_connection", slow_connection):
+            flusher = threading.Thread(target=meter.flush)
+            flusher.start()
+            self.assertTrue(writing.wait(5))
+            # Flush parado no banco: registrar não bloqueia
+            recorder = threading.Thread(target=meter.record, args=(usage(datetime.now()),))
+            recorder.start()
+            recorder.join(1)
+            self.assertFalse(recorder.is_alive())
+            release.set()
+            flusher.join(5)
+
+        self.assertEqual(self.count_rows(), 1)
+        self.assertEqual(len(meter.pending), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
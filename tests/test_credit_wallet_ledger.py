@@ -0,0 +1,135 @@
+"""
+🧪 TESTES - Ledger da carteira de créditos
+Nexora Prime
+
+Valida:
+- Créditos e débitos gravando lançamento + saldo materializado
+- Débito condicional (sem saldo negativo) sob concorrência
+- Recarga em lote com saldo após cada lançamento
+- Migração das carteiras JSON legadas
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.payments.credit_wallet_service import CreditWalletService
+
+
+class TestCreditWalletLedger(unittest.TestCase):
+    """Testes do ledger"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.wallets_dir = os.path.join(self.tmp_dir, "wallets")
+        self.service = CreditWalletService(storage_dir=self.wallets_dir)
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_add_and_deduct(self):
+        result = self.service.add_credits("u1", "MANUS", 100.0, transaction_id="pi_1", source="stripe")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["new_balance"], 100.0)
+        self.assertEqual(result["currency"], "BRL")
+
+        result = self.service.deduct_credits("u1", "MANUS", 30.0, reason="campaign")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["new_balance"], 70.0)
+
+        self.assertEqual(self.service.get_balance("u1", "MANUS")["balance"], 70.0)
+        balances = self.service.get_balances("u1")["balances"]
+        self.assertEqual(balances["MANUS"]["balance"], 70.0)
+        self.assertEqual(balances["OPENAI"]["balance"], 0.0)
+
+        entries = self.service.get_entries("u1")
+        self.assertEqual([e["amount"] for e in entries], [-30.0, 100.0])
+        self.assertEqual([e["balance_after"] for e in entries], [70.0, 100.0])
+        self.assertEqual(entries[1]["reference"], "pi_1")
+
+    def test_insufficient_and_invalid(self):
+        self.service.add_credits("u1", "OPENAI", 10.0)
+        result = self.service.deduct_credits("u1", "OPENAI", 10.01)
+        self.assertFalse(result["success"])
+        self.assertIn("Saldo insuficiente", result["error"])
+        self.assertEqual(self.service.get_balance("u1", "OPENAI")["balance"], 10.0)
+        self.assertEqual(len(self.service.get_entries("u1")), 1)
+
+        self.assertFalse(self.service.deduct_credits("nobody", "OPENAI", 1)["success"])
+        self.assertFalse(self.service.add_credits("u1", "INVALID", 5)["success"])
+        self.assertFalse(self.service.add_credits("u1", "OPENAI", -5)["success"])
+
+        check = self.service.check_sufficient_balance("u1", "OPENAI", 25.0)
+        self.assertFalse(check["sufficient"])
+        self.assertEqual(check["deficit"], 15.0)
+
+    def test_concurrent_deductions_never_overdraw(self):
+        self.service.add_credits("u1", "FACEBOOK_ADS", 100.0)
+        successes = []
+
+        def worker():
+            service = CreditWalletService(storage_dir=self.wallets_dir)
+            for _ in range(20):
+                if service.deduct_credits("u1", "FACEBOOK_ADS", 1.0)["success"]:
+                    successes.append(1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(successes), 100)
+        self.assertEqual(self.service.get_balance("u1", "FACEBOOK_ADS")["balance"], 0.0)
+        entries = self.service.get_entries("u1", "FACEBOOK_ADS", limit=500)
+        self.assertEqual(len(entries), 101)
+        self.assertEqual(sorted(e["balance_after"] for e in entries if e["amount"] < 0), [float(i) for i in range(100)])
+
+    def test_bulk_add_credits(self):
+        self.service.add_credits("u1", "MANUS", 5.0)
+        result = self.service.bulk_add_credits([
+            {"user_id": "u1", "credit_type": "MANUS", "amount": 10.0},
+            {"user_id": "u2", "credit_type": "GOOGLE_ADS", "amount": 50.0, "transaction_id": "t2"},
+            {"user_id": "u1", "credit_type": "MANUS", "amount": 2.5},
+        ], source="promo")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["entries"], 3)
+        self.assertEqual(result["balances"], {"u1": {"MANUS": 17.5}, "u2": {"GOOGLE_ADS": 50.0}})
+        self.assertEqual([e["balance_after"] for e in self.service.get_entries("u1")], [17.5, 15.0, 5.0])
+
+        # Item inválido: nada é gravado
+        result = self.service.bulk_add_credits([
+            {"user_id": "u3", "credit_type": "MANUS", "amount": 1.0},
+            {"user_id": "u3", "credit_type": "MANUS", "amount": 0},
+        ])
+        self.assertFalse(result["success"])
+        self.assertEqual(self.service.get_entries("u3"), [])
+
+    def test_json_wallets_are_migrated_once(self):
+        os.makedirs(self.wallets_dir, exist_ok=True)
+        with open(os.path.join(self.wallets_dir, "legacy.json"), "w") as f:
+            json.dump({"user_id": "legacy", "balances": {
+                "MANUS": {"balance": 42.0, "currency": "BRL", "updated_at": "2026-01-01T00:00:00"},
+                "OPENAI": {"balance": 0.0, "currency": "USD", "updated_at": "2026-01-01T00:00:00"}
+            }}, f)
+
+        CreditWalletService(storage_dir=self.wallets_dir)
+        CreditWalletService(storage_dir=self.wallets_dir)
+
+        self.assertEqual(self.service.get_balance("legacy", "MANUS")["balance"], 42.0)
+        self.assertEqual(len(self.service.get_entries("legacy")), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.wallets_dir, "legacy.json.migrated")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+🧪 TESTES - Estado de segurança compartilhado (EnterpriseSecurity)
+Nexora Prime
+
+Valida:
+- Sessão criada em uma instância é válida em outra (workers)
+- Expiração por TTL, invalidação e limpeza das expiradas
+- Bloqueio de login por falhas na janela deslizante
+- Log de auditoria com filtros, contagem e anonimização
+- Consentimentos persistidos e relatório de compliance
+"""
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services import sliding_window_limiter
+from services.enterprise_security import EnterpriseSecurity
+from services.security_store import hash_session_token
+
+
+class TestEnterpriseSecurityStore(unittest.TestCase):
+    """Testes do backend de segurança"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        sliding_window_limiter._limiters.clear()
+        self.security = EnterpriseSecurity()
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        sliding_window_limiter._limiters.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_session_shared_between_instances(self):
+        session = self.security.create_session("user_1", {"ip_address": "10.0.0.1"})
+
+        other_worker = EnterpriseSecurity()
+        result = other_worker.validate_session(session["session_id"])
+        self.assertTrue(result["valid"])
+        self.assertEqual(result["user_id"], "user_1")
+
+        # O token não é gravado, só o hash
+        row = self.security.store._fetch("SELECT token_hash FROM security_sessions")[0]
+        self.assertEqual(row["token_hash"], hash_session_token(session["session_id"]))
+
+        self.assertEqual(self.security.validate_session("desconhecida")["error"], "Sessao nao encontrada")
+
+    def test_invalidate_and_expire(self):
+        session = self.security.create_session("user_1")
+        EnterpriseSecurity().invalidate_session(session["session_id"])
+        self.assertEqual(self.security.validate_session(session["session_id"])["error"], "Sessao inativa")
+        self.assertIn("error", self.security.invalidate_session("desconhecida"))
+
+        self.security.security_config["session_timeout_minutes"] = -1
+        expired = self.security.create_session("user_2")
+        self.assertEqual(self.security.validate_session(expired["session_id"])["error"], "Sessao expirada")
+        self.assertGreaterEqual(self.security.store.purge_expired(force=True), 1)
+        self.assertIsNone(self.security.store.get_session(expired["session_id"]))
+
+    def test_login_throttling(self):
+        self.assertTrue(self.security.check_login_allowed("user_1")["allowed"])
+        for _ in range(4):
+            self.assertTrue(self.security.register_login_attempt("user_1", False)["allowed"])
+        result = self.security.register_login_attempt("user_1", False)
+        self.assertFalse(result["allowed"])
+        self.assertEqual(result["failed_attempts"], 5)
+
+        # Bloqueio visível para outra instância; outros usuários não afetados
+        self.assertFalse(EnterpriseSecurity().check_login_allowed("user_1")["allowed"])
+        self.assertTrue(self.security.check_login_allowed("user_2")["allowed"])
+
+        self.security.register_login_attempt("user_1", True)
+        self.assertTrue(self.security.check_login_allowed("user_1")["allowed"])
+
+    def test_audit_filters_and_anonymization(self):
+        for i in range(3):
+            self.security.create_session("user_1")
+        self.security.create_session("user_2")
+
+        logs = self.security.get_audit_logs({"user_id": "user_1", "action": "session_created"})
+        self.assertEqual(logs["total_logs"], 3)
+        self.assertTrue(all(l["user_id"] == "user_1" for l in logs["logs"]))
+        self.assertEqual(self.security.get_audit_logs()["total_logs"], 4)
+
+        timestamps = [l["timestamp"] for l in self.security.get_audit_logs()["logs"]]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+        self.security.delete_user_data("user_1", confirm=True)
+        self.assertEqual(self.security.get_audit_logs({"user_id": "user_1"})["total_logs"], 0)
+        self.assertEqual(self.security.get_audit_logs({"action": "data_deleted"})["total_logs"], 1)
+
+    def test_consents_persisted(self):
+        self.security.register_consent("user_1", "marketing_emails", True, {"ip_address": "10.0.0.1"})
+        self.security.register_consent("user_1", "analytics_tracking", False)
+        self.security.register_consent("user_2", "marketing_emails", True)
+        self.security.register_consent("user_2", "marketing_emails", False)
+
+        consents = EnterpriseSecurity().get_user_consents("user_1")["consents"]
+        self.assertTrue(consents["marketing_emails"]["granted"])
+        self.assertEqual(consents["marketing_emails"]["ip_address"], "10.0.0.1")
+        self.assertFalse(consents["analytics_tracking"]["granted"])
+
+        report = self.security.generate_compliance_report()
+        self.assertEqual(report["summary"]["users_with_consent"], 2)
+        self.assertEqual(report["details"]["consent_breakdown"]["marketing_emails"], {"granted": 1, "denied": 1})
+
+        export = self.security.export_user_data("user_1")
+        self.assertIn("consents", export["data_categories"])
+
+    def test_validate_session_latency(self):
+        session = self.security.create_session("user_1")
+        start = time.perf_counter()
+        for _ in range(200):
+            self.security.validate_session(session["session_id"])
+        per_call = (time.perf_counter() - start) / 200
+        self.assertLess(per_call, 0.005)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+🧪 TESTES - Monte Carlo do FinancialSimulator
+Nexora Prime
+
+Valida:
+- Reprodutibilidade com seed (inclusive em blocos)
+- Bandas de percentis ordenadas e coerentes com a projeção determinística
+- validate_budget_proposal usando a distribuição simulada
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import financial_simulator as simulator_module
+from services.financial_simulator import FinancialSimulator
+
+
+class TestMonteCarlo(unittest.TestCase):
+    """Testes da simulação estocástica"""
+
+    def setUp(self):
+        self.simulator = FinancialSimulator()
+
+    def test_seeded_and_chunk_independent(self):
+        """Teste: mesmo seed dá o mesmo resultado, com ou sem blocos"""
+        first = self.simulator.simulate_monte_carlo(5000, "google", n_scenarios=30000, seed=7)
+        second = self.simulator.simulate_monte_carlo(5000, "google", n_scenarios=30000, seed=7)
+        self.assertEqual(first["bands"], second["bands"])
+
+        original = simulator_module.MC_CHUNK_SIZE
+        simulator_module.MC_CHUNK_SIZE = 10000
+        try:
+            chunked = self.simulator.simulate_monte_carlo(5000, "google", n_scenarios=30000, seed=7)
+        finally:
+            simulator_module.MC_CHUNK_SIZE = original
+        self.assertEqual(chunked["n_scenarios"], 30000)
+        self.assertAlmostEqual(chunked["bands"]["cpc"]["p50"], 2.0, delta=0.05)
+
+    def test_bands_are_ordered(self):
+        """Teste: p5 <= p50 <= p95 e mediana perto da projeção base"""
+        result = self.simulator.simulate_monte_carlo(5000, "facebook", n_scenarios=50000, seed=1, target_roas=2)
+        for metric in ("clicks", "conversions", "revenue", "roas"):
+            band = result["bands"][metric]
+            self.assertLessEqual(band["p5"], band["p50"])
+            self.assertLessEqual(band["p50"], band["p95"])
+
+        deterministic = self.simulator.simulate_campaign(5000, "facebook", "geral")
+        expected_clicks = deterministic["projections"]["estimated"]["clicks"]
+        self.assertAlmostEqual(result["bands"]["clicks"]["p50"] / expected_clicks, 1, delta=0.05)
+        self.assertTrue(0 < result["probabilities"]["target_roas"] < 1)
+
+    def test_validation_uses_distribution(self):
+        """Teste: ROAS fora da distribuição é marcado como irreal"""
+        validation = self.simulator.validate_budget_proposal(5000, 9.5)
+        self.assertIn("monte_carlo", validation)
+        self.assertLess(validation["monte_carlo"]["probability_of_expected_roas"], 0.1)
+        self.assertTrue(validation["warnings"])
+
+        easy = self.simulator.validate_budget_proposal(5000, 1.0)
+        self.assertTrue(easy["is_realistic"])
+        self.assertEqual(easy["warnings"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""
+🧪 TESTES - Busca BM25 da base de conhecimento do Velyra
+Nexora Prime
+
+Valida:
+- Tokenizador sem acentos e com plurais unificados
+- Ranking BM25 e atualização incremental do índice invertido
+- Persistência em disco reaproveitada pela impressão digital
+- Gravações concorrentes usam temporários próprios
+- answer_question roteando por glossário, playbooks e memórias
+- Conteúdo da LivingKnowledgeBase indexado na hora
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import knowledge_search
+from services.knowledge_search import KnowledgeSearchIndex, tokenize
+from services.velyra_knowledge_base import VelyraKnowledgeBase
+from services.living_knowledge_base import LivingKnowledgeBase
+
+
+class TestKnowledgeSearchIndex(unittest.TestCase):
+    """Testes do índice invertido"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "index.json")
+        self.documents = [
+            {"id": "d1", "source": "module", "title": "Otimização por conversões", "text": "O pixel envia eventos de conversão"},
+            {"id": "d2", "source": "module", "title": "Públicos", "text": "Lookalike de compradores e remarketing"},
+            {"id": "d3", "source": "memory", "title": "Campanha Fitness", "text": "vídeo ugc no tiktok"},
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_tokenizer_ignores_accents_and_plurals(self):
+        self.assertEqual(tokenize("Conversões"), tokenize("conversao"))
+        self.assertEqual(tokenize("Públicos"), tokenize("publico"))
+        self.assertEqual(tokenize("O que é o CPA?"), ["cpa"])
+
+    def test_bm25_ranking_and_source_filter(self):
+        index = KnowledgeSearchIndex(path=self.path)
+        index.build(self.documents)
+
+        hits = index.search("conversão no pixel")
+        self.assertEqual(hits[0]["id"], "d1")
+        self.assertEqual(hits[0]["matched_terms"], 2)
+        self.assertEqual(index.search("ugc tiktok", sources={"module"}), [])
+        self.assertEqual(index.search("palavra inexistente"), [])
+
+    def test_incremental_add_and_remove(self):
+        index = KnowledgeSearchIndex(path=self.path)
+        index.build(self.documents)
+
+        index.add_document("d4", "living_case", "Escala Black Friday", "escala de orçamento na black friday")
+        self.assertEqual(index.search("black friday")[0]["id"], "d4")
+
+        index.add_document("d4", "living_case", "Escala Natal", "escala de orçamento no natal")
+        self.assertEqual(index.search("black friday"), [])
+        self.assertTrue(index.remove_document("d4"))
+        self.assertEqual(index.search("natal"), [])
+        self.assertEqual(len(index), 3)
+
+    def test_persisted_index_is_reused(self):
+        index = KnowledgeSearchIndex(path=self.path)
+        self.assertTrue(index.build(self.documents))
+        index.add_document("runtime", "living_case", "Runtime", "conteúdo aprendido", persist=False)
+
+        reloaded = KnowledgeSearchIndex(path=self.path)
+        self.assertFalse(reloaded.build(self.documents))
+        self.assertEqual(len(reloaded), 3)
+        self.assertEqual(reloaded.search("lookalike")[0]["id"], "d2")
+
+        # Corpus alterado: reconstrói
+        changed = self.documents + [{"id": "d5", "source": "module", "title": "Novo", "text": "conteúdo novo"}]
+        self.assertTrue(KnowledgeSearchIndex(path=self.path).build(changed))
+
+    def test_concurrent_saves_do_not_collide(self):
+        writers = [KnowledgeSearchIndex(path=self.path) for _ in range(4)]
+        for writer in writers:
+            writer.build(self.documents)
+        results = []
+
+        def save_many(writer):
+            results.extend(writer.save() for _ in range(20))
+
+        threads = [threading.Thread(target=save_many, args=(w,)) for w in writers]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertTrue(all(results))
+        self.assertEqual(os.listdir(self.tmp_dir), ["index.json"])
+        reloaded = KnowledgeSearchIndex(path=self.path)
+        self.assertFalse(reloaded.build(self.documents))
+
+
+class TestVelyraKnowledgeAnswers(unittest.TestCase):
+    """Testes de answer_question sobre o índice"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_index = knowledge_search._knowledge_index
+        knowledge_search._knowledge_index = KnowledgeSearchIndex(path=os.path.join(self.tmp_dir, "index.json"))
+        self.kb = VelyraKnowledgeBase()
+
+    def tearDown(self):
+        knowledge_search._knowledge_index = self._original_index
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_glossary_lookup(self):
+        result = self.kb.answer_question("O que é ROAS?")
+        self.assertEqual(result["type"], "glossary")
+        self.assertEqual(result["term"], "ROAS")
+
+        result = self.kb.answer_question("o que é custo por clique")
+        self.assertEqual(result["term"], "CPC")
+
+    def test_comparison_reaches_curated_answer(self):
+        result = self.kb.answer_question("Qual a diferença entre CBO e ABO?")
+        self.assertEqual(result["type"], "comparison")
+
+    def test_best_practices_category_from_index(self):
+        self.assertEqual(self.kb.answer_question("Dicas de texto para anúncios")["category"], "copy")
+        self.assertEqual(self.kb.answer_question("melhores práticas de audiência")["category"], "publicos")
+
+    def test_playbook_sections_are_searchable(self):
+        result = self.kb.answer_question("Como funciona o framework CATT?")
+        self.assertEqual(result["type"], "knowledge")
+        self.assertIn("CATT", result["answer"])
+        self.assertTrue(result["sources"][0]["id"].startswith("playbook:"))
+
+    def test_memories_found_without_fixed_tag_list(self):
+        result = self.kb.answer_question("campanha de fitness no tiktok com ugc")
+        self.assertEqual(result["type"], "case_study")
+        memory = self.kb._memories_by_id[result["memory_id"]]
+        self.assertIn("fitness", memory["tags"])
+        self.assertIn("tiktok_ads", memory["tags"])
+
+    def test_unrelated_question_falls_back_to_general(self):
+        self.assertEqual(self.kb.answer_question("xyz abc")["type"], "general")
+
+    def test_living_knowledge_is_indexed_incrementally(self):
+        living = LivingKnowledgeBase()
+        living.add_case_study(
+            title="Black Friday Pet Shop",
+            context={"niche": "pets"},
+            actions=["Antecipar ofertas relâmpago"],
+            results={"roas": 6.1},
+            learnings=["Cupom progressivo aumentou o ticket"]
+        )
+
+        result = self.kb.answer_question("black friday pet shop")
+        self.assertEqual(result["type"], "knowledge")
+        self.assertIn("Cupom progressivo", result["answer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+"""
+🧪 TESTES - Armazenamento do sistema de monetização
+Nexora Prime
+
+Valida:
+- Assinaturas, saldos e faturas persistidos e compartilhados entre instâncias
+- Consumo de créditos atômico (sem saldo negativo com concorrência)
+- Relatórios de uso agregados por período
+- Cache de plano invalidado em upgrade/cancelamento
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services.monetization_system import MonetizationSystem
+
+
+class TestMonetizationStorage(unittest.TestCase):
+    """Testes do armazenamento de monetização"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.system = MonetizationSystem()
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_state_shared_between_instances(self):
+        result = self.system.create_subscription("u1", "starter")
+        other = MonetizationSystem()
+
+        status = other.get_subscription_status("u1")
+        self.assertTrue(status["has_subscription"])
+        self.assertEqual(status["plan_name"], "Starter")
+        self.assertEqual(other.get_credit_balance("u1")["balances"]["report"]["available"], 10)
+        self.assertEqual(other.get_invoices("u1")[0]["id"], result["invoice"]["id"])
+
+    def test_free_credits_initialized_on_first_consumption(self):
+        self.assertTrue(self.system.consume_credits("u1", "report", 2)["success"])
+        result = self.system.consume_credits("u1", "report", 1)
+        self.assertFalse(result["success"])
+        self.assertEqual(result["available"], 0)
+        self.assertIn("error", self.system.consume_credits("u1", "invalido"))
+
+    def test_concurrent_consumption_never_overspends(self):
+        self.system.create_subscription("u1", "starter")  # 10 relatórios
+        results = []
+
+        def worker():
+            system = MonetizationSystem()
+            for _ in range(5):
+                results.append(system.consume_credits("u1", "report", 1)["success"])
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count(True), 10)
+        balance = self.system.get_credit_balance("u1")["balances"]["report"]
+        self.assertEqual(balance["available"], 0)
+        self.assertEqual(balance["used_this_period"], 10)
+
+    def test_usage_report_by_period(self):
+        self.system.create_subscription("u1", "starter")
+        self.system.consume_credits("u1", "ai_generation", 30)
+        self.system.consume_credits("u1", "ai_generation", 50)
+
+        current = self.system.get_usage_report("u1")["usage"]["ai_generation"]
+        self.assertEqual(current["used"], 80)
+        self.assertEqual(current["percentage_used"], 80.0)
+
+        week = self.system.get_usage_report("u1", "7d")["usage"]["ai_generation"]
+        self.assertEqual(week["used"], 80)
+        self.assertEqual(week["available"], 20)
+
+    def test_upgrade_and_cancel_refresh_plan(self):
+        subscription_id = self.system.create_subscription("u1", "starter")["subscription_id"]
+        self.assertEqual(self.system.get_subscription_status("u1")["plan"], "starter")
+
+        self.system.upgrade_subscription(subscription_id, "unlimited")
+        self.assertEqual(self.system.get_subscription_status("u1")["plan"], "unlimited")
+        result = self.system.consume_credits("u1", "automation", 1000)
+        self.assertEqual(result["remaining"], -1)
+
+        self.system.cancel_subscription(subscription_id, immediate=True)
+        self.assertFalse(self.system.get_subscription_status("u1")["has_subscription"])
+
+    def test_upgrade_keeps_debits_from_other_workers(self):
+        subscription_id = self.system.create_subscription("u1", "starter")["subscription_id"]
+        # Débito feito por outro worker depois de este ter lido o saldo
+        MonetizationSystem().consume_credits("u1", "ai_generation", 30)
+
+        self.system.upgrade_subscription(subscription_id, "professional")
+        balance = self.system.consume_credits("u1", "ai_generation", 1)
+        self.assertEqual(balance["remaining"], 100 - 30 + (500 - 100) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
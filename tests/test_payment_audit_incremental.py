@@ -0,0 +1,156 @@
+"""
+🧪 TESTES - Consolidação incremental do audit log de pagamentos
+Nexora Prime
+
+Valida:
+- Só as linhas novas de cada origem são lidas (offset em bytes)
+- Merge das origens em ordem de timestamp e segmentação por dia
+- Contadores do resumo mantidos incrementalmente
+- Linha parcial (sem '\\n') fica para a próxima consolidação
+- Queda entre o append e o índice não duplica entradas
+- Segmento sem data fica por último (mais antigo) nas consultas
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from unittest import mock
+
+from services.payments.payment_audit_log import PaymentAuditLog
+
+
+def write_lines(path, entries, partial=None):
+    with open(path, 'a') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+        if partial is not None:
+            f.write(partial)
+
+
+class TestPaymentAuditIncremental(unittest.TestCase):
+    """Testes da consolidação incremental"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.base_dir = os.path.join(self.tmp_dir, "payments")
+        os.makedirs(self.base_dir)
+        self.audit = PaymentAuditLog(base_dir=self.base_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_merge_by_timestamp_and_day_segments(self):
+        write_lines(self.audit.log_files["webhooks"], [
+            {"timestamp": "2026-01-01T10:00:00", "event_type": "payment_intent.succeeded"},
+            {"timestamp": "2026-01-02T09:00:00", "event_type": "charge.refunded"},
+        ])
+        write_lines(self.audit.log_files["credit_wallet"], [
+            {"timestamp": "2026-01-01T08:00:00", "operation": "add_credits"},
+            {"timestamp": "2026-01-01T12:00:00", "operation": "deduct_credits"},
+        ])
+
+        result = self.audit.consolidate_logs()
+        self.assertTrue(result["success"])
+        self.assertEqual(result["new_entries"], 4)
+
+        index = self.audit.get_segment_index()
+        self.assertEqual(index["2026-01-01"]["entries"], 3)
+        self.assertEqual(index["2026-01-02"]["entries"], 1)
+
+        day_one = [e["timestamp"] for e in self.audit.get_logs_for_day("2026-01-01")]
+        self.assertEqual(day_one, sorted(day_one))
+
+        logs = self.audit.get_consolidated_logs(limit=2)
+        self.assertEqual([e["timestamp"] for e in logs], ["2026-01-01T12:00:00", "2026-01-02T09:00:00"])
+
+    def test_only_new_lines_are_consolidated(self):
+        path = self.audit.log_files["webhooks"]
+        write_lines(path, [{"timestamp": "2026-01-01T10:00:00", "event_type": "payment_intent.succeeded"}])
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 1)
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 0)
+
+        write_lines(path, [{"timestamp": "2026-01-01T11:00:00", "event_type": "payment_intent.payment_failed"}])
+        result = self.audit.consolidate_logs()
+        self.assertEqual(result["new_entries"], 1)
+        self.assertEqual(result["total_entries"], 2)
+        self.assertEqual(len(list(self.audit.get_logs_for_day("2026-01-01"))), 2)
+
+    def test_partial_line_waits_for_next_run(self):
+        path = self.audit.log_files["security_blocks"]
+        line = json.dumps({"timestamp": "2026-01-01T10:00:00", "reason": "blocked"})
+        write_lines(path, [], partial=line[:10])
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 0)
+
+        with open(path, 'a') as f:
+            f.write(line[10:] + '\n')
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 1)
+
+    def test_summary_counters_are_incremental(self):
+        write_lines(self.audit.log_files["webhooks"], [
+            {"timestamp": "2026-01-01T10:00:00", "event_type": "payment_intent.succeeded"},
+            {"timestamp": "2026-01-01T11:00:00", "event_type": "payment_intent.payment_failed"},
+        ])
+        write_lines(self.audit.log_files["security_blocks"], [
+            {"timestamp": "2026-01-01T12:00:00", "reason": "limit"},
+        ])
+        summary = self.audit.generate_audit_summary()["summary"]
+        self.assertEqual(summary["total_entries"], 3)
+        self.assertEqual(summary["successful_payments"], 1)
+        self.assertEqual(summary["failed_payments"], 1)
+        self.assertEqual(summary["security_block_count"], 1)
+        self.assertEqual(summary["error_count"], 1)
+        self.assertEqual(summary["entries_by_source"]["webhooks"], 2)
+
+        write_lines(self.audit.log_files["webhooks"], [
+            {"timestamp": "2026-01-02T10:00:00", "event_type": "charge.refunded"},
+        ])
+        summary = self.audit.generate_audit_summary()["summary"]
+        self.assertEqual(summary["total_entries"], 4)
+        self.assertEqual(summary["refunds"], 1)
+
+    def test_truncated_source_restarts_from_beginning(self):
+        path = self.audit.log_files["google_funding"]
+        write_lines(path, [{"timestamp": "2026-01-01T10:00:00"}] * 3)
+        self.audit.consolidate_logs()
+
+        open(path, 'w').close()
+        write_lines(path, [{"timestamp": "2026-01-03T10:00:00"}])
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 1)
+
+    def test_crash_before_index_save_does_not_duplicate(self):
+        write_lines(self.audit.log_files["webhooks"], [{"timestamp": "2026-01-01T10:00:00"}])
+        self.audit.consolidate_logs()
+        write_lines(self.audit.log_files["webhooks"], [
+            {"timestamp": "2026-01-01T11:00:00"}, {"timestamp": "2026-01-03T11:00:00"}
+        ])
+
+        # Segmentos gravados, índice/offsets não
+        with mock.patch.object(self.audit, "_save_state", side_effect=OSError("queda")):
+            with self.assertRaises(OSError):
+                self.audit.consolidate_logs()
+
+        self.assertEqual(self.audit.consolidate_logs()["new_entries"], 2)
+        day_one = [e["timestamp"] for e in self.audit.get_logs_for_day("2026-01-01")]
+        self.assertEqual(day_one, ["2026-01-01T10:00:00", "2026-01-01T11:00:00"])
+        self.assertEqual(len(list(self.audit.get_logs_for_day("2026-01-03"))), 1)
+        self.assertEqual(self.audit.generate_audit_summary()["summary"]["total_entries"], 3)
+
+    def test_undated_segment_is_oldest(self):
+        write_lines(self.audit.log_files["webhooks"], [
+            {"event_type": "sem_data"}, {"timestamp": "2026-01-01T10:00:00"}
+        ])
+        logs = self.audit.get_consolidated_logs(limit=1)
+        self.assertEqual(logs[0]["timestamp"], "2026-01-01T10:00:00")
+        self.assertEqual(len(self.audit.get_consolidated_logs(limit=5)), 2)
+        self.assertEqual(self.audit.get_consolidated_logs(limit=5)[0]["event_type"], "sem_data")
+
+
+if __name__ == '__main__':
+    unittest.main()
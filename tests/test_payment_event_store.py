@@ -0,0 +1,173 @@
+"""
+🧪 TESTES - Store indexado de eventos de pagamento
+Nexora Prime
+
+Valida:
+- Confirmação de webhook por payment_intent_id sem varrer o JSONL
+- Idempotência por event.id do Stripe (reenvios não duplicam créditos)
+- Evento retomado após queda do worker não credita de novo
+- Migração única dos JSONL legados
+- Histórico de funding e eventos recentes a partir do store
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services.payments.payment_event_store import PaymentEventStore
+from services.payments.stripe_webhook_handler import StripeWebhookHandler
+from services.payments.payment_security_blocks import PaymentSecurityBlocks
+from services.payments.facebook_ads_funding_service import FacebookAdsFundingService
+
+
+def succeeded_event(event_id, payment_intent_id, user_id="u1", amount=5000):
+    return {
+        "id": event_id,
+        "type": "payment_intent.succeeded",
+        "data": {"object": {
+            "id": payment_intent_id,
+            "amount": amount,
+            "currency": "brl",
+            "metadata": {"user_id": user_id, "credit_type": "MANUS"}
+        }}
+    }
+
+
+class TestPaymentEventStore(unittest.TestCase):
+    """Testes do store de eventos"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        self._original_cwd = os.getcwd()
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        # Os serviços gravam JSONL em caminhos relativos (data/payments/...)
+        os.chdir(self.tmp_dir)
+
+    def tearDown(self):
+        os.chdir(self._original_cwd)
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_webhook_confirmation_and_idempotency(self):
+        handler = StripeWebhookHandler()
+        blocks = PaymentSecurityBlocks()
+
+        self.assertTrue(blocks.check_webhook_confirmation("pi_1")["blocked"])
+
+        result = handler.handle_event(succeeded_event("evt_1", "pi_1"))
+        self.assertTrue(result["success"])
+        self.assertEqual(result["new_balance"], 50.0)
+        self.assertFalse(blocks.check_webhook_confirmation("pi_1")["blocked"])
+        self.assertTrue(blocks.check_webhook_confirmation("pi_2")["blocked"])
+
+        # Reenvio do mesmo evento: não credita de novo
+        duplicate = handler.handle_event(succeeded_event("evt_1", "pi_1"))
+        self.assertTrue(duplicate["duplicate"])
+        self.assertEqual(duplicate["previous_result"]["new_balance"], 50.0)
+        self.assertEqual(handler.wallet_service.get_balance("u1", "MANUS")["balance"], 50.0)
+
+        statuses = [e["status"] for e in handler.get_recent_events()]
+        self.assertEqual(statuses, ["received", "processed", "duplicate"])
+        self.assertEqual(len(handler.get_recent_events(limit=1)), 1)
+
+    def test_failed_event_can_be_retried(self):
+        handler = StripeWebhookHandler()
+        event = succeeded_event("evt_2", "pi_2")
+        event["data"]["object"]["metadata"] = {}
+        self.assertFalse(handler.handle_event(event)["success"])
+
+        event = succeeded_event("evt_2", "pi_2")
+        self.assertTrue(handler.handle_event(event)["success"])
+        self.assertEqual(handler.event_store.get_processed_event("evt_2")["status"], "processed")
+
+    def test_in_flight_event_is_not_acknowledged_and_lease_expires(self):
+        handler = StripeWebhookHandler()
+        store = handler.event_store
+        # Worker que morreu no meio do handler deixou a reserva
+        self.assertTrue(store.claim_event("evt_3", "payment_intent.succeeded"))
+
+        result = handler.handle_event(succeeded_event("evt_3", "pi_3"))
+        self.assertFalse(result["success"])
+        self.assertTrue(result["in_progress"])
+        self.assertNotIn("duplicate", result)
+        self.assertEqual(handler.wallet_service.get_balance("u1", "MANUS")["balance"], 0.0)
+
+        # Reserva vencida: o reenvio do Stripe retoma e credita
+        conn = db_utils.get_db_connection()
+        conn.execute("UPDATE processed_webhook_events SET claimed_at = '2000-01-01T00:00:00'")
+        conn.commit()
+        conn.close()
+        self.assertTrue(handler.handle_event(succeeded_event("evt_3", "pi_3"))["success"])
+        self.assertEqual(handler.wallet_service.get_balance("u1", "MANUS")["balance"], 50.0)
+        self.assertFalse(store.claim_event("evt_3", lease_seconds=-1))  # processado não é retomado
+
+    def test_reclaimed_event_after_crash_does_not_credit_twice(self):
+        handler = StripeWebhookHandler()
+        event = succeeded_event("evt_4", "pi_4")
+        # Worker creditou e morreu antes de marcar o evento como processado
+        self.assertTrue(handler.event_store.claim_event("evt_4", "payment_intent.succeeded"))
+        self.assertTrue(handler._handle_payment_succeeded(event)["success"])
+
+        conn = db_utils.get_db_connection()
+        conn.execute("UPDATE processed_webhook_events SET claimed_at = '2000-01-01T00:00:00'")
+        conn.commit()
+        conn.close()
+        result = handler.handle_event(event)
+        self.assertTrue(result["success"])
+        self.assertEqual(result["new_balance"], 50.0)
+        self.assertEqual(handler.wallet_service.get_balance("u1", "MANUS")["balance"], 50.0)
+        self.assertEqual(len(handler.wallet_service.get_entries("u1")), 1)
+        self.assertEqual(handler.event_store.get_processed_event("evt_4")["status"], "processed")
+
+    def test_legacy_jsonl_is_migrated_once(self):
+        os.makedirs("data/payments", exist_ok=True)
+        with open("data/payments/webhook_events.jsonl", "w") as f:
+            f.write(json.dumps({
+                "timestamp": "2026-01-01T10:00:00",
+                "event_type": "payment_intent.succeeded",
+                "event_id": "evt_old",
+                "status": "processed",
+                "details": {"user_id": "u9", "payment_intent_id": "pi_old", "amount": 20.0}
+            }) + "\n\n")
+        with open("data/payments/facebook_ads_funding.jsonl", "w") as f:
+            for i in range(3):
+                f.write(json.dumps({
+                    "timestamp": f"2026-01-0{i + 1}T10:00:00", "user_id": "u9" if i else "u8",
+                    "operation": "fund_account", "amount": 100.0 + i, "status": "success", "details": {}
+                }) + "\n")
+
+        blocks = PaymentSecurityBlocks()
+        StripeWebhookHandler()
+        self.assertFalse(blocks.check_webhook_confirmation("pi_old")["blocked"])
+        self.assertEqual(PaymentEventStore().migrate_jsonl("webhook", "data/payments/webhook_events.jsonl"), 0)
+
+        funding = FacebookAdsFundingService()
+        FacebookAdsFundingService()
+        history = funding.get_funding_history("u9")
+        self.assertEqual([h["amount"] for h in history], [101.0, 102.0])
+        self.assertEqual(len(funding.get_funding_history("u9", limit=1)), 1)
+
+    def test_funding_history_from_store(self):
+        funding = FacebookAdsFundingService()
+        funding.wallet_service.add_credits("u1", "FACEBOOK_ADS", 500.0)
+
+        result = funding.fund_account("u1", "act_1", 100.0, transaction_id="tx_1")
+        self.assertTrue(result["success"])
+        self.assertEqual(result["wallet_balance"], 400.0)
+
+        history = funding.get_funding_history("u1")
+        self.assertEqual(len(history), 1)
+        self.assertEqual(history[0]["status"], "success")
+        self.assertEqual(funding.get_funding_history("other"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
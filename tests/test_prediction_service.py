@@ -0,0 +1,88 @@
+"""
+🧪 TESTES - Prediction Service (registro + cache)
+Nexora Prime
+
+Valida:
+- Registro só cria nova versão quando o fingerprint muda
+- Predições repetidas vêm do cache
+- Retreino invalida o cache via versão do modelo
+- Log de predições persistido em lote
+"""
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.prediction_service import PredictionService, ModelRegistry
+from services.ml_prediction_engine import MLPredictionEngine
+from services.predictive_analytics_engine import PredictiveAnalyticsEngine, PredictionType
+
+
+class TestPredictionService(unittest.TestCase):
+    """Testes do registro e do cache de predições"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.service = PredictionService()
+        self.service.log_writer._ensure_worker = lambda: None
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_registry_versions_by_fingerprint(self):
+        """Teste: mesmo fingerprint reaproveita a versão, inclusive após restart"""
+        registry = self.service.registry
+        self.assertEqual(registry.register("m", "a"), 1)
+        self.assertEqual(registry.register("m", "a"), 1)
+        self.assertEqual(registry.register("m", "b"), 2)
+        self.assertEqual(ModelRegistry().register("m", "b"), 2)
+
+    def test_repeated_prediction_hits_cache(self):
+        """Teste: segunda chamada não recalcula e devolve o mesmo resultado"""
+        engine = MLPredictionEngine()
+        engine._prediction_service = self.service
+        campaign = {"campaign_id": "c1", "current_roas": 2.5, "roas_trend": 1}
+
+        first = engine.predict_roas(campaign, 7)
+        second = engine.predict_roas(campaign, 7)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.cache.hits, 1)
+
+        batch = engine.predict_roas_batch([campaign, {"campaign_id": "c2", "current_roas": 1.0}], 7)
+        self.assertEqual(batch[0], first)
+        self.assertEqual(self.service.cache.hits, 2)
+
+        self.assertEqual(self.service.log_writer.flush(), 2)
+
+    def test_retraining_invalidates_cache(self):
+        """Teste: novo treino gera nova versão e nova predição"""
+        engine = PredictiveAnalyticsEngine(models_dir=os.path.join(self.tmp_dir, "models"))
+        engine._prediction_service = self.service
+        engine._register_models()
+
+        rng = random.Random(1)
+        records = [{"daily_budget": b, "revenue": 4 * b} for b in (rng.uniform(10, 100) for _ in range(50))]
+        engine.train_models(records)
+        campaign = {"id": "c1", "daily_budget": 50, "revenue": 150}
+        first = engine.predict_metric(campaign, PredictionType.REVENUE)
+        self.assertAlmostEqual(first.predicted_value, 200, delta=1)
+
+        engine.train_models([dict(r, revenue=2 * r["daily_budget"]) for r in records])
+        second = engine.predict_metric(campaign, PredictionType.REVENUE)
+
+        self.assertEqual(self.service.registry.current_version("predictive_revenue"), 3)
+        self.assertAlmostEqual(second.predicted_value, 100, delta=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,172 @@
+"""
+🧪 TESTES - Report Jobs (geração assíncrona de relatórios)
+Nexora Prime
+
+Valida:
+- Resumo calculado em SQL igual ao cálculo antigo em Python
+- Exportação em blocos para CSV e NDJSON
+- Job registrado em `reports` apenas com resumo + referência ao arquivo
+- Jobs órfãos reenfileirados (com limite de tentativas): na inicialização
+  sem esperar o corte de idade; job com heartbeat vivo não é tocado
+"""
+
+import os
+import csv
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.report_jobs import ReportJobManager
+
+
+class TestReportJobs(unittest.TestCase):
+    """Testes do ReportJobManager"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        conn.executescript("""
+            CREATE TABLE campaigns (id INTEGER PRIMARY KEY, name TEXT, created_at TEXT);
+            CREATE TABLE campaign_metrics (
+                campaign_id INTEGER, impressions INTEGER, clicks INTEGER, conversions INTEGER,
+                spend REAL, revenue REAL, roas REAL
+            );
+            CREATE TABLE reports (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, report_name TEXT NOT NULL, report_type TEXT NOT NULL,
+                date_range_start TEXT, date_range_end TEXT, data_json TEXT
+            );
+        """)
+        for i in range(1, 26):
+            conn.execute("INSERT INTO campaigns VALUES (?, ?, ?)", (i, f"Campanha {i}", f"2026-01-{i:02d}"))
+            if i % 5:
+                conn.execute(
+                    "INSERT INTO campaign_metrics VALUES (?, 1000, 50, 5, ?, ?, ?)",
+                    (i, 10.0 * i, 30.0 * i, 3.0)
+                )
+        conn.commit()
+        conn.close()
+
+        self.manager = ReportJobManager(output_dir=os.path.join(self.tmp_dir, "reports"), chunk_size=7)
+        # Execução síncrona nos testes
+        self.manager._get_executor = lambda: _InlineExecutor()
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_csv_export_and_sql_summary(self):
+        """Teste: CSV completo e resumo igual ao cálculo em Python"""
+        job_id = self.manager.submit("2026-01-01", "2026-01-31", fmt="csv")
+        job = self.manager.get_job(job_id)
+
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["rows_written"], 25)
+
+        spends = [10.0 * i for i in range(1, 26) if i % 5]
+        self.assertEqual(job["summary"]["total_campaigns"], 25)
+        self.assertAlmostEqual(job["summary"]["total_spend"], sum(spends))
+        self.assertAlmostEqual(job["summary"]["avg_roas"], 3.0 * len(spends) / 25)
+
+        download = self.manager.get_download(job_id)
+        with open(download["path"], newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 25)
+        self.assertIn("revenue", rows[0])
+
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        data_json = conn.execute("SELECT data_json FROM reports WHERE id = ?", (job["report_id"],)).fetchone()[0]
+        conn.close()
+        self.assertNotIn("campaigns", json.loads(data_json))
+
+    def test_ndjson_export(self):
+        """Teste: uma linha JSON por registro"""
+        job_id = self.manager.submit("2026-01-10", "2026-01-19", fmt="ndjson")
+        with open(self.manager.get_download(job_id)["path"], encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([r["id"] for r in records], list(range(10, 20)))
+
+    def test_invalid_format(self):
+        """Teste: formato desconhecido é rejeitado antes de criar o job"""
+        with self.assertRaises(ValueError):
+            self.manager.submit("2026-01-01", "2026-01-31", fmt="xlsx")
+
+    def test_orphaned_jobs_are_requeued(self):
+        """Teste: job parado por restart volta para a fila; sem tentativas, falha"""
+        old = (datetime.now() - timedelta(hours=2)).isoformat()
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        conn.executemany("""
+            INSERT INTO report_jobs (id, report_name, report_type, date_range_start, date_range_end,
+                                     format, status, attempts, created_at, started_at)
+            VALUES (?, 'R', 'performance', '2026-01-01', '2026-01-31', 'csv', ?, ?, ?, ?)
+        """, [
+            ("orfao", "running", 1, old, old),
+            ("esgotado", "running", 3, old, old),
+            ("recente", "queued", 0, datetime.now().isoformat(), None),
+        ])
+        conn.commit()
+        conn.close()
+
+        self.assertEqual(self.manager.recover_orphaned_jobs(), ["orfao"])
+        job = self.manager.get_job("orfao")
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["attempts"], 2)
+        self.assertEqual(job["rows_written"], 25)
+        self.assertEqual(self.manager.get_job("esgotado")["status"], "failed")
+        self.assertEqual(self.manager.get_job("recente")["status"], "queued")
+
+        # Job já em execução não é pego de novo
+        self.manager.run_job("orfao")
+        self.assertEqual(self.manager.get_job("orfao")["attempts"], 2)
+
+    def test_startup_requeues_without_waiting(self):
+        """Teste: na inicialização, queued e running sem heartbeat voltam na hora"""
+        now = datetime.now()
+        just_now = (now - timedelta(seconds=5)).isoformat()
+        dead_beat = (now - timedelta(minutes=5)).isoformat()
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        conn.executemany("""
+            INSERT INTO report_jobs (id, report_name, report_type, date_range_start, date_range_end,
+                                     format, status, attempts, created_at, started_at, heartbeat_at)
+            VALUES (?, 'R', 'performance', '2026-01-01', '2026-01-31', 'csv', ?, ?, ?, ?, ?)
+        """, [
+            ("na_fila", "queued", 0, just_now, None, None),
+            ("sem_heartbeat", "running", 1, dead_beat, dead_beat, dead_beat),
+            ("vivo", "running", 1, dead_beat, dead_beat, just_now),
+        ])
+        conn.commit()
+        conn.close()
+
+        # Varredura periódica: fila recente ainda espera o corte de idade
+        self.manager._get_executor = lambda: _QueuedExecutor()
+        self.assertEqual(self.manager.recover_orphaned_jobs(), ["sem_heartbeat"])
+
+        self.manager._get_executor = lambda: _InlineExecutor()
+        self.assertCountEqual(self.manager.recover_orphaned_jobs(startup=True), ["na_fila", "sem_heartbeat"])
+        self.assertEqual(self.manager.get_job("na_fila")["status"], "done")
+        self.assertEqual(self.manager.get_job("sem_heartbeat")["status"], "done")
+        self.assertEqual(self.manager.get_job("vivo")["status"], "running")
+        self.assertEqual(self.manager.get_job("vivo")["attempts"], 1)
+
+
+class _QueuedExecutor:
+    def submit(self, fn, *args):
+        pass
+
+
+class _InlineExecutor:
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+if __name__ == "__main__":
+    unittest.main()
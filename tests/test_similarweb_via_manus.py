@@ -21,12 +21,15 @@ from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime
 import sys
 import os
+import shutil
+import tempfile
 
 # Add project root to path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from services.similarweb_intelligence import SimilarwebIntelligence
 from services.manus_credit_tracker import ManusCreditTracker, ActionType
+from services import db_utils
 
 
 class TestSimilarwebViaManus(unittest.TestCase):
@@ -34,13 +37,22 @@ class TestSimilarwebViaManus(unittest.TestCase):
     
     def setUp(self):
         """Setup antes de cada teste"""
+        # Banco temporário: o consumo de créditos é persistido
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        
         self.service = SimilarwebIntelligence()
         self.tracker = ManusCreditTracker()
         
-        # Reset cache e contadores
+        # Reset cache e contadores (o histórico de uso começa vazio no banco novo)
         self.service.cache = {}
         self.service.credits_used = 0
-        self.tracker.usage_log = []
+    
+    def tearDown(self):
+        self.tracker.meter.close()
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
     
     def test_01_service_initialization(self):
         """Teste 1: Inicialização do serviço"""
@@ -0,0 +1,198 @@
+"""
+🧪 TESTES - Limitador por janela deslizante
+Nexora Prime
+
+Valida:
+- Baldes de tempo expiram conforme a janela avança
+- Limites de valor e de quantidade (check / acquire / release)
+- Estado persistido e compartilhado entre instâncias (processos)
+- Limite diário em PaymentSecurityBlocks e nos serviços de funding
+- Gastos do BudgetGuardian a partir das janelas
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import threading
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from services import db_utils
+from services import sliding_window_limiter
+from services.sliding_window_limiter import SlidingWindowLimiter, LimitRule, DAY, HOUR
+from services.payments.payment_security_blocks import PaymentSecurityBlocks, MAX_DAILY_AMOUNT
+from services.payments.facebook_ads_funding_service import FacebookAdsFundingService, MAX_DAILY_FUNDING
+from services.payments.stripe_webhook_handler import StripeWebhookHandler
+from services.budget_guardian import BudgetGuardian
+from models.payments.credit_wallet import CreditType
+
+RULES = {
+    "daily_amount": LimitRule(window_seconds=DAY, bucket_seconds=HOUR, max_amount=1000.0),
+    "hourly_count": LimitRule(window_seconds=HOUR, bucket_seconds=60, max_count=3)
+}
+T0 = 1_800_000_000.0
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+    """Testes do limitador"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        self._original_cwd = os.getcwd()
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        os.chdir(self.tmp_dir)
+        sliding_window_limiter._limiters.clear()
+        self.limiter = SlidingWindowLimiter("test", RULES)
+
+    def tearDown(self):
+        os.chdir(self._original_cwd)
+        db_utils.DATABASE_PATH = self._original_path
+        sliding_window_limiter._limiters.clear()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_amount_limit_and_expiry(self):
+        self.limiter.record("u1", 600.0, now=T0)
+        self.assertTrue(self.limiter.check("u1", 400.0, now=T0 + 10)["allowed"])
+
+        result = self.limiter.check("u1", 500.0, now=T0 + 10)
+        self.assertFalse(result["allowed"])
+        self.assertEqual(result["rule"], "daily_amount")
+        self.assertEqual(result["usage"]["daily_amount"]["remaining_amount"], 400.0)
+
+        # 24h depois o balde saiu da janela
+        self.assertTrue(self.limiter.check("u1", 900.0, now=T0 + DAY + HOUR)["allowed"])
+
+    def test_count_limit(self):
+        for i in range(3):
+            self.assertTrue(self.limiter.acquire("u1", 1.0, now=T0 + i)["allowed"])
+        result = self.limiter.acquire("u1", 1.0, now=T0 + 5)
+        self.assertFalse(result["allowed"])
+        self.assertEqual(result["rule"], "hourly_count")
+
+        self.limiter.release("u1", 1.0, acquired_at=T0, now=T0 + 6)
+        self.assertTrue(self.limiter.acquire("u1", 1.0, now=T0 + 7)["allowed"])
+
+    def test_release_after_window_is_noop(self):
+        acquired = self.limiter.acquire("u1", 300.0, now=T0)
+        self.limiter.acquire("u1", 100.0, now=T0 + 2 * HOUR)
+
+        # A contagem horária da reserva já expirou: nada a devolver nela
+        self.limiter.release("u1", 300.0, acquired["acquired_at"], now=T0 + 2 * HOUR + 10)
+        usage = self.limiter.usage("u1", now=T0 + 2 * HOUR + 10)
+        self.assertEqual(usage["hourly_count"]["count"], 1)
+        self.assertEqual(usage["daily_amount"]["amount"], 100.0)
+        for i in range(2):
+            self.assertTrue(self.limiter.acquire("u1", 1.0, now=T0 + 2 * HOUR + 20 + i)["allowed"])
+        self.assertFalse(self.limiter.acquire("u1", 1.0, now=T0 + 2 * HOUR + 30)["allowed"])
+
+        # Devolução repetida não deixa a janela negativa
+        self.limiter.release("u1", 300.0, acquired["acquired_at"], now=T0 + 2 * HOUR + 40)
+        self.assertEqual(self.limiter.usage("u1", now=T0 + 2 * HOUR + 40)["daily_amount"]["amount"], 102.0)
+
+    def test_keys_are_independent(self):
+        self.limiter.record("u1", 1000.0, now=T0)
+        self.assertFalse(self.limiter.check("u1", 1.0, now=T0)["allowed"])
+        self.assertTrue(self.limiter.check("u2", 1.0, now=T0)["allowed"])
+
+    def test_state_shared_between_instances(self):
+        other = SlidingWindowLimiter("test", RULES)
+        self.limiter.usage("u1", now=T0)  # popular o cache
+        other.record("u1", 700.0, now=T0)
+
+        usage = self.limiter.usage("u1", now=T0)
+        self.assertEqual(usage["daily_amount"]["amount"], 700.0)
+        self.assertEqual(usage["hourly_count"]["count"], 1)
+
+    def test_payment_security_daily_limit(self):
+        blocks = PaymentSecurityBlocks()
+        self.assertFalse(blocks.check_payment_limits("u1", 5000.0, "MANUS")["blocked"])
+
+        blocks.limiter.record("u1", MAX_DAILY_AMOUNT - 1000.0)
+        result = blocks.check_payment_limits("u1", 5000.0, "MANUS")
+        self.assertTrue(result["blocked"])
+        self.assertIn("Limite diário", result["reason"])
+
+    def test_funding_records_daily_window(self):
+        service = FacebookAdsFundingService()
+        service.wallet_service.add_credits("u1", CreditType.FACEBOOK_ADS, 5000.0)
+        result = service.fund_account("u1", "act_123", 1000.0)
+        self.assertTrue(result["success"])
+        self.assertEqual(service.limiter.usage("u1")["daily_amount"]["amount"], 1000.0)
+
+    def test_validate_payment_reserves_and_webhook_settles(self):
+        blocks = PaymentSecurityBlocks()
+        blocks.check_stripe_availability = lambda: {"success": True, "blocked": False}
+        blocks.limiter.record("u1", MAX_DAILY_AMOUNT - 8000.0)
+
+        self.assertTrue(blocks.validate_payment("u1", "pi_1", 5000.0, "MANUS")["success"])
+        self.assertTrue(blocks.validate_payment("u1", "pi_1", 5000.0, "MANUS")["success"])  # idempotente
+        result = blocks.validate_payment("u1", "pi_2", 5000.0, "MANUS")
+        self.assertTrue(result["blocked"])
+        self.assertIn("Limite diário", result["reason"])
+
+        # Falha devolve a reserva; sucesso mantém
+        handler = StripeWebhookHandler()
+        handler.handle_event({"id": "evt_f", "type": "payment_intent.payment_failed", "data": {"object": {
+            "id": "pi_1", "amount": 500000, "metadata": {"user_id": "u1", "credit_type": "MANUS"}
+        }}})
+        self.assertTrue(blocks.validate_payment("u1", "pi_2", 5000.0, "MANUS")["success"])
+        handler.handle_event({"id": "evt_s", "type": "payment_intent.succeeded", "data": {"object": {
+            "id": "pi_2", "amount": 500000, "currency": "brl", "metadata": {"user_id": "u1", "credit_type": "MANUS"}
+        }}})
+        self.assertEqual(blocks.limiter.usage("u1")["daily_amount"]["amount"], MAX_DAILY_AMOUNT - 3000.0)
+
+    def test_released_intent_is_checked_again(self):
+        blocks = PaymentSecurityBlocks()
+        self.assertTrue(blocks.reservations.reserve("u1", "pi_1", 5000.0)["allowed"])
+        blocks.reservations.release("pi_1")
+        self.assertEqual(blocks.limiter.usage("u1")["daily_amount"]["amount"], 0.0)
+
+        # Retentativa do intent devolvido passa pelo limite de novo
+        blocks.limiter.record("u1", MAX_DAILY_AMOUNT - 1000.0)
+        result = blocks.reservations.reserve("u1", "pi_1", 5000.0)
+        self.assertFalse(result["allowed"])
+        self.assertEqual(result["rule"], "daily_amount")
+
+        blocks.limiter.reset("u1")
+        self.assertTrue(blocks.reservations.reserve("u1", "pi_1", 5000.0)["allowed"])
+        self.assertTrue(blocks.reservations.reserve("u1", "pi_1", 5000.0)["allowed"])  # idempotente
+        self.assertEqual(blocks.limiter.usage("u1")["daily_amount"]["amount"], 5000.0)
+
+    def test_concurrent_funding_respects_daily_limit(self):
+        service = FacebookAdsFundingService()
+        service.wallet_service.add_credits("u1", CreditType.FACEBOOK_ADS, 30000.0)
+        service.limiter.record("u1", MAX_DAILY_FUNDING - 15000.0, count=0)
+        results = []
+
+        def fund():
+            results.append(FacebookAdsFundingService().fund_account("u1", "act_123", 10000.0)["success"])
+
+        threads = [threading.Thread(target=fund) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(service.limiter.usage("u1")["daily_amount"]["amount"], MAX_DAILY_FUNDING - 5000.0)
+        # Funding bem-sucedido alimenta o BudgetGuardian da conta
+        self.assertEqual(BudgetGuardian(account_id="u1").get_budget_report()["spending"]["today"], 10000.0)
+
+    def test_budget_guardian_spending(self):
+        guardian = BudgetGuardian(account_id="acc1")
+        self.assertEqual(guardian.get_budget_report()["spending"]["today"], 0.0)
+        spending = guardian.record_spending(120.0)
+        self.assertEqual(spending["today"], 120.0)
+        self.assertEqual(spending["this_month"], 120.0)
+
+        requires, reason, _ = guardian.check_budget_approval_required(450.0, {})
+        self.assertTrue(requires)
+        self.assertEqual(reason, "Limite diário seria excedido")
+
+
+if __name__ == '__main__':
+    unittest.main()
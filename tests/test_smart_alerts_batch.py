@@ -0,0 +1,90 @@
+"""
+🧪 TESTES - Avaliação em lote do Smart Alerts
+Nexora Prime
+
+Valida:
+- Avaliação vetorizada equivalente a AlertRuleEngine.evaluate_rule
+- Cooldown por (regra, campanha)
+- Snooze bloqueia apenas a campanha adiada
+- Notificações enfileiradas e enviadas em digest por usuário
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.smart_alerts_system import SmartAlertsSystem
+
+
+class TestBatchAlertEvaluation(unittest.TestCase):
+    """Testes do BatchAlertEvaluator"""
+
+    def setUp(self):
+        self.system = SmartAlertsSystem()
+        # Sem thread em background: os testes drenam a fila manualmente
+        self.system.notification_dispatcher._ensure_worker = lambda: None
+        self.system.set_user_preferences("u1", {
+            "email": "u1@example.com",
+            "channels": ["email", "in_app"],
+            "min_severity": "INFO"
+        })
+
+    def test_matches_single_rule_evaluation(self):
+        """Teste: disparos batem com evaluate_rule por campanha"""
+        metrics = {
+            "c1": {"cpa": 70.0, "roas": 3.0},
+            "c2": {"cpa": 50.0, "roas": 1.0},
+            "c3": {"cpa": 10.0, "roas": 4.0},
+        }
+        targets = {c: {"cpa": 40.0} for c in metrics}
+
+        expected = set()
+        for campaign_id, campaign_metrics in metrics.items():
+            for rule in self.system.rule_engine.rules.values():
+                if self.system.rule_engine.evaluate_rule(rule, campaign_metrics, targets[campaign_id]):
+                    expected.add((rule.id, campaign_id))
+
+        alerts = self.system.evaluate_all_campaigns(metrics, targets, default_user_id="u1")
+
+        self.assertEqual({(a.rule_id, a.campaign_id) for a in alerts}, expected)
+        self.assertIn(("rule_cpa_critical", "c1"), expected)
+        self.assertIn(("rule_roas_low", "c2"), expected)
+
+    def test_cooldown_is_per_campaign(self):
+        """Teste: cooldown de uma campanha não bloqueia as demais"""
+        self.system.evaluate_all_campaigns({"c1": {"roas": 1.0}}, default_user_id="u1")
+        alerts = self.system.evaluate_all_campaigns(
+            {"c1": {"roas": 1.0}, "c2": {"roas": 1.0}},
+            default_user_id="u1"
+        )
+        self.assertEqual([a.campaign_id for a in alerts if a.rule_id == "rule_roas_low"], ["c2"])
+
+    def test_snooze_blocks_campaign(self):
+        """Teste: alerta adiado não dispara novamente durante o snooze"""
+        alerts = self.system.evaluate_all_campaigns({"c1": {"errors": 3}}, default_user_id="u1")
+        alert = next(a for a in alerts if a.rule_id == "rule_system_error")
+        self.system.snooze_alert(alert.id, minutes=60)
+
+        state = self.system.batch_evaluator.state
+        state.set_cooldown("rule_system_error", state.rows_for(["c1"]), 0)
+
+        alerts = self.system.evaluate_all_campaigns({"c1": {"errors": 3}}, default_user_id="u1")
+        self.assertNotIn("rule_system_error", [a.rule_id for a in alerts])
+
+    def test_notifications_are_digested_per_user(self):
+        """Teste: vários alertas do mesmo usuário geram um único email"""
+        metrics = {f"c{i}": {"roas": 1.0, "ctr_ratio": 1.0} for i in range(5)}
+        self.system.evaluate_all_campaigns(metrics, default_user_id="u1")
+
+        dispatcher = self.system.notification_dispatcher
+        self.assertEqual(dispatcher.drain(), 5)
+        self.assertEqual(dispatcher.digests_sent, 1)
+        channels = [n["channel"] for n in dispatcher.sent_notifications]
+        self.assertEqual(channels.count("email"), 5)
+        self.assertEqual(channels.count("in_app"), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+🧪 TESTES - Streaming Anomaly Detector
+Nexora Prime
+
+Valida:
+- Estatísticas de Welford batem com o cálculo sobre a lista completa
+- Pico é pontuado antes de entrar na baseline
+- Estado persistido permite warm start
+- Flush de vários workers mescla os pontos em vez de sobrescrever
+- Pontos sem timestamp não são reincorporados a cada chamada
+"""
+
+import os
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services import streaming_anomaly_detector
+from services.streaming_anomaly_detector import StreamingAnomalyDetector
+from services.ml_prediction_engine import MLPredictionEngine
+
+
+class TestStreamingAnomalyDetector(unittest.TestCase):
+    """Testes do detector incremental"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+        self.detector = StreamingAnomalyDetector(flush_interval=3600)
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_welford_matches_batch_statistics(self):
+        """Teste: média e desvio incrementais = cálculo em lote"""
+        values = [10.0, 12.0, 9.5, 11.0, 10.5, 13.0, 8.0]
+        for value in values:
+            self.detector.update("c1", "cpa", value)
+
+        mean = sum(values) / len(values)
+        std_dev = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+
+        state = self.detector.get_state("c1", "cpa")
+        self.assertAlmostEqual(state["mean"], mean)
+        self.assertAlmostEqual(state["std_dev"], std_dev)
+
+    def test_spike_is_detected_on_ingest(self):
+        """Teste: pico é sinalizado na ingestão"""
+        for i in range(10):
+            self.assertEqual(self.detector.ingest("c1", {"spend": 100 + (i % 3)}), [])
+
+        anomalies = self.detector.ingest("c1", {"spend": 500})
+        self.assertEqual(len(anomalies), 1)
+        self.assertGreater(anomalies[0]["z_score"], 2)
+        self.assertEqual(self.detector.get_state("c1", "spend")["count"], 11)
+
+    def test_state_survives_restart(self):
+        """Teste: flush + novo detector recupera o estado"""
+        for i in range(6):
+            self.detector.ingest("c1", {"roas": 2.0 + i * 0.1})
+        self.assertEqual(self.detector.flush(), 1)
+
+        restarted = StreamingAnomalyDetector()
+        self.assertEqual(restarted.get_state("c1", "roas")["count"], 6)
+        self.assertIsNotNone(restarted.score("c1", "roas", 9.0))
+
+    def test_flush_merges_workers(self):
+        """Teste: dois workers gravam a mesma série sem perder nem duplicar pontos"""
+        worker_b = StreamingAnomalyDetector(flush_interval=3600)
+        for day in range(1, 4):
+            self.detector.update("c1", "cpa", 10.0 + day, f"2026-03-0{day}T00:00:00")
+        for day in range(2, 6):  # 2 e 3 repetidos
+            worker_b.update("c1", "cpa", 10.0 + day, f"2026-03-0{day}T00:00:00")
+
+        self.assertEqual(self.detector.flush(), 1)
+        self.assertEqual(worker_b.flush(), 1)
+        self.assertEqual(worker_b.get_state("c1", "cpa")["count"], 5)
+        self.assertEqual(StreamingAnomalyDetector().get_state("c1", "cpa")["count"], 5)
+
+    def test_points_without_timestamp_are_not_reingested(self):
+        """Teste: histórico sem timestamp não cresce o estado a cada chamada"""
+        engine = MLPredictionEngine()
+        original = streaming_anomaly_detector._detector_instance
+        streaming_anomaly_detector._detector_instance = self.detector
+        try:
+            history = [{"spend": 100 + (i % 3)} for i in range(6)] + [{"spend": 500}]
+            for _ in range(3):
+                result = engine.detect_anomalies(history, campaign_id="c1")
+                self.assertEqual(result["anomalies_found"], 1)
+            self.assertIsNone(self.detector.get_state("c1", "spend"))
+
+            dated = [{"spend": 100 + (i % 3), "date": f"2026-03-0{i + 1}"} for i in range(6)]
+            for _ in range(3):
+                engine.detect_anomalies(dated, campaign_id="c1")
+            self.assertEqual(self.detector.get_state("c1", "spend")["count"], 6)
+        finally:
+            streaming_anomaly_detector._detector_instance = original
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+🧪 TESTES - Roteador de comandos pré-compilado do Velyra
+Nexora Prime
+
+Valida:
+- Mesma classificação do loop original de re.search por padrão
+- Prioridade pela ordem dos comandos, não pela posição na mensagem
+- Extração de parâmetros com regexes pré-compiladas
+- Micro-benchmark de latência de parse
+"""
+
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.velyra_command_router import CommandRouter, benchmark_parse, SAMPLE_MESSAGES
+from services.velyra_prime_v3 import VelyraPrimeV3
+
+
+def reference_match(command_patterns, message_lower):
+    """Loop original: primeiro comando (em ordem) com algum padrão que casa"""
+    for cmd_name, cmd_config in command_patterns.items():
+        for pattern in cmd_config['patterns']:
+            if re.search(pattern, message_lower):
+                return cmd_name
+    return None
+
+
+class TestVelyraCommandRouter(unittest.TestCase):
+    """Testes do roteador"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agent = VelyraPrimeV3()
+        cls.router = cls.agent.command_router
+
+    def test_matches_reference_loop(self):
+        messages = SAMPLE_MESSAGES + [
+            "gerar copy para o clareador",
+            "status das campanhas",
+            "como melhorar meu ctr",
+            "meta vs google",
+            "o que você pode fazer?",
+            "explique frequência",
+            "investir mais no tiktok",
+            "analise a performance da semana",
+            "texto qualquer sem comando",
+        ]
+        for message in messages:
+            message_lower = message.lower().strip()
+            expected = reference_match(self.agent.command_patterns, message_lower)
+            index = self.router.match_command(message_lower)
+            actual = self.router.commands[index][0] if index >= 0 else None
+            self.assertEqual(actual, expected, message)
+
+    def test_priority_follows_command_order(self):
+        # "status" (comando tardio) aparece antes de "pausar a campanha" no texto
+        command_type, params = self.agent._parse_command("status: pausar a campanha Verão agora por favor")
+        self.assertEqual(command_type, "action")
+        self.assertEqual(params["command_name"], "pause_campaign")
+
+    def test_route_types_and_params(self):
+        self.assertEqual(self.agent._parse_command("Oi")[0], "greeting")
+        self.assertEqual(self.agent._parse_command("Qual o CPA ideal?")[0], "question")
+
+        command_type, params = self.agent._parse_command(
+            "Crie uma campanha para o Synadentix no Instagram com orçamento de 350,50 para vendas"
+        )
+        self.assertEqual(params["action"], "create_campaign")
+        self.assertEqual(params["data"], {
+            "product": "Synadentix",
+            "platform": "meta_ads",
+            "budget": 350.5,
+            "objective": "conversions"
+        })
+
+        _, params = self.agent._parse_command("Escalar a campanha 'Verão' em 25%")
+        self.assertEqual(params["data"]["percentage"], 25)
+        self.assertEqual(params["data"]["campaign_name"], "verão")
+
+        command_type, params = self.agent._parse_command("Resultado do ROAS ontem")
+        self.assertEqual((command_type, params["action"]), ("action", "analyze_performance"))
+
+    def test_router_without_patterns(self):
+        router = CommandRouter({})
+        self.assertEqual(router.route("pausar campanha")[0], "question")
+
+    def test_parse_latency_benchmark(self):
+        result = benchmark_parse(self.agent._parse_command, SAMPLE_MESSAGES, iterations=50)
+        self.assertEqual(result["calls"], 50 * len(SAMPLE_MESSAGES))
+        # Limite folgado: só pega regressões grosseiras (ex.: recompilar por mensagem)
+        self.assertLess(result["avg_us"], 2000)
+
+
+if __name__ == "__main__":
+    unittest.main()
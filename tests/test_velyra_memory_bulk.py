@@ -0,0 +1,110 @@
+"""
+🧪 TESTES - Ingestão em lote e cache write-behind da VelyraMemory
+Nexora Prime
+
+Valida:
+- learn_from_campaigns igual a learn_from_campaign em sequência
+- Cache limitado com deltas gravados no flush
+- Aquecimento do cache a partir do snapshot em memory_stats
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.velyra_memory import VelyraMemory
+from services.velyra_memory_cache import WriteBehindMemoryCache
+
+
+def _campaigns(n):
+    return [
+        {
+            "id": f"c{i}", "niche": ["fitness", "finance", "beauty"][i % 3], "country": "BR",
+            "platform": "facebook", "spend": 100, "revenue": 100 * (i % 5), "roas": i % 5,
+            "conversions": 10 * i, "strategy": {"type": ["cbo", "abo"][i % 2]}
+        }
+        for i in range(n)
+    ]
+
+
+class TestVelyraMemoryBulk(unittest.TestCase):
+    """Testes da ingestão em lote"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        self.memories = []
+
+    def tearDown(self):
+        # Flush final no banco temporário de cada instância
+        for path, memory in self.memories:
+            db_utils.DATABASE_PATH = path
+            memory.memory_cache.close()
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _use_db(self, name):
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, name)
+        memory = VelyraMemory()
+        self.memories.append((db_utils.DATABASE_PATH, memory))
+        return memory
+
+    @staticmethod
+    def _dump(query):
+        conn = sqlite3.connect(db_utils.DATABASE_PATH)
+        rows = conn.execute(query).fetchall()
+        conn.close()
+        return rows
+
+    def test_bulk_matches_sequential(self):
+        """Teste: mesmas estratégias e padrões gravados"""
+        queries = (
+            "SELECT id, times_used, times_succeeded, avg_roas FROM winning_strategies ORDER BY id",
+            "SELECT id, pattern_value, occurrences FROM learned_patterns ORDER BY id",
+            "SELECT id, status, success_score FROM campaigns_history ORDER BY id",
+        )
+
+        sequential = self._use_db("seq.db")
+        for campaign in _campaigns(60):
+            sequential.learn_from_campaign(campaign)
+        expected = [self._dump(q) for q in queries]
+
+        bulk = self._use_db("bulk.db")
+        result = bulk.learn_from_campaigns(_campaigns(60), batch_size=25)
+        self.assertEqual(result["campaigns_learned"], 60)
+        self.assertEqual([self._dump(q) for q in queries], expected)
+        self.assertEqual(len(bulk.similarity_index), 60)
+
+    def test_cache_bounded_and_flushed(self):
+        """Teste: LRU limitado, flush grava deltas e o snapshot aquece o cache"""
+        memory = self._use_db("cache.db")
+        memory.memory_cache.max_entries = 4
+        memory.learn_from_campaigns(_campaigns(30))
+
+        self.assertLessEqual(len(memory.memory_cache), 4)
+        self.assertEqual(self._dump("SELECT COUNT(*) FROM memory_stats"), [(0,)])
+
+        # Leitura de chave fora do cache combina banco + pendentes
+        self.assertEqual(memory.memory_cache.get_stats("niches", "fitness")["campaigns"], 10)
+        memory.memory_cache.flush()
+        self.assertEqual(
+            self._dump("SELECT campaigns FROM memory_stats WHERE section = 'niches' AND key = 'fitness'"),
+            [(10,)]
+        )
+
+        memory.learn_from_campaigns(_campaigns(3))
+        memory.memory_cache.flush()
+        fresh = WriteBehindMemoryCache(max_entries=50)
+        self.assertGreater(fresh.warm_load(), 0)
+        self.assertEqual(fresh["niches"]["fitness"]["campaigns"], 11)
+        self.assertEqual(fresh.get("successful_campaigns", []), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+"""
+🧪 TESTES - Webhook Dispatcher
+Nexora Prime
+
+Valida a outbox de webhooks:
+- Emissão grava na outbox sem chamar o assinante
+- Entrega em lote só para assinaturas com `batch`; as demais recebem um POST por evento
+- Retry com backoff e dead-letter
+- Circuit breaker por endpoint
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import db_utils
+from services.webhook_dispatcher import WebhookDispatcher, CircuitBreaker
+
+
+class TestWebhookDispatcher(unittest.TestCase):
+    """Testes da outbox de webhooks"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self._original_path = db_utils.DATABASE_PATH
+        db_utils.DATABASE_PATH = os.path.join(self.tmp_dir, "test.db")
+
+        self.dispatcher = WebhookDispatcher(autostart=False, batch_size=10, max_attempts=2)
+        self.sent = []
+        self.status_code = 200
+
+        def fake_send(url, body, headers):
+            self.sent.append((url, json.loads(body), headers))
+            return self.status_code
+
+        self.dispatcher._send = fake_send
+
+    def tearDown(self):
+        db_utils.DATABASE_PATH = self._original_path
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_enqueue_does_not_call_subscriber(self):
+        """Teste: emitir evento apenas grava na outbox"""
+        queued = self.dispatcher.enqueue("campaign_created", {"id": 1}, [{"url": "http://a"}])
+        self.assertEqual(queued, 1)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"pending": 1})
+
+    def test_single_event_keeps_original_payload(self):
+        """Teste: evento único mantém o corpo original e é assinado"""
+        self.dispatcher.enqueue("campaign_created", {"id": 1}, [{"url": "http://a", "secret": "s3cr3t"}])
+        self.dispatcher.process_pending()
+
+        url, body, headers = self.sent[0]
+        self.assertEqual(body, {"id": 1})
+        self.assertEqual(headers["X-Webhook-Event"], "campaign_created")
+        self.assertIn("X-Webhook-Signature", headers)
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"delivered": 1})
+
+    def test_events_to_same_endpoint_are_batched(self):
+        """Teste: eventos para endpoint com batch vão em um único POST"""
+        for i in range(5):
+            self.dispatcher.enqueue("metrics", {"i": i}, [
+                {"url": "http://a", "batch": True}, {"url": "http://b", "batch": True}
+            ])
+        self.dispatcher.process_pending()
+
+        self.assertEqual(len(self.sent), 2)
+        for url, body, headers in self.sent:
+            self.assertEqual(headers["X-Webhook-Batch-Size"], "5")
+            self.assertEqual([e["data"]["i"] for e in body["events"]], list(range(5)))
+
+    def test_subscribers_without_batch_get_one_event_per_post(self):
+        """Teste: sem opt-in, cada evento sai no formato original"""
+        for i in range(3):
+            self.dispatcher.enqueue("metrics", {"i": i}, [{"url": "http://a", "secret": "s3cr3t"}])
+        self.assertEqual(self.dispatcher.process_pending(), 3)
+
+        self.assertEqual([body for _, body, _ in self.sent], [{"i": 0}, {"i": 1}, {"i": 2}])
+        for _, _, headers in self.sent:
+            self.assertEqual(headers["X-Webhook-Event"], "metrics")
+            self.assertNotIn("X-Webhook-Batch-Size", headers)
+            self.assertIn("X-Webhook-Signature", headers)
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"delivered": 3})
+
+    def test_open_circuit_mid_group_defers_the_rest(self):
+        """Teste: circuito aberto no meio do grupo adia os eventos restantes"""
+        self.status_code = 500
+        self.dispatcher.failure_threshold = 2
+        for i in range(4):
+            self.dispatcher.enqueue("metrics", {"i": i}, [{"url": "http://a"}])
+        self.dispatcher.process_pending()
+
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(self.dispatcher._get_breaker("http://a").state, CircuitBreaker.OPEN)
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"pending": 4})
+        self.assertEqual(self.dispatcher._claim_due(100), [])
+
+    def test_failed_delivery_is_retried_then_dead(self):
+        """Teste: falhas reagendam com backoff e viram dead após max_attempts"""
+        self.status_code = 500
+        self.dispatcher.backoff_delay = lambda attempts: 0
+        self.dispatcher.enqueue("campaign_created", {"id": 1}, [{"url": "http://a"}])
+
+        self.dispatcher.process_pending()
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"pending": 1})
+
+        self.dispatcher.process_pending()
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"dead": 1})
+        self.assertEqual(len(self.sent), 2)
+
+    def test_open_circuit_skips_endpoint(self):
+        """Teste: circuito aberto não consome tentativas"""
+        breaker = self.dispatcher._get_breaker("http://a")
+        for _ in range(self.dispatcher.failure_threshold):
+            breaker.record_failure()
+
+        self.dispatcher.enqueue("campaign_created", {"id": 1}, [{"url": "http://a"}])
+        self.dispatcher.process_pending()
+
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.dispatcher.get_statistics()["outbox"], {"pending": 1})
+
+    def test_deferred_rows_are_not_counted_nor_due(self):
+        """Teste: endpoint sem vaga adia as linhas para o futuro e o ciclo conta 0"""
+        self.dispatcher.enqueue("campaign_created", {"id": 1}, [{"url": "http://a"}])
+        for _ in range(self.dispatcher.per_endpoint_concurrency):
+            self.dispatcher._acquire_slot("http://a")
+
+        self.assertEqual(self.dispatcher.process_pending(), 0)
+        self.assertEqual(self.dispatcher._claim_due(100), [])  # nada vencido: sem busy-loop
+        self.assertEqual(self.sent, [])
+
+    def test_half_open_sends_single_probe(self):
+        """Teste: em half_open só uma linha testa o endpoint; o resto aguarda"""
+        breaker = self.dispatcher._get_breaker("http://a")
+        for _ in range(self.dispatcher.failure_threshold):
+            breaker.record_failure()
+        breaker.opened_at -= breaker.reset_timeout
+
+        for i in range(3):
+            self.dispatcher.enqueue("metrics", {"i": i}, [{"url": "http://a"}])
+        self.status_code = 500
+        self.assertEqual(self.dispatcher.process_pending(), 1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        # Linhas adiadas e o probe que falhou não voltam antes do reset_timeout
+        self.assertEqual(self.dispatcher._claim_due(100), [])
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Testes do circuit breaker"""
+
+    def test_half_open_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow_request())  # probe já em andamento
+        breaker.record_success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()